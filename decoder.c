@@ -42,6 +42,20 @@
 /* The list of loaded protocol decoders. */
 static GSList *pd_list = NULL;
 
+/* The module index in decoder archives, see tools/install-decoders. */
+#define ZIP_INDEX_NAME "decoders.index"
+
+/*
+ * Decoders from the metadata cache, whose module is not imported yet:
+ * struct srd_decoder * -> struct lazy_decoder *.
+ */
+static GHashTable *lazy_decoders = NULL;
+
+struct lazy_decoder {
+	char *module_name;
+	char *doc;
+};
+
 /* srd.c */
 extern SRD_PRIV GSList *searchpaths;
 
@@ -63,6 +77,43 @@ static gboolean srd_check_init(void)
 		return TRUE;
 }
 
+static void lazy_decoder_free(void *data)
+{
+	struct lazy_decoder *lazy = data;
+
+	g_free(lazy->module_name);
+	g_free(lazy->doc);
+	g_free(lazy);
+}
+
+static gboolean lazy_decoder_has_module(void *key, void *value,
+		void *module_name)
+{
+	struct lazy_decoder *lazy = value;
+
+	(void)key;
+
+	return !strcmp(lazy->module_name, module_name);
+}
+
+/* Check whether a module is imported, or listed from the cache. */
+static gboolean module_loaded(const char *module_name)
+{
+	gboolean loaded;
+	PyGILState_STATE gstate;
+
+	if (lazy_decoders && g_hash_table_find(lazy_decoders,
+			lazy_decoder_has_module, (void *)module_name))
+		return TRUE;
+
+	gstate = srd_gil_ensure(NULL);
+	loaded = PyDict_GetItemString(PyImport_GetModuleDict(),
+			module_name) != NULL;
+	srd_gil_release(gstate);
+
+	return loaded;
+}
+
 /**
  * Returns the list of loaded protocol decoders.
  *
@@ -169,10 +220,10 @@ static void decoder_free(struct srd_decoder *dec)
 	if (!dec)
 		return;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 	Py_XDECREF(dec->py_dec);
 	Py_XDECREF(dec->py_mod);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	g_slist_free_full(dec->options, &decoder_option_free);
 	g_slist_free_full(dec->binary, (GDestroyNotify)&g_strfreev);
@@ -202,11 +253,11 @@ static int get_channels(const struct srd_decoder *d, const char *attr,
 	ssize_t ch_idx;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyObject_HasAttrString(d->py_dec, attr)) {
 		/* No channels of this type specified. */
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return SRD_OK;
 	}
 
@@ -250,7 +301,7 @@ static int get_channels(const struct srd_decoder *d, const char *attr,
 	Py_DECREF(py_channellist);
 	*out_pdchl = pdchl;
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
@@ -261,7 +312,7 @@ except_out:
 err_out:
 	g_slist_free_full(pdchl, &channel_free);
 	Py_XDECREF(py_channellist);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -275,11 +326,11 @@ static int get_options(struct srd_decoder *d)
 	ssize_t opt, val_idx;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyObject_HasAttrString(d->py_dec, "options")) {
 		/* No options, that's fine. */
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return SRD_OK;
 	}
 
@@ -377,7 +428,7 @@ static int get_options(struct srd_decoder *d)
 	}
 	d->options = options;
 	Py_DECREF(py_opts);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
@@ -387,7 +438,7 @@ except_out:
 err_out:
 	g_slist_free_full(options, &decoder_option_free);
 	Py_XDECREF(py_opts);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -404,10 +455,10 @@ static int get_annotations(struct srd_decoder *dec, size_t *ret_count)
 	if (ret_count)
 		*ret_count = 0;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyObject_HasAttrString(dec->py_dec, "annotations")) {
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return SRD_OK;
 	}
 
@@ -443,7 +494,7 @@ static int get_annotations(struct srd_decoder *dec, size_t *ret_count)
 	}
 	dec->annotations = annotations;
 	Py_DECREF(py_annlist);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
@@ -453,7 +504,7 @@ except_out:
 err_out:
 	g_slist_free_full(annotations, (GDestroyNotify)&g_strfreev);
 	Py_XDECREF(py_annlist);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -470,10 +521,10 @@ static int get_annotation_rows(struct srd_decoder *dec, size_t cls_count)
 	size_t class_idx;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyObject_HasAttrString(dec->py_dec, py_member_name)) {
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return SRD_OK;
 	}
 
@@ -552,7 +603,7 @@ static int get_annotation_rows(struct srd_decoder *dec, size_t cls_count)
 	}
 	dec->annotation_rows = annotation_rows;
 	Py_DECREF(py_ann_rows);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
@@ -563,7 +614,7 @@ except_out:
 err_out:
 	g_slist_free_full(annotation_rows, &annotation_row_free);
 	Py_XDECREF(py_ann_rows);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -577,10 +628,10 @@ static int get_binary_classes(struct srd_decoder *dec)
 	ssize_t bin_idx;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyObject_HasAttrString(dec->py_dec, "binary")) {
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return SRD_OK;
 	}
 
@@ -616,7 +667,7 @@ static int get_binary_classes(struct srd_decoder *dec)
 	}
 	dec->binary = bin_classes;
 	Py_DECREF(py_bin_classes);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
@@ -627,7 +678,7 @@ except_out:
 err_out:
 	g_slist_free_full(bin_classes, (GDestroyNotify)&g_strfreev);
 	Py_XDECREF(py_bin_classes);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -641,10 +692,10 @@ static int get_logic_output_channels(struct srd_decoder *dec)
 	ssize_t i;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyObject_HasAttrString(dec->py_dec, "logic_output_channels")) {
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return SRD_OK;
 	}
 
@@ -689,7 +740,7 @@ static int get_logic_output_channels(struct srd_decoder *dec)
 	}
 	dec->logic_output_channels = logic_out_chs;
 	Py_DECREF(py_logic_out_chs);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
@@ -700,7 +751,7 @@ except_out:
 err_out:
 	g_slist_free_full(logic_out_chs, &logic_output_channel_free);
 	Py_XDECREF(py_logic_out_chs);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -713,20 +764,20 @@ static int check_method(PyObject *py_dec, const char *mod_name,
 	int is_callable;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	py_method = PyObject_GetAttrString(py_dec, method_name);
 	if (!py_method) {
 		srd_exception_catch("Protocol decoder %s Decoder class "
 				"has no %s() method", mod_name, method_name);
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return SRD_ERR_PYTHON;
 	}
 
 	is_callable = PyCallable_Check(py_method);
 	Py_DECREF(py_method);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	if (!is_callable) {
 		srd_err("Protocol decoder %s Decoder class attribute '%s' "
@@ -755,14 +806,14 @@ SRD_PRIV long srd_decoder_apiver(const struct srd_decoder *d)
 	if (!d)
 		return 0;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	py_apiver = PyObject_GetAttrString(d->py_dec, "api_version");
 	apiver = (py_apiver && PyLong_Check(py_apiver))
 			? PyLong_AsLong(py_apiver) : 0;
 	Py_XDECREF(py_apiver);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return apiver;
 }
@@ -839,14 +890,13 @@ SRD_API int srd_decoder_load(const char *module_name)
 	if (!module_name)
 		return SRD_ERR_ARG;
 
-	gstate = PyGILState_Ensure();
-
-	if (PyDict_GetItemString(PyImport_GetModuleDict(), module_name)) {
-		/* Module was already imported. */
-		PyGILState_Release(gstate);
+	if (module_loaded(module_name)) {
+		/* Module was already imported (or listed from the cache). */
 		return SRD_OK;
 	}
 
+	gstate = srd_gil_ensure(NULL);
+
 	d = g_malloc0(sizeof(struct srd_decoder));
 	fail_txt = NULL;
 
@@ -1049,7 +1099,7 @@ SRD_API int srd_decoder_load(const char *module_name)
 		goto err_out;
 	}
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	/* Append it to the list of loaded decoders. */
 	pd_list = g_slist_append(pd_list, d);
@@ -1068,11 +1118,109 @@ err_out:
 	if (fail_txt)
 		srd_err("Failed to load decoder %s: %s", module_name, fail_txt);
 	decoder_free(d);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
 
+/**
+ * Import the Python module of a decoder which srd_decoder_load_all()
+ * listed from the metadata cache.
+ *
+ * @param dec The decoder. Must not be NULL.
+ *
+ * @return SRD_OK upon success (or if the module was imported already),
+ *         a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_decoder_import(struct srd_decoder *dec)
+{
+	struct lazy_decoder *lazy;
+	PyObject *py_basedec;
+	int is_subclass;
+	PyGILState_STATE gstate;
+
+	if (!lazy_decoders || !(lazy = g_hash_table_lookup(lazy_decoders, dec)))
+		return SRD_OK;
+
+	srd_dbg("Importing decoder %s.", lazy->module_name);
+
+	gstate = srd_gil_ensure(NULL);
+
+	if (!(dec->py_mod = py_import_by_name(lazy->module_name)))
+		goto except_out;
+
+	if (!mod_sigrokdecode) {
+		srd_err("sigrokdecode module not loaded.");
+		goto err_out;
+	}
+
+	if (!(dec->py_dec = PyObject_GetAttrString(dec->py_mod, "Decoder")))
+		goto except_out;
+
+	if (!(py_basedec = PyObject_GetAttrString(mod_sigrokdecode, "Decoder")))
+		goto except_out;
+	is_subclass = PyObject_IsSubclass(dec->py_dec, py_basedec);
+	Py_DECREF(py_basedec);
+	if (is_subclass < 0)
+		goto except_out;
+	if (!is_subclass) {
+		srd_err("Decoder class in protocol decoder module %s is not "
+			"a subclass of sigrokdecode.Decoder.", lazy->module_name);
+		goto err_out;
+	}
+
+	srd_gil_release(gstate);
+
+	g_hash_table_remove(lazy_decoders, dec);
+
+	return SRD_OK;
+
+except_out:
+	srd_exception_catch("Failed to import decoder %s", lazy->module_name);
+
+err_out:
+	Py_CLEAR(dec->py_dec);
+	Py_CLEAR(dec->py_mod);
+	srd_gil_release(gstate);
+
+	return SRD_ERR_PYTHON;
+}
+
+/**
+ * Return the name of a decoder's Python module.
+ *
+ * @param dec The decoder. Must not be NULL.
+ *
+ * @return A newly allocated string, or NULL upon errors.
+ *
+ * @private
+ */
+SRD_PRIV char *srd_decoder_module_name(const struct srd_decoder *dec)
+{
+	struct lazy_decoder *lazy;
+	const char *name;
+	char *module_name;
+	PyGILState_STATE gstate;
+
+	if (lazy_decoders && (lazy = g_hash_table_lookup(lazy_decoders, dec)))
+		return g_strdup(lazy->module_name);
+
+	gstate = srd_gil_ensure(NULL);
+
+	module_name = NULL;
+	if ((name = PyModule_GetName(dec->py_mod)))
+		module_name = g_strdup(name);
+	else
+		srd_exception_catch("Failed to get the module name of %s",
+				dec->id);
+
+	srd_gil_release(gstate);
+
+	return module_name;
+}
+
 /**
  * Return a protocol decoder's docstring.
  *
@@ -1087,15 +1235,22 @@ SRD_API char *srd_decoder_doc_get(const struct srd_decoder *dec)
 {
 	PyObject *py_str;
 	char *doc;
+	struct lazy_decoder *lazy;
 	PyGILState_STATE gstate;
 
 	if (!srd_check_init())
 		return NULL;
 
-	if (!dec || !dec->py_mod)
+	if (!dec)
 		return NULL;
 
-	gstate = PyGILState_Ensure();
+	if (lazy_decoders && (lazy = g_hash_table_lookup(lazy_decoders, dec)))
+		return g_strdup(lazy->doc);
+
+	if (!dec->py_mod)
+		return NULL;
+
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyObject_HasAttrString(dec->py_mod, "__doc__"))
 		goto err;
@@ -1110,12 +1265,12 @@ SRD_API char *srd_decoder_doc_get(const struct srd_decoder *dec)
 		py_str_as_str(py_str, &doc);
 	Py_DECREF(py_str);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return doc;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return NULL;
 }
@@ -1153,40 +1308,106 @@ SRD_API int srd_decoder_unload(struct srd_decoder *dec)
 
 	/* Remove the PD from the list of loaded decoders. */
 	pd_list = g_slist_remove(pd_list, dec);
+	if (lazy_decoders)
+		g_hash_table_remove(lazy_decoders, dec);
 
 	decoder_free(dec);
 
 	return SRD_OK;
 }
 
-static void srd_decoder_load_all_zip_path(char *zip_path)
+/*
+ * Load a decoder module found in a search path, or list it from the
+ * metadata cache if the cache has an up to date entry.
+ *
+ * This ignores errors returned by srd_decoder_load(). That function
+ * will have logged the cause, but in any case we want to continue.
+ */
+static void decoder_load_or_list(struct srd_decoder_cache *cache,
+		const char *module_name)
 {
-	PyObject *zipimport_mod, *zipimporter_class, *zipimporter;
-	PyObject *prefix_obj, *files, *key, *value, *set, *modname;
-	Py_ssize_t pos = 0;
-	char *prefix;
-	size_t prefix_len;
-	PyGILState_STATE gstate;
+	struct srd_decoder *dec;
+	struct lazy_decoder *lazy;
+	guint num_loaded;
+	char *doc;
 
-	set = files = prefix_obj = zipimporter = zipimporter_class = NULL;
+	if (!cache) {
+		srd_decoder_load(module_name);
+		return;
+	}
+	/* The "common" directory is not a PD, nothing to list. */
+	if (!strcmp(module_name, "common"))
+		return;
+	if (module_loaded(module_name)) {
+		/* Keep it in the cache, even though it's not used. */
+		srd_decoder_cache_lookup(cache, module_name, NULL, NULL);
+		return;
+	}
+	if (srd_decoder_cache_lookup(cache, module_name, &dec, &doc)) {
+		/* Defer the import until an instance gets created. */
+		lazy = g_malloc(sizeof(struct lazy_decoder));
+		lazy->module_name = g_strdup(module_name);
+		lazy->doc = doc;
+		if (!lazy_decoders)
+			lazy_decoders = g_hash_table_new_full(g_direct_hash,
+				g_direct_equal, NULL, lazy_decoder_free);
+		g_hash_table_insert(lazy_decoders, dec, lazy);
+		pd_list = g_slist_append(pd_list, dec);
+		return;
+	}
+	num_loaded = g_slist_length(pd_list);
+	if (srd_decoder_load(module_name) != SRD_OK ||
+			g_slist_length(pd_list) == num_loaded)
+		return;
+	dec = g_slist_last(pd_list)->data;
+	doc = srd_decoder_doc_get(dec);
+	srd_decoder_cache_store(cache, module_name, dec, doc);
+	g_free(doc);
+}
 
-	gstate = PyGILState_Ensure();
+/*
+ * Get the module names from the index which tools/install-decoders
+ * writes into decoder archives, one name per line. Returns FALSE if the
+ * archive has no index.
+ */
+static gboolean zip_index_get(PyObject *zipimporter, const char *prefix,
+		GSList **modules)
+{
+	PyObject *py_data;
+	char *index_path, **lines, *line;
+	int i;
+
+	index_path = g_strconcat(prefix, ZIP_INDEX_NAME, NULL);
+	py_data = PyObject_CallMethod(zipimporter, "get_data", "s", index_path);
+	g_free(index_path);
+	if (!py_data || !PyBytes_Check(py_data)) {
+		Py_XDECREF(py_data);
+		PyErr_Clear();
+		return FALSE;
+	}
 
-	zipimport_mod = py_import_by_name("zipimport");
-	if (zipimport_mod == NULL)
-		goto err_out;
+	lines = g_strsplit(PyBytes_AsString(py_data), "\n", 0);
+	Py_DECREF(py_data);
+	for (i = 0; lines[i]; i++) {
+		line = g_strstrip(lines[i]);
+		if (*line && *line != '#')
+			*modules = g_slist_append(*modules, g_strdup(line));
+	}
+	g_strfreev(lines);
 
-	zipimporter_class = PyObject_GetAttrString(zipimport_mod, "zipimporter");
-	if (zipimporter_class == NULL)
-		goto err_out;
+	return TRUE;
+}
 
-	zipimporter = PyObject_CallFunction(zipimporter_class, "s", zip_path);
-	if (zipimporter == NULL)
-		goto err_out;
+/* Get the module names from the directory listing of an archive. */
+static void zip_files_get(PyObject *zipimporter, const char *prefix,
+		GSList **modules)
+{
+	PyObject *files, *key, *value, *set, *modname;
+	Py_ssize_t pos = 0;
+	size_t prefix_len;
+	char *path, *slash, *modname_str;
 
-	prefix_obj = PyObject_GetAttrString(zipimporter, "prefix");
-	if (prefix_obj == NULL)
-		goto err_out;
+	set = NULL;
 
 	files = PyObject_GetAttrString(zipimporter, "_files");
 	if (files == NULL || !PyDict_Check(files))
@@ -1196,13 +1417,9 @@ static void srd_decoder_load_all_zip_path(char *zip_path)
 	if (set == NULL)
 		goto err_out;
 
-	if (py_str_as_str(prefix_obj, &prefix) != SRD_OK)
-		goto err_out;
-
 	prefix_len = strlen(prefix);
 
 	while (PyDict_Next(files, &pos, &key, &value)) {
-		char *path, *slash;
 		if (py_str_as_str(key, &path) == SRD_OK) {
 			if (strlen(path) > prefix_len
 					&& memcmp(path, prefix, prefix_len) == 0
@@ -1220,33 +1437,82 @@ static void srd_decoder_load_all_zip_path(char *zip_path)
 			g_free(path);
 		}
 	}
-	g_free(prefix);
 
 	while ((modname = PySet_Pop(set))) {
-		char *modname_str;
-		if (py_str_as_str(modname, &modname_str) == SRD_OK) {
-			/* The directory name is the module name (e.g. "i2c"). */
-			srd_decoder_load(modname_str);
-			g_free(modname_str);
-		}
+		if (py_str_as_str(modname, &modname_str) == SRD_OK)
+			*modules = g_slist_append(*modules, modname_str);
 		Py_DECREF(modname);
 	}
 
 err_out:
 	Py_XDECREF(set);
 	Py_XDECREF(files);
+	PyErr_Clear();
+}
+
+static void srd_decoder_load_all_zip_path(char *zip_path)
+{
+	PyObject *zipimport_mod, *zipimporter_class, *zipimporter;
+	PyObject *prefix_obj;
+	struct srd_decoder_cache *cache;
+	GSList *modules, *l;
+	char *prefix;
+	PyGILState_STATE gstate;
+
+	modules = NULL;
+	prefix_obj = zipimporter = zipimporter_class = NULL;
+
+	gstate = srd_gil_ensure(NULL);
+
+	zipimport_mod = py_import_by_name("zipimport");
+	if (zipimport_mod == NULL)
+		goto err_out;
+
+	zipimporter_class = PyObject_GetAttrString(zipimport_mod, "zipimporter");
+	if (zipimporter_class == NULL)
+		goto err_out;
+
+	zipimporter = PyObject_CallFunction(zipimporter_class, "s", zip_path);
+	if (zipimporter == NULL)
+		goto err_out;
+
+	prefix_obj = PyObject_GetAttrString(zipimporter, "prefix");
+	if (prefix_obj == NULL)
+		goto err_out;
+
+	if (py_str_as_str(prefix_obj, &prefix) != SRD_OK)
+		goto err_out;
+
+	/* Archives without an index get listed the slow way. */
+	if (!zip_index_get(zipimporter, prefix, &modules))
+		zip_files_get(zipimporter, prefix, &modules);
+	g_free(prefix);
+
+err_out:
 	Py_XDECREF(prefix_obj);
 	Py_XDECREF(zipimporter);
 	Py_XDECREF(zipimporter_class);
 	Py_XDECREF(zipimport_mod);
 	PyErr_Clear();
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
+
+	if (!modules)
+		return;
+
+	cache = srd_decoder_cache_open(zip_path);
+	for (l = modules; l; l = l->next) {
+		/* The directory name is the module name (e.g. "i2c"). */
+		decoder_load_or_list(cache, l->data);
+	}
+	srd_decoder_cache_close(cache);
+	g_slist_free_full(modules, g_free);
 }
 
 static void srd_decoder_load_all_path(char *path)
 {
 	GDir *dir;
 	const gchar *direntry;
+	struct srd_decoder_cache *cache;
 
 	if (!(dir = g_dir_open(path, 0, NULL))) {
 		/* Not really fatal. Try zipimport method too. */
@@ -1254,21 +1520,28 @@ static void srd_decoder_load_all_path(char *path)
 		return;
 	}
 
-	/*
-	 * This ignores errors returned by srd_decoder_load(). That
-	 * function will have logged the cause, but in any case we
-	 * want to continue anyway.
-	 */
+	cache = srd_decoder_cache_open(path);
+
 	while ((direntry = g_dir_read_name(dir)) != NULL) {
 		/* The directory name is the module name (e.g. "i2c"). */
-		srd_decoder_load(direntry);
+		decoder_load_or_list(cache, direntry);
 	}
 	g_dir_close(dir);
+
+	srd_decoder_cache_close(cache);
 }
 
 /**
  * Load all installed protocol decoders.
  *
+ * The metadata of the decoders in a search path directory are kept in a
+ * cache, so that decoders whose files did not change are listed without
+ * importing their Python module. The import is deferred until the first
+ * instance of the decoder is created. The cache is kept in the user's
+ * cache directory, or in the directory which the SIGROKDECODE_CACHE_DIR
+ * environment variable points to. An empty SIGROKDECODE_CACHE_DIR
+ * disables the cache.
+ *
  * @return SRD_OK upon success, a (negative) error code otherwise.
  *
  * @since 0.1.0
@@ -1305,6 +1578,10 @@ SRD_API int srd_decoder_unload_all(void)
 	g_slist_foreach(pd_list, srd_decoder_unload_cb, NULL);
 	g_slist_free(pd_list);
 	pd_list = NULL;
+	if (lazy_decoders) {
+		g_hash_table_destroy(lazy_decoders);
+		lazy_decoders = NULL;
+	}
 
 	return SRD_OK;
 }
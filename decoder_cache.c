@@ -0,0 +1,628 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <config.h>
+#include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
+#include "libsigrokdecode.h"
+#include <glib.h>
+#include <glib/gstdio.h>
+#include <string.h>
+
+/**
+ * @file
+ *
+ * Persistent cache of protocol decoder metadata.
+ *
+ * srd_decoder_load_all() has to import every decoder module to get its
+ * metadata (channels, options, annotation classes, ...), although most
+ * sessions only use a few decoders. The metadata of the decoders in a
+ * search path are kept in a cache file, so that later runs can list the
+ * decoders without importing them. Every decoder's entry is keyed by a
+ * fingerprint of the names, sizes and modification times of its files.
+ * The whole file is keyed by the library and Python versions, and by
+ * the fingerprint of the "common" directory which decoders import from.
+ * For a search path which is a zip archive, the size and modification
+ * time of the archive take the place of all of these fingerprints.
+ *
+ * The cache files are kept in the user's cache directory, or in the
+ * directory which the SIGROKDECODE_CACHE_DIR environment variable points
+ * to. An empty SIGROKDECODE_CACHE_DIR disables the cache.
+ *
+ * @private
+ */
+
+/* The format of the cache files, bump on changes. */
+#define CACHE_FORMAT 1
+
+/*
+ * A decoder: module name, fingerprint, id, name, longname, desc,
+ * license, module docstring, inputs, outputs, tags, channels, optional
+ * channels, annotation classes, annotation rows, binary classes, logic
+ * output channels, options.
+ */
+#define DECODER_TYPE "(sssssssmsasasasa(sss)a(sss)a(ss)a(ssat)a(ss)a(ss)a(smsmvav))"
+
+/* The cache key, and the decoders. */
+#define CACHE_TYPE "(sa" DECODER_TYPE ")"
+
+struct srd_decoder_cache {
+	char *filename;
+	char *key;
+	/* Module name -> decoder entry, as read from the file. */
+	GHashTable *entries;
+	/* Module name -> fingerprint of the module's directory. */
+	GHashTable *fingerprints;
+	/* Module name -> decoder entry, as to be written back. */
+	GHashTable *current;
+	char *path;
+	/* Fingerprint of the archive, NULL for a directory. */
+	char *archive;
+	gboolean dirty;
+};
+
+static int compare_names(gconstpointer a, gconstpointer b)
+{
+	return strcmp(*(const char **)a, *(const char **)b);
+}
+
+/* Add the names, sizes and modification times of a directory's files. */
+static void fingerprint_dir(GString *s, const char *dir_path,
+		const char *prefix)
+{
+	GDir *dir;
+	GPtrArray *names;
+	GStatBuf st;
+	const char *name;
+	char *file, *sub_prefix;
+	guint i;
+
+	if (!(dir = g_dir_open(dir_path, 0, NULL)))
+		return;
+	names = g_ptr_array_new_with_free_func(g_free);
+	while ((name = g_dir_read_name(dir))) {
+		if (strcmp(name, "__pycache__"))
+			g_ptr_array_add(names, g_strdup(name));
+	}
+	g_dir_close(dir);
+	g_ptr_array_sort(names, compare_names);
+
+	for (i = 0; i < names->len; i++) {
+		name = g_ptr_array_index(names, i);
+		file = g_build_filename(dir_path, name, NULL);
+		if (g_stat(file, &st) == 0) {
+			g_string_append_printf(s, "%s%s %" G_GINT64_FORMAT
+				" %" G_GINT64_FORMAT "\n", prefix, name,
+				(gint64)st.st_size, (gint64)st.st_mtime);
+			if (g_file_test(file, G_FILE_TEST_IS_DIR)) {
+				sub_prefix = g_strconcat(prefix, name, "/", NULL);
+				fingerprint_dir(s, file, sub_prefix);
+				g_free(sub_prefix);
+			}
+		}
+		g_free(file);
+	}
+	g_ptr_array_free(names, TRUE);
+}
+
+/* Fingerprint of a directory, NULL if it's not a directory. */
+static char *fingerprint(const char *dir_path)
+{
+	GString *s;
+	char *sum;
+
+	if (!g_file_test(dir_path, G_FILE_TEST_IS_DIR))
+		return NULL;
+
+	s = g_string_new(NULL);
+	fingerprint_dir(s, dir_path, "");
+	sum = g_compute_checksum_for_string(G_CHECKSUM_SHA1, s->str, s->len);
+	g_string_free(s, TRUE);
+
+	return sum;
+}
+
+/* Fingerprint of an archive file. */
+static char *fingerprint_archive(const char *file_path)
+{
+	GStatBuf st;
+
+	if (g_stat(file_path, &st) != 0)
+		return NULL;
+
+	return g_strdup_printf("%" G_GINT64_FORMAT " %" G_GINT64_FORMAT,
+			(gint64)st.st_size, (gint64)st.st_mtime);
+}
+
+static char *cache_filename(const char *path)
+{
+	const char *dir;
+	char *sum, *name, *filename;
+
+	dir = g_getenv("SIGROKDECODE_CACHE_DIR");
+	if (dir && !*dir)
+		return NULL;
+
+	sum = g_compute_checksum_for_string(G_CHECKSUM_SHA1, path, -1);
+	name = g_strdup_printf("decoders-%s.cache", sum);
+	if (dir)
+		filename = g_build_filename(dir, name, NULL);
+	else
+		filename = g_build_filename(g_get_user_cache_dir(),
+				"libsigrokdecode", name, NULL);
+	g_free(name);
+	g_free(sum);
+
+	return filename;
+}
+
+/**
+ * Open the metadata cache of a decoder search path.
+ *
+ * @param path The search path, a directory or a zip archive.
+ *
+ * @return The cache, or NULL if the cache is disabled.
+ *
+ * @private
+ */
+SRD_PRIV struct srd_decoder_cache *srd_decoder_cache_open(const char *path)
+{
+	struct srd_decoder_cache *cache;
+	GVariant *file, *entries, *entry;
+	GVariantIter iter;
+	const char *key, *module_name;
+	char *filename, *dir, *common, *contents;
+	gsize len;
+
+	if (!(filename = cache_filename(path)))
+		return NULL;
+
+	cache = g_malloc0(sizeof(struct srd_decoder_cache));
+	cache->filename = filename;
+	cache->path = g_strdup(path);
+	if (g_file_test(path, G_FILE_TEST_IS_REGULAR)) {
+		cache->archive = fingerprint_archive(path);
+		common = g_strdup(cache->archive);
+	} else {
+		dir = g_build_filename(path, "common", NULL);
+		common = fingerprint(dir);
+		g_free(dir);
+	}
+	cache->key = g_strdup_printf("%d %s %s %s %s", CACHE_FORMAT,
+			SRD_PACKAGE_VERSION_STRING, PY_VERSION, path,
+			common ? common : "");
+	g_free(common);
+	cache->entries = g_hash_table_new_full(g_str_hash, g_str_equal,
+			NULL, (GDestroyNotify)g_variant_unref);
+	cache->fingerprints = g_hash_table_new_full(g_str_hash, g_str_equal,
+			g_free, g_free);
+	cache->current = g_hash_table_new_full(g_str_hash, g_str_equal,
+			NULL, (GDestroyNotify)g_variant_unref);
+
+	if (!g_file_get_contents(filename, &contents, &len, NULL))
+		return cache;
+
+	file = g_variant_new_from_data(G_VARIANT_TYPE(CACHE_TYPE), contents,
+			len, FALSE, g_free, contents);
+	g_variant_ref_sink(file);
+	g_variant_get(file, "(&s@a" DECODER_TYPE ")", &key, &entries);
+	if (!strcmp(key, cache->key)) {
+		g_variant_iter_init(&iter, entries);
+		while ((entry = g_variant_iter_next_value(&iter))) {
+			/* The key points into the entry. */
+			g_variant_get_child(entry, 0, "&s", &module_name);
+			g_hash_table_replace(cache->entries,
+				(char *)module_name, entry);
+		}
+	} else {
+		srd_dbg("Decoder metadata cache %s is outdated.", filename);
+	}
+	g_variant_unref(entries);
+	g_variant_unref(file);
+
+	return cache;
+}
+
+/* Get the list of strings of a GVariant "as" iterator. */
+static GSList *strlist_get(GVariantIter *iter)
+{
+	GSList *list;
+	const char *s;
+
+	list = NULL;
+	while (g_variant_iter_next(iter, "&s", &s))
+		list = g_slist_append(list, g_strdup(s));
+	g_variant_iter_free(iter);
+
+	return list;
+}
+
+static GSList *channels_get(GVariantIter *iter, int offset)
+{
+	struct srd_channel *pdch;
+	GSList *list;
+	const char *id, *name, *desc;
+
+	list = NULL;
+	while (g_variant_iter_next(iter, "(&s&s&s)", &id, &name, &desc)) {
+		pdch = g_malloc(sizeof(struct srd_channel));
+		pdch->id = g_strdup(id);
+		pdch->name = g_strdup(name);
+		pdch->desc = g_strdup(desc);
+		pdch->order = offset++;
+		list = g_slist_append(list, pdch);
+	}
+	g_variant_iter_free(iter);
+
+	return list;
+}
+
+/* Get a list of string pairs (char **) of a GVariant "a(ss)" iterator. */
+static GSList *pairs_get(GVariantIter *iter)
+{
+	GSList *list;
+	const char *s1, *s2;
+	char **pair;
+
+	list = NULL;
+	while (g_variant_iter_next(iter, "(&s&s)", &s1, &s2)) {
+		pair = g_malloc0(3 * sizeof(char *));
+		pair[0] = g_strdup(s1);
+		pair[1] = g_strdup(s2);
+		list = g_slist_append(list, pair);
+	}
+	g_variant_iter_free(iter);
+
+	return list;
+}
+
+static GSList *annotation_rows_get(GVariantIter *iter)
+{
+	struct srd_decoder_annotation_row *ann_row;
+	GVariantIter *classes;
+	GSList *list;
+	const char *id, *desc;
+	guint64 class_idx;
+
+	list = NULL;
+	while (g_variant_iter_next(iter, "(&s&sat)", &id, &desc, &classes)) {
+		ann_row = g_malloc0(sizeof(struct srd_decoder_annotation_row));
+		ann_row->id = g_strdup(id);
+		ann_row->desc = g_strdup(desc);
+		while (g_variant_iter_next(classes, "t", &class_idx))
+			ann_row->ann_classes = g_slist_append(ann_row->ann_classes,
+				GSIZE_TO_POINTER(class_idx));
+		g_variant_iter_free(classes);
+		list = g_slist_append(list, ann_row);
+	}
+	g_variant_iter_free(iter);
+
+	return list;
+}
+
+static GSList *logic_output_channels_get(GVariantIter *iter)
+{
+	struct srd_decoder_logic_output_channel *logic_out_ch;
+	GSList *list;
+	const char *id, *desc;
+
+	list = NULL;
+	while (g_variant_iter_next(iter, "(&s&s)", &id, &desc)) {
+		logic_out_ch = g_malloc0(sizeof(*logic_out_ch));
+		logic_out_ch->id = g_strdup(id);
+		logic_out_ch->desc = g_strdup(desc);
+		list = g_slist_append(list, logic_out_ch);
+	}
+	g_variant_iter_free(iter);
+
+	return list;
+}
+
+static GSList *options_get(GVariantIter *iter)
+{
+	struct srd_decoder_option *o;
+	GVariantIter *values;
+	GVariant *value;
+	GSList *list;
+	const char *id, *desc;
+
+	list = NULL;
+	while (g_variant_iter_next(iter, "(&sm&smvav)", &id, &desc,
+			&value, &values)) {
+		o = g_malloc0(sizeof(struct srd_decoder_option));
+		o->id = g_strdup(id);
+		o->desc = g_strdup(desc);
+		o->def = value;
+		while (g_variant_iter_next(values, "v", &value))
+			o->values = g_slist_append(o->values, value);
+		g_variant_iter_free(values);
+		list = g_slist_append(list, o);
+	}
+	g_variant_iter_free(iter);
+
+	return list;
+}
+
+/**
+ * Look up a decoder in the metadata cache.
+ *
+ * The entry is kept in the cache if it's up to date, even if the
+ * caller does not use it.
+ *
+ * @param cache The cache. Must not be NULL.
+ * @param module_name The module name of the decoder.
+ * @param dec If not NULL, will be set to a newly allocated decoder with
+ *            the cached metadata, which has no Python module yet.
+ * @param doc If not NULL, will be set to a newly allocated copy of the
+ *            module's docstring, or NULL if it has none.
+ *
+ * @return TRUE if the cache has up to date metadata of the decoder.
+ *
+ * @private
+ */
+SRD_PRIV gboolean srd_decoder_cache_lookup(struct srd_decoder_cache *cache,
+		const char *module_name, struct srd_decoder **dec, char **doc)
+{
+	struct srd_decoder *d;
+	GVariant *entry;
+	GVariantIter *inputs, *outputs, *tags, *channels, *opt_channels;
+	GVariantIter *annotations, *annotation_rows, *binary;
+	GVariantIter *logic_output_channels, *options;
+	const char *key, *fp;
+	char *dir, *dir_fp;
+
+	if (cache->archive) {
+		dir_fp = g_strdup(cache->archive);
+	} else {
+		dir = g_build_filename(cache->path, module_name, NULL);
+		dir_fp = fingerprint(dir);
+		g_free(dir);
+	}
+	if (!dir_fp)
+		return FALSE;
+	g_hash_table_replace(cache->fingerprints, g_strdup(module_name), dir_fp);
+
+	if (!(entry = g_hash_table_lookup(cache->entries, module_name)))
+		return FALSE;
+	g_variant_get_child(entry, 1, "&s", &fp);
+	if (strcmp(fp, dir_fp))
+		return FALSE;
+
+	g_variant_get_child(entry, 0, "&s", &key);
+	g_hash_table_replace(cache->current, (char *)key, g_variant_ref(entry));
+
+	if (doc)
+		g_variant_get_child(entry, 7, "ms", doc);
+	if (!dec)
+		return TRUE;
+
+	d = g_malloc0(sizeof(struct srd_decoder));
+	g_variant_get(entry, DECODER_TYPE, NULL, NULL, &d->id, &d->name,
+		&d->longname, &d->desc, &d->license, NULL, &inputs, &outputs,
+		&tags, &channels, &opt_channels, &annotations, &annotation_rows,
+		&binary, &logic_output_channels, &options);
+	d->inputs = strlist_get(inputs);
+	d->outputs = strlist_get(outputs);
+	d->tags = strlist_get(tags);
+	d->channels = channels_get(channels, 0);
+	d->opt_channels = channels_get(opt_channels,
+			g_slist_length(d->channels));
+	d->annotations = pairs_get(annotations);
+	d->annotation_rows = annotation_rows_get(annotation_rows);
+	d->binary = pairs_get(binary);
+	d->logic_output_channels = logic_output_channels_get(
+			logic_output_channels);
+	d->options = options_get(options);
+	*dec = d;
+
+	return TRUE;
+}
+
+static GVariant *strlist_value(const GSList *list)
+{
+	GVariantBuilder b;
+
+	g_variant_builder_init(&b, G_VARIANT_TYPE("as"));
+	for (; list; list = list->next)
+		g_variant_builder_add(&b, "s", list->data);
+
+	return g_variant_builder_end(&b);
+}
+
+static GVariant *channels_value(const GSList *list)
+{
+	const struct srd_channel *pdch;
+	GVariantBuilder b;
+
+	g_variant_builder_init(&b, G_VARIANT_TYPE("a(sss)"));
+	for (; list; list = list->next) {
+		pdch = list->data;
+		g_variant_builder_add(&b, "(sss)", pdch->id, pdch->name,
+			pdch->desc);
+	}
+
+	return g_variant_builder_end(&b);
+}
+
+static GVariant *pairs_value(const GSList *list)
+{
+	char **pair;
+	GVariantBuilder b;
+
+	g_variant_builder_init(&b, G_VARIANT_TYPE("a(ss)"));
+	for (; list; list = list->next) {
+		pair = list->data;
+		g_variant_builder_add(&b, "(ss)", pair[0], pair[1]);
+	}
+
+	return g_variant_builder_end(&b);
+}
+
+static GVariant *annotation_rows_value(const GSList *list)
+{
+	const struct srd_decoder_annotation_row *ann_row;
+	GVariantBuilder b, classes;
+	const GSList *l;
+
+	g_variant_builder_init(&b, G_VARIANT_TYPE("a(ssat)"));
+	for (; list; list = list->next) {
+		ann_row = list->data;
+		g_variant_builder_init(&classes, G_VARIANT_TYPE("at"));
+		for (l = ann_row->ann_classes; l; l = l->next)
+			g_variant_builder_add(&classes, "t",
+				(guint64)GPOINTER_TO_SIZE(l->data));
+		g_variant_builder_add(&b, "(ss@at)", ann_row->id,
+			ann_row->desc, g_variant_builder_end(&classes));
+	}
+
+	return g_variant_builder_end(&b);
+}
+
+static GVariant *logic_output_channels_value(const GSList *list)
+{
+	const struct srd_decoder_logic_output_channel *logic_out_ch;
+	GVariantBuilder b;
+
+	g_variant_builder_init(&b, G_VARIANT_TYPE("a(ss)"));
+	for (; list; list = list->next) {
+		logic_out_ch = list->data;
+		g_variant_builder_add(&b, "(ss)", logic_out_ch->id,
+			logic_out_ch->desc);
+	}
+
+	return g_variant_builder_end(&b);
+}
+
+static GVariant *options_value(const GSList *list)
+{
+	const struct srd_decoder_option *o;
+	GVariantBuilder b, values;
+	const GSList *l;
+
+	g_variant_builder_init(&b, G_VARIANT_TYPE("a(smsmvav)"));
+	for (; list; list = list->next) {
+		o = list->data;
+		g_variant_builder_init(&values, G_VARIANT_TYPE("av"));
+		for (l = o->values; l; l = l->next)
+			g_variant_builder_add(&values, "v", l->data);
+		g_variant_builder_add(&b, "(smsmv@av)", o->id, o->desc,
+			o->def, g_variant_builder_end(&values));
+	}
+
+	return g_variant_builder_end(&b);
+}
+
+/**
+ * Store the metadata of a decoder in the metadata cache.
+ *
+ * This has no effect unless srd_decoder_cache_lookup() was called for
+ * the decoder first. That way, the cache gets the fingerprint of the
+ * decoder's files as they were before the module was imported.
+ *
+ * @param cache The cache. Must not be NULL.
+ * @param module_name The module name of the decoder.
+ * @param dec The decoder. Must not be NULL.
+ * @param doc The module's docstring, or NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_decoder_cache_store(struct srd_decoder_cache *cache,
+		const char *module_name, const struct srd_decoder *dec,
+		const char *doc)
+{
+	GVariant *entry;
+	const char *fp, *key;
+
+	if (!(fp = g_hash_table_lookup(cache->fingerprints, module_name)))
+		return;
+
+	entry = g_variant_new("(sssssssms@as@as@as@a(sss)@a(sss)@a(ss)"
+		"@a(ssat)@a(ss)@a(ss)@a(smsmvav))", module_name, fp,
+		dec->id, dec->name, dec->longname, dec->desc, dec->license,
+		doc, strlist_value(dec->inputs), strlist_value(dec->outputs),
+		strlist_value(dec->tags), channels_value(dec->channels),
+		channels_value(dec->opt_channels),
+		pairs_value(dec->annotations),
+		annotation_rows_value(dec->annotation_rows),
+		pairs_value(dec->binary),
+		logic_output_channels_value(dec->logic_output_channels),
+		options_value(dec->options));
+	g_variant_ref_sink(entry);
+	g_variant_get_child(entry, 0, "&s", &key);
+	g_hash_table_replace(cache->current, (char *)key, entry);
+	cache->dirty = TRUE;
+}
+
+static void cache_write(struct srd_decoder_cache *cache)
+{
+	GVariantBuilder b;
+	GHashTableIter iter;
+	GVariant *file, *entry;
+	GError *error;
+	char *dir;
+
+	g_variant_builder_init(&b, G_VARIANT_TYPE("a" DECODER_TYPE));
+	g_hash_table_iter_init(&iter, cache->current);
+	while (g_hash_table_iter_next(&iter, NULL, (gpointer *)&entry))
+		g_variant_builder_add_value(&b, entry);
+	file = g_variant_ref_sink(g_variant_new("(s@a" DECODER_TYPE ")",
+		cache->key, g_variant_builder_end(&b)));
+
+	error = NULL;
+	dir = g_path_get_dirname(cache->filename);
+	if (g_mkdir_with_parents(dir, 0755) != 0 ||
+			!g_file_set_contents(cache->filename,
+				g_variant_get_data(file),
+				g_variant_get_size(file), &error)) {
+		srd_dbg("Cannot write decoder metadata cache %s: %s.",
+			cache->filename, error ? error->message : "no directory");
+		if (error)
+			g_error_free(error);
+	} else {
+		srd_dbg("Wrote decoder metadata cache %s.", cache->filename);
+	}
+	g_free(dir);
+	g_variant_unref(file);
+}
+
+/**
+ * Close a metadata cache.
+ *
+ * The cache file gets rewritten if decoders were stored, or if some
+ * cached decoders were not looked up (because they were removed).
+ *
+ * @param cache The cache. May be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_decoder_cache_close(struct srd_decoder_cache *cache)
+{
+	if (!cache)
+		return;
+
+	if (cache->dirty || g_hash_table_size(cache->current) !=
+			g_hash_table_size(cache->entries))
+		cache_write(cache);
+
+	g_hash_table_destroy(cache->current);
+	g_hash_table_destroy(cache->fingerprints);
+	g_hash_table_destroy(cache->entries);
+	g_free(cache->key);
+	g_free(cache->archive);
+	g_free(cache->path);
+	g_free(cache->filename);
+	g_free(cache);
+}
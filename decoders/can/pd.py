@@ -18,6 +18,7 @@
 ## along with this program; if not, see <http://www.gnu.org/licenses/>.
 ##
 
+from common.crc import CRC15_CAN, CRC17_CAN_FD, CRC21_CAN_FD
 from common.srdhelper import bitpack_msb
 import sigrokdecode as srd
 
@@ -160,6 +161,11 @@ def is_stuff_bit(self):
         # But not in the CRC delimiter, ACK, and end of frame fields.
         if len(self.bits) > self.last_databit + 17:
             return False
+        # CAN FD uses fixed stuff bits in the CRC field instead, which
+        # are part of the CRC sequence. The first one follows the data
+        # field, and replaces a dynamic stuff bit after 5 equal bits.
+        if self.fd and len(self.bits) > self.last_databit + 1:
+            return False
         last_6_bits = self.rawbits[-6:]
         if last_6_bits not in ([0, 0, 0, 0, 0, 1], [1, 1, 1, 1, 1, 0]):
             return False
@@ -169,7 +175,19 @@ def is_stuff_bit(self):
         return True
 
     def is_valid_crc(self, crc_bits):
-        return True # TODO
+        if not self.fd:
+            # CRC-15 over SOF to the end of the data field, no stuff bits.
+            crc = CRC15_CAN.calc_bits(self.bits[:self.last_databit + 1])
+            return crc == bitpack_msb(crc_bits)
+
+        # CAN FD (ISO 11898-1:2015): The CRC also covers the dynamic stuff
+        # bits and the stuff count. A fixed stuff bit precedes the stuff
+        # count and follows every fourth bit of the CRC field.
+        field = [b for i, b in enumerate(crc_bits) if i % 5]
+        crc = CRC17_CAN_FD if len(field) == 4 + 17 else CRC21_CAN_FD
+        reg = crc.update_bits(self.rawbits[:self.crc_rawbit])
+        reg = crc.update_bits(field[:4], reg)
+        return crc.finish(reg) == bitpack_msb(field[4:])
 
     def decode_error_frame(self, bits):
         pass # TODO
@@ -185,8 +203,9 @@ def decode_frame_end(self, can_rx, bitnum):
         # Remember start of CRC sequence (see below).
         if bitnum == (self.last_databit + 1):
             self.ss_block = self.samplenum
+            self.crc_rawbit = len(self.rawbits) - 1
             if self.fd:
-                if dlc2len(self.dlc) < 16:
+                if dlc2len(self.dlc) <= 16:
                     self.crc_len = 27 # 17 + SBC + stuff bits
                 else:
                     self.crc_len = 32 # 21 + SBC + stuff bits
@@ -196,7 +215,7 @@ def decode_frame_end(self, can_rx, bitnum):
         # CRC sequence (15 bits, 17 bits or 21 bits)
         elif bitnum == (self.last_databit + self.crc_len):
             if self.fd:
-                if dlc2len(self.dlc) < 16:
+                if dlc2len(self.dlc) <= 16:
                     crc_type = "CRC-17"
                 else:
                     crc_type = "CRC-21"
@@ -206,8 +225,8 @@ def decode_frame_end(self, can_rx, bitnum):
             x = self.last_databit + 1
             crc_bits = self.bits[x:x + self.crc_len + 1]
             self.crc = bitpack_msb(crc_bits)
-            self.putb([11, ['%s sequence: 0x%04x' % (crc_type, self.crc),
-                            '%s: 0x%04x' % (crc_type, self.crc), '%s' % crc_type]])
+            self.putb([11, ['{} sequence: 0x{:04x}', '{}: 0x{:04x}', '{}'],
+                       (crc_type, self.crc)])
             if not self.is_valid_crc(crc_bits):
                 self.putb([16, ['CRC is invalid']])
 
@@ -224,7 +243,7 @@ def decode_frame_end(self, can_rx, bitnum):
         # ACK slot bit (dominant: ACK, recessive: NACK)
         elif bitnum == (self.last_databit + self.crc_len + 2):
             ack = 'ACK' if can_rx == 0 else 'NACK'
-            self.putx([13, ['ACK slot: %s' % ack, 'ACK s: %s' % ack, 'ACK s']])
+            self.putx([13, ['ACK slot: {}', 'ACK s: {}', 'ACK s'], (ack,)])
 
         # ACK delimiter bit (recessive)
         elif bitnum == (self.last_databit + self.crc_len + 3):
@@ -296,8 +315,8 @@ def decode_standard_frame(self, can_rx, bitnum):
         # Bits 15-18: Data length code (DLC), in number of bytes (0-8).
         elif bitnum == self.dlc_start + 3:
             self.dlc = bitpack_msb(self.bits[self.dlc_start:self.dlc_start + 4])
-            self.putb([10, ['Data length code: %d' % self.dlc,
-                            'DLC: %d' % self.dlc, 'DLC']])
+            self.putb([10, ['Data length code: {}', 'DLC: {}', 'DLC'],
+                       (self.dlc,)])
             self.last_databit = self.dlc_start + 3 + (dlc2len(self.dlc) * 8)
             if self.dlc > 8 and not self.fd:
                 self.putb([16, ['Data length code (DLC) > 8 is not allowed']])
@@ -316,8 +335,9 @@ def decode_standard_frame(self, can_rx, bitnum):
                 self.frame_bytes.append(b)
                 ss = self.ss_databytebits[i * 8]
                 es = self.ss_databytebits[((i + 1) * 8) - 1]
-                self.putg(ss, es, [0, ['Data byte %d: 0x%02x' % (i, b),
-                                       'DB %d: 0x%02x' % (i, b), 'DB']])
+                if self.ann_enabled(0):
+                    self.putg(ss, es, [0, ['Data byte %d: 0x%02x' % (i, b),
+                                           'DB %d: 0x%02x' % (i, b), 'DB']])
             self.ss_databytebits = []
 
         elif bitnum > self.last_databit:
@@ -337,18 +357,18 @@ def decode_extended_frame(self, can_rx, bitnum):
         # Bits 14-31: Extended identifier (EID[17..0])
         elif bitnum == 31:
             self.eid = bitpack_msb(self.bits[14:])
-            s = '%d (0x%x)' % (self.eid, self.eid)
-            self.putb([4, ['Extended Identifier: %s' % s,
-                           'Extended ID: %s' % s, 'Extended ID', 'EID']])
+            self.putb([4, ['Extended Identifier: {0} (0x{0:x})',
+                           'Extended ID: {0} (0x{0:x})', 'Extended ID', 'EID'],
+                       (self.eid,)])
 
             self.fullid = self.ident << 18 | self.eid
-            s = '%d (0x%x)' % (self.fullid, self.fullid)
-            self.putb([5, ['Full Identifier: %s' % s, 'Full ID: %s' % s,
-                           'Full ID', 'FID']])
+            self.putb([5, ['Full Identifier: {0} (0x{0:x})',
+                           'Full ID: {0} (0x{0:x})', 'Full ID', 'FID'],
+                       (self.fullid,)])
 
             # Bit 12: Substitute remote request (SRR) bit
-            self.put12([9, ['Substitute remote request: %d' % self.bits[12],
-                            'SRR: %d' % self.bits[12], 'SRR']])
+            self.put12([9, ['Substitute remote request: {}', 'SRR: {}', 'SRR'],
+                        (self.bits[12],)])
 
         # Bit 32: Remote transmission request (RTR) bit
         # Data frame: dominant, remote frame: recessive
@@ -398,8 +418,8 @@ def decode_extended_frame(self, can_rx, bitnum):
         # Bits 35-38: Data length code (DLC), in number of bytes (0-8).
         elif bitnum == self.dlc_start + 3:
             self.dlc = bitpack_msb(self.bits[self.dlc_start:self.dlc_start + 4])
-            self.putb([10, ['Data length code: %d' % self.dlc,
-                            'DLC: %d' % self.dlc, 'DLC']])
+            self.putb([10, ['Data length code: {}', 'DLC: {}', 'DLC'],
+                       (self.dlc,)])
             self.last_databit = self.dlc_start + 3 + (dlc2len(self.dlc) * 8)
 
         # Remember all databyte bits, except the very last one.
@@ -416,8 +436,9 @@ def decode_extended_frame(self, can_rx, bitnum):
                 self.frame_bytes.append(b)
                 ss = self.ss_databytebits[i * 8]
                 es = self.ss_databytebits[((i + 1) * 8) - 1]
-                self.putg(ss, es, [0, ['Data byte %d: 0x%02x' % (i, b),
-                                       'DB %d: 0x%02x' % (i, b), 'DB']])
+                if self.ann_enabled(0):
+                    self.putg(ss, es, [0, ['Data byte %d: 0x%02x' % (i, b),
+                                           'DB %d: 0x%02x' % (i, b), 'DB']])
             self.ss_databytebits = []
 
         elif bitnum > self.last_databit:
@@ -440,10 +461,11 @@ def handle_bit(self, can_rx):
 
         # If this is a stuff bit, remove it from self.bits and ignore it.
         if self.is_stuff_bit():
-            self.putx([15, [str(can_rx)]])
+            if self.ann_enabled(15):
+                self.putx([15, [str(can_rx)]])
             self.curbit += 1 # Increase self.curbit (bitnum is not affected).
             return
-        else:
+        elif self.ann_enabled(17):
             self.putx([17, [str(can_rx)]])
 
         # Bit 0: Start of frame (SOF) bit
@@ -464,8 +486,8 @@ def handle_bit(self, can_rx):
             # part of its boiler plate!
             self.ident = bitpack_msb(self.bits[1:])
             self.fullid = self.ident
-            s = '%d (0x%x)' % (self.ident, self.ident),
-            self.putb([3, ['Identifier: %s' % s, 'ID: %s' % s, 'ID']])
+            self.putb([3, ['Identifier: {0} (0x{0:x})', 'ID: {0} (0x{0:x})',
+                           'ID'], (self.ident,)])
             if (self.ident & 0x7f0) == 0x7f0:
                 self.putb([16, ['Identifier bits 10..4 must not be all recessive']])
 
@@ -478,8 +500,8 @@ def handle_bit(self, can_rx):
         # Standard frame: dominant, extended frame: recessive
         elif bitnum == 13:
             ide = self.frame_type = 'standard' if can_rx == 0 else 'extended'
-            self.putx([6, ['Identifier extension bit: %s frame' % ide,
-                           'IDE: %s frame' % ide, 'IDE']])
+            self.putx([6, ['Identifier extension bit: {} frame',
+                           'IDE: {} frame', 'IDE'], (ide,)])
 
         # Bits 14-X: Frame-type dependent, passed to the resp. handlers.
         elif bitnum >= 14:
@@ -501,18 +523,24 @@ def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
 
+        # The conditions get reused for every bit, compile them once.
+        cond_dominant = self.compile_conditions({0: 'l'})
+        cond_bit = self.compile_conditions([{'skip': 0}, {0: 'f'}])
+
         while True:
             # State machine.
             if self.state == 'IDLE':
+                # The bus is free, decoding can resume from here.
+                self.checkpoint()
                 # Wait for a dominant state (logic 0) on the bus.
-                (can_rx,) = self.wait({0: 'l'})
+                (can_rx,) = yield cond_dominant
                 self.sof = self.samplenum
                 self.dom_edge_seen(force = True)
                 self.state = 'GET BITS'
             elif self.state == 'GET BITS':
                 # Wait until we're in the correct bit/sampling position.
                 pos = self.get_sample_point(self.curbit)
-                (can_rx,) = self.wait([{'skip': pos - self.samplenum}, {0: 'f'}])
+                (can_rx,) = yield self.wait(cond_bit, skip=pos - self.samplenum)
                 if self.matched[1]:
                     self.dom_edge_seen()
                 if self.matched[0]:
@@ -0,0 +1,164 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2026 The libsigrokdecode project
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+# This module contains a table driven CRC implementation for any width,
+# polynomial, initial value, bit order and final XOR value (the usual
+# "Rocksoft" parameters), and the CRCs which are used by decoders.
+
+__all__ = [
+    'reflect', 'Crc',
+    'CRC5_USB', 'CRC16_USB', 'CRC16_MODBUS', 'CRC16_MAXIM', 'CRC8_PJON',
+    'CRC32', 'CRC15_CAN', 'CRC17_CAN_FD', 'CRC21_CAN_FD', 'CRC7_SD',
+    'CRC16_SD',
+]
+
+def reflect(value, width):
+    '''Reverse the order of the lowest 'width' bits of 'value'.'''
+    return int('{:0{}b}'.format(value & ((1 << width) - 1), width)[::-1], 2)
+
+_reflect8 = [reflect(i, 8) for i in range(256)]
+_bit_chars = bytes.maketrans(b'\x00\x01', b'01')
+
+# Lookup tables are shared by all CRCs with the same register layout.
+_tables = {}
+
+class Crc:
+    '''A CRC algorithm.
+
+    CRCs can be computed in one go by calc() over bytes, calc_bits() over
+    a bit sequence, or calc_int() over the bits of an integer. They can
+    also be computed incrementally: update*() take the register value of
+    the previous call (or start from scratch without one) and return the
+    new register value, finish() turns the register into the CRC value.
+
+    Bit sequences are taken in transmission order, that is the order in
+    which the bits get shifted into the CRC register. For reflected CRCs
+    this is LSB-first for each byte, like on the wire for USB.
+    '''
+
+    def __init__(self, width, poly, init=0, refin=False, refout=False,
+                 xorout=0):
+        self.width, self.poly = width, poly
+        self.refin, self.refout, self.xorout = refin, refout, xorout
+        if refin:
+            # Reflected register, bits shift towards the LSB.
+            self._shift = 0
+            self._mask = (1 << width) - 1
+            self._poly = reflect(poly, width)
+            self._init = reflect(init, width)
+        else:
+            # The register is at least 8 bits wide, with narrower
+            # CRCs in the upper bits, so that bytes line up with it.
+            self._shift = max(8 - width, 0)
+            self._mask = (1 << (width + self._shift)) - 1
+            self._poly = poly << self._shift
+            self._init = init << self._shift
+        self._top = (width + self._shift) - 1
+        key = (width, poly, refin)
+        if key not in _tables:
+            _tables[key] = [self._update_bits_slow(b, 8, 0) for b in range(256)]
+        self._table = _tables[key]
+
+    def _update_bits_slow(self, value, nbits, reg):
+        # Bit at a time, 'nbits' of 'value' in transmission order, that
+        # is MSB-first (non-reflected) or LSB-first (reflected).
+        poly, mask, top = self._poly, self._mask, self._top
+        if self.refin:
+            reg ^= value
+            for _ in range(nbits):
+                reg = (reg >> 1) ^ poly if reg & 1 else reg >> 1
+            return reg
+        reg ^= value << (top - 7)
+        for _ in range(nbits):
+            reg = ((reg << 1) & mask) ^ poly if reg >> top else reg << 1
+        return reg
+
+    def update(self, data, reg=None):
+        '''Feed bytes into the CRC register.'''
+        if reg is None:
+            reg = self._init
+        table = self._table
+        if self.refin:
+            for b in data:
+                reg = (reg >> 8) ^ table[(reg ^ b) & 0xff]
+        else:
+            mask, top = self._mask, self._top - 7
+            for b in data:
+                reg = ((reg << 8) & mask) ^ table[(reg >> top) ^ b]
+        return reg
+
+    def update_int(self, value, nbits, reg=None):
+        '''Feed the lowest 'nbits' of an integer (MSB-first) into the CRC register.'''
+        if reg is None:
+            reg = self._init
+        # Odd bits up front one at a time, then whole bytes.
+        head = nbits % 8
+        nbits -= head
+        if head:
+            bits = (value >> nbits) & ((1 << head) - 1)
+            if self.refin:
+                reg = self._update_bits_slow(reflect(bits, head), head, reg)
+            else:
+                for i in range(head - 1, -1, -1):
+                    reg = self._update_bits_slow(((bits >> i) & 1) << 7, 1, reg)
+        if nbits:
+            data = (value & ((1 << nbits) - 1)).to_bytes(nbits // 8, 'big')
+            if self.refin:
+                data = bytes(_reflect8[b] for b in data)
+            reg = self.update(data, reg)
+        return reg
+
+    def update_bits(self, bits, reg=None):
+        '''Feed a sequence of bits (0/1 integers, or a '0'/'1' string) into the CRC register.'''
+        if not isinstance(bits, str):
+            bits = bytes(bits).translate(_bit_chars).decode()
+        if not bits:
+            return self._init if reg is None else reg
+        return self.update_int(int(bits, 2), len(bits), reg)
+
+    def finish(self, reg):
+        '''Get the CRC value of a register value.'''
+        value = reg >> self._shift
+        if self.refin != self.refout:
+            value = reflect(value, self.width)
+        return value ^ self.xorout
+
+    def calc(self, data):
+        '''Calculate the CRC of bytes.'''
+        return self.finish(self.update(data))
+
+    def calc_int(self, value, nbits):
+        '''Calculate the CRC of the lowest 'nbits' of an integer, MSB-first.'''
+        return self.finish(self.update_int(value, nbits))
+
+    def calc_bits(self, bits):
+        '''Calculate the CRC of a sequence of bits.'''
+        return self.finish(self.update_bits(bits))
+
+CRC5_USB = Crc(5, 0x05, 0x1f, True, True, 0x1f)
+CRC16_USB = Crc(16, 0x8005, 0xffff, True, True, 0xffff)
+CRC16_MODBUS = Crc(16, 0x8005, 0xffff, True, True)
+CRC16_MAXIM = Crc(16, 0x8005, 0, True, True, 0xffff)
+CRC8_PJON = Crc(8, 0xe9, 0, True, True)
+CRC32 = Crc(32, 0x04c11db7, 0xffffffff, True, True, 0xffffffff)
+CRC15_CAN = Crc(15, 0x4599)
+CRC17_CAN_FD = Crc(17, 0x1685b, 1 << 16)
+CRC21_CAN_FD = Crc(21, 0x102899, 1 << 20)
+CRC7_SD = Crc(7, 0x09)
+CRC16_SD = Crc(16, 0x1021)
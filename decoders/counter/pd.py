@@ -74,8 +74,8 @@ def metadata(self, key, value):
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
 
-    def putc(self, cls, ss, annlist):
-        self.put(ss, self.samplenum, self.out_ann, [cls, annlist])
+    def putc(self, cls, ss, es, annlist):
+        self.put(ss, es, self.out_ann, [cls, annlist])
 
     def decode(self):
         opt_edge_map = {'rising': 'r', 'falling': 'f', 'any': 'e'}
@@ -103,43 +103,43 @@ def decode(self):
             dead_count = 0
 
         while True:
-            self.wait(condition)
-            now = self.samplenum
-
-            if have_reset and self.matched[cond_reset]:
-                edge_count = int(self.options['edge_off'])
-                edge_start = now
-                word_count = int(self.options['word_off'])
-                word_start = now
-                self.putc(ROW_RESET, now, ['Word reset', 'Reset', 'Rst', 'R'])
-                dead_count = int(self.options['dead_cycles'])
-                continue
-
-            if dead_count:
-                dead_count -= 1
+            samplenums, _, matches = self.wait_many(condition, 1024)
+            for now, match in zip(samplenums, matches):
+
+                if have_reset and match & (1 << cond_reset):
+                    edge_count = int(self.options['edge_off'])
+                    edge_start = now
+                    word_count = int(self.options['word_off'])
+                    word_start = now
+                    self.putc(ROW_RESET, now, now, ['Word reset', 'Reset', 'Rst', 'R'])
+                    dead_count = int(self.options['dead_cycles'])
+                    continue
+
+                if dead_count:
+                    dead_count -= 1
+                    edge_start = now
+                    word_start = now
+                    continue
+
+                # Implementation note: In the absence of a RESET condition
+                # before the first data edge, any arbitrary choice of where
+                # to start the annotation is valid. One may choose to emit a
+                # narrow annotation (where ss=es), or assume that the cycle
+                # which corresponds to the counter value started at sample
+                # number 0. We decided to go with the latter here, to avoid
+                # narrow annotations (see bug #1210). None of this matters in
+                # the presence of a RESET condition in the input stream.
+                if edge_start is None:
+                    edge_start = 0
+                if word_start is None:
+                    word_start = 0
+
+                edge_count += 1
+                self.putc(ROW_EDGE, edge_start, now, ["{:d}".format(edge_count)])
                 edge_start = now
-                word_start = now
-                continue
-
-            # Implementation note: In the absence of a RESET condition
-            # before the first data edge, any arbitrary choice of where
-            # to start the annotation is valid. One may choose to emit a
-            # narrow annotation (where ss=es), or assume that the cycle
-            # which corresponds to the counter value started at sample
-            # number 0. We decided to go with the latter here, to avoid
-            # narrow annotations (see bug #1210). None of this matters in
-            # the presence of a RESET condition in the input stream.
-            if edge_start is None:
-                edge_start = 0
-            if word_start is None:
-                word_start = 0
-
-            edge_count += 1
-            self.putc(ROW_EDGE, edge_start, ["{:d}".format(edge_count)])
-            edge_start = now
-
-            word_edge_count = edge_count - int(self.options['edge_off'])
-            if divider and (word_edge_count % divider) == 0:
-                word_count += 1
-                self.putc(ROW_WORD, word_start, ["{:d}".format(word_count)])
-                word_start = now
+
+                word_edge_count = edge_count - int(self.options['edge_off'])
+                if divider and (word_edge_count % divider) == 0:
+                    word_count += 1
+                    self.putc(ROW_WORD, word_start, now, ["{:d}".format(word_count)])
+                    word_start = now
@@ -19,6 +19,7 @@
 ##
 
 import sigrokdecode as srd
+from common.crc import CRC16_MAXIM
 
 # Dictionary of FUNCTION commands and their names.
 commands_2432 = {
@@ -44,22 +45,6 @@
     0x23: ('DS2433', commands_2433),
 }
 
-# Calculate the CRC-16 checksum.
-# Initial value: 0x0000, xor-in: 0x0000, polynom 0x8005, xor-out: 0xffff.
-def crc16(byte_array):
-    reverse = 0xa001 # Use the reverse polynom to make algo simpler.
-    crc = 0x0000 # Initial value.
-    # Reverse CRC calculation.
-    for byte in byte_array:
-        for bit in range(8):
-            if (byte ^ crc) & 1:
-                crc = (crc >> 1) ^ reverse
-            else:
-                crc >>= 1
-            byte >>= 1
-    crc ^= 0xffff # Invert CRC.
-    return crc
-
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'ds243x'
@@ -143,7 +128,7 @@ def decode(self, ss, es, data):
                 elif 13 == len(self.bytes):
                     self.es = es
                     self.putx([0, ['CRC: '
-                        + ('ok' if crc16(self.bytes[0:11]) == (self.bytes[11]
+                        + ('ok' if CRC16_MAXIM.calc(self.bytes[0:11]) == (self.bytes[11]
                         + (self.bytes[12] << 8)) else 'error')]])
             elif 0xaa == self.bytes[0]: # Read scratchpad
                 if 2 == len(self.bytes):
@@ -167,7 +152,7 @@ def decode(self, ss, es, data):
                 elif 14 == len(self.bytes):
                     self.es = es
                     self.putx([0, ['CRC: '
-                        + ('ok' if crc16(self.bytes[0:12]) == (self.bytes[12]
+                        + ('ok' if CRC16_MAXIM.calc(self.bytes[0:12]) == (self.bytes[12]
                         + (self.bytes[13] << 8)) else 'error')]])
             elif 0x5a == self.bytes[0]: # Load first secret
                 if 2 == len(self.bytes):
@@ -235,7 +220,7 @@ def decode(self, ss, es, data):
                 elif 38 == len(self.bytes):
                     self.es = es
                     self.putx([0, ['CRC: '
-                        + ('ok' if crc16(self.bytes[0:36]) == (self.bytes[36]
+                        + ('ok' if CRC16_MAXIM.calc(self.bytes[0:36]) == (self.bytes[36]
                         + (self.bytes[37] << 8)) else 'error')]])
                 elif 39 == len(self.bytes):
                     self.ss = ss
@@ -249,7 +234,7 @@ def decode(self, ss, es, data):
                 elif 60 == len(self.bytes):
                     self.es = es
                     self.putx([0, ['MAC CRC: '
-                        + ('ok' if crc16(self.bytes[38:58]) == (self.bytes[58]
+                        + ('ok' if CRC16_MAXIM.calc(self.bytes[38:58]) == (self.bytes[58]
                         + (self.bytes[59] << 8)) else 'error')]])
                 elif 60 < len(self.bytes):
                     self.ss, self.es = ss, es
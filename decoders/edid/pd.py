@@ -27,7 +27,7 @@
 
 import sigrokdecode as srd
 from common.srdhelper import SrdIntEnum
-import os
+import pkgutil
 
 St = SrdIntEnum.from_str('St', 'OFFSET EXTENSIONS HEADER EDID')
 
@@ -276,9 +276,13 @@ def ann_field(self, start, end, annotation):
                  self.out_ann, [ANN_FIELDS, annotation])
 
     def lookup_pnpid(self, pnpid):
-        pnpid_file = os.path.join(os.path.dirname(__file__), 'pnpids.txt')
-        if os.path.exists(pnpid_file):
-            for line in open(pnpid_file).readlines():
+        # Also works when the decoders are installed as a zip archive.
+        try:
+            pnpids = pkgutil.get_data(__package__, 'pnpids.txt')
+        except OSError:
+            pnpids = None
+        if pnpids:
+            for line in pnpids.decode().splitlines():
                 if line.find(pnpid + ';') == 0:
                     return line[4:].strip()
         return ''
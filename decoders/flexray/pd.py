@@ -18,6 +18,7 @@
 ##
 
 import sigrokdecode as srd
+from common.crc import Crc
 
 # Selection of constants as defined in FlexRay specification 3.0.1 Chapter A.1:
 class Const:
@@ -39,6 +40,13 @@ class Const:
     cStaticSlotIDMax = 1023
     cVotingSamples = 5
 
+header_crc = Crc(Const.cHCrcSize, Const.cHCrcPolynomial, Const.cHCrcInit)
+# The initial value of the frame CRC differs between channels A and B.
+frame_crc = {
+    'A': Crc(Const.cCrcSize, Const.cCrcPolynomial, Const.cCrcInitA),
+    'B': Crc(Const.cCrcSize, Const.cCrcPolynomial, Const.cCrcInitB),
+}
+
 class SamplerateError(Exception):
     pass
 
@@ -120,29 +128,6 @@ def putx(self, data):
     def putb(self, data):
         self.putg(self.ss_block, self.samplenum, data)
 
-    # Generic CRC algorithm for any bit size and any data length. Used for
-    # 11-bit header and 24-bit trailer. Not very efficient but at least it
-    # works for now.
-    #
-    # TODO:
-    # - use precalculated tables to increase performance.
-    # - Add support for reverse CRC calculations.
-
-    @staticmethod
-    def crc(data, data_len_bits, polynom, crc_len_bits, iv=0, xor=0):
-        reg = iv ^ xor
-
-        for i in range(data_len_bits - 1, -1, -1):
-            bit = ((reg >> (crc_len_bits - 1)) & 0x1) ^ ((data >> i) & 0x1)
-            reg <<= 1
-            if bit:
-                reg ^= polynom
-
-        mask = (1 << crc_len_bits) - 1
-        crc = reg & mask
-
-        return crc ^ xor
-
     def reset_variables(self):
         self.sample_point_percent = 50 # TODO: use vote based sampling
         self.state = 'IDLE'
@@ -291,10 +276,7 @@ def handle_bit(self, fr_rx):
         # Bits 24-34: Header CRC (11-bit) (HCRC[11..0])
         # Calculation of header CRC is equal on both channels.
         elif bitnum == 34:
-            bits = ''.join([str(b) for b in self.bits[4:24]])
-            header_to_check = int(bits, 2)
-            expected_crc = self.crc(header_to_check, len(bits),
-                Const.cHCrcPolynomial, Const.cHCrcSize, Const.cHCrcInit)
+            expected_crc = header_crc.calc_bits(self.bits[4:24])
             self.header_crc = int(''.join(str(d) for d in self.bits[24:]), 2)
 
             crc_ok = self.header_crc == expected_crc
@@ -338,11 +320,8 @@ def handle_bit(self, fr_rx):
         # Initialization vector of channel A and B are different, so CRCs are
         # different for same data.
         elif bitnum == self.last_databit + 23:
-            bits = ''.join([str(b) for b in self.bits[1:-24]])
-            frame_to_check = int(bits, 2)
-            iv = Const.cCrcInitA if self.options['channel_type'] == 'A' else Const.cCrcInitB
-            expected_crc = self.crc(frame_to_check, len(bits),
-                Const.cCrcPolynomial, Const.cCrcSize, iv=iv)
+            crc = frame_crc[self.options['channel_type']]
+            expected_crc = crc.calc_bits(self.bits[1:-24])
             self.frame_crc = int(''.join(str(d) for d in self.bits[self.last_databit:]), 2)
 
             crc_ok = self.frame_crc == expected_crc
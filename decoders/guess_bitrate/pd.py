@@ -39,8 +39,8 @@ class Decoder(srd.Decoder):
         ('bitrate', 'Bitrate / baudrate'),
     )
 
-    def putx(self, data):
-        self.put(self.ss_edge, self.samplenum, self.out_ann, data)
+    def putx(self, es, data):
+        self.put(self.ss_edge, es, self.out_ann, data)
 
     def __init__(self):
         self.reset()
@@ -69,11 +69,11 @@ def decode(self):
         # This heuristics keeps getting better for longer captures.
         bitwidth = None
         while True:
-            self.wait({0: 'e'})
-
-            b = self.samplenum - self.ss_edge
-            if bitwidth is None or b < bitwidth:
-                bitwidth = b
-                bitrate = int(float(self.samplerate) / float(b))
-                self.putx([0, ['%d' % bitrate]])
-            self.ss_edge = self.samplenum
+            samplenums, _, _ = self.wait_many({0: 'e'}, 1024)
+            for es in samplenums:
+                b = es - self.ss_edge
+                if bitwidth is None or b < bitwidth:
+                    bitwidth = b
+                    bitrate = int(float(self.samplerate) / float(b))
+                    self.putx(es, [0, ['%d' % bitrate]])
+                self.ss_edge = es
@@ -263,10 +263,11 @@ def handle_address_or_data(self, ss, es, value):
 
         self.putb(ss_byte, es_byte, [bin_class, bytes([d])])
 
-        for bit_value, ss_bit, es_bit in lsb_bits:
-            cls, texts = proto['BIT'][0], proto['BIT'][1:]
-            texts = [t.format(b = bit_value) for t in texts]
-            self.putg(ss_bit, es_bit, cls, texts)
+        cls = proto['BIT'][0]
+        if self.ann_enabled(cls):
+            for bit_value, ss_bit, es_bit in lsb_bits:
+                texts = [t.format(b = bit_value) for t in proto['BIT'][1:]]
+                self.putg(ss_bit, es_bit, cls, texts)
 
         if is_address and has_rw_bit:
             # Assign the last bit's location to the R/W annotation.
@@ -278,8 +279,9 @@ def handle_address_or_data(self, ss, es, value):
             self.putg(ss_bit, es_bit, cls, w)
 
         cls, texts = proto[cmd][0], proto[cmd][1:]
-        texts = [t.format(b = d) for t in texts]
-        self.putg(ss_byte, es_byte, cls, texts)
+        if self.ann_enabled(cls):
+            texts = [t.format(b = d) for t in texts]
+            self.putg(ss_byte, es_byte, cls, texts)
 
     def get_ack(self, ss, es, value):
         ss_bit, es_bit = ss, es
@@ -315,6 +317,12 @@ def handle_stop(self, ss, es):
         self.data_bits.clear()
 
     def decode(self):
+        # The conditions get reused for every bit, compile them once.
+        cond_start = self.compile_conditions({0: 'h', 1: 'f'})
+        cond_bit = self.compile_conditions({0: 'r'})
+        cond_bit_start_stop = self.compile_conditions([{0: 'r'},
+            {0: 'h', 1: 'f'}, {0: 'h', 1: 'r'}])
+
         # Check for several bus conditions. Determine sample numbers
         # here and pass ss, es, and bit values to handling routines.
         while True:
@@ -328,13 +336,15 @@ def decode(self):
             # and assuming that they remain valid until the next bit
             # starts, is also done for backwards compatibility.
             if self._wants_start():
+                # The bus is idle, decoding can resume from here.
+                self.checkpoint()
                 # Wait for a START condition (S): SCL = high, SDA = falling.
-                pins = self.wait({0: 'h', 1: 'f'})
+                pins = yield cond_start
                 ss, es = self.samplenum, self.samplenum
                 self.handle_start(ss, es)
             elif self._collects_address() and self._collects_byte():
                 # Wait for a data bit: SCL = rising.
-                pins = self.wait({0: 'r'})
+                pins = yield cond_bit
                 _, sda = pins
                 ss, es = self.samplenum, self.samplenum + self.bitwidth
                 self.handle_address_or_data(ss, es, sda)
@@ -343,7 +353,7 @@ def decode(self):
                 #  a) Data sampling of receiver: SCL = rising, and/or
                 #  b) START condition (S): SCL = high, SDA = falling, and/or
                 #  c) STOP condition (P): SCL = high, SDA = rising
-                pins = self.wait([{0: 'r'}, {0: 'h', 1: 'f'}, {0: 'h', 1: 'r'}])
+                pins = yield cond_bit_start_stop
 
                 # Check which of the condition(s) matched and handle them.
                 if self.matched[0]:
@@ -358,7 +368,7 @@ def decode(self):
                     self.handle_stop(ss, es)
             else:
                 # Wait for a data/ack bit: SCL = rising.
-                pins = self.wait({0: 'r'})
+                pins = yield cond_bit
                 _, sda = pins
                 ss, es = self.samplenum, self.samplenum + self.bitwidth
                 self.get_ack(ss, es, sda)
@@ -66,32 +66,36 @@ def putframe(self, data):
         ss = data['start'] * self.rate_factor
         es = data['end'] * self.rate_factor
 
-        # Prepare display texts for several zoom levels.
-        # Implementor's note: Keep list lengths for flags aligned during
-        # maintenance. Make sure there are as many flags text variants
-        # as are referenced by annotation text variants. Differing list
-        # lengths or dynamic refs will severely complicate the logic.
-        rep_txts = ['repeat', 'rep', 'r']
-        rel_txts = ['release', 'rel', 'R']
-        flag_txts = [None,] * len(rep_txts)
-        for zoom in range(len(flag_txts)):
-            flag_txts[zoom] = []
-            if repeat:
-                flag_txts[zoom].append(rep_txts[zoom])
-            if release:
-                flag_txts[zoom].append(rel_txts[zoom])
-        flag_txts = [' '.join(t) or '-' for t in flag_txts]
-        flg = flag_txts # Short name for .format() references.
-        txts = [
-            'Protocol: {name} ({nr}), Address 0x{addr:04x}, Command: 0x{cmd:04x}, Flags: {flg[0]}'.format(**locals()),
-            'P: {name} ({nr}), Addr: 0x{addr:x}, Cmd: 0x{cmd:x}, Flg: {flg[1]}'.format(**locals()),
-            'P: {nr} A: 0x{addr:x} C: 0x{cmd:x} F: {flg[1]}'.format(**locals()),
-            'C:{cmd:x} A:{addr:x} {flg[2]}'.format(**locals()),
-            'C:{cmd:x}'.format(**locals()),
-        ]
+        # Prepare display texts for several zoom levels. This only runs
+        # when a frontend receives the annotation.
+        def texts():
+            # Implementor's note: Keep list lengths for flags aligned during
+            # maintenance. Make sure there are as many flags text variants
+            # as are referenced by annotation text variants. Differing list
+            # lengths or dynamic refs will severely complicate the logic.
+            rep_txts = ['repeat', 'rep', 'r']
+            rel_txts = ['release', 'rel', 'R']
+            flag_txts = [None,] * len(rep_txts)
+            for zoom in range(len(flag_txts)):
+                flag_txts[zoom] = []
+                if repeat:
+                    flag_txts[zoom].append(rep_txts[zoom])
+                if release:
+                    flag_txts[zoom].append(rel_txts[zoom])
+            flag_txts = [' '.join(t) or '-' for t in flag_txts]
+            flg = flag_txts # Short name for .format() references.
+            fields = {'name': name, 'nr': nr, 'addr': addr, 'cmd': cmd, 'flg': flg}
+            txts = [
+                'Protocol: {name} ({nr}), Address 0x{addr:04x}, Command: 0x{cmd:04x}, Flags: {flg[0]}'.format(**fields),
+                'P: {name} ({nr}), Addr: 0x{addr:x}, Cmd: 0x{cmd:x}, Flg: {flg[1]}'.format(**fields),
+                'P: {nr} A: 0x{addr:x} C: 0x{cmd:x} F: {flg[1]}'.format(**fields),
+                'C:{cmd:x} A:{addr:x} {flg[2]}'.format(**fields),
+                'C:{cmd:x}'.format(**fields),
+            ]
+            return txts
 
         # Emit the annotation from details which were constructed above.
-        self.put(ss, es, self.out_ann, [0, txts])
+        self.put(ss, es, self.out_ann, [0, texts])
 
     def __init__(self):
         self.irmp = None
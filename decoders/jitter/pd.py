@@ -117,11 +117,11 @@ def putb(self, delta):
                  [0, x.encode('UTF-8')])
 
     # Helper function for missed clock and signal annotations.
-    def putm(self, data):
-        self.put(self.samplenum, self.samplenum, self.out_ann, data)
+    def putm(self, samplenum, data):
+        self.put(samplenum, samplenum, self.out_ann, data)
 
-    def handle_clk(self, clk, sig):
-        if self.clk_start == self.samplenum:
+    def handle_clk(self, samplenum, clk, sig):
+        if self.clk_start == samplenum:
             # Clock transition already treated.
             # We have done everything we can with this sample.
             return True
@@ -129,25 +129,25 @@ def handle_clk(self, clk, sig):
         if self.clk_edge(self.oldclk, clk):
             # Clock edge found.
             # We note the sample and move to the next state.
-            self.clk_start = self.samplenum
+            self.clk_start = samplenum
             self.state = 'SIG'
             return False
         else:
             if self.sig_start is not None \
-               and self.sig_start != self.samplenum \
+               and self.sig_start != samplenum \
                and self.sig_edge(self.oldsig, sig):
                 # If any transition in the resulting signal
                 # occurs while we are waiting for a clock,
                 # we increase the missed signal counter.
                 self.sig_missed += 1
-                self.put(self.samplenum, self.samplenum, self.out_sig_missed, self.sig_missed)
-                self.putm([2, ['Missed signal', 'MS']])
+                self.put(samplenum, samplenum, self.out_sig_missed, self.sig_missed)
+                self.putm(samplenum, [2, ['Missed signal', 'MS']])
             # No clock edge found, we have done everything we
             # can with this sample.
             return True
 
-    def handle_sig(self, clk, sig):
-        if self.sig_start == self.samplenum:
+    def handle_sig(self, samplenum, clk, sig):
+        if self.sig_start == samplenum:
             # Signal transition already treated.
             # We have done everything we can with this sample.
             return True
@@ -156,7 +156,7 @@ def handle_sig(self, clk, sig):
             # Signal edge found.
             # We note the sample, calculate the jitter
             # and move to the next state.
-            self.sig_start = self.samplenum
+            self.sig_start = samplenum
             self.state = 'CLK'
             # Calculate and report the timing jitter.
             delta = (self.sig_start - self.clk_start) / self.samplerate
@@ -164,14 +164,14 @@ def handle_sig(self, clk, sig):
             self.putb(delta)
             return False
         else:
-            if self.clk_start != self.samplenum \
+            if self.clk_start != samplenum \
                and self.clk_edge(self.oldclk, clk):
                 # If any transition in the clock signal
                 # occurs while we are waiting for a resulting
                 # signal, we increase the missed clock counter.
                 self.clk_missed += 1
-                self.put(self.samplenum, self.samplenum, self.out_clk_missed, self.clk_missed)
-                self.putm([1, ['Missed clock', 'MC']])
+                self.put(samplenum, samplenum, self.out_clk_missed, self.clk_missed)
+                self.putm(samplenum, [1, ['Missed clock', 'MC']])
             # No resulting signal edge found, we have done
             # everything we can with this sample.
             return True
@@ -180,19 +180,21 @@ def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
         while True:
-            # Wait for a transition on CLK and/or SIG.
-            clk, sig = self.wait([{0: 'e'}, {1: 'e'}])
-
-            # State machine:
-            # For each sample we can move 2 steps forward in the state machine.
-            while True:
-                # Clock state has the lead.
-                if self.state == 'CLK':
-                    if self.handle_clk(clk, sig):
-                        break
-                if self.state == 'SIG':
-                    if self.handle_sig(clk, sig):
-                        break
-
-            # Save current CLK/SIG values for the next round.
-            self.oldclk, self.oldsig = clk, sig
+            # Wait for transitions on CLK and/or SIG, in batches.
+            samplenums, pins, _ = self.wait_many([{0: 'e'}, {1: 'e'}], 1024)
+            for samplenum, pinstates in zip(samplenums, pins):
+                clk, sig = pinstates & 1, (pinstates >> 1) & 1
+
+                # State machine:
+                # For each sample we can move 2 steps forward in the state machine.
+                while True:
+                    # Clock state has the lead.
+                    if self.state == 'CLK':
+                        if self.handle_clk(samplenum, clk, sig):
+                            break
+                    if self.state == 'SIG':
+                        if self.handle_sig(samplenum, clk, sig):
+                            break
+
+                # Save current CLK/SIG values for the next round.
+                self.oldclk, self.oldsig = clk, sig
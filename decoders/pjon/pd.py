@@ -34,6 +34,7 @@
 
 import sigrokdecode as srd
 import struct
+from common.crc import CRC8_PJON, CRC32
 
 ANN_RX_INFO, ANN_HDR_CFG, ANN_PKT_LEN, ANN_META_CRC, ANN_TX_INFO, \
 ANN_SVC_ID, ANN_PKT_ID, ANN_ANON_DATA, ANN_PAYLOAD, ANN_END_CRC, \
@@ -42,29 +43,6 @@
 ANN_WARN, \
     = range(13)
 
-def calc_crc8(data):
-    crc = 0
-    for b in data:
-        crc ^= b
-        for i in range(8):
-            odd = crc % 2
-            crc >>= 1
-            if odd:
-                crc ^= 0x97
-    return crc
-
-def calc_crc32(data):
-    crc = 0xffffffff
-    for b in data:
-        crc ^= b
-        for i in range(8):
-            odd = crc % 2
-            crc >>= 1
-            if odd:
-                crc ^= 0xedb88320
-    crc ^= 0xffffffff
-    return crc
-
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'pjon'
@@ -389,7 +367,7 @@ def handle_field_common_crc(self, have, is_meta):
         # Check received against expected checksum. Emit warnings.
         warn_texts = []
         data = self.frame_bytes[:-crc_bytes]
-        want = calc_crc32(data) if crc_len == 32 else calc_crc8(data)
+        want = CRC32.calc(data) if crc_len == 32 else CRC8_PJON.calc(data)
         if want != have:
             want_text = crc_fmt.format(want)
             warn_texts.append('CRC mismatch - want {} have {}'.format(want_text, have_text))
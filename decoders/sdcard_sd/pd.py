@@ -18,6 +18,7 @@
 ##
 
 import sigrokdecode as srd
+from common.crc import CRC7_SD
 from common.srdhelper import SrdIntEnum, SrdStrEnum
 from common.sdcard import (cmd_names, acmd_names, accepted_voltages, sd_status)
 
@@ -138,14 +139,21 @@ def cmd_name(self, cmd):
         return c.get(cmd, 'Unknown')
 
     def get_token_bits(self, cmd_pin, n):
-        # Get a bit, return True if we already got 'n' bits, False otherwise.
-        self.token.append(Bit(self.samplenum, self.samplenum, cmd_pin))
-        if len(self.token) > 0:
-            self.token[len(self.token) - 2].es = self.samplenum
-        if len(self.token) < n:
-            return False
-        self.token[n - 1].es += self.token[n - 1].ss - self.token[n - 2].ss
-        return True
+        # The start bit was seen on the current CLK edge. Shift in the
+        # remaining bits of the 'n' bits token on the next rising edges.
+        ss = [self.samplenum]
+        _, (bits,), samplenums = self.shift_in(Pin.CLK, 'r', (Pin.CMD,),
+                                               n - 1, samplenums=True)
+        ss.extend(samplenums)
+        es = ss[1:] + [2 * ss[n - 1] - ss[n - 2]]
+        values = [cmd_pin] + [(bits >> i) & 1 for i in range(n - 2, -1, -1)]
+        self.token = [Bit(*b) for b in zip(ss, es, values)]
+
+    def crc_status(self, s, e):
+        # Check token bits s..e-1 against the CRC7 which follows them.
+        bits = [b.bit for b in self.token[s:e + 7]]
+        crc = int(''.join(str(b) for b in bits[-7:]), 2)
+        return 'OK' if CRC7_SD.calc_bits(bits[:-7]) == crc else 'bad'
 
     def handle_common_token_fields(self):
         s = self.token
@@ -173,7 +181,9 @@ def handle_common_token_fields(self):
 
         # CMD[07:01]: CRC7
         self.crc = int('0b' + ''.join([str(s[i].bit) for i in range(40, 47)]), 2)
-        self.putf(40, 46, [Ann.F_CRC, ['CRC: 0x%x' % self.crc, 'CRC', 'C']])
+        crc_ann = self.crc_status(0, 40)
+        self.putf(40, 46, [Ann.F_CRC, ['CRC: 0x%x (%s)' % (self.crc, crc_ann),
+                                       'CRC (%s)' % crc_ann, 'CRC', 'C']])
 
         # CMD[00:00]: End bit (always 1)
         self.putf(47, 47, [Ann.F_END, ['End bit', 'End', 'E']])
@@ -190,8 +200,7 @@ def get_command_token(self, cmd_pin):
         #  - Bits[07:01]: CRC7
         #  - Bits[00:00]: End bit (always 1)
 
-        if not self.get_token_bits(cmd_pin, 48):
-            return
+        self.get_token_bits(cmd_pin, 48)
 
         self.handle_common_token_fields()
 
@@ -351,7 +360,9 @@ def handle_reg_cid(self):
         self.putf(80, 111, [Ann.R_CID_PSN, ['Product serial number', 'PSN']])
         self.putf(112, 115, [Ann.R_CID_RSVD, ['Reserved', 'RSVD', 'R']])
         self.putf(116, 127, [Ann.R_CID_MDT, ['Manufacturing date', 'MDT']])
-        self.putf(128, 134, [Ann.R_CID_CRC, ['CRC7 checksum', 'CRC']])
+        crc_ann = self.crc_status(8, 128)
+        self.putf(128, 134, [Ann.R_CID_CRC, ['CRC7 checksum (%s)' % crc_ann,
+                                             'CRC (%s)' % crc_ann, 'CRC']])
         self.putf(135, 135, [Ann.R_CID_ONE, ['Always 1', '1']])
 
     def handle_reg_csd(self):
@@ -388,7 +399,8 @@ def handle_reg_csd(self):
         self.putf(123, 123, [Ann.R_CSD_TMP_WRITE_PROTECT, ['Temporary write protection', 'TMP_WRITE_PROTECT']])
         self.putf(124, 125, [Ann.R_CSD_FILE_FORMAT, ['File format', 'FILE_FORMAT']])
         self.putf(126, 127, [Ann.R_CSD_RSVD, ['Reserved', 'RSVD', 'R']])
-        self.putf(128, 134, [Ann.R_CSD_CRC, ['CRC', 'CRC', 'C']])
+        crc_ann = self.crc_status(8, 128)
+        self.putf(128, 134, [Ann.R_CSD_CRC, ['CRC (%s)' % crc_ann, 'CRC', 'C']])
         self.putf(135, 135, [Ann.R_CSD_ONE, ['Always 1', '1']])
 
     # Response tokens can have one of four formats (depends on content).
@@ -404,8 +416,7 @@ def handle_response_r1(self, cmd_pin):
         #  - Bits[39:08]: Card status
         #  - Bits[07:01]: CRC7
         #  - Bits[00:00]: End bit (always 1)
-        if not self.get_token_bits(cmd_pin, 48):
-            return
+        self.get_token_bits(cmd_pin, 48)
         self.handle_common_token_fields()
         self.putr(Ann.RESPONSE_R1)
         self.puta(0, 31, [Ann.DECODED_F, ['Card status', 'Status', 'S']])
@@ -415,8 +426,7 @@ def handle_response_r1(self, cmd_pin):
 
     def handle_response_r1b(self, cmd_pin):
         # R1b: Same as R1 with an optional busy signal (on the data line)
-        if not self.get_token_bits(cmd_pin, 48):
-            return
+        self.get_token_bits(cmd_pin, 48)
         self.handle_common_token_fields()
         self.puta(0, 31, [Ann.DECODED_F, ['Card status', 'Status', 'S']])
         self.putr(Ann.RESPONSE_R1B)
@@ -429,8 +439,7 @@ def handle_response_r2(self, cmd_pin):
         #  - Bits[133:128]: Reserved (always 0b111111)
         #  - Bits[127:001]: CID or CSD register including internal CRC7
         #  - Bits[000:000]: End bit (always 1)
-        if not self.get_token_bits(cmd_pin, 136):
-            return
+        self.get_token_bits(cmd_pin, 136)
         # Annotations for each individual bit.
         for bit in range(len(self.token)):
             self.putf(bit, bit, [Ann.BIT_0 + self.token[bit].bit, ['%d' % self.token[bit].bit]])
@@ -459,8 +468,7 @@ def handle_response_r3(self, cmd_pin):
         #  - Bits[39:08]: OCR register
         #  - Bits[07:01]: Reserved (always 0b111111)
         #  - Bits[00:00]: End bit (always 1)
-        if not self.get_token_bits(cmd_pin, 48):
-            return
+        self.get_token_bits(cmd_pin, 48)
         self.putr(Ann.RESPONSE_R3)
         # Annotations for each individual bit.
         for bit in range(len(self.token)):
@@ -484,8 +492,7 @@ def handle_response_r6(self, cmd_pin):
         #  - Bits[23:08]: Argument[15:0]: Card status bits
         #  - Bits[07:01]: CRC7
         #  - Bits[00:00]: End bit (always 1)
-        if not self.get_token_bits(cmd_pin, 48):
-            return
+        self.get_token_bits(cmd_pin, 48)
         self.handle_common_token_fields()
         self.puta(0, 15, [Ann.DECODED_F, ['Card status bits', 'Status', 'S']])
         self.puta(16, 31, [Ann.DECODED_F, ['Relative card address', 'RCA', 'R']])
@@ -502,8 +509,7 @@ def handle_response_r7(self, cmd_pin):
         #  - Bits[15:08]: Echo-back of check pattern
         #  - Bits[07:01]: CRC7
         #  - Bits[00:00]: End bit (always 1)
-        if not self.get_token_bits(cmd_pin, 48):
-            return
+        self.get_token_bits(cmd_pin, 48)
         self.handle_common_token_fields()
 
         self.putr(Ann.RESPONSE_R7)
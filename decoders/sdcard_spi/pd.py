@@ -18,6 +18,7 @@
 ##
 
 import sigrokdecode as srd
+from common.crc import CRC16_SD
 from common.srdhelper import SrdIntEnum
 from common.sdcard import (cmd_names, acmd_names)
 
@@ -382,8 +383,10 @@ def handle_data_cmd17(self, miso):
                 self.ss_crc = self.ss
             elif len(self.read_buf) == (self.blocklen + 2):
                 self.es_crc = self.es
-                # TODO: Check CRC.
-                self.put(self.ss_crc, self.es_crc, self.out_ann, [Ann.CMD17, ['CRC']])
+                crc = (self.read_buf[-2] << 8) | self.read_buf[-1]
+                ok = CRC16_SD.calc(self.read_buf[:-2]) == crc
+                self.put(self.ss_crc, self.es_crc, self.out_ann, [Ann.CMD17,
+                         ['CRC: 0x%04x (%s)' % (crc, 'OK' if ok else 'bad'), 'CRC']])
                 self.state = 'IDLE'
         elif miso == 0xfe:
             self.put(self.ss, self.es, self.out_ann, [Ann.CMD17, ['Start Block']])
@@ -181,17 +181,17 @@ def putdata(self):
             self.mosibytes.append(Data(ss=ss, es=es, val=si))
 
         # Bit annotations.
-        if self.have_miso:
+        if self.have_miso and self.ann_enabled(2):
             for bit in self.misobits:
                 self.put(bit[1], bit[2], self.out_ann, [2, ['%d' % bit[0]]])
-        if self.have_mosi:
+        if self.have_mosi and self.ann_enabled(3):
             for bit in self.mosibits:
                 self.put(bit[1], bit[2], self.out_ann, [3, ['%d' % bit[0]]])
 
         # Dataword annotations.
-        if self.have_miso:
+        if self.have_miso and self.ann_enabled(0):
             self.put(ss, es, self.out_ann, [0, ['%02X' % self.misodata]])
-        if self.have_mosi:
+        if self.have_mosi and self.ann_enabled(1):
             self.put(ss, es, self.out_ann, [1, ['%02X' % self.mosidata]])
 
     def reset_decoder_state(self):
@@ -200,6 +200,7 @@ def reset_decoder_state(self):
         self.misobits = [] if self.have_miso else None
         self.mosibits = [] if self.have_mosi else None
         self.bitcount = 0
+        self.cs_was_deasserted = False
 
     def cs_asserted(self, cs):
         active_low = (self.options['cs_polarity'] == 'active-low')
@@ -208,46 +209,55 @@ def cs_asserted(self, cs):
     def handle_bit(self, miso, mosi, clk, cs):
         # If this is the first bit of a dataword, save its sample number.
         if self.bitcount == 0:
-            self.ss_block = self.samplenum
             self.cs_was_deasserted = \
                 not self.cs_asserted(cs) if self.have_cs else False
 
+        self.handle_bits((self.samplenum,), miso, mosi)
+
+    def handle_bits(self, samplenums, miso, mosi):
+        # Receive bits which were sampled at the given sample numbers,
+        # packed into words in capture order (like shift_in() does).
+        n = len(samplenums)
+        if self.bitcount == 0:
+            self.ss_block = samplenums[0]
+
         ws = self.options['wordsize']
-        bo = self.options['bitorder']
+        msb_first = self.options['bitorder'] == 'msb-first'
 
-        # Receive MISO bit into our shift register.
+        # Receive MISO/MOSI bits into our shift registers.
+        shift = ws - self.bitcount - n if msb_first else self.bitcount
         if self.have_miso:
-            if bo == 'msb-first':
-                self.misodata |= miso << (ws - 1 - self.bitcount)
-            else:
-                self.misodata |= miso << self.bitcount
-
-        # Receive MOSI bit into our shift register.
+            self.misodata |= miso << shift
         if self.have_mosi:
-            if bo == 'msb-first':
-                self.mosidata |= mosi << (ws - 1 - self.bitcount)
-            else:
-                self.mosidata |= mosi << self.bitcount
-
-        # Guesstimate the endsample for this bit (can be overridden below).
-        es = self.samplenum
-        if self.bitcount > 0:
-            if self.have_miso:
-                es += self.samplenum - self.misobits[0][1]
-            elif self.have_mosi:
-                es += self.samplenum - self.mosibits[0][1]
-
+            self.mosidata |= mosi << shift
+
+        # Each bit ends where the next bit starts. Guesstimate the
+        # endsample of the last bit from the previous bit's width.
+        bits = self.misobits if self.have_miso else self.mosibits
+        prev = bits[0][1] if self.bitcount > 0 else None
+        ends = list(samplenums[1:])
+        last = samplenums[-1]
+        if n > 1:
+            ends.append(2 * last - samplenums[-2])
+        elif prev is not None:
+            ends.append(2 * last - prev)
+        else:
+            ends.append(last)
+
+        # Bit lists hold [bit, ss, es] entries, the latest bit first.
+        positions = range(n - 1, -1, -1) if msb_first else range(n)
         if self.have_miso:
-            self.misobits.insert(0, [miso, self.samplenum, es])
+            if self.bitcount > 0:
+                self.misobits[0][2] = samplenums[0]
+            self.misobits[:0] = [[(miso >> b) & 1, s, e] for b, s, e in
+                                 reversed(list(zip(positions, samplenums, ends)))]
         if self.have_mosi:
-            self.mosibits.insert(0, [mosi, self.samplenum, es])
+            if self.bitcount > 0:
+                self.mosibits[0][2] = samplenums[0]
+            self.mosibits[:0] = [[(mosi >> b) & 1, s, e] for b, s, e in
+                                 reversed(list(zip(positions, samplenums, ends)))]
 
-        if self.bitcount > 0 and self.have_miso:
-            self.misobits[1][2] = self.samplenum
-        if self.bitcount > 0 and self.have_mosi:
-            self.mosibits[1][2] = self.samplenum
-
-        self.bitcount += 1
+        self.bitcount += n
 
         # Continue to receive if not enough bits were received, yet.
         if self.bitcount != ws:
@@ -258,9 +268,9 @@ def handle_bit(self, miso, mosi, clk, cs):
         # Meta bitrate.
         if self.samplerate:
             elapsed = 1 / float(self.samplerate)
-            elapsed *= (self.samplenum - self.ss_block + 1)
+            elapsed *= (last - self.ss_block + 1)
             bitrate = int(1 / elapsed * ws)
-            self.put(self.ss_block, self.samplenum, self.out_bitrate, bitrate)
+            self.put(self.ss_block, last, self.out_bitrate, bitrate)
 
         if self.have_cs and self.cs_was_deasserted:
             self.putw([4, ['CS# was deasserted during this data word!']])
@@ -279,10 +289,10 @@ def find_clk_edge(self, miso, mosi, clk, cs, first):
                 self.misobytes = []
                 self.mosibytes = []
             elif self.ss_transfer != -1:
-                if self.have_miso:
+                if self.have_miso and self.ann_enabled(5):
                     self.put(self.ss_transfer, self.samplenum, self.out_ann,
                         [5, [' '.join(format(x.val, '02X') for x in self.misobytes)]])
-                if self.have_mosi:
+                if self.have_mosi and self.ann_enabled(6):
                     self.put(self.ss_transfer, self.samplenum, self.out_ann,
                         [6, [' '.join(format(x.val, '02X') for x in self.mosibytes)]])
                 self.put(self.ss_transfer, self.samplenum, self.out_python,
@@ -334,14 +344,46 @@ def decode(self):
         if self.have_cs:
             self.have_cs = len(wait_cond)
             wait_cond.append({3: 'e'})
+        wait_cond = self.compile_conditions(wait_cond)
 
         # "Pixel compatibility" with the v2 implementation. Grab and
         # process the very first sample before checking for edges. The
         # previous implementation did this by seeding old values with
         # None, which led to an immediate "change" in comparison.
-        (clk, miso, mosi, cs) = self.wait({})
-        self.find_clk_edge(miso, mosi, clk, cs, True)
+        # Decoding which resumes from a checkpoint continues with CS#
+        # deasserted instead.
+        if self.resumed:
+            cs = 1 if self.options['cs_polarity'] == 'active-low' else 0
+        else:
+            (clk, miso, mosi, cs) = yield {}
+            self.find_clk_edge(miso, mosi, clk, cs, True)
+
+        # While CS# is asserted (or not used), have the data bits shifted
+        # in on the sampling clock edge, until the word is complete or
+        # CS# changes.
+        mode = spi_mode[self.options['cpol'], self.options['cpha']]
+        edge = 'r' if mode in (0, 3) else 'f'
+        data = [c for c in (1, 2) if self.has_channel(c)]
+        stop = {3: 'e'} if self.have_cs else None
+        lsb_first = self.options['bitorder'] == 'lsb-first'
+        ws = self.options['wordsize']
 
         while True:
-            (clk, miso, mosi, cs) = self.wait(wait_cond)
-            self.find_clk_edge(miso, mosi, clk, cs, False)
+            if self.have_cs and not self.cs_asserted(cs):
+                # CS# is deasserted, decoding can resume from here.
+                self.checkpoint()
+                (clk, miso, mosi, cs) = yield wait_cond
+                self.find_clk_edge(miso, mosi, clk, cs, False)
+                continue
+
+            count = ws - self.bitcount
+            n, words, samplenums = yield self.shift_in(0, edge, data,
+                count, stop=stop, lsb_first=lsb_first, samplenums=True)
+            if n:
+                miso = words[0] if self.have_miso else None
+                mosi = words[-1] if self.have_mosi else None
+                self.handle_bits(samplenums, miso, mosi)
+            if n < count:
+                (clk, miso, mosi, cs), = yield self.sample_at(
+                    (self.samplenum,))
+                self.find_clk_edge(miso, mosi, clk, cs, False)
@@ -154,41 +154,43 @@ def decode(self):
         ss = None
         last_n = deque()
         last_t = None
+        if edge == 'rising':
+            cond = {Pin.DATA: 'r'}
+        elif edge == 'falling':
+            cond = {Pin.DATA: 'f'}
+        else:
+            cond = {Pin.DATA: 'e'}
         while True:
-            if edge == 'rising':
-                pin = self.wait({Pin.DATA: 'r'})
-            elif edge == 'falling':
-                pin = self.wait({Pin.DATA: 'f'})
-            else:
-                pin = self.wait({Pin.DATA: 'e'})
-
-            if not ss:
-                ss = self.samplenum
-                continue
-            es = self.samplenum
-            sa = es - ss
-            t = sa / self.samplerate
-
-            if fmt == 'full':
-                cls, txt = Ann.TIME, [normalize_time(t)]
-            elif fmt == 'samples':
-                cls, txt = Ann.TERSE, terse_times(sa, fmt)
-            else:
-                cls, txt = Ann.TERSE, terse_times(t, fmt)
-            if txt:
-                self.put(ss, es, self.out_ann, [cls, txt])
-
-            if avg_period > 0:
-                if t > 0:
-                    last_n.append(t)
-                if len(last_n) > avg_period:
-                    last_n.popleft()
-                average = sum(last_n) / len(last_n)
-                cls, txt = Ann.AVG, normalize_time(average)
-                self.put(ss, es, self.out_ann, [cls, [txt]])
-            if last_t and delta:
-                cls, txt = Ann.DELTA, normalize_time(t - last_t)
-                self.put(ss, es, self.out_ann, [cls, [txt]])
-
-            last_t = t
-            ss = es
+            # Only the positions of the edges are of interest, fetch
+            # them in batches.
+            samplenums, _, _ = self.wait_many(cond, 1024)
+            for es in samplenums:
+                if not ss:
+                    ss = es
+                    continue
+                sa = es - ss
+                t = sa / self.samplerate
+
+                if fmt == 'full':
+                    cls, txt = Ann.TIME, [normalize_time(t)]
+                elif fmt == 'samples':
+                    cls, txt = Ann.TERSE, terse_times(sa, fmt)
+                else:
+                    cls, txt = Ann.TERSE, terse_times(t, fmt)
+                if txt:
+                    self.put(ss, es, self.out_ann, [cls, txt])
+
+                if avg_period > 0:
+                    if t > 0:
+                        last_n.append(t)
+                    if len(last_n) > avg_period:
+                        last_n.popleft()
+                    average = sum(last_n) / len(last_n)
+                    cls, txt = Ann.AVG, normalize_time(average)
+                    self.put(ss, es, self.out_ann, [cls, [txt]])
+                if last_t and delta:
+                    cls, txt = Ann.DELTA, normalize_time(t - last_t)
+                    self.put(ss, es, self.out_ann, [cls, [txt]])
+
+                last_t = t
+                ss = es
@@ -299,14 +299,15 @@ def handle_packet(self, rxtx):
         self.packet_cache[rxtx].append(self.datavalue[rxtx])
         if self.datavalue[rxtx] == delim or len(self.packet_cache[rxtx]) == plen:
             self.es_packet[rxtx] = self.samplenum
-            s = ''
-            for b in self.packet_cache[rxtx]:
-                s += self.format_value(b)
-                if self.options['format'] != 'ascii':
-                    s += ' '
-            if self.options['format'] != 'ascii' and s[-1] == ' ':
-                s = s[:-1] # Drop trailing space.
-            self.putx_packet(rxtx, [Ann.RX_PACKET + rxtx, [s]])
+            if self.ann_enabled(Ann.RX_PACKET + rxtx):
+                s = ''
+                for b in self.packet_cache[rxtx]:
+                    s += self.format_value(b)
+                    if self.options['format'] != 'ascii':
+                        s += ' '
+                if self.options['format'] != 'ascii' and s[-1] == ' ':
+                    s = s[:-1] # Drop trailing space.
+                self.putx_packet(rxtx, [Ann.RX_PACKET + rxtx, [s]])
             self.packet_cache[rxtx] = []
 
     def get_data_bits(self, rxtx, signal):
@@ -314,7 +315,8 @@ def get_data_bits(self, rxtx, signal):
         if self.startsample[rxtx] == -1:
             self.startsample[rxtx] = self.samplenum
 
-        self.putg([Ann.RX_DATA_BIT + rxtx, ['%d' % signal]])
+        if self.ann_enabled(Ann.RX_DATA_BIT + rxtx):
+            self.putg([Ann.RX_DATA_BIT + rxtx, ['%d' % signal]])
 
         # Store individual data bits and their start/end samplenumbers.
         s, halfbit = self.samplenum, int(self.bit_width / 2)
@@ -335,9 +337,10 @@ def get_data_bits(self, rxtx, signal):
             (self.datavalue[rxtx], self.databits[rxtx])])
 
         b = self.datavalue[rxtx]
-        formatted = self.format_value(b)
-        if formatted is not None:
-            self.putx(rxtx, [rxtx, [formatted]])
+        if self.ann_enabled(Ann.RX_DATA + rxtx):
+            formatted = self.format_value(b)
+            if formatted is not None:
+                self.putx(rxtx, [rxtx, [formatted]])
 
         bdata = b.to_bytes(self.bw, byteorder='big')
         self.putbin(rxtx, [Bin.RX + rxtx, bdata])
@@ -597,6 +600,9 @@ def decode(self):
         cond_idle_idx = [None] * len(has_pin)
 
         while True:
+            # Decoding can resume while both lines wait for a START bit.
+            if self.state[RX] == self.state[TX] == 'WAIT FOR START BIT':
+                self.checkpoint()
             conds = []
             if has_pin[RX]:
                 cond_data_idx[RX] = len(conds)
@@ -618,7 +624,7 @@ def decode(self):
                 if idle_cond:
                     cond_idle_idx[TX] = len(conds)
                     conds.append(idle_cond)
-            (rx, tx) = self.wait(conds)
+            (rx, tx) = yield conds
             if cond_data_idx[RX] is not None and self.matched[cond_data_idx[RX]]:
                 self.inspect_sample(RX, rx, inv[RX])
             if cond_edge_idx[RX] is not None and self.matched[cond_edge_idx[RX]]:
@@ -19,6 +19,7 @@
 ##
 
 import sigrokdecode as srd
+from common.crc import reflect, CRC5_USB, CRC16_USB
 
 '''
 OUTPUT_PYTHON format:
@@ -38,6 +39,8 @@
  - 'EOP', <eop>
  - 'FRAMENUM', <framenum>
  - 'DATABYTE', <databyte>
+ - 'DATABYTES', <databytes>
+ - 'PAYLOAD', <payload>
  - 'HUBADDR', <hubaddr>
  - 'SC', <sc>
  - 'PORT', <port>
@@ -76,6 +79,7 @@
 <framenum>: USB (micro)frame number, 0-2047 (11 bits).
 <databyte>: A single data byte, e.g. 0x55.
 <databytes>: List of data bytes, e.g. [0x55, 0xaa, 0x99] (0 - 1024 bytes).
+<payload>: The same data bytes as a bytes object, e.g. b'\x55\xaa\x99'.
 <hubaddr>: TODO
 <sc>: TODO
 <port>: TODO
@@ -136,41 +140,12 @@ def ann_index(pidname):
         return 28
     return l.index(pidname) + 11
 
-def bitstr_to_num(bitstr):
-    if not bitstr:
-        return 0
-    l = list(bitstr)
-    l.reverse()
-    return int(''.join(l), 2)
-
-def reverse_number(num, count):
-    out = list(count * '0')
-    for i in range(0, count):
-        if num >> i & 1:
-            out[i] = '1'
-    return int(''.join(out), 2)
-
-def calc_crc5(bitstr):
-    poly5 = 0x25
-    crc5 = 0x1f
-    for bit in bitstr:
-        crc5 <<= 1
-        if int(bit) != (crc5 >> 5):
-            crc5 ^= poly5
-        crc5 &= 0x1f
-    crc5 ^= 0x1f
-    return reverse_number(crc5, 5)
-
-def calc_crc16(bitstr):
-    poly16 = 0x18005
-    crc16 = 0xffff
-    for bit in bitstr:
-        crc16 <<= 1
-        if int(bit) != (crc16 >> 16):
-            crc16 ^= poly16
-        crc16 &= 0xffff
-    crc16 ^= 0xffff
-    return reverse_number(crc16, 16)
+# The same PIDs, keyed by their value (the first bit on the wire in the LSB).
+pid_values = {reflect(int(k, 2), 8): v for k, v in pids.items()}
+
+def num_to_bitstr(num, nbits):
+    # Bit string in wire order, the LSB of 'num' first.
+    return '{:0{}b}'.format(num, nbits)[::-1]
 
 class Decoder(srd.Decoder):
     api_version = 3
@@ -226,7 +201,8 @@ def __init__(self):
         self.reset()
 
     def reset(self):
-        self.bits = []
+        self.bits = self.nbits = 0
+        self.bit_ss, self.bit_es = [], []
         self.packet = []
         self.packet_summary = ''
         self.ss = self.es = None
@@ -250,17 +226,16 @@ def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
 
     def handle_packet(self):
-        packet = ''
-        for (bit, ss, es) in self.bits:
-            packet += bit
+        packet, nbits = self.bits, self.nbits
+        bit_ss, bit_es = self.bit_ss, self.bit_es
 
-        if len(packet) < 8:
+        if nbits < 8:
             self.putp([28, ['Invalid packet (shorter than 8 bits)']])
             return
 
         # Bits[0:7]: SYNC
-        sync = packet[:7 + 1]
-        self.ss, self.es = self.bits[0][1], self.bits[7][2]
+        sync = num_to_bitstr(packet & 0xff, 8)
+        self.ss, self.es = bit_ss[0], bit_es[7]
         # The SYNC pattern for low-speed/full-speed is KJKJKJKK (00000001).
         if sync != '00000001':
             self.putpb(['SYNC ERROR', sync])
@@ -271,36 +246,36 @@ def handle_packet(self):
             self.putb([0, ['SYNC: %s' % sync, 'SYNC', 'S']])
         self.packet.append(sync)
 
-        if len(packet) < 16:
+        if nbits < 16:
             self.putp([28, ['Invalid packet (shorter than 16 bits)']])
             return
 
         # Bits[8:15]: PID
-        pid = packet[8:15 + 1]
-        pidname = pids.get(pid, ('UNKNOWN', 'Unknown PID'))[0]
-        self.ss, self.es = self.bits[8][1], self.bits[15][2]
+        pid = (packet >> 8) & 0xff
+        pidname = pid_values.get(pid, ('UNKNOWN', 'Unknown PID'))[0]
+        self.ss, self.es = bit_ss[8], bit_es[15]
         self.putpb(['PID', pidname])
         self.putb([2, ['PID: %s' % pidname, pidname, pidname[0]]])
-        self.packet.append(pid)
+        self.packet.append(num_to_bitstr(pid, 8))
         self.packet_summary += pidname
 
         if pidname in ('OUT', 'IN', 'SOF', 'SETUP', 'PING'):
-            if len(packet) < 32:
+            if nbits < 32:
                 self.putp([28, ['Invalid packet (shorter than 32 bits)']])
                 return
 
             if pidname == 'SOF':
                 # Bits[16:26]: Framenum
-                framenum = bitstr_to_num(packet[16:26 + 1])
-                self.ss, self.es = self.bits[16][1], self.bits[26][2]
+                framenum = (packet >> 16) & 0x7ff
+                self.ss, self.es = bit_ss[16], bit_es[26]
                 self.putpb(['FRAMENUM', framenum])
                 self.putb([3, ['Frame: %d' % framenum, 'Frame', 'Fr', 'F']])
                 self.packet.append(framenum)
                 self.packet_summary += ' %d' % framenum
             else:
                 # Bits[16:22]: Addr
-                addr = bitstr_to_num(packet[16:22 + 1])
-                self.ss, self.es = self.bits[16][1], self.bits[22][2]
+                addr = (packet >> 16) & 0x7f
+                self.ss, self.es = bit_ss[16], bit_es[22]
                 self.putpb(['ADDR', addr])
                 self.putb([4, ['Address: %d' % addr, 'Addr: %d' % addr,
                                'Addr', 'A']])
@@ -308,17 +283,17 @@ def handle_packet(self):
                 self.packet_summary += ' ADDR %d' % addr
 
                 # Bits[23:26]: EP
-                ep = bitstr_to_num(packet[23:26 + 1])
-                self.ss, self.es = self.bits[23][1], self.bits[26][2]
+                ep = (packet >> 23) & 0xf
+                self.ss, self.es = bit_ss[23], bit_es[26]
                 self.putpb(['EP', ep])
                 self.putb([5, ['Endpoint: %d' % ep, 'EP: %d' % ep, 'EP', 'E']])
                 self.packet.append(ep)
                 self.packet_summary += ' EP %d' % ep
 
             # Bits[27:31]: CRC5
-            crc5 = bitstr_to_num(packet[27:31 + 1])
-            crc5_calc = calc_crc5(packet[16:27])
-            self.ss, self.es = self.bits[27][1], self.bits[31][2]
+            crc5 = (packet >> 27) & 0x1f
+            crc5_calc = CRC5_USB.calc_int(reflect(packet >> 16, 11), 11)
+            self.ss, self.es = bit_ss[27], bit_es[31]
             if crc5 == crc5_calc:
                 self.putpb(['CRC5', crc5])
                 self.putb([6, ['CRC5: 0x%02X' % crc5, 'CRC5', 'C']])
@@ -328,29 +303,38 @@ def handle_packet(self):
             self.packet.append(crc5)
         elif pidname in ('DATA0', 'DATA1', 'DATA2', 'MDATA'):
             # Bits[16:packetlen-16]: Data
-            data = packet[16:-16]
-            # TODO: len(data) must be a multiple of 8.
-            databytes = []
+            # TODO: The number of data bits must be a multiple of 8.
+            ndata = max(nbits - 32, 0)
+            data = (packet >> 16) & ((1 << ndata) - 1)
+            payload = data.to_bytes((ndata + 7) // 8, 'little')
             self.packet_summary += ' ['
-            for i in range(0, len(data), 8):
-                db = bitstr_to_num(data[i:i + 8])
-                self.ss, self.es = self.bits[16 + i][1], self.bits[23 + i][2]
-                self.putpb(['DATABYTE', db])
-                self.putb([8, ['Databyte: %02X' % db, 'Data: %02X' % db,
-                               'DB: %02X' % db, '%02X' % db]])
-                databytes.append(db)
-                self.packet_summary += ' %02X' % db
+            if self.ann_enabled(8):
+                for i, db in enumerate(payload):
+                    self.ss, self.es = bit_ss[16 + 8 * i], bit_es[23 + 8 * i]
+                    self.putpb(['DATABYTE', db])
+                    self.putb([8, ['Databyte: %02X' % db, 'Data: %02X' % db,
+                                   'DB: %02X' % db, '%02X' % db]])
+            else:
+                for i, db in enumerate(payload):
+                    self.ss, self.es = bit_ss[16 + 8 * i], bit_es[23 + 8 * i]
+                    self.putpb(['DATABYTE', db])
+            self.packet_summary += ''.join(' %02X' % db for db in payload)
             self.packet_summary += ' ]'
 
             # Convenience Python output (no annotation) for all bytes together.
-            self.ss, self.es = self.bits[16][1], self.bits[-16][2]
+            databytes = list(payload)
+            self.ss, self.es = bit_ss[16], bit_es[-16]
             self.putpb(['DATABYTES', databytes])
+            self.putpb(['PAYLOAD', payload])
             self.packet.append(databytes)
 
             # Bits[packetlen-16:packetlen]: CRC16
-            crc16 = bitstr_to_num(packet[-16:])
-            crc16_calc = calc_crc16(packet[16:-16])
-            self.ss, self.es = self.bits[-16][1], self.bits[-1][2]
+            crc16 = packet >> (nbits - 16)
+            if ndata % 8:
+                crc16_calc = CRC16_USB.calc_int(reflect(data, ndata), ndata)
+            else:
+                crc16_calc = CRC16_USB.calc(payload)
+            self.ss, self.es = bit_ss[-16], bit_es[-1]
             if crc16 == crc16_calc:
                 self.putpb(['CRC16', crc16])
                 self.putb([9, ['CRC16: 0x%04X' % crc16, 'CRC16', 'C']])
@@ -376,7 +360,7 @@ def decode(self, ss, es, data):
         (ptype, pdata) = data
 
         # We only care about certain packet types for now.
-        if ptype not in ('SOP', 'BIT', 'EOP', 'ERR'):
+        if ptype not in ('SOP', 'BITS', 'EOP', 'ERR'):
             return
 
         # State machine.
@@ -386,12 +370,14 @@ def decode(self, ss, es, data):
             self.ss_packet = ss
             self.state = 'GET BIT'
         elif self.state == 'GET BIT':
-            if ptype == 'BIT':
-                self.bits.append([pdata, ss, es])
+            if ptype == 'BITS':
+                self.nbits, self.bits, self.bit_ss, self.bit_es = pdata
             elif ptype == 'EOP' or ptype == 'ERR':
                 self.es_packet = es
                 self.handle_packet()
                 self.packet, self.packet_summary = [], ''
-                self.bits, self.state = [], 'WAIT FOR SOP'
+                self.bits = self.nbits = 0
+                self.bit_ss, self.bit_es = [], []
+                self.state = 'WAIT FOR SOP'
             else:
                 pass # TODO: Error
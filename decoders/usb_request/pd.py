@@ -200,7 +200,7 @@ def handle_transfer(self):
                 self.handle_request(0, 1)
 
         if not (addr, ep) in self.request:
-            self.request[(addr, ep)] = {'setup_data': [], 'data': [],
+            self.request[(addr, ep)] = {'setup_data': b'', 'data': bytearray(),
                 'type': None, 'ss': self.ss_transaction, 'es': None,
                 'ss_data': None, 'id': self.request_id, 'addr': addr, 'ep': ep}
             self.request_id += 1
@@ -228,7 +228,7 @@ def handle_transfer(self):
         elif request['type'] is None and self.transaction_type == 'SETUP':
             request['setup_data'] = self.transaction_data
             request['wLength'] = struct.unpack('<H',
-                bytes(self.transaction_data[6:8]))[0]
+                self.transaction_data[6:8])[0]
             if self.transaction_data[0] & 0x80:
                 request['type'] = 'SETUP IN'
                 self.handle_request(1, 0)
@@ -270,11 +270,9 @@ def write_pcap_header(self):
     def request_summary(self, request):
         s = '['
         if request['type'] in ('SETUP IN', 'SETUP OUT'):
-            for b in request['setup_data']:
-                s += ' %02X' % b
+            s += ''.join(' %02X' % b for b in request['setup_data'])
             s += ' ]['
-        for b in request['data']:
-            s += ' %02X' % b
+        s += ''.join(' %02X' % b for b in request['data'])
         s += ' ] : %s' % request['handshake']
         return s
 
@@ -347,7 +345,7 @@ def decode(self, ss, es, data):
                 return
 
             sync, pid, addr, ep, crc5 = pinfo
-            self.transaction_data = []
+            self.transaction_data = b''
             self.ss_transaction = ss
             self.es_transaction = es
             self.transaction_state = 'TOKEN RECEIVED'
@@ -363,7 +361,7 @@ def decode(self, ss, es, data):
                     (pname, self.transaction_state)]])
                 return
 
-            self.transaction_data = pinfo[2]
+            self.transaction_data = bytes(pinfo[2])
             self.transaction_state = 'DATA RECEIVED'
 
         elif pcategory == 'HANDSHAKE':
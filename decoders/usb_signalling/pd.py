@@ -31,6 +31,7 @@
  - 'SOP', None
  - 'SYM', <sym>
  - 'BIT', <bit>
+ - 'BITS', [<nbits>, <value>, <bit_ss>, <bit_es>]
  - 'STUFF BIT', None
  - 'EOP', None
  - 'ERR', None
@@ -43,8 +44,22 @@
 <bit>:
  - '0' or '1'
  - Note: Symbols like SE0, SE1, and the J that's part of EOP don't yield 'BIT'.
+
+<nbits>, <value>, <bit_ss>, <bit_es>:
+ - All bits of a packet (without stuff bits) in one go, sent right before
+   the 'EOP' or 'ERR' which ends the packet. It spans the whole packet.
+ - <nbits> is the number of bits.
+ - <value> is an integer with the first bit on the wire in its LSB, the
+   way USB sends its fields, so these can be taken apart by shifts and
+   masks (e.g. the PID is (value >> 8) & 0xff).
+ - <bit_ss> and <bit_es> are lists with the start and end samples of
+   each bit, like the ones of the 'BIT' packets.
 '''
 
+# SYNC pattern and low-speed PREamble PID (00000001 00111100), first bit
+# in the LSB.
+SYNC_PRE = 0x3c80
+
 # Low-/full-speed symbols.
 # Note: Low-speed J and K are inverted compared to the full-speed J and K!
 symbols = {
@@ -153,7 +168,10 @@ def reset(self):
         self.samplenum_lastedge = 0
         self.edgepins = None
         self.consecutive_ones = 0
-        self.bits = None
+        self.sync_bits = self.sync_nbits = 0
+        self.ss_packet = None
+        self.bits = self.nbits = 0
+        self.bit_ss, self.bit_es = [], []
         self.state = St.IDLE
 
     def start(self):
@@ -195,6 +213,18 @@ def putb(self, data):
         s, e = self.samplenum_lastedge, self.samplenum_edge
         self.put(s, e, self.out_ann, data)
 
+    def putpbits(self):
+        # All bits of the packet, right before the 'EOP' or 'ERR' which
+        # ends it.
+        s, e = self.ss_packet, self.samplenum_edge
+        self.put(s, e, self.out_python,
+                 ['BITS', [self.nbits, self.bits, self.bit_ss, self.bit_es]])
+
+    def putsym(self, sym):
+        ann = sym_annotation[sym]
+        if self.ann_enabled(ann[0]):
+            self.putb(ann)
+
     def set_new_target_samplenum(self):
         self.samplepos += self.bitwidth
         self.samplenum_target = int(self.samplepos)
@@ -206,30 +236,40 @@ def wait_for_sop(self, sym):
         if sym != 'K' or self.oldsym != 'J':
             return
         self.consecutive_ones = 0
-        self.bits = ''
+        self.sync_bits = self.sync_nbits = 0
+        self.bits = self.nbits = 0
+        self.bit_ss, self.bit_es = [], []
         self.update_bitrate()
         self.samplepos = self.samplenum - (self.bitwidth / 2) + 0.5
         self.set_new_target_samplenum()
+        self.ss_packet = self.samplenum_edge
         self.putpx(['SOP', None])
         self.putx([4, ['SOP', 'S']])
         self.state = St.GET_BIT
 
     def handle_bit(self, b):
         if self.consecutive_ones == 6:
-            if b == '0':
+            if not b:
                 # Stuff bit.
                 self.putpb(['STUFF BIT', None])
                 self.putb([7, ['Stuff bit: 0', 'SB: 0', '0']])
                 self.consecutive_ones = 0
             else:
+                self.putpbits()
                 self.putpb(['ERR', None])
                 self.putb([8, ['Bit stuff error', 'BS ERR', 'B']])
                 self.state = St.IDLE
         else:
             # Normal bit (not a stuff bit).
-            self.putpb(['BIT', b])
-            self.putb([6, ['%s' % b]])
-            if b == '1':
+            bitstr = '01'[b]
+            self.putpb(['BIT', bitstr])
+            if self.ann_enabled(6):
+                self.putb([6, [bitstr]])
+            self.bits |= b << self.nbits
+            self.nbits += 1
+            self.bit_ss.append(self.samplenum_lastedge)
+            self.bit_es.append(self.samplenum_edge)
+            if b:
                 self.consecutive_ones += 1
             else:
                 self.consecutive_ones = 0
@@ -238,23 +278,25 @@ def get_eop(self, sym):
         # EOP: SE0 for >= 1 bittime (usually 2 bittimes), then J.
         self.set_new_target_samplenum()
         self.putpb(['SYM', sym])
-        self.putb(sym_annotation[sym])
+        self.putsym(sym)
         self.oldsym = sym
         if sym == 'SE0':
             pass
         elif sym == 'J':
             # Got an EOP.
+            self.putpbits()
             self.putpm(['EOP', None])
             self.putm([5, ['EOP', 'E']])
             self.state = St.WAIT_IDLE
         else:
+            self.putpbits()
             self.putpm(['ERR', None])
             self.putm([8, ['EOP Error', 'EErr', 'E']])
             self.state = St.IDLE
 
     def get_bit(self, sym):
         self.set_new_target_samplenum()
-        b = '0' if self.oldsym != sym else '1'
+        b = 0 if self.oldsym != sym else 1
         self.oldsym = sym
         if sym == 'SE0':
             # Start of an EOP. Change state, save edge
@@ -263,17 +305,19 @@ def get_bit(self, sym):
         else:
             self.handle_bit(b)
         self.putpb(['SYM', sym])
-        self.putb(sym_annotation[sym])
-        if len(self.bits) <= 16:
-            self.bits += b
-        if len(self.bits) == 16 and self.bits == '0000000100111100':
-            # Sync and low-speed PREamble seen
-            self.putpx(['EOP', None])
-            self.state = St.IDLE
-            self.signalling = 'low-speed-rp'
-            self.update_bitrate()
-            self.oldsym = 'J'
-        if b == '0':
+        self.putsym(sym)
+        if self.sync_nbits < 16:
+            self.sync_bits |= b << self.sync_nbits
+            self.sync_nbits += 1
+            if self.sync_nbits == 16 and self.sync_bits == SYNC_PRE:
+                # Sync and low-speed PREamble seen
+                self.putpbits()
+                self.putpx(['EOP', None])
+                self.state = St.IDLE
+                self.signalling = 'low-speed-rp'
+                self.update_bitrate()
+                self.oldsym = 'J'
+        if not b:
             edgesym = symbols[self.signalling][tuple(self.edgepins)]
             if edgesym not in ('SE0', 'SE1'):
                 if edgesym == sym:
@@ -312,11 +356,15 @@ def decode(self):
         sym = symbols[self.options['signalling']][pins]
         self.handle_idle(sym)
 
+        # The conditions get reused for every bit, compile them once.
+        cond_edge = self.compile_conditions([{0: 'e'}, {1: 'e'}])
+        cond_high = self.compile_conditions([{0: 'h'}, {1: 'h'}])
+
         while True:
             # State machine.
             if self.state == St.IDLE:
                 # Wait for any edge on either DP and/or DM.
-                pins = self.wait([{0: 'e'}, {1: 'e'}])
+                pins = self.wait(cond_edge)
                 sym = symbols[self.signalling][pins]
                 if sym == 'SE0':
                     self.samplenum_lastedge = self.samplenum
@@ -325,9 +373,9 @@ def decode(self):
                     self.wait_for_sop(sym)
                 self.edgepins = pins
             elif self.state in (St.GET_BIT, St.GET_EOP):
-                # Wait until we're in the middle of the desired bit.
-                self.edgepins = self.wait([{'skip': self.samplenum_edge - self.samplenum}])
-                pins = self.wait([{'skip': self.samplenum_target - self.samplenum}])
+                # Get the pins at the bit's edge and in its middle.
+                self.edgepins, pins = self.sample_at((self.samplenum_edge,
+                    self.samplenum_target))
 
                 sym = symbols[self.signalling][pins]
                 if self.state == St.GET_BIT:
@@ -338,7 +386,7 @@ def decode(self):
                 # Skip "all-low" input. Wait for high level on either DP or DM.
                 pins = self.wait()
                 while not pins[0] and not pins[1]:
-                    pins = self.wait([{0: 'h'}, {1: 'h'}])
+                    pins = self.wait(cond_high)
                 if self.samplenum - self.samplenum_lastedge > 1:
                     sym = symbols[self.options['signalling']][pins]
                     self.handle_idle(sym)
@@ -28,7 +28,7 @@ static char *py_stringify(PyObject *py_obj)
 	PyObject *py_str, *py_bytes;
 	char *str = NULL;
 
-	/* Note: Caller already ran PyGILState_Ensure(). */
+	/* Note: Caller already ran srd_gil_ensure(NULL). */
 
 	if (!py_obj)
 		return NULL;
@@ -59,7 +59,7 @@ static char *py_get_string_attr(PyObject *py_obj, const char *attr)
 	PyObject *py_str, *py_bytes;
 	char *str = NULL;
 
-	/* Note: Caller already ran PyGILState_Ensure(). */
+	/* Note: Caller already ran srd_gil_ensure(NULL). */
 
 	if (!py_obj)
 		return NULL;
@@ -103,7 +103,7 @@ SRD_PRIV void srd_exception_catch(const char *format, ...)
 	msg = g_strdup_vprintf(format, args);
 	va_end(args);
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	PyErr_Fetch(&py_etype, &py_evalue, &py_etraceback);
 	if (!py_etype) {
@@ -166,7 +166,7 @@ cleanup:
 	/* Just in case. */
 	PyErr_Clear();
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	g_free(msg);
 }
@@ -112,11 +112,11 @@ SRD_API int srd_inst_option_set(struct srd_decoder_inst *di,
 		return SRD_ERR_ARG;
 	}
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(di->sess);
 
-	if (!PyObject_HasAttrString(di->decoder->py_dec, "options")) {
+	if (!PyObject_HasAttrString(di->py_inst, "options")) {
 		/* Decoder has no options. */
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		if (g_hash_table_size(options) == 0) {
 			/* No options provided. */
 			return SRD_OK;
@@ -201,11 +201,36 @@ err_out:
 		srd_exception_catch("Stray exception in srd_inst_option_set()");
 		ret = SRD_ERR_PYTHON;
 	}
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return ret;
 }
 
+/*
+ * Release the Python objects which wait() keeps for re-use. Must be
+ * called with the GIL held.
+ */
+static void py_value_cache_free(struct srd_decoder_inst *di)
+{
+	unsigned int i, count;
+
+	if (di->py_pinvalues_cache) {
+		count = 1U << di->dec_num_channels;
+		for (i = 0; i < count; i++)
+			Py_XDECREF(di->py_pinvalues_cache[i]);
+		g_free(di->py_pinvalues_cache);
+		di->py_pinvalues_cache = NULL;
+	}
+
+	if (di->py_matched_cache) {
+		count = 1U << (SRD_MATCHED_CACHE_CONDITIONS + 1);
+		for (i = 0; i < count; i++)
+			Py_XDECREF(di->py_matched_cache[i]);
+		g_free(di->py_matched_cache);
+		di->py_matched_cache = NULL;
+	}
+}
+
 /* Helper GComparefunc for g_slist_find_custom() in srd_inst_channel_set_all(). */
 static gint compare_channel_id(const struct srd_channel *pdch,
 			const char *channel_id)
@@ -237,6 +262,7 @@ SRD_API int srd_inst_channel_set_all(struct srd_decoder_inst *di,
 	struct srd_channel *pdch;
 	int *new_channelmap, new_channelnum, num_required_channels, i;
 	char *channel_id;
+	PyGILState_STATE gstate;
 
 	srd_dbg("Setting channels for instance %s with list of %d channels.",
 		di->inst_id, g_hash_table_size(new_channels));
@@ -316,9 +342,33 @@ SRD_API int srd_inst_channel_set_all(struct srd_decoder_inst *di,
 	g_free(di->dec_channelmap);
 	di->dec_channelmap = new_channelmap;
 
+	/* Cached pin value tuples depend on which channels are unused. */
+	gstate = srd_gil_ensure(di->sess);
+	py_value_cache_free(di);
+	srd_gil_release(gstate);
+
 	return SRD_OK;
 }
 
+static struct srd_inst_counters *counters_new(const struct srd_decoder *dec)
+{
+	struct srd_inst_counters *c;
+
+	c = g_malloc0(sizeof(*c));
+	c->num_ann_classes = g_slist_length(dec->annotations);
+	c->ann_put_calls = g_malloc0(c->num_ann_classes * sizeof(uint64_t));
+
+	return c;
+}
+
+static void counters_free(struct srd_inst_counters *c)
+{
+	if (!c)
+		return;
+	g_free(c->ann_put_calls);
+	g_free(c);
+}
+
 /**
  * Create a new protocol decoder instance.
  *
@@ -339,7 +389,8 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 	int i;
 	struct srd_decoder *dec;
 	struct srd_decoder_inst *di;
-	char *inst_id;
+	char *inst_id, *module_name;
+	PyObject *py_dec;
 	PyGILState_STATE gstate;
 
 	i = 1;
@@ -352,10 +403,23 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 		return NULL;
 	}
 
+	/*
+	 * The module of a decoder from the metadata cache gets imported
+	 * now. Isolated sessions import it into their own interpreter.
+	 */
+	module_name = NULL;
+	if (sess->interp) {
+		if (!(module_name = srd_decoder_module_name(dec)))
+			return NULL;
+	} else if (srd_decoder_import(dec) != SRD_OK) {
+		return NULL;
+	}
+
 	di = g_malloc0(sizeof(struct srd_decoder_inst));
 
 	di->decoder = dec;
 	di->sess = sess;
+	di->stack_bottom = di;
 
 	if (options) {
 		inst_id = g_hash_table_lookup(options, "id");
@@ -394,39 +458,51 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 	/* Default to the initial pins being the same as in sample 0. */
 	oldpins_array_seed(di);
 
-	gstate = PyGILState_Ensure();
+	di->stats = counters_new(dec);
+
+	gstate = srd_gil_ensure(sess);
 
 	/* Create a new instance of this decoder class. */
-	if (!(di->py_inst = PyObject_CallObject(dec->py_dec, NULL))) {
+	py_dec = dec->py_dec;
+	if (sess->interp)
+		py_dec = srd_interp_decoder_get(sess->interp, dec, module_name);
+	g_free(module_name);
+	if (!py_dec || !(di->py_inst = PyObject_CallObject(py_dec, NULL))) {
 		if (PyErr_Occurred())
 			srd_exception_catch("Failed to create %s instance",
 					decoder_id);
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
+		counters_free(di->stats);
 		g_free(di->dec_channelmap);
 		g_free(di);
 		return NULL;
 	}
+	srd_Decoder_inst_set(di->py_inst, di);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	if (options && srd_inst_option_set(di, options) != SRD_OK) {
+		counters_free(di->stats);
 		g_free(di->dec_channelmap);
 		g_free(di);
 		return NULL;
 	}
 
-	di->condition_list = NULL;
+	di->conditions = NULL;
 	di->match_array = NULL;
 	di->abs_start_samplenum = 0;
 	di->abs_end_samplenum = 0;
 	di->inbuf = NULL;
 	di->inbuflen = 0;
+	di->in_run_lengths = NULL;
+	di->in_num_runs = 0;
 	di->abs_cur_samplenum = 0;
 	di->thread_handle = NULL;
 	di->got_new_samples = FALSE;
 	di->handled_all_samples = FALSE;
 	di->want_wait_terminate = FALSE;
 	di->communicate_eof = FALSE;
+	di->resuming = FALSE;
 	di->decoder_state = SRD_OK;
 
 	/*
@@ -446,6 +522,33 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 	return di;
 }
 
+static void string_free(GString *str)
+{
+	g_string_free(str, TRUE);
+}
+
+static void ann_batch_clear(struct srd_ann_batch *batch)
+{
+	if (!batch)
+		return;
+
+	g_array_set_size(batch->records, 0);
+	g_ptr_array_set_size(batch->ann_texts, 0);
+	g_hash_table_remove_all(batch->text_index);
+}
+
+static void ann_batch_free(struct srd_ann_batch *batch)
+{
+	if (!batch)
+		return;
+
+	g_array_free(batch->records, TRUE);
+	g_ptr_array_free(batch->ann_texts, TRUE);
+	g_hash_table_destroy(batch->text_index);
+	g_string_free(batch->texts, TRUE);
+	g_free(batch);
+}
+
 static void srd_inst_join_decode_thread(struct srd_decoder_inst *di)
 {
 	if (!di)
@@ -496,8 +599,12 @@ static void srd_inst_reset_state(struct srd_decoder_inst *di)
 	di->abs_end_samplenum = 0;
 	di->inbuf = NULL;
 	di->inbuflen = 0;
+	di->in_run_lengths = NULL;
+	di->in_num_runs = 0;
 	di->abs_cur_samplenum = 0;
 	oldpins_array_free(di);
+	di->edge_scan_start = 0;
+	di->edge_scan_end = 0;
 	di->got_new_samples = FALSE;
 	di->handled_all_samples = FALSE;
 	di->want_wait_terminate = FALSE;
@@ -678,6 +785,284 @@ SRD_API int srd_inst_initial_pins_set_all(struct srd_decoder_inst *di, GArray *i
 	return SRD_OK;
 }
 
+/**
+ * Enable or disable an annotation class of a decoder instance.
+ *
+ * Annotations of disabled classes are dropped by put() before they get
+ * converted, and decoders can check for disabled classes with
+ * self.ann_enabled(), to not even format their texts. This is useful
+ * for frontends which don't show some of a decoder's annotations (e.g.
+ * rows of individual bits). All classes are enabled by default.
+ *
+ * This should be called before the session is started, or between
+ * chunks of sample data.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param ann_class The annotation class (index into the decoder's
+ *                  annotations).
+ * @param enable TRUE to enable the class, FALSE to disable it.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_inst_ann_class_enable(struct srd_decoder_inst *di,
+		int ann_class, gboolean enable)
+{
+	guint num_classes;
+
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return SRD_ERR_ARG;
+	}
+
+	num_classes = g_slist_length(di->decoder->annotations);
+	if (ann_class < 0 || (guint)ann_class >= num_classes) {
+		srd_err("Invalid annotation class %d for decoder %s.",
+			ann_class, di->decoder->id);
+		return SRD_ERR_ARG;
+	}
+
+	if (!di->ann_disabled) {
+		if (enable)
+			return SRD_OK;
+		di->ann_disabled = g_array_sized_new(FALSE, TRUE,
+				sizeof(guint8), num_classes);
+		g_array_set_size(di->ann_disabled, num_classes);
+	}
+	g_array_index(di->ann_disabled, guint8, ann_class) = !enable;
+
+	srd_dbg("%s annotation class %d of instance %s.",
+		enable ? "Enabling" : "Disabling", ann_class, di->inst_id);
+
+	return SRD_OK;
+}
+
+/**
+ * Enable or disable the annotation classes of an annotation row.
+ *
+ * See srd_inst_ann_class_enable() for details.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param row_id The ID of the annotation row. Must not be NULL.
+ * @param enable TRUE to enable the row's classes, FALSE to disable them.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_inst_ann_row_enable(struct srd_decoder_inst *di,
+		const char *row_id, gboolean enable)
+{
+	const GSList *l, *c;
+	const struct srd_decoder_annotation_row *row;
+	int ret;
+
+	if (!di || !row_id)
+		return SRD_ERR_ARG;
+
+	for (l = di->decoder->annotation_rows; l; l = l->next) {
+		row = l->data;
+		if (strcmp(row->id, row_id) != 0)
+			continue;
+		for (c = row->ann_classes; c; c = c->next) {
+			ret = srd_inst_ann_class_enable(di,
+					GPOINTER_TO_INT(c->data), enable);
+			if (ret != SRD_OK)
+				return ret;
+		}
+		return SRD_OK;
+	}
+
+	srd_err("Decoder %s has no annotation row %s.", di->decoder->id, row_id);
+
+	return SRD_ERR_ARG;
+}
+
+/**
+ * Check whether a decoder instance's annotations of a class are wanted.
+ *
+ * They are not when the class was disabled, or when the session has no
+ * callback which would receive them.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param ann_class The annotation class.
+ *
+ * @return TRUE if annotations of the class should be submitted.
+ *
+ * @private
+ */
+SRD_PRIV gboolean srd_inst_ann_wanted(const struct srd_decoder_inst *di,
+		int ann_class)
+{
+	if (di->ann_disabled && ann_class >= 0 &&
+			(guint)ann_class < di->ann_disabled->len &&
+			g_array_index(di->ann_disabled, guint8, ann_class))
+		return FALSE;
+
+	return di->sess->ann_batch_cb ||
+		srd_pd_output_callback_find(di->sess, SRD_OUTPUT_ANN);
+}
+
+/**
+ * Get the performance counters of a decoder instance.
+ *
+ * The counters tell how much work an instance does, to find out which
+ * decoder of a stack takes the time. They are only collected while the
+ * instance's session has them enabled, see srd_session_stats_set().
+ * The times are wall clock times of the decoder's worker thread.
+ *
+ * This should be called between chunks of sample data, or after the
+ * end of the data, when the decoders don't run.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @return A copy of the counters, to be released with g_free(), or NULL
+ *         upon errors. Its ann_put_calls array is part of the allocation.
+ *
+ * @since 0.6.0
+ */
+SRD_API struct srd_inst_stats *srd_inst_stats_get(
+		const struct srd_decoder_inst *di)
+{
+	struct srd_inst_counters *c;
+	struct srd_inst_stats *stats;
+	int64_t decode_time;
+
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return NULL;
+	}
+
+	c = di->stats;
+	stats = g_malloc0(sizeof(*stats) +
+			c->num_ann_classes * sizeof(uint64_t));
+	stats->wait_calls = c->wait_calls;
+	stats->matches = c->matches;
+	stats->samples_scanned = c->samples_scanned;
+	stats->match_time = c->match_time;
+	decode_time = c->busy_time - c->match_time - c->stacked_time;
+	stats->decode_time = MAX(decode_time, 0);
+	memcpy(stats->put_calls, c->put_calls, sizeof(stats->put_calls));
+	memcpy(stats->put_bytes, c->put_bytes, sizeof(stats->put_bytes));
+	stats->num_ann_classes = c->num_ann_classes;
+	stats->ann_put_calls = (uint64_t *)(stats + 1);
+	memcpy(stats->ann_put_calls, c->ann_put_calls,
+			c->num_ann_classes * sizeof(uint64_t));
+
+	return stats;
+}
+
+/**
+ * Reset the performance counters of a decoder instance to zero.
+ *
+ * See srd_inst_stats_get() for details.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_inst_stats_reset(struct srd_decoder_inst *di)
+{
+	struct srd_inst_counters *c;
+	uint64_t *ann_put_calls;
+	unsigned int num_ann_classes;
+	int64_t busy_since;
+
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return SRD_ERR_ARG;
+	}
+
+	c = di->stats;
+	ann_put_calls = c->ann_put_calls;
+	num_ann_classes = c->num_ann_classes;
+	busy_since = c->busy_since;
+	memset(c, 0, sizeof(*c));
+	memset(ann_put_calls, 0, num_ann_classes * sizeof(uint64_t));
+	c->ann_put_calls = ann_put_calls;
+	c->num_ann_classes = num_ann_classes;
+	if (busy_since)
+		c->busy_since = g_get_monotonic_time();
+
+	return SRD_OK;
+}
+
+/**
+ * Mark the begin or end of a busy period of a stack's worker thread.
+ *
+ * The time in between counts as busy time of the stack's bottom
+ * instance. Its decode() is busy unless it waits for sample data.
+ *
+ * @param di The decoder instance at the bottom of a stack.
+ * @param busy TRUE when the thread gets busy, FALSE when it gets idle.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_stats_busy(struct srd_decoder_inst *di, gboolean busy)
+{
+	struct srd_inst_counters *c;
+	int64_t now;
+
+	if (!(c = srd_inst_counters_get(di)))
+		return;
+
+	now = g_get_monotonic_time();
+	if (busy) {
+		c->busy_since = now;
+	} else if (c->busy_since) {
+		c->busy_time += now - c->busy_since;
+		c->busy_since = 0;
+	}
+}
+
+/**
+ * Log the performance counters of an instance and its stacked instances.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_stats_log(const struct srd_decoder_inst *di)
+{
+	struct srd_inst_stats *stats;
+	GString *ann;
+	GSList *l;
+	uint64_t i;
+
+	stats = srd_inst_stats_get(di);
+	ann = g_string_new(NULL);
+	for (i = 0; i < stats->num_ann_classes; i++) {
+		if (stats->ann_put_calls[i])
+			g_string_append_printf(ann, " %" PRIu64 ":%" PRIu64,
+				i, stats->ann_put_calls[i]);
+	}
+
+	srd_info("Instance %s: %" PRIu64 " wait() calls, %" PRIu64
+		" matches, %" PRIu64 " samples scanned, %" PRIu64
+		" us matching, %" PRIu64 " us in decode().", di->inst_id,
+		stats->wait_calls, stats->matches, stats->samples_scanned,
+		stats->match_time, stats->decode_time);
+	srd_info("Instance %s: put() %" PRIu64 " annotations, %" PRIu64
+		" python, %" PRIu64 " binary (%" PRIu64 " bytes), %" PRIu64
+		" logic, %" PRIu64 " meta; per annotation class:%s",
+		di->inst_id, stats->put_calls[SRD_OUTPUT_ANN],
+		stats->put_calls[SRD_OUTPUT_PYTHON],
+		stats->put_calls[SRD_OUTPUT_BINARY],
+		stats->put_bytes[SRD_OUTPUT_BINARY],
+		stats->put_calls[SRD_OUTPUT_LOGIC],
+		stats->put_calls[SRD_OUTPUT_META],
+		ann->len ? ann->str : " none");
+
+	g_string_free(ann, TRUE);
+	g_free(stats);
+
+	for (l = di->next_di; l; l = l->next)
+		srd_inst_stats_log(l->data);
+}
+
 /** @private */
 SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di)
 {
@@ -689,17 +1074,29 @@ SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di)
 
 	srd_dbg("Calling start() of instance %s.", di->inst_id);
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(di->sess);
 
 	/* Run self.start(). */
 	if (!(py_res = PyObject_CallMethod(di->py_inst, "start", NULL))) {
 		srd_exception_catch("Protocol decoder instance %s",
 				di->inst_id);
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return SRD_ERR_PYTHON;
 	}
 	Py_DECREF(py_res);
 
+	/*
+	 * Look up decode() once. For stacked PDs it gets called on every
+	 * put() of Python output by the PD below.
+	 */
+	Py_XDECREF(di->py_decode);
+	if (!(di->py_decode = PyObject_GetAttrString(di->py_inst, "decode"))) {
+		srd_exception_catch("Protocol decoder instance %s",
+				di->inst_id);
+		srd_gil_release(gstate);
+		return SRD_ERR_PYTHON;
+	}
+
 	/* Set self.samplenum to 0. */
 	py_samplenum = PyLong_FromUnsignedLongLong(0);
 	PyObject_SetAttrString(di->py_inst, "samplenum", py_samplenum);
@@ -708,11 +1105,15 @@ SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di)
 	/* Set self.matched to None. */
 	PyObject_SetAttrString(di->py_inst, "matched", Py_None);
 
-	PyGILState_Release(gstate);
+	/* Set self.resumed to False, srd_inst_resume() sets it. */
+	PyObject_SetAttrString(di->py_inst, "resumed", Py_False);
+
+	srd_gil_release(gstate);
 
 	/* Start all the PDs stacked on top of this one. */
 	for (l = di->next_di; l; l = l->next) {
 		next_di = l->data;
+		next_di->stack_bottom = di->stack_bottom;
 		if ((ret = srd_inst_start(next_di)) != SRD_OK)
 			return ret;
 	}
@@ -792,55 +1193,198 @@ SRD_PRIV void match_array_free(struct srd_decoder_inst *di)
 /** @private */
 SRD_PRIV void condition_list_free(struct srd_decoder_inst *di)
 {
-	GSList *l, *ll;
-
 	if (!di)
 		return;
 
-	for (l = di->condition_list; l; l = l->next) {
-		ll = l->data;
-		if (ll)
-			g_slist_free_full(ll, g_free);
+	srd_conditions_free(di->conditions);
+	di->conditions = NULL;
+}
+
+/** @private */
+SRD_PRIV struct srd_conditions *srd_conditions_new(void)
+{
+	return g_malloc0(sizeof(struct srd_conditions));
+}
+
+/** @private */
+SRD_PRIV void srd_conditions_free(struct srd_conditions *conds)
+{
+	if (!conds)
+		return;
+
+	g_free(conds->terms);
+	g_free(conds->cond_start);
+	g_free(conds);
+}
+
+/**
+ * Remove all conditions, but keep the memory for their next use.
+ *
+ * @private
+ */
+SRD_PRIV void srd_conditions_clear(struct srd_conditions *conds)
+{
+	conds->num_conditions = 0;
+	conds->num_terms = 0;
+}
+
+/**
+ * Append a new condition without any terms.
+ *
+ * @private
+ */
+SRD_PRIV void srd_conditions_add(struct srd_conditions *conds)
+{
+	unsigned int i;
+
+	if (conds->num_conditions + 2 > conds->max_conditions) {
+		conds->max_conditions = MAX(8, 2 * conds->max_conditions);
+		conds->cond_start = g_renew(unsigned int, conds->cond_start,
+			conds->max_conditions);
+	}
+	i = conds->num_conditions++;
+	conds->cond_start[i] = conds->num_terms;
+	conds->cond_start[i + 1] = conds->num_terms;
+}
+
+/**
+ * Append a term to the last condition.
+ *
+ * @return The new term, all of its fields are zero.
+ *
+ * @private
+ */
+SRD_PRIV struct srd_term *srd_conditions_add_term(struct srd_conditions *conds)
+{
+	struct srd_term *term;
+
+	if (conds->num_terms + 1 > conds->max_terms) {
+		conds->max_terms = MAX(8, 2 * conds->max_terms);
+		conds->terms = g_renew(struct srd_term, conds->terms,
+			conds->max_terms);
 	}
+	term = &conds->terms[conds->num_terms++];
+	memset(term, 0, sizeof(*term));
+	conds->cond_start[conds->num_conditions] = conds->num_terms;
 
-	g_slist_free(di->condition_list);
-	di->condition_list = NULL;
+	return term;
 }
 
-static gboolean have_non_null_conds(const struct srd_decoder_inst *di)
+/**
+ * Replace the conditions in 'dst' by a copy of those in 'src'.
+ *
+ * @private
+ */
+SRD_PRIV void srd_conditions_copy(struct srd_conditions *dst,
+	const struct srd_conditions *src)
 {
-	GSList *l, *cond;
+	if (src->num_conditions + 1 > dst->max_conditions) {
+		dst->max_conditions = src->num_conditions + 1;
+		dst->cond_start = g_renew(unsigned int, dst->cond_start,
+			dst->max_conditions);
+	}
+	if (src->num_terms > dst->max_terms) {
+		dst->max_terms = src->num_terms;
+		dst->terms = g_renew(struct srd_term, dst->terms,
+			dst->max_terms);
+	}
+	dst->num_conditions = src->num_conditions;
+	dst->num_terms = src->num_terms;
+	if (src->num_conditions)
+		memcpy(dst->cond_start, src->cond_start,
+			(src->num_conditions + 1) * sizeof(dst->cond_start[0]));
+	if (src->num_terms)
+		memcpy(dst->terms, src->terms,
+			src->num_terms * sizeof(dst->terms[0]));
+}
 
-	if (!di)
+static gboolean have_non_null_conds(const struct srd_decoder_inst *di)
+{
+	if (!di || !di->conditions)
 		return FALSE;
 
-	for (l = di->condition_list; l; l = l->next) {
-		cond = l->data;
-		if (cond)
-			return TRUE;
+	/* Terms only exist within conditions. */
+	return di->conditions->num_terms > 0;
+}
+
+/**
+ * Get the location of a sample's data in the current chunk.
+ *
+ * For run-length encoded input this is the value of the run which
+ * contains the sample. Runs get looked up from the most recently used
+ * run onwards, which is cheap for increasing sample numbers.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param abs_samplenum The absolute sample number. Must be within the
+ *                      current chunk.
+ *
+ * @return Pointer to the sample's unitsize bytes.
+ *
+ * @private
+ */
+SRD_PRIV const uint8_t *srd_inst_sample_pos(struct srd_decoder_inst *di,
+		uint64_t abs_samplenum)
+{
+	if (!di->in_run_lengths) {
+		return di->inbuf + ((abs_samplenum - di->abs_start_samplenum) *
+			di->data_unitsize);
 	}
 
-	return FALSE;
+	if (abs_samplenum < di->in_run_start) {
+		di->in_run_idx = 0;
+		di->in_run_start = di->abs_start_samplenum;
+	}
+	while (di->in_run_idx + 1 < di->in_num_runs &&
+	       abs_samplenum >= di->in_run_start + di->in_run_lengths[di->in_run_idx]) {
+		di->in_run_start += di->in_run_lengths[di->in_run_idx];
+		di->in_run_idx++;
+	}
+
+	return di->inbuf + di->in_run_idx * di->data_unitsize;
 }
 
-static void update_old_pins_array(struct srd_decoder_inst *di,
+/*
+ * Update the "old" pins from the sample at the given position. Returns
+ * whether any of the mapped channels has changed its value.
+ */
+static gboolean update_old_pins_array(struct srd_decoder_inst *di,
 		const uint8_t *sample_pos)
 {
 	uint8_t sample;
 	int i, byte_offset, bit_offset;
+	gboolean changed;
 
 	if (!di || !di->dec_channelmap || !sample_pos)
-		return;
+		return TRUE;
 
 	oldpins_array_seed(di);
+	changed = FALSE;
 	for (i = 0; i < di->dec_num_channels; i++) {
 		if (di->dec_channelmap[i] == -1)
 			continue; /* Ignore unused optional channels. */
 		byte_offset = di->dec_channelmap[i] / 8;
 		bit_offset = di->dec_channelmap[i] % 8;
 		sample = *(sample_pos + byte_offset) & (1 << bit_offset) ? 1 : 0;
+		if (di->old_pins_array->data[i] != sample)
+			changed = TRUE;
 		di->old_pins_array->data[i] = sample;
 	}
+
+	return changed;
+}
+
+/**
+ * Make a sample the reference for subsequent edge conditions.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param sample_pos The sample, see srd_inst_sample_pos().
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_old_pins_set(struct srd_decoder_inst *di,
+		const uint8_t *sample_pos)
+{
+	(void)update_old_pins_array(di, sample_pos);
 }
 
 static void update_old_pins_array_initial_pins(struct srd_decoder_inst *di)
@@ -852,7 +1396,7 @@ static void update_old_pins_array_initial_pins(struct srd_decoder_inst *di)
 	if (!di || !di->dec_channelmap)
 		return;
 
-	sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+	sample_pos = srd_inst_sample_pos(di, di->abs_cur_samplenum);
 
 	oldpins_array_seed(di);
 	for (i = 0; i < di->dec_num_channels; i++) {
@@ -867,6 +1411,21 @@ static void update_old_pins_array_initial_pins(struct srd_decoder_inst *di)
 	}
 }
 
+/**
+ * Set up the initial pin values at sample 0, like wait() does before it
+ * inspects the sample. Pins without an initial value assume the value
+ * which they have in sample 0.
+ *
+ * @param di The decoder instance to use. Must not be NULL. Its current
+ *           sample must be sample 0.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_initial_pins_apply(struct srd_decoder_inst *di)
+{
+	update_old_pins_array_initial_pins(di);
+}
+
 static gboolean term_matches(const struct srd_decoder_inst *di,
 		struct srd_term *term, const uint8_t *sample_pos)
 {
@@ -888,15 +1447,12 @@ static gboolean term_matches(const struct srd_decoder_inst *di,
 }
 
 static gboolean all_terms_match(const struct srd_decoder_inst *di,
-		const GSList *cond, const uint8_t *sample_pos)
+		struct srd_term *term, struct srd_term *end,
+		const uint8_t *sample_pos)
 {
-	const GSList *l;
-	struct srd_term *term;
+	/* Caller ensures di, term, sample_pos != NULL. */
 
-	/* Caller ensures di, cond, sample_pos != NULL. */
-
-	for (l = cond; l; l = l->next) {
-		term = l->data;
+	for (; term < end; term++) {
 		if (term->type == SRD_TERM_ALWAYS_FALSE)
 			return FALSE;
 		if (!term_matches(di, term, sample_pos))
@@ -921,17 +1477,258 @@ static gboolean at_least_one_condition_matched(
 	return FALSE;
 }
 
-static gboolean find_match(struct srd_decoder_inst *di)
-{
-	uint64_t i, j, num_samples_to_process;
-	GSList *l, *cond;
-	const uint8_t *sample_pos;
-	unsigned int num_conditions;
+/**
+ * Prepare the edge index for a new chunk of input data.
+ *
+ * Derives the mask of sample bits which carry the instance's mapped
+ * channels (depends on the unitsize of the chunk), and invalidates
+ * the previous chunk's results of the search for channel changes.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ *
+ * @private
+ */
+static void edge_index_reset(struct srd_decoder_inst *di)
+{
+	int i, ch;
+	unsigned int b;
+
+	di->edge_mask = g_realloc(di->edge_mask, di->data_unitsize);
+	memset(di->edge_mask, 0, di->data_unitsize);
+	for (i = 0; i < di->dec_num_channels; i++) {
+		ch = di->dec_channelmap ? di->dec_channelmap[i] : -1;
+		if (ch < 0 || ch / 8 >= di->data_unitsize)
+			continue; /* Ignore unused optional channels. */
+		di->edge_mask[ch / 8] |= 1 << (ch % 8);
+	}
+
+	/* Replicate the mask when a word holds several whole samples. */
+	di->edge_mask_word = 0;
+	if (di->data_unitsize <= 8 && (8 % di->data_unitsize) == 0) {
+		for (b = 0; b < 8; b++)
+			di->edge_mask_word |= (uint64_t)di->edge_mask[b % di->data_unitsize] << (8 * b);
+	}
+
+	di->edge_scan_start = di->abs_start_samplenum;
+	di->edge_scan_end = di->abs_start_samplenum;
+	di->in_run_idx = 0;
+	di->in_run_start = di->abs_start_samplenum;
+}
+
+/* Get the index of the lowest addressed non-zero byte in a word. */
+static inline unsigned int first_nonzero_byte(uint64_t word)
+{
+#ifdef WORDS_BIGENDIAN
+	return __builtin_clzll(word) / 8;
+#else
+	return __builtin_ctzll(word) / 8;
+#endif
+}
+
+/* Check whether two samples differ in any of the mapped channels. */
+static gboolean samples_differ(const struct srd_decoder_inst *di,
+		const uint8_t *a, const uint8_t *b)
+{
+	int i;
+
+	for (i = 0; i < di->data_unitsize; i++) {
+		if ((a[i] ^ b[i]) & di->edge_mask[i])
+			return TRUE;
+	}
+
+	return FALSE;
+}
+
+/*
+ * Find the next channel change in run-length encoded input. Changes
+ * can only occur at the start of a run, and every run is inspected
+ * at most once, regardless of its length.
+ */
+static uint64_t next_run_change(struct srd_decoder_inst *di, uint64_t from)
+{
+	const uint8_t *values;
+	uint64_t idx, start;
+	unsigned int unitsize;
+
+	/* Locate the run which contains 'from'. */
+	(void)srd_inst_sample_pos(di, from);
+	idx = di->in_run_idx;
+	start = di->in_run_start;
+	if (from > start) {
+		start += di->in_run_lengths[idx];
+		idx++;
+	}
+
+	values = di->inbuf;
+	unitsize = di->data_unitsize;
+	while (idx < di->in_num_runs) {
+		if (samples_differ(di, values + idx * unitsize,
+				values + (idx - 1) * unitsize))
+			break;
+		start += di->in_run_lengths[idx];
+		idx++;
+	}
+
+	return MIN(start, di->abs_end_samplenum);
+}
+
+/**
+ * Find the next sample where any of the mapped channels changes.
+ *
+ * Compares each sample against its predecessor in the current chunk,
+ * a machine word at a time where the unitsize permits. The result is
+ * kept, repeated searches which start within a previously scanned
+ * range without changes return immediately.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param from The absolute sample number to start the search at.
+ *             Must be larger than the chunk's start sample number.
+ *
+ * @return The absolute number of the first sample at or after 'from'
+ *         which differs from its predecessor, or the chunk's end sample
+ *         number if no such sample exists.
+ *
+ * @private
+ */
+static uint64_t next_channel_change(struct srd_decoder_inst *di, uint64_t from)
+{
+	const uint8_t *inbuf;
+	uint64_t idx, count, word, prev_word;
+	unsigned int unitsize, per_word, b;
+
+	if (from >= di->edge_scan_start && from <= di->edge_scan_end)
+		return di->edge_scan_end;
+
+	if (di->in_run_lengths) {
+		di->edge_scan_start = from;
+		di->edge_scan_end = next_run_change(di, from);
+		return di->edge_scan_end;
+	}
+
+	inbuf = di->inbuf;
+	unitsize = di->data_unitsize;
+	idx = from - di->abs_start_samplenum;
+	count = di->abs_end_samplenum - di->abs_start_samplenum;
+
+	if (di->edge_mask_word) {
+		per_word = 8 / unitsize;
+		while (idx + per_word <= count) {
+			memcpy(&word, inbuf + idx * unitsize, sizeof(word));
+			memcpy(&prev_word, inbuf + (idx - 1) * unitsize, sizeof(word));
+			word = (word ^ prev_word) & di->edge_mask_word;
+			if (word) {
+				idx += first_nonzero_byte(word) / unitsize;
+				goto found;
+			}
+			idx += per_word;
+		}
+	}
+	for (; idx < count; idx++) {
+		for (b = 0; b < unitsize; b++) {
+			if ((inbuf[idx * unitsize + b] ^
+			     inbuf[(idx - 1) * unitsize + b]) & di->edge_mask[b])
+				goto found;
+		}
+	}
+
+found:
+	di->edge_scan_start = from;
+	di->edge_scan_end = di->abs_start_samplenum + idx;
+
+	return di->edge_scan_end;
+}
+
+/**
+ * Check whether runs of unchanged samples can be skipped over.
+ *
+ * Terms only depend on the current and the previous sample's pin
+ * values, except for SRD_TERM_SKIP which counts evaluated samples. In
+ * a run of identical samples all terms but 'skip' yield the same result
+ * as they did for the run's first sample. Such runs can be skipped as
+ * long as skip counts are kept, which is straight forward for 'skip'
+ * terms which form a condition of their own. When 'skip' is combined
+ * with other terms, its count depends on the evaluation of the other
+ * terms, and samples need to get inspected one by one.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ *
+ * @return TRUE when runs of unchanged samples can be skipped.
+ *
+ * @private
+ */
+static gboolean edge_skipping_possible(const struct srd_decoder_inst *di)
+{
+	const struct srd_conditions *conds;
+	unsigned int i, t;
+
+	conds = di->conditions;
+	for (i = 0; i < conds->num_conditions; i++) {
+		for (t = conds->cond_start[i]; t < conds->cond_start[i + 1]; t++) {
+			if (conds->terms[t].type != SRD_TERM_SKIP)
+				continue;
+			if (conds->cond_start[i + 1] - conds->cond_start[i] != 1)
+				return FALSE;
+		}
+	}
+
+	return TRUE;
+}
+
+/**
+ * Skip over samples which are known to not match any condition.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param limit The absolute sample number to advance to at most.
+ *
+ * @private
+ */
+static void skip_unchanged_samples(struct srd_decoder_inst *di, uint64_t limit)
+{
+	struct srd_conditions *conds;
+	struct srd_term *term;
+	uint64_t count, remain;
+	unsigned int t;
+
+	/*
+	 * Stop at the sample where a 'skip' term will match. Such terms
+	 * form conditions of their own, see edge_skipping_possible().
+	 */
+	conds = di->conditions;
+	for (t = 0; t < conds->num_terms; t++) {
+		term = &conds->terms[t];
+		if (term->type != SRD_TERM_SKIP)
+			continue;
+		remain = term->num_samples_to_skip - term->num_samples_already_skipped;
+		if (limit - di->abs_cur_samplenum > remain)
+			limit = di->abs_cur_samplenum + remain;
+	}
+
+	count = limit - di->abs_cur_samplenum;
+	if (!count)
+		return;
+
+	/* Account for the samples which have been skipped. */
+	for (t = 0; t < conds->num_terms; t++) {
+		term = &conds->terms[t];
+		if (term->type == SRD_TERM_SKIP)
+			term->num_samples_already_skipped += count;
+	}
+	di->abs_cur_samplenum = limit;
+}
+
+static gboolean find_match(struct srd_decoder_inst *di)
+{
+	uint64_t next_change;
+	struct srd_conditions *conds;
+	const uint8_t *sample_pos;
+	unsigned int j, num_conditions;
+	gboolean skip_unchanged, changed;
 
 	/* Caller ensures di != NULL. */
 
 	/* Check whether the condition list is NULL/empty. */
-	if (!di->condition_list) {
+	conds = di->conditions;
+	if (!conds || !conds->num_conditions) {
 		srd_dbg("NULL/empty condition list, automatic match.");
 		return TRUE;
 	}
@@ -942,41 +1739,87 @@ static gboolean find_match(struct srd_decoder_inst *di)
 		return TRUE;
 	}
 
-	num_samples_to_process = di->abs_end_samplenum - di->abs_cur_samplenum;
-	num_conditions = g_slist_length(di->condition_list);
+	num_conditions = conds->num_conditions;
+	skip_unchanged = edge_skipping_possible(di);
 
-	/* di->match_array is NULL here. Create a new GArray. */
-	di->match_array = g_array_sized_new(FALSE, TRUE, sizeof(gboolean), num_conditions);
+	/* Re-use the match array of previous wait() calls. */
+	if (!di->match_array)
+		di->match_array = g_array_sized_new(FALSE, TRUE,
+			sizeof(gboolean), num_conditions);
 	g_array_set_size(di->match_array, num_conditions);
 
 	/* Sample 0: Set di->old_pins_array for SRD_INITIAL_PIN_SAME_AS_SAMPLE0 pins. */
 	if (di->abs_cur_samplenum == 0)
 		update_old_pins_array_initial_pins(di);
 
-	for (i = 0; i < num_samples_to_process; i++, (di->abs_cur_samplenum)++) {
+	while (di->abs_cur_samplenum < di->abs_end_samplenum) {
 
-		sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+		sample_pos = srd_inst_sample_pos(di, di->abs_cur_samplenum);
 
 		/* Check whether the current sample matches at least one of the conditions (logical OR). */
 		/* IMPORTANT: We need to check all conditions, even if there was a match already! */
-		for (l = di->condition_list, j = 0; l; l = l->next, j++) {
-			cond = l->data;
-			if (!cond)
+		for (j = 0; j < num_conditions; j++) {
+			if (conds->cond_start[j] == conds->cond_start[j + 1])
 				continue;
-			/* All terms in 'cond' must match (logical AND). */
-			di->match_array->data[j] = all_terms_match(di, cond, sample_pos);
+			/* All terms of the condition must match (logical AND). */
+			di->match_array->data[j] = all_terms_match(di,
+				&conds->terms[conds->cond_start[j]],
+				&conds->terms[conds->cond_start[j + 1]], sample_pos);
 		}
 
-		update_old_pins_array(di, sample_pos);
+		changed = update_old_pins_array(di, sample_pos);
 
 		/* If at least one condition matched we're done. */
 		if (at_least_one_condition_matched(di, num_conditions))
 			return TRUE;
+
+		di->abs_cur_samplenum++;
+
+		/*
+		 * A sample which equals its predecessor did not match. Neither
+		 * will the subsequent samples until one of the channels
+		 * changes, or a 'skip' term's count is reached. Jump there.
+		 */
+		if (!skip_unchanged || changed)
+			continue;
+		if (di->abs_cur_samplenum >= di->abs_end_samplenum)
+			break;
+		next_change = next_channel_change(di, di->abs_cur_samplenum);
+		skip_unchanged_samples(di, next_change);
 	}
 
 	return FALSE;
 }
 
+/*
+ * Look for the next condition match in the current chunk. Kept out of
+ * line, so that the counters in the caller don't slow down the loop.
+ */
+__attribute__((noinline))
+static void find_next_match(struct srd_decoder_inst *di, gboolean *found_match)
+{
+	/* Check if any of the current condition(s) match. */
+	while (TRUE) {
+		/* Feed the (next chunk of the) buffer to find_match(). */
+		*found_match = find_match(di);
+
+		/* Did we handle all samples yet? */
+		if (di->abs_cur_samplenum >= di->abs_end_samplenum) {
+			srd_dbg("Done, handled all samples (abs cur %" PRIu64
+				" / abs end %" PRIu64 ").",
+				di->abs_cur_samplenum, di->abs_end_samplenum);
+			return;
+		}
+
+		/* If we didn't find a match, continue looking. */
+		if (!(*found_match))
+			continue;
+
+		/* At least one condition matched, return. */
+		return;
+	}
+}
+
 /**
  * Process available samples and check if they match the defined conditions.
  *
@@ -996,6 +1839,10 @@ static gboolean find_match(struct srd_decoder_inst *di)
  */
 SRD_PRIV int process_samples_until_condition_match(struct srd_decoder_inst *di, gboolean *found_match)
 {
+	struct srd_inst_counters *c;
+	uint64_t start_samplenum;
+	int64_t start_time;
+
 	if (!di || !found_match)
 		return SRD_ERR_ARG;
 
@@ -1003,25 +1850,17 @@ SRD_PRIV int process_samples_until_condition_match(struct srd_decoder_inst *di,
 	if (di->want_wait_terminate)
 		return SRD_OK;
 
-	/* Check if any of the current condition(s) match. */
-	while (TRUE) {
-		/* Feed the (next chunk of the) buffer to find_match(). */
-		*found_match = find_match(di);
+	start_samplenum = di->abs_cur_samplenum;
+	start_time = 0;
+	if ((c = srd_inst_counters_get(di)))
+		start_time = g_get_monotonic_time();
 
-		/* Did we handle all samples yet? */
-		if (di->abs_cur_samplenum >= di->abs_end_samplenum) {
-			srd_dbg("Done, handled all samples (abs cur %" PRIu64
-				" / abs end %" PRIu64 ").",
-				di->abs_cur_samplenum, di->abs_end_samplenum);
-			return SRD_OK;
-		}
-
-		/* If we didn't find a match, continue looking. */
-		if (!(*found_match))
-			continue;
+	find_next_match(di, found_match);
 
-		/* At least one condition matched, return. */
-		return SRD_OK;
+	if (c) {
+		c->matches += *found_match ? 1 : 0;
+		c->samples_scanned += di->abs_cur_samplenum - start_samplenum;
+		c->match_time += g_get_monotonic_time() - start_time;
 	}
 
 	return SRD_OK;
@@ -1049,7 +1888,7 @@ static gpointer di_thread(gpointer data)
 
 	srd_dbg("%s: Starting thread routine for decoder.", di->inst_id);
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(di->sess);
 
 	/*
 	 * Call self.decode(). Only returns if the PD throws an exception.
@@ -1057,7 +1896,9 @@ static gpointer di_thread(gpointer data)
 	 */
 	Py_INCREF(di->py_inst);
 	srd_dbg("%s: Calling decode().", di->inst_id);
+	srd_inst_stats_busy(di, TRUE);
 	py_res = PyObject_CallMethod(di->py_inst, "decode", NULL);
+	srd_inst_stats_busy(di, FALSE);
 	srd_dbg("%s: decode() terminated.", di->inst_id);
 
 	/*
@@ -1100,7 +1941,7 @@ static gpointer di_thread(gpointer data)
 		 */
 		srd_dbg("%s: Thread done (!res, want_term).", di->inst_id);
 		PyErr_Clear();
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return NULL;
 	}
 	if (!py_res) {
@@ -1112,7 +1953,7 @@ static gpointer di_thread(gpointer data)
 		srd_dbg("%s: decode() terminated unrequested.", di->inst_id);
 		srd_exception_catch("Protocol decoder instance %s: ", di->inst_id);
 		srd_dbg("%s: Thread done (!res, !want_term).", di->inst_id);
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return NULL;
 	}
 
@@ -1125,13 +1966,385 @@ static gpointer di_thread(gpointer data)
 	Py_DECREF(py_res);
 	PyErr_Clear();
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	srd_dbg("%s: Thread done (with res).", di->inst_id);
 
 	return NULL;
 }
 
+/*
+ * Check whether decode() is a generator function. It isn't known when
+ * start() failed. Expects the GIL.
+ */
+static gboolean is_generator_function(struct srd_decoder_inst *di)
+{
+	PyObject *py_mod, *py_res;
+	int ret;
+
+	if (!di->py_decode)
+		return FALSE;
+
+	py_res = NULL;
+	if ((py_mod = py_import_by_name("inspect"))) {
+		py_res = PyObject_CallMethod(py_mod, "isgeneratorfunction",
+			"O", di->py_decode);
+		Py_DECREF(py_mod);
+	}
+	ret = py_res ? PyObject_IsTrue(py_res) : -1;
+	Py_XDECREF(py_res);
+	if (ret < 0)
+		srd_exception_catch("Protocol decoder instance %s: ",
+			di->inst_id);
+
+	return ret > 0;
+}
+
+/*
+ * Resume a generator based decode() with the result of the operation
+ * which it yielded, or raise the pending Python exception in decode()
+ * when there is no result. Returns the value which decode() yields
+ * next, or NULL when it is done. Expects the GIL to be held.
+ */
+static PyObject *generator_resume(struct srd_decoder_inst *di,
+		PyObject *py_result)
+{
+	PyObject *py_type, *py_value, *py_tb, *py_ret;
+
+	if (py_result)
+		return PyObject_CallFunctionObjArgs(di->py_gen_send,
+			py_result, NULL);
+
+	PyErr_Fetch(&py_type, &py_value, &py_tb);
+	PyErr_NormalizeException(&py_type, &py_value, &py_tb);
+	if (py_tb)
+		PyException_SetTraceback(py_value, py_tb);
+	py_ret = PyObject_CallMethod(di->py_gen, "throw", "O", py_value);
+	Py_XDECREF(py_type);
+	Py_XDECREF(py_value);
+	Py_XDECREF(py_tb);
+
+	return py_ret;
+}
+
+/*
+ * Handle the return of a generator based decode(), like the worker
+ * thread does for regular decode() methods. Expects the GIL to be held.
+ */
+static void generator_done(struct srd_decoder_inst *di)
+{
+	/*
+	 * Termination with an EOFError exception is accepted like for
+	 * regular decode() methods.
+	 */
+	if (!PyErr_Occurred() || PyErr_ExceptionMatches(PyExc_StopIteration) ||
+			PyErr_ExceptionMatches(PyExc_EOFError)) {
+		srd_dbg("%s: decode() terminated.", di->inst_id);
+		PyErr_Clear();
+	} else {
+		srd_dbg("%s: decode() terminated unrequested.", di->inst_id);
+		srd_exception_catch("Protocol decoder instance %s: ", di->inst_id);
+		di->decoder_state = SRD_ERR;
+	}
+
+	srd_wait_op_clear(di);
+	di->want_wait_terminate = TRUE;
+}
+
+/*
+ * Create the generator when decode() is a generator function. Such
+ * decode() methods run on the thread which sends the sample data, or
+ * on the session's pool with parallel decoding. The others get a
+ * worker thread.
+ */
+static int generator_new(struct srd_decoder_inst *di)
+{
+	PyGILState_STATE gstate;
+	int ret;
+
+	ret = SRD_OK;
+	gstate = srd_gil_ensure(di->sess);
+	if (is_generator_function(di)) {
+		srd_dbg("%s: decode() is a generator function.", di->inst_id);
+		di->py_gen = PyObject_CallObject(di->py_decode, NULL);
+		if (di->py_gen)
+			di->py_gen_send = PyObject_GetAttrString(di->py_gen, "send");
+		if (!di->py_gen_send) {
+			srd_exception_catch("Protocol decoder instance %s: ",
+				di->inst_id);
+			Py_XDECREF(di->py_gen);
+			di->py_gen = NULL;
+			ret = SRD_ERR_PYTHON;
+		}
+	}
+	srd_gil_release(gstate);
+
+	return ret;
+}
+
+/*
+ * Close the generator of a generator based decode(), if any. Raises
+ * GeneratorExit in decode() when it waits for an operation.
+ */
+static void generator_free(struct srd_decoder_inst *di)
+{
+	PyObject *py_res;
+	PyGILState_STATE gstate;
+
+	if (!di->py_gen)
+		return;
+
+	srd_dbg("%s: Closing decode() generator.", di->inst_id);
+
+	gstate = srd_gil_ensure(di->sess);
+	srd_wait_op_clear(di);
+	py_res = PyObject_CallMethod(di->py_gen, "close", NULL);
+	Py_XDECREF(py_res);
+	PyErr_Clear();
+	Py_DECREF(di->py_gen);
+	Py_XDECREF(di->py_gen_send);
+	di->py_gen = NULL;
+	di->py_gen_send = NULL;
+	srd_gil_release(gstate);
+}
+
+/*
+ * Process the current chunk with a generator based decode().
+ *
+ * Runs the operation which decode() yielded on the chunk, sends its
+ * result into decode() when it completes, and goes on with the next
+ * operation which decode() yields, until the chunk is exhausted. The
+ * pending operation then carries over to the next chunk. The GIL is
+ * released while the operations inspect the samples.
+ */
+static void generator_decode_chunk(struct srd_decoder_inst *di)
+{
+	PyObject *py_result, *py_yielded;
+	gboolean resume;
+	PyGILState_STATE gstate;
+	int ret;
+
+	if (di->want_wait_terminate)
+		return;
+
+	gstate = srd_gil_ensure(di->sess);
+	srd_inst_stats_busy(di, TRUE);
+
+	/* Upon the first chunk, start decode(). */
+	resume = !srd_wait_op_armed(di);
+	py_result = NULL;
+	if (resume) {
+		py_result = Py_None;
+		Py_INCREF(py_result);
+	}
+
+	while (1) {
+		if (resume) {
+			py_yielded = generator_resume(di, py_result);
+			Py_XDECREF(py_result);
+			py_result = NULL;
+			if (!py_yielded) {
+				generator_done(di);
+				break;
+			}
+			ret = srd_wait_op_arm(di, py_yielded);
+			Py_DECREF(py_yielded);
+			if (ret != SRD_OK)
+				continue; /* Raise the error in decode(). */
+		}
+
+		if (!srd_wait_op_run(di))
+			break;
+
+		/* A NULL result raises the error in decode(). */
+		py_result = srd_wait_op_finish(di);
+		resume = TRUE;
+	}
+
+	srd_inst_stats_busy(di, FALSE);
+	srd_gil_release(gstate);
+}
+
+/*
+ * Communicate EOF to a generator based decode(). Raises EOFError where
+ * decode() waits for an operation, like wait() does in regular decode()
+ * methods. decode() is closed when it yields another operation anyway.
+ */
+static void generator_eof(struct srd_decoder_inst *di)
+{
+	PyObject *py_samplenum, *py_yielded, *py_res;
+	PyGILState_STATE gstate;
+
+	if (di->want_wait_terminate)
+		return;
+
+	gstate = srd_gil_ensure(di->sess);
+	srd_inst_stats_busy(di, TRUE);
+
+	/* Advance self.samplenum to the (absolute) last sample number. */
+	py_samplenum = PyLong_FromUnsignedLongLong(di->abs_cur_samplenum);
+	PyObject_SetAttrString(di->py_inst, "samplenum", py_samplenum);
+	Py_DECREF(py_samplenum);
+
+	srd_dbg("%s: Raising EOF in decode().", di->inst_id);
+	srd_wait_op_clear(di);
+	PyErr_SetString(PyExc_EOFError, "samples exhausted");
+	py_yielded = generator_resume(di, NULL);
+	if (py_yielded) {
+		Py_DECREF(py_yielded);
+		py_res = PyObject_CallMethod(di->py_gen, "close", NULL);
+		Py_XDECREF(py_res);
+	}
+	generator_done(di);
+
+	srd_inst_stats_busy(di, FALSE);
+	srd_gil_release(gstate);
+}
+
+/* Set the instance's current chunk of input data. */
+static void inst_chunk_set(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen,
+		const uint64_t *run_lengths, uint64_t num_runs)
+{
+	di->abs_start_samplenum = abs_start_samplenum;
+	di->abs_end_samplenum = abs_end_samplenum;
+	di->inbuf = inbuf;
+	di->inbuflen = inbuflen;
+	di->in_run_lengths = run_lengths;
+	di->in_num_runs = num_runs;
+}
+
+/*
+ * Process the chunk of a generator based decode() on a thread of the
+ * session's pool, see inst_decode_chunk(). Unlike the worker threads
+ * this always completes the chunk, even when decode() terminates.
+ */
+static void generator_decode_job(gpointer data, gpointer user_data)
+{
+	struct srd_decoder_inst *di;
+
+	(void)user_data;
+
+	di = data;
+	generator_decode_chunk(di);
+
+	g_mutex_lock(&di->data_mutex);
+	inst_chunk_set(di, 0, 0, NULL, 0, NULL, 0);
+	di->handled_all_samples = TRUE;
+	g_cond_signal(&di->handled_all_samples_cond);
+	g_mutex_unlock(&di->data_mutex);
+}
+
+/*
+ * Push a chunk of input data to the instance's worker thread, and wait
+ * until it was processed. Common part of the plain and the run-length
+ * encoded input paths. The caller has checked the input for validity.
+ *
+ * A generator based decode() processes the chunk on the caller's
+ * thread instead, before this returns. Unless the caller doesn't wait
+ * (parallel decoding), then a thread of the session's pool does.
+ */
+static int inst_decode_chunk(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen,
+		const uint64_t *run_lengths, uint64_t num_runs, uint64_t unitsize,
+		gboolean wait)
+{
+	PyGILState_STATE gstate;
+	int ret;
+
+	if (di->resuming && abs_start_samplenum < di->abs_cur_samplenum &&
+	    abs_end_samplenum >= abs_start_samplenum) {
+		/*
+		 * After a resume the input restarts at the earliest checkpoint
+		 * of all stacks. Skip the samples up to this stack's one.
+		 */
+		if (abs_end_samplenum <= di->abs_cur_samplenum) {
+			srd_dbg("%s: Skipping samples %" PRIu64 "-%" PRIu64
+				" before the checkpoint.", di->inst_id,
+				abs_start_samplenum, abs_end_samplenum);
+			di->handled_all_samples = TRUE;
+			return SRD_OK;
+		}
+	} else if (abs_start_samplenum != di->abs_cur_samplenum ||
+	    abs_end_samplenum < abs_start_samplenum) {
+		srd_dbg("Incorrect sample numbers: start=%" PRIu64 ", cur=%"
+			PRIu64 ", end=%" PRIu64 ".", abs_start_samplenum,
+			di->abs_cur_samplenum, abs_end_samplenum);
+		return SRD_ERR_ARG;
+	}
+	di->resuming = FALSE;
+
+	di->data_unitsize = unitsize;
+
+	srd_dbg("Decoding: abs start sample %" PRIu64 ", abs end sample %"
+		PRIu64 " (%" PRIu64 " samples, %" PRIu64 " bytes, unitsize = "
+		"%d), instance %s.", abs_start_samplenum, abs_end_samplenum,
+		abs_end_samplenum - abs_start_samplenum, inbuflen, di->data_unitsize,
+		di->inst_id);
+
+	/*
+	 * If this is the first call, start decode(). Resuming from the
+	 * beginning is always possible, when the session takes checkpoints.
+	 */
+	if (!di->thread_handle && !di->py_gen) {
+		gstate = srd_gil_ensure(di->sess);
+		if (srd_inst_checkpoint(di) != SRD_OK)
+			srd_exception_catch("Protocol decoder instance %s: ",
+				di->inst_id);
+		srd_gil_release(gstate);
+		if ((ret = generator_new(di)) != SRD_OK)
+			return ret;
+	}
+	if (!di->thread_handle && !di->py_gen) {
+		srd_dbg("No worker thread for this decoder stack "
+			"exists yet, creating one: %s.", di->inst_id);
+		di->thread_handle = g_thread_new(di->inst_id,
+						 di_thread, di);
+	}
+
+	if (di->py_gen && !wait) {
+		if (!di->sess->gen_pool)
+			di->sess->gen_pool = g_thread_pool_new(generator_decode_job,
+				NULL, -1, FALSE, NULL);
+		g_mutex_lock(&di->data_mutex);
+		inst_chunk_set(di, abs_start_samplenum, abs_end_samplenum,
+			inbuf, inbuflen, run_lengths, num_runs);
+		edge_index_reset(di);
+		di->handled_all_samples = FALSE;
+		g_mutex_unlock(&di->data_mutex);
+		g_thread_pool_push(di->sess->gen_pool, di, NULL);
+		return SRD_OK;
+	}
+	if (di->py_gen) {
+		inst_chunk_set(di, abs_start_samplenum, abs_end_samplenum,
+			inbuf, inbuflen, run_lengths, num_runs);
+		edge_index_reset(di);
+		generator_decode_chunk(di);
+		inst_chunk_set(di, 0, 0, NULL, 0, NULL, 0);
+		di->handled_all_samples = TRUE;
+		return wait ? srd_inst_decode_wait(di) : SRD_OK;
+	}
+
+	/* Push the new sample chunk to the worker thread. */
+	g_mutex_lock(&di->data_mutex);
+	inst_chunk_set(di, abs_start_samplenum, abs_end_samplenum,
+		inbuf, inbuflen, run_lengths, num_runs);
+	edge_index_reset(di);
+	di->got_new_samples = TRUE;
+	di->handled_all_samples = FALSE;
+
+	/* Signal the thread that we have new data. */
+	g_cond_signal(&di->got_new_samples_cond);
+	g_mutex_unlock(&di->data_mutex);
+
+	if (!wait)
+		return SRD_OK;
+
+	return srd_inst_decode_wait(di);
+}
+
 /**
  * Decode a chunk of samples.
  *
@@ -1162,41 +2375,98 @@ static gpointer di_thread(gpointer data)
  *   srd_inst_decode(di, 2048, 3072, inbuf, 1024, 1);
  *   srd_inst_decode(di, 3072, 4096, inbuf, 1024, 1);
  *
- * INCORRECT example (4096 samples total, 4 chunks @ 1024 samples each, but
- * the start- and end-samplenumbers are not absolute):
- *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
- *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
- *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
- *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
+ * INCORRECT example (4096 samples total, 4 chunks @ 1024 samples each, but
+ * the start- and end-samplenumbers are not absolute):
+ *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
+ *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
+ *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
+ *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
+ *
+ * @param di The decoder instance to call. Must not be NULL.
+ * @param abs_start_samplenum The absolute starting sample number for the
+ * 		buffer's sample set, relative to the start of capture.
+ * @param abs_end_samplenum The absolute ending sample number for the
+ * 		buffer's sample set, relative to the start of capture.
+ * @param inbuf The buffer to decode. Must not be NULL.
+ * @param inbuflen Length of the buffer. Must be > 0.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ * @param wait Whether to wait until the chunk was processed. When FALSE,
+ * 		the chunk is only handed to the worker thread, and the caller
+ * 		must call srd_inst_decode_wait() before the buffer is released
+ * 		or the next chunk is sent. Instances with a generator based
+ * 		decode() have processed the chunk when this returns anyway.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		gboolean wait)
+{
+	/* Return an error upon unusable input. */
+	if (!di) {
+		srd_dbg("empty decoder instance");
+		return SRD_ERR_ARG;
+	}
+	if (!inbuf) {
+		srd_dbg("NULL buffer pointer");
+		return SRD_ERR_ARG;
+	}
+	if (inbuflen == 0) {
+		srd_dbg("empty buffer");
+		return SRD_ERR_ARG;
+	}
+	if (unitsize == 0) {
+		srd_dbg("unitsize 0");
+		return SRD_ERR_ARG;
+	}
+
+	return inst_decode_chunk(di, abs_start_samplenum, abs_end_samplenum,
+		inbuf, inbuflen, NULL, 0, unitsize, wait);
+}
+
+/**
+ * Decode a chunk of run-length encoded samples.
+ *
+ * The chunk consists of 'num_runs' runs, run N has the sample value at
+ * 'run_values' + N * 'unitsize' repeated 'run_lengths'[N] times. The
+ * same rules as for srd_inst_decode() apply to the sequence of chunks.
  *
  * @param di The decoder instance to call. Must not be NULL.
  * @param abs_start_samplenum The absolute starting sample number for the
- * 		buffer's sample set, relative to the start of capture.
- * @param abs_end_samplenum The absolute ending sample number for the
- * 		buffer's sample set, relative to the start of capture.
- * @param inbuf The buffer to decode. Must not be NULL.
- * @param inbuflen Length of the buffer. Must be > 0.
+ * 		chunk's sample set, relative to the start of capture.
+ * @param run_lengths The number of samples in each run. Must not be NULL,
+ * 		all run lengths must be > 0.
+ * @param run_values The sample value of each run. Must not be NULL.
+ * @param num_runs The number of runs. Must be > 0.
  * @param unitsize The number of bytes per sample. Must be > 0.
+ * @param wait Whether to wait until the chunk was processed, see
+ * 		srd_inst_decode().
  *
  * @return SRD_OK upon success, a (negative) error code otherwise.
  *
  * @private
  */
-SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
-		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
-		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+SRD_PRIV int srd_inst_decode_rle(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, const uint64_t *run_lengths,
+		const uint8_t *run_values, uint64_t num_runs, uint64_t unitsize,
+		gboolean wait)
 {
+	uint64_t abs_end_samplenum, i;
+
 	/* Return an error upon unusable input. */
 	if (!di) {
 		srd_dbg("empty decoder instance");
 		return SRD_ERR_ARG;
 	}
-	if (!inbuf) {
-		srd_dbg("NULL buffer pointer");
+	if (!run_lengths || !run_values) {
+		srd_dbg("NULL run pointer");
 		return SRD_ERR_ARG;
 	}
-	if (inbuflen == 0) {
-		srd_dbg("empty buffer");
+	if (num_runs == 0) {
+		srd_dbg("no runs");
 		return SRD_ERR_ARG;
 	}
 	if (unitsize == 0) {
@@ -1204,51 +2474,165 @@ SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		return SRD_ERR_ARG;
 	}
 
-	if (abs_start_samplenum != di->abs_cur_samplenum ||
-	    abs_end_samplenum < abs_start_samplenum) {
-		srd_dbg("Incorrect sample numbers: start=%" PRIu64 ", cur=%"
-			PRIu64 ", end=%" PRIu64 ".", abs_start_samplenum,
-			di->abs_cur_samplenum, abs_end_samplenum);
-		return SRD_ERR_ARG;
+	abs_end_samplenum = abs_start_samplenum;
+	for (i = 0; i < num_runs; i++) {
+		if (run_lengths[i] == 0) {
+			srd_dbg("empty run %" PRIu64, i);
+			return SRD_ERR_ARG;
+		}
+		abs_end_samplenum += run_lengths[i];
 	}
 
-	di->data_unitsize = unitsize;
+	return inst_decode_chunk(di, abs_start_samplenum, abs_end_samplenum,
+		run_values, num_runs * unitsize, run_lengths, num_runs, unitsize,
+		wait);
+}
 
-	srd_dbg("Decoding: abs start sample %" PRIu64 ", abs end sample %"
-		PRIu64 " (%" PRIu64 " samples, %" PRIu64 " bytes, unitsize = "
-		"%d), instance %s.", abs_start_samplenum, abs_end_samplenum,
-		abs_end_samplenum - abs_start_samplenum, inbuflen, di->data_unitsize,
-		di->inst_id);
+/**
+ * Get the annotation batch of a decoder instance's stack.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @return The batch, which is created upon first use.
+ *
+ * @private
+ */
+SRD_PRIV struct srd_ann_batch *srd_inst_ann_batch_get(struct srd_decoder_inst *di)
+{
+	struct srd_ann_batch *batch;
+
+	di = di->stack_bottom;
+	if (!(batch = di->ann_batch)) {
+		batch = g_malloc(sizeof(*batch));
+		batch->records = g_array_sized_new(FALSE, FALSE,
+			sizeof(struct srd_proto_data_annotation_record),
+			SRD_ANN_BATCH_SIZE);
+		batch->ann_texts = g_ptr_array_new_with_free_func(
+			(GDestroyNotify)g_strfreev);
+		batch->text_index = g_hash_table_new_full(
+			(GHashFunc)g_string_hash, (GEqualFunc)g_string_equal,
+			(GDestroyNotify)string_free, NULL);
+		batch->texts = g_string_sized_new(64);
+		di->ann_batch = batch;
+	}
 
-	/* If this is the first call, start the worker thread. */
-	if (!di->thread_handle) {
-		srd_dbg("No worker thread for this decoder stack "
-			"exists yet, creating one: %s.", di->inst_id);
-		di->thread_handle = g_thread_new(di->inst_id,
-						 di_thread, di);
+	return batch;
+}
+
+/**
+ * Add an annotation to a batch.
+ *
+ * The annotation's texts are taken from the batch's 'texts' field, where
+ * the caller has put them, every text followed by a NUL character.
+ *
+ * @param batch The batch. Must not be NULL.
+ * @param pdata The annotation's sample range and output. Must not be NULL.
+ * @param ann_class The annotation class.
+ *
+ * @return TRUE if the batch is full and should get flushed.
+ *
+ * @private
+ */
+SRD_PRIV gboolean srd_ann_batch_add(struct srd_ann_batch *batch,
+		const struct srd_proto_data *pdata, int ann_class)
+{
+	struct srd_proto_data_annotation_record rec;
+	const char *text, *end;
+	char **ann_text;
+	guint idx, i;
+
+	idx = GPOINTER_TO_UINT(g_hash_table_lookup(batch->text_index,
+			batch->texts));
+	if (!idx) {
+		/* A list of texts which this batch didn't see yet. */
+		end = batch->texts->str + batch->texts->len;
+		for (i = 0, text = batch->texts->str; text < end; i++)
+			text += strlen(text) + 1;
+		ann_text = g_new(char *, i + 1);
+		for (i = 0, text = batch->texts->str; text < end; i++) {
+			ann_text[i] = g_strdup(text);
+			text += strlen(text) + 1;
+		}
+		ann_text[i] = NULL;
+		g_ptr_array_add(batch->ann_texts, ann_text);
+		idx = batch->ann_texts->len;
+		g_hash_table_insert(batch->text_index,
+			g_string_new_len(batch->texts->str, batch->texts->len),
+			GUINT_TO_POINTER(idx));
 	}
 
-	/* Push the new sample chunk to the worker thread. */
-	g_mutex_lock(&di->data_mutex);
-	di->abs_start_samplenum = abs_start_samplenum;
-	di->abs_end_samplenum = abs_end_samplenum;
-	di->inbuf = inbuf;
-	di->inbuflen = inbuflen;
-	di->got_new_samples = TRUE;
-	di->handled_all_samples = FALSE;
+	rec.start_sample = pdata->start_sample;
+	rec.end_sample = pdata->end_sample;
+	rec.pdo = pdata->pdo;
+	rec.ann_class = ann_class;
+	rec.text_idx = idx - 1;
+	g_array_append_val(batch->records, rec);
 
-	/* Signal the thread that we have new data. */
-	g_cond_signal(&di->got_new_samples_cond);
-	g_mutex_unlock(&di->data_mutex);
+	return batch->records->len >= SRD_ANN_BATCH_SIZE;
+}
+
+/**
+ * Pass the pending annotations of a decoder stack to the frontend.
+ *
+ * Must be called without holding the Python GIL, and while no decoder
+ * of the stack is running in another thread.
+ *
+ * @param di A decoder instance of the stack. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_ann_batch_flush(struct srd_decoder_inst *di)
+{
+	struct srd_ann_batch *batch;
+	struct srd_proto_data_annotation_batch pdab;
+	struct srd_session *sess;
+
+	di = di->stack_bottom;
+	if (!(batch = di->ann_batch) || !batch->records->len)
+		return;
+
+	sess = di->sess;
+	if (sess->ann_batch_cb) {
+		pdab.num_records = batch->records->len;
+		pdab.records = (void *)batch->records->data;
+		pdab.num_texts = batch->ann_texts->len;
+		pdab.ann_texts = (char ***)batch->ann_texts->pdata;
+		sess->ann_batch_cb(&pdab, sess->ann_batch_cb_data);
+	}
+	ann_batch_clear(batch);
+}
 
-	/* When all samples in this chunk were handled, return. */
+/**
+ * Wait until a decoder instance has processed its current chunk.
+ *
+ * Completes a previous srd_inst_decode() or srd_inst_decode_rle() call
+ * which did not wait for the worker thread, and flushes the stack.
+ *
+ * @param di The decoder instance to wait for. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_decode_wait(struct srd_decoder_inst *di)
+{
+	if (!di)
+		return SRD_ERR_ARG;
+
+	/*
+	 * When all samples in this chunk were handled, return. A worker
+	 * thread may leave a chunk upon termination, a generator's pool
+	 * job always completes it.
+	 */
 	g_mutex_lock(&di->data_mutex);
-	while (!di->handled_all_samples && !di->want_wait_terminate)
+	while (!di->handled_all_samples &&
+			(di->py_gen || !di->want_wait_terminate))
 		g_cond_wait(&di->handled_all_samples_cond, &di->data_mutex);
 	g_mutex_unlock(&di->data_mutex);
 
 	/* Flush all PDs in the stack that can be flushed */
 	srd_inst_flush(di);
+	srd_inst_ann_batch_flush(di);
 
 	if (di->want_wait_terminate)
 		return SRD_ERR_TERM_REQ;
@@ -1256,7 +2640,6 @@ SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 	return SRD_OK;
 }
 
-
 /**
  * Flush all data that is pending, bottom decoder first up to the top of the stack.
  *
@@ -1276,13 +2659,13 @@ SRD_PRIV int srd_inst_flush(struct srd_decoder_inst *di)
 	if (!di)
 		return SRD_ERR_ARG;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(di->sess);
 	if (PyObject_HasAttrString(di->py_inst, "flush")) {
 		srd_dbg("Calling flush() of instance %s", di->inst_id);
 		py_ret = PyObject_CallMethod(di->py_inst, "flush", NULL);
 		Py_XDECREF(py_ret);
 	}
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	/* Pass the "flush" request to all stacked decoders. */
 	for (l = di->next_di; l; l = l->next) {
@@ -1317,15 +2700,22 @@ SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di)
 	 * started or previously finished is perfectly acceptable.
 	 */
 	srd_dbg("End of sample data: instance %s.", di->inst_id);
-	if (!di->thread_handle) {
+	if (!di->thread_handle && !di->py_gen) {
 		srd_dbg("No worker thread, nothing to do.");
 		return SRD_OK;
 	}
 
+	if (di->py_gen) {
+		generator_eof(di);
+		goto flush;
+	}
+
 	/* Signal the thread about the EOF condition. */
 	g_mutex_lock(&di->data_mutex);
 	di->inbuf = NULL;
 	di->inbuflen = 0;
+	di->in_run_lengths = NULL;
+	di->in_num_runs = 0;
 	di->got_new_samples = TRUE;
 	di->handled_all_samples = FALSE;
 	di->want_wait_terminate = TRUE;
@@ -1339,6 +2729,7 @@ SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di)
 		g_cond_wait(&di->handled_all_samples_cond, &di->data_mutex);
 	g_mutex_unlock(&di->data_mutex);
 
+flush:
 	/* Flush the decoder instance which handled EOF. */
 	srd_inst_flush(di);
 
@@ -1349,6 +2740,368 @@ SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di)
 			return ret;
 	}
 
+	srd_inst_ann_batch_flush(di);
+
+	return SRD_OK;
+}
+
+/* Terminate an instance's decode(), and reset its state. */
+static void inst_terminate(struct srd_decoder_inst *di)
+{
+	srd_dbg("Terminating instance %s", di->inst_id);
+	srd_inst_join_decode_thread(di);
+	generator_free(di);
+	srd_inst_reset_state(di);
+	ann_batch_clear(di->ann_batch);
+}
+
+/* A snapshot of a decoder stack's state, see srd_inst_checkpoint(). */
+struct srd_checkpoint {
+	/* The bottom instance's current sample number. */
+	uint64_t samplenum;
+	/* A copy of the bottom instance's "old" pins, NULL if it had none. */
+	GArray *old_pins;
+	/*
+	 * A list of (attributes, samplenum, matched, recording mark) per
+	 * instance.
+	 */
+	PyObject *py_states;
+};
+
+/* Expects the GIL. */
+static void checkpoint_free(void *data)
+{
+	struct srd_checkpoint *cp;
+
+	cp = data;
+	if (cp->old_pins)
+		g_array_free(cp->old_pins, TRUE);
+	Py_DECREF(cp->py_states);
+	g_free(cp);
+}
+
+static void checkpoints_free(struct srd_decoder_inst *di)
+{
+	PyGILState_STATE gstate;
+
+	if (!di->checkpoints)
+		return;
+
+	gstate = srd_gil_ensure(di->sess);
+	g_slist_free_full(di->checkpoints, checkpoint_free);
+	di->checkpoints = NULL;
+	srd_gil_release(gstate);
+}
+
+/*
+ * Collect the Python side state of an instance and the instances stacked
+ * on top of it, in the order of a depth-first walk. Expects the GIL.
+ */
+static int stack_states_get(struct srd_decoder_inst *di, PyObject *py_states)
+{
+	PyObject *py_dict, *py_samplenum, *py_matched, *py_mark, *py_state;
+	GSList *l;
+	int ret;
+
+	py_dict = PyObject_GetAttrString(di->py_inst, "__dict__");
+	py_samplenum = PyObject_GetAttrString(di->py_inst, "samplenum");
+	py_matched = PyObject_GetAttrString(di->py_inst, "matched");
+	py_mark = PyLong_FromSsize_t(srd_recording_mark(di));
+	py_state = NULL;
+	if (py_dict && py_samplenum && py_matched && py_mark)
+		py_state = PyTuple_Pack(4, py_dict, py_samplenum, py_matched,
+			py_mark);
+	Py_XDECREF(py_dict);
+	Py_XDECREF(py_samplenum);
+	Py_XDECREF(py_matched);
+	Py_XDECREF(py_mark);
+	if (!py_state)
+		return SRD_ERR_PYTHON;
+	ret = PyList_Append(py_states, py_state);
+	Py_DECREF(py_state);
+	if (ret < 0)
+		return SRD_ERR_PYTHON;
+
+	for (l = di->next_di; l; l = l->next) {
+		if ((ret = stack_states_get(l->data, py_states)) != SRD_OK)
+			return ret;
+	}
+
+	return SRD_OK;
+}
+
+/*
+ * Restore the state which stack_states_get() collected. 'idx' is the
+ * position of the instance's state in the list. Expects the GIL.
+ */
+static int stack_states_set(struct srd_decoder_inst *di, PyObject *py_states,
+		Py_ssize_t *idx)
+{
+	PyObject *py_state, *py_dict;
+	GSList *l;
+	int ret;
+
+	if (!(py_state = PyList_GetItem(py_states, (*idx)++)))
+		return SRD_ERR_PYTHON;
+	if (!(py_dict = PyObject_GetAttrString(di->py_inst, "__dict__")))
+		return SRD_ERR_PYTHON;
+	PyDict_Clear(py_dict);
+	ret = PyDict_Update(py_dict, PyTuple_GetItem(py_state, 0));
+	Py_DECREF(py_dict);
+	if (ret < 0)
+		return SRD_ERR_PYTHON;
+	if (PyObject_SetAttrString(di->py_inst, "samplenum",
+			PyTuple_GetItem(py_state, 1)) < 0)
+		return SRD_ERR_PYTHON;
+	if (PyObject_SetAttrString(di->py_inst, "matched",
+			PyTuple_GetItem(py_state, 2)) < 0)
+		return SRD_ERR_PYTHON;
+	/* Drop the output which gets decoded again. */
+	srd_recording_truncate(di, PyLong_AsSsize_t(PyTuple_GetItem(py_state, 3)));
+
+	for (l = di->next_di; l; l = l->next) {
+		if ((ret = stack_states_set(l->data, py_states, idx)) != SRD_OK)
+			return ret;
+	}
+
+	return SRD_OK;
+}
+
+/* Have copy.deepcopy() share an object instead of copying it. */
+static int memo_share(PyObject *py_memo, PyObject *py_obj)
+{
+	PyObject *py_key;
+	int ret;
+
+	if (!(py_key = PyLong_FromVoidPtr(py_obj)))
+		return SRD_ERR_PYTHON;
+	ret = PyDict_SetItem(py_memo, py_key, py_obj);
+	Py_DECREF(py_key);
+
+	return ret < 0 ? SRD_ERR_PYTHON : SRD_OK;
+}
+
+static int stack_memo_seed(struct srd_decoder_inst *di, PyObject *py_memo)
+{
+	GSList *l;
+	int ret;
+
+	if ((ret = memo_share(py_memo, di->py_inst)) != SRD_OK)
+		return ret;
+	for (l = di->next_di; l; l = l->next) {
+		if ((ret = stack_memo_seed(l->data, py_memo)) != SRD_OK)
+			return ret;
+	}
+
+	return SRD_OK;
+}
+
+/*
+ * Deep copy a stack's state. The instances themselves, which e.g. bound
+ * methods refer to, and compiled conditions, which are immutable, get
+ * shared instead of copied. Expects the GIL.
+ */
+static PyObject *states_copy(struct srd_decoder_inst *di, PyObject *py_states)
+{
+	PyObject *py_mod, *py_memo, *py_dict, *py_value, *py_copy;
+	Py_ssize_t i, pos;
+	int ret;
+
+	if (!(py_mod = py_import_by_name("copy")))
+		return NULL;
+	py_memo = PyDict_New();
+	ret = py_memo ? stack_memo_seed(di, py_memo) : SRD_ERR_PYTHON;
+	for (i = 0; ret == SRD_OK && i < PyList_Size(py_states); i++) {
+		py_dict = PyTuple_GetItem(PyList_GetItem(py_states, i), 0);
+		pos = 0;
+		while (ret == SRD_OK && PyDict_Next(py_dict, &pos, NULL, &py_value)) {
+			if (PyCapsule_CheckExact(py_value))
+				ret = memo_share(py_memo, py_value);
+		}
+	}
+	py_copy = NULL;
+	if (ret == SRD_OK)
+		py_copy = PyObject_CallMethod(py_mod, "deepcopy", "OO",
+			py_states, py_memo);
+	Py_XDECREF(py_memo);
+	Py_DECREF(py_mod);
+
+	return py_copy;
+}
+
+/**
+ * Take a snapshot of a decoder stack's state, to resume decoding from.
+ *
+ * Only takes one when the session takes checkpoints, 'di' is at the
+ * bottom of its stack, and the session's checkpoint interval has passed
+ * since the stack's previous checkpoint. The snapshot holds deep copies
+ * of the attributes of all instances of the stack, and the state of the
+ * condition matching. Expects the GIL.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @return SRD_OK upon success, SRD_ERR_PYTHON with a Python exception
+ *         set when the state can't be copied.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_checkpoint(struct srd_decoder_inst *di)
+{
+	struct srd_session *sess;
+	struct srd_checkpoint *cp, *last;
+	PyObject *py_states, *py_copy;
+	uint64_t samplenum;
+	int ret;
+
+	sess = di->sess;
+	if (!sess->checkpoint_interval || di != di->stack_bottom)
+		return SRD_OK;
+	samplenum = di->abs_cur_samplenum;
+	last = di->checkpoints ? di->checkpoints->data : NULL;
+	if (last && samplenum - last->samplenum < sess->checkpoint_interval)
+		return SRD_OK;
+
+	if (!(py_states = PyList_New(0)))
+		return SRD_ERR_PYTHON;
+	py_copy = NULL;
+	if ((ret = stack_states_get(di, py_states)) == SRD_OK)
+		py_copy = states_copy(di, py_states);
+	Py_DECREF(py_states);
+	if (!py_copy)
+		return SRD_ERR_PYTHON;
+
+	cp = g_malloc0(sizeof(struct srd_checkpoint));
+	cp->samplenum = samplenum;
+	if (di->old_pins_array) {
+		cp->old_pins = g_array_sized_new(FALSE, FALSE, sizeof(uint8_t),
+			di->old_pins_array->len);
+		g_array_append_vals(cp->old_pins, di->old_pins_array->data,
+			di->old_pins_array->len);
+	}
+	cp->py_states = py_copy;
+	di->checkpoints = g_slist_prepend(di->checkpoints, cp);
+
+	srd_dbg("%s: Checkpoint at sample %" PRIu64 ".", di->inst_id,
+		samplenum);
+	if (sess->checkpoint_cb)
+		sess->checkpoint_cb(di, samplenum, sess->checkpoint_cb_data);
+
+	return SRD_OK;
+}
+
+/**
+ * Find the checkpoint which a decoder stack would resume from.
+ *
+ * @param di The decoder instance at the bottom of the stack. Must not
+ *           be NULL.
+ * @param abs_samplenum The sample number to resume at, at the latest.
+ * @param samplenum The sample number of the checkpoint, on return. 0 for
+ *                  stacks which didn't get any input yet.
+ *
+ * @return SRD_OK upon success, SRD_ERR if there is no such checkpoint.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_resume_point(const struct srd_decoder_inst *di,
+		uint64_t abs_samplenum, uint64_t *samplenum)
+{
+	const struct srd_checkpoint *cp;
+	GSList *l;
+
+	for (l = di->checkpoints; l; l = l->next) {
+		cp = l->data;
+		if (cp->samplenum <= abs_samplenum) {
+			*samplenum = cp->samplenum;
+			return SRD_OK;
+		}
+	}
+
+	if (!di->checkpoints && !di->thread_handle && !di->py_gen &&
+			!di->abs_cur_samplenum) {
+		*samplenum = 0;
+		return SRD_OK;
+	}
+
+	srd_err("%s: No checkpoint at or before sample %" PRIu64 ".",
+		di->inst_id, abs_samplenum);
+
+	return SRD_ERR;
+}
+
+static void stack_terminate(struct srd_decoder_inst *di)
+{
+	GSList *l;
+
+	inst_terminate(di);
+	for (l = di->next_di; l; l = l->next)
+		stack_terminate(l->data);
+}
+
+/**
+ * Resume a decoder stack from its latest checkpoint at or before a
+ * given sample number.
+ *
+ * Terminates the stack's decode() and restores the state of the
+ * checkpoint, later checkpoints get dropped. The stack's next decode()
+ * starts anew with the restored attributes and self.resumed set, and
+ * gets the samples from the checkpoint on. Unlike srd_inst_terminate_reset() this doesn't
+ * call the decoders' reset() methods, and they don't get started again.
+ *
+ * @param di The decoder instance at the bottom of the stack. Must not
+ *           be NULL.
+ * @param abs_samplenum The sample number to resume at, at the latest.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_resume(struct srd_decoder_inst *di,
+		uint64_t abs_samplenum)
+{
+	struct srd_checkpoint *cp;
+	PyObject *py_copy;
+	PyGILState_STATE gstate;
+	uint64_t samplenum;
+	Py_ssize_t idx;
+	int ret;
+
+	ret = srd_inst_resume_point(di, abs_samplenum, &samplenum);
+	if (ret != SRD_OK || !di->checkpoints)
+		return ret;
+
+	stack_terminate(di);
+
+	gstate = srd_gil_ensure(di->sess);
+	while ((cp = di->checkpoints->data)->samplenum > abs_samplenum) {
+		di->checkpoints = g_slist_delete_link(di->checkpoints,
+			di->checkpoints);
+		checkpoint_free(cp);
+	}
+	idx = 0;
+	py_copy = states_copy(di, cp->py_states);
+	if (!py_copy || stack_states_set(di, py_copy, &idx) != SRD_OK ||
+			PyObject_SetAttrString(di->py_inst, "resumed",
+			Py_True) < 0) {
+		srd_exception_catch("Protocol decoder instance %s: ",
+			di->inst_id);
+		ret = SRD_ERR_PYTHON;
+	}
+	Py_XDECREF(py_copy);
+	srd_gil_release(gstate);
+	if (ret != SRD_OK)
+		return ret;
+
+	di->abs_cur_samplenum = cp->samplenum;
+	if (cp->old_pins) {
+		oldpins_array_seed(di);
+		memcpy(di->old_pins_array->data, cp->old_pins->data,
+			cp->old_pins->len);
+	}
+	di->resuming = TRUE;
+
+	srd_dbg("%s: Resuming at sample %" PRIu64 ".", di->inst_id,
+		cp->samplenum);
+
 	return SRD_OK;
 }
 
@@ -1387,9 +3140,9 @@ SRD_PRIV int srd_inst_terminate_reset(struct srd_decoder_inst *di)
 	 * decoders' state just like after creation. This block handles
 	 * the C language library side.
 	 */
-	srd_dbg("Terminating instance %s", di->inst_id);
-	srd_inst_join_decode_thread(di);
-	srd_inst_reset_state(di);
+	inst_terminate(di);
+	checkpoints_free(di);
+	srd_recording_free(di);
 
 	/*
 	 * Have the Python side's .reset() method executed (if the PD
@@ -1398,13 +3151,13 @@ SRD_PRIV int srd_inst_terminate_reset(struct srd_decoder_inst *di)
 	 * that was allocated in previous calls gets released by Python
 	 * as it's not referenced any longer.
 	 */
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(di->sess);
 	if (PyObject_HasAttrString(di->py_inst, "reset")) {
 		srd_dbg("Calling reset() of instance %s", di->inst_id);
 		py_ret = PyObject_CallMethod(di->py_inst, "reset", NULL);
 		Py_XDECREF(py_ret);
 	}
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	/* Pass the "restart" request to all stacked decoders. */
 	for (l = di->next_di; l; l = l->next) {
@@ -1426,16 +3179,28 @@ SRD_PRIV void srd_inst_free(struct srd_decoder_inst *di)
 	srd_dbg("Freeing instance %s.", di->inst_id);
 
 	srd_inst_join_decode_thread(di);
+	generator_free(di);
 
 	srd_inst_reset_state(di);
-
-	gstate = PyGILState_Ensure();
+	checkpoints_free(di);
+	srd_recording_free(di);
+
+	gstate = srd_gil_ensure(di->sess);
+	srd_wait_op_free(di);
+	py_value_cache_free(di);
+	srd_Decoder_inst_set(di->py_inst, NULL);
+	Py_XDECREF(di->py_decode);
 	Py_DECREF(di->py_inst);
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	g_free(di->inst_id);
 	g_free(di->dec_channelmap);
 	g_free(di->channel_samples);
+	g_free(di->edge_mask);
+	ann_batch_free(di->ann_batch);
+	counters_free(di->stats);
+	if (di->ann_disabled)
+		g_array_free(di->ann_disabled, TRUE);
 	g_slist_free(di->next_di);
 	for (l = di->pd_output; l; l = l->next) {
 		pdo = l->data;
@@ -0,0 +1,361 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+/*
+ * Sub-interpreters, and the configuration of their GIL in particular,
+ * are not part of the limited API.
+ */
+#define SRD_PYTHON_FULL_API
+
+#include <config.h>
+#include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
+#include "libsigrokdecode.h"
+#include <glib.h>
+
+/**
+ * @file
+ *
+ * Python sub-interpreters of isolated sessions.
+ *
+ * All sessions share the Python interpreter which srd_init() creates,
+ * unless srd_session_isolated_set() gives a session a sub-interpreter of
+ * its own. With Python 3.12 and later the sub-interpreter also has a GIL
+ * of its own (PEP 684). Every interpreter imports the decoder modules
+ * which its sessions instantiate, and has its own sigrokdecode module.
+ *
+ * The PyGILState API only knows one interpreter per thread. That is why
+ * the library acquires the GIL through srd_gil_ensure(), which gives a
+ * thread that runs the Python code of an isolated session a thread state
+ * of the session's interpreter, for as long as the thread holds the GIL.
+ *
+ * @private
+ */
+
+/** @cond PRIVATE */
+
+/* srd.c */
+extern SRD_PRIV GSList *searchpaths;
+
+/** @endcond */
+
+struct srd_interp {
+	PyInterpreterState *interp;
+	/*
+	 * The thread state which the interpreter was created with. Kept
+	 * until the interpreter ends, an interpreter must not run out of
+	 * thread states.
+	 */
+	PyThreadState *tstate;
+	/* The interpreter's sigrokdecode module, and its Decoder class. */
+	PyObject *py_mod;
+	PyObject *py_basedec;
+	/* Imported Decoder classes, struct srd_decoder * -> PyObject *. */
+	GHashTable *decoders;
+};
+
+/* The thread state of an isolated session's interpreter, per thread. */
+struct gil_frame {
+	PyThreadState *tstate;
+	/* Nesting depth of srd_gil_ensure() calls, 0 when not in use. */
+	unsigned int depth;
+};
+
+static GPrivate gil_frame_key = G_PRIVATE_INIT(g_free);
+
+static PyGILState_STATE gil_ensure(const struct srd_interp *interp)
+{
+	struct gil_frame *frame;
+
+	frame = g_private_get(&gil_frame_key);
+	if (frame && frame->depth) {
+		frame->depth++;
+		return PyGILState_LOCKED;
+	}
+
+	if (!interp)
+		return PyGILState_Ensure();
+
+	if (!frame) {
+		frame = g_malloc0(sizeof(struct gil_frame));
+		g_private_set(&gil_frame_key, frame);
+	}
+	frame->tstate = PyThreadState_New(interp->interp);
+	frame->depth = 1;
+	PyEval_RestoreThread(frame->tstate);
+
+	return PyGILState_UNLOCKED;
+}
+
+/**
+ * Acquire the GIL, to run Python code.
+ *
+ * The Python code of an isolated session runs in the session's
+ * interpreter, all other code runs in the main interpreter. Calls nest:
+ * while a thread holds the GIL, further calls use the same interpreter.
+ *
+ * @param sess The session whose decoders are about to run, or NULL for
+ *             the interpreter which the thread already runs Python code
+ *             in, or the main interpreter.
+ *
+ * @return The value to pass to srd_gil_release().
+ *
+ * @private
+ */
+SRD_PRIV PyGILState_STATE srd_gil_ensure(const struct srd_session *sess)
+{
+	return gil_ensure(sess ? sess->interp : NULL);
+}
+
+/**
+ * Release the GIL which srd_gil_ensure() acquired.
+ *
+ * @param gstate The return value of the srd_gil_ensure() call.
+ *
+ * @private
+ */
+SRD_PRIV void srd_gil_release(PyGILState_STATE gstate)
+{
+	struct gil_frame *frame;
+
+	frame = g_private_get(&gil_frame_key);
+	if (!frame || !frame->depth) {
+		PyGILState_Release(gstate);
+		return;
+	}
+
+	if (--frame->depth)
+		return;
+	PyThreadState_Clear(frame->tstate);
+	PyEval_SaveThread();
+	PyThreadState_Delete(frame->tstate);
+	frame->tstate = NULL;
+}
+
+/* Prepare a new interpreter for the decoders. Expects its GIL. */
+static int interp_setup(struct srd_interp *interp)
+{
+	PyObject *py_path, *py_item;
+	GSList *l;
+	Py_ssize_t pos;
+
+	/*
+	 * The interpreter imports a sigrokdecode module of its own, with
+	 * its own Decoder class, which the decoders' imports then find.
+	 */
+	if (!(interp->py_mod = py_import_by_name("sigrokdecode")))
+		goto err;
+	interp->py_basedec = PyObject_GetAttrString(interp->py_mod, "Decoder");
+	if (!interp->py_basedec)
+		goto err;
+
+	/* The decoder search paths, in the main interpreter's order. */
+	if (!(py_path = PySys_GetObject("path")))
+		goto err;
+	pos = 0;
+	for (l = searchpaths; l; l = l->next) {
+		if (!(py_item = PyUnicode_FromString(l->data)))
+			goto err;
+		if (PyList_Insert(py_path, pos++, py_item) < 0) {
+			Py_DECREF(py_item);
+			goto err;
+		}
+		Py_DECREF(py_item);
+	}
+
+	return SRD_OK;
+
+err:
+	srd_exception_catch("Failed to set up a Python sub-interpreter");
+
+	return SRD_ERR_PYTHON;
+}
+
+/**
+ * Create a Python sub-interpreter for an isolated session.
+ *
+ * @param interp A pointer which will hold the new interpreter on return.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_interp_new(struct srd_interp **interp)
+{
+	struct srd_interp *it;
+	PyThreadState *main_tstate, *tstate;
+	PyGILState_STATE gstate;
+	int ret;
+#if PY_VERSION_HEX >= 0x030C0000
+	PyInterpreterConfig config = {
+		.use_main_obmalloc = 0,
+		.allow_fork = 0,
+		.allow_exec = 0,
+		.allow_threads = 1,
+		.allow_daemon_threads = 0,
+		.check_multi_interp_extensions = 1,
+		.gil = PyInterpreterConfig_OWN_GIL,
+	};
+	PyStatus status;
+#endif
+
+	gstate = srd_gil_ensure(NULL);
+	main_tstate = PyThreadState_Get();
+
+	/* The new interpreter's thread state becomes the current one. */
+#if PY_VERSION_HEX >= 0x030C0000
+	status = Py_NewInterpreterFromConfig(&tstate, &config);
+	if (PyStatus_Exception(status))
+		tstate = NULL;
+#else
+	tstate = Py_NewInterpreter();
+#endif
+	if (!tstate) {
+		srd_err("Failed to create a Python sub-interpreter.");
+		srd_gil_release(gstate);
+		return SRD_ERR_PYTHON;
+	}
+	PyEval_SaveThread();
+	PyEval_RestoreThread(main_tstate);
+
+	srd_gil_release(gstate);
+
+	it = g_malloc0(sizeof(struct srd_interp));
+	it->interp = PyThreadState_GetInterpreter(tstate);
+	it->tstate = tstate;
+	it->decoders = g_hash_table_new(g_direct_hash, g_direct_equal);
+
+	gstate = gil_ensure(it);
+	ret = interp_setup(it);
+	srd_gil_release(gstate);
+
+	if (ret != SRD_OK) {
+		srd_interp_free(it);
+		return ret;
+	}
+
+#if PY_VERSION_HEX >= 0x030C0000
+	srd_dbg("Created a Python sub-interpreter with its own GIL.");
+#else
+	srd_dbg("Created a Python sub-interpreter, it shares the GIL.");
+#endif
+	*interp = it;
+
+	return SRD_OK;
+}
+
+/**
+ * End the Python sub-interpreter of an isolated session.
+ *
+ * None of the interpreter's objects must be in use any longer.
+ *
+ * @param interp The interpreter. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_interp_free(struct srd_interp *interp)
+{
+	PyThreadState *main_tstate;
+	PyGILState_STATE gstate;
+	GHashTableIter iter;
+	void *py_dec;
+
+	gstate = srd_gil_ensure(NULL);
+	main_tstate = PyThreadState_Get();
+	PyEval_SaveThread();
+	PyEval_RestoreThread(interp->tstate);
+
+	g_hash_table_iter_init(&iter, interp->decoders);
+	while (g_hash_table_iter_next(&iter, NULL, &py_dec))
+		Py_DECREF((PyObject *)py_dec);
+	Py_XDECREF(interp->py_basedec);
+	Py_XDECREF(interp->py_mod);
+
+	Py_EndInterpreter(interp->tstate);
+#if PY_VERSION_HEX >= 0x030C0000
+	/* The interpreter's own GIL ended with it. */
+	PyEval_RestoreThread(main_tstate);
+#else
+	/* The GIL is shared, and still held. */
+	PyThreadState_Swap(main_tstate);
+#endif
+
+	srd_gil_release(gstate);
+
+	g_hash_table_destroy(interp->decoders);
+	g_free(interp);
+
+	srd_dbg("Ended a Python sub-interpreter.");
+}
+
+/**
+ * Get the sigrokdecode module of a sub-interpreter.
+ *
+ * @param interp The interpreter. Must not be NULL.
+ *
+ * @return A borrowed reference to the module.
+ *
+ * @private
+ */
+SRD_PRIV PyObject *srd_interp_module_get(const struct srd_interp *interp)
+{
+	return interp->py_mod;
+}
+
+/**
+ * Return the Decoder class of a decoder in a sub-interpreter, and import
+ * the decoder's module into the interpreter if needed. Expects the
+ * interpreter's GIL.
+ *
+ * @param interp The interpreter. Must not be NULL.
+ * @param dec The decoder. Must not be NULL.
+ * @param module_name The name of the decoder's module. Must not be NULL.
+ *
+ * @return A borrowed reference to the class, or NULL upon errors.
+ *
+ * @private
+ */
+SRD_PRIV PyObject *srd_interp_decoder_get(struct srd_interp *interp,
+		const struct srd_decoder *dec, const char *module_name)
+{
+	PyObject *py_mod, *py_dec;
+	int is_subclass;
+
+	if ((py_dec = g_hash_table_lookup(interp->decoders, dec)))
+		return py_dec;
+
+	srd_dbg("Importing decoder %s into a sub-interpreter.", module_name);
+
+	if (!(py_mod = py_import_by_name(module_name)))
+		return NULL;
+	py_dec = PyObject_GetAttrString(py_mod, "Decoder");
+	Py_DECREF(py_mod);
+	if (!py_dec)
+		return NULL;
+
+	is_subclass = PyObject_IsSubclass(py_dec, interp->py_basedec);
+	if (is_subclass <= 0) {
+		if (!is_subclass)
+			srd_err("Decoder class in protocol decoder module %s is "
+				"not a subclass of sigrokdecode.Decoder.",
+				module_name);
+		Py_DECREF(py_dec);
+		return NULL;
+	}
+	g_hash_table_insert(interp->decoders, (void *)dec, py_dec);
+
+	return py_dec;
+}
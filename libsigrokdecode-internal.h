@@ -21,8 +21,17 @@
 #ifndef LIBSIGROKDECODE_LIBSIGROKDECODE_INTERNAL_H
 #define LIBSIGROKDECODE_LIBSIGROKDECODE_INTERNAL_H
 
-/* Use the stable ABI subset as per PEP 384. */
+/*
+ * Use the stable ABI subset as per PEP 384, interpreter.c excepted. Files
+ * may raise the version by defining SRD_PYTHON_LIMITED_API.
+ */
+#ifndef SRD_PYTHON_FULL_API
+#ifdef SRD_PYTHON_LIMITED_API
+#define Py_LIMITED_API SRD_PYTHON_LIMITED_API
+#else
 #define Py_LIMITED_API 0x03020000
+#endif
+#endif
 
 #include <Python.h> /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
@@ -49,6 +58,18 @@ enum {
 	SRD_TERM_SKIP,
 };
 
+/* Largest channel count for which wait() keeps its pin value tuples. */
+#define SRD_PINVALUES_CACHE_CHANNELS 8
+
+/* Largest condition count for which wait() keeps its .matched tuples. */
+#define SRD_MATCHED_CACHE_CONDITIONS 5
+
+/* Bytes of a capture file which srd_session_send_file() maps at a time. */
+#define SRD_FILE_WINDOW_SIZE (16 * 1024 * 1024)
+
+/* Most annotations a batch collects before it is passed to the frontend. */
+#define SRD_ANN_BATCH_SIZE 4096
+
 struct srd_term {
 	int type;
 	int channel;
@@ -56,6 +77,50 @@ struct srd_term {
 	uint64_t num_samples_already_skipped;
 };
 
+/*
+ * A list of conditions. The terms of all conditions are kept back to
+ * back in one array, condition i spans terms[cond_start[i]] up to (but
+ * not including) terms[cond_start[i + 1]].
+ */
+struct srd_conditions {
+	struct srd_term *terms;
+	unsigned int *cond_start;
+	unsigned int num_conditions;
+	unsigned int num_terms;
+	/* Allocated sizes of the arrays. */
+	unsigned int max_conditions;
+	unsigned int max_terms;
+};
+
+struct srd_ann_batch {
+	/* The annotations, struct srd_proto_data_annotation_record. */
+	GArray *records;
+	/* Distinct lists of annotation texts (char **). */
+	GPtrArray *ann_texts;
+	/* Maps encoded text lists (GString *) to their index + 1. */
+	GHashTable *text_index;
+	/* The texts of the annotation being added, NUL separated. */
+	GString *texts;
+};
+
+/* Performance counters of a decoder instance. Times in microseconds. */
+struct srd_inst_counters {
+	uint64_t wait_calls;
+	uint64_t matches;
+	uint64_t samples_scanned;
+	int64_t match_time;
+	/* Time in decode(), including matching and stacked decoders. */
+	int64_t busy_time;
+	/* Start of the current busy period of a stack's bottom, or 0. */
+	int64_t busy_since;
+	/* Time in the decode() calls of stacked decoders. */
+	int64_t stacked_time;
+	uint64_t put_calls[SRD_OUTPUT_META + 1];
+	uint64_t put_bytes[SRD_OUTPUT_META + 1];
+	unsigned int num_ann_classes;
+	uint64_t *ann_put_calls;
+};
+
 /* Custom Python types: */
 
 typedef struct {
@@ -76,26 +141,128 @@ struct srd_session {
 
 	/* List of frontend callbacks to receive decoder output. */
 	GSList *callbacks;
+
+	/* Hand chunks to all decoder stacks at once, see srd_session_parallel_set(). */
+	gboolean parallel;
+	/* Threads for generator based stacks in parallel mode, or NULL. */
+	GThreadPool *gen_pool;
+
+	/* Collect performance counters, see srd_session_stats_set(). */
+	gboolean stats;
+
+	/* Frontend callback to receive batches of annotations. */
+	srd_pd_annotation_batch_callback ann_batch_cb;
+	void *ann_batch_cb_data;
+
+	/* Own Python interpreter, see srd_session_isolated_set(). */
+	struct srd_interp *interp;
+
+	/* Buffered input, see srd_session_stream_set(). */
+	struct srd_stream *stream;
+
+	/* Frontend callback to learn about congestion of the buffered input. */
+	srd_session_backpressure_callback backpressure_cb;
+	void *backpressure_cb_data;
+
+	/* Samples between snapshots of the stacks, see srd_session_checkpoint_interval_set(). */
+	uint64_t checkpoint_interval;
+
+	/* Frontend callback to learn about snapshots of the stacks. */
+	srd_session_checkpoint_callback checkpoint_cb;
+	void *checkpoint_cb_data;
+
+	/* Record the Python output of the instances, see srd_session_record_set(). */
+	gboolean record;
+
+	/* The samplerate which the frontend passed, 0 if none. */
+	uint64_t samplerate;
 };
 
+/* The counters of an instance, NULL if its session doesn't collect any. */
+static inline struct srd_inst_counters *srd_inst_counters_get(
+		const struct srd_decoder_inst *di)
+{
+	return di->sess->stats ? di->stats : NULL;
+}
+
 /* srd.c */
 SRD_PRIV int srd_decoder_searchpath_add(const char *path);
 
 /* session.c */
 SRD_PRIV struct srd_pd_callback *srd_pd_output_callback_find(struct srd_session *sess,
 		int output_type);
+SRD_PRIV int srd_session_decode(struct srd_session *sess,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_PRIV int srd_session_decode_rle(struct srd_session *sess,
+		uint64_t abs_start_samplenum, const uint64_t *run_lengths,
+		const uint8_t *run_values, uint64_t num_runs, uint64_t unitsize);
+
+/* stream.c */
+struct srd_stream;
+SRD_PRIV struct srd_stream *srd_stream_new(struct srd_session *sess,
+		uint64_t size, uint64_t high_water);
+SRD_PRIV void srd_stream_free(struct srd_stream *stream);
+SRD_PRIV int srd_stream_flush(struct srd_stream *stream, gboolean discard);
+SRD_PRIV int srd_stream_push(struct srd_stream *stream,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint64_t *run_lengths, uint64_t num_runs,
+		const uint8_t *data, uint64_t len, uint64_t unitsize);
+SRD_PRIV void srd_stream_stats_get(struct srd_stream *stream,
+		struct srd_session_stream_stats *stats);
+
+/* record.c */
+SRD_PRIV void srd_recording_put(struct srd_decoder_inst *di,
+		uint64_t start_sample, uint64_t end_sample, PyObject *py_data);
+SRD_PRIV Py_ssize_t srd_recording_mark(struct srd_decoder_inst *di);
+SRD_PRIV void srd_recording_truncate(struct srd_decoder_inst *di,
+		Py_ssize_t mark);
+SRD_PRIV void srd_recording_free(struct srd_decoder_inst *di);
+SRD_PRIV int srd_recording_replay(struct srd_decoder_inst *di,
+		struct srd_decoder_inst *next_di);
 
 /* instance.c */
 SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di);
+SRD_PRIV gboolean srd_inst_ann_wanted(const struct srd_decoder_inst *di,
+		int ann_class);
 SRD_PRIV void match_array_free(struct srd_decoder_inst *di);
 SRD_PRIV void condition_list_free(struct srd_decoder_inst *di);
+SRD_PRIV struct srd_conditions *srd_conditions_new(void);
+SRD_PRIV void srd_conditions_free(struct srd_conditions *conds);
+SRD_PRIV void srd_conditions_clear(struct srd_conditions *conds);
+SRD_PRIV void srd_conditions_add(struct srd_conditions *conds);
+SRD_PRIV struct srd_term *srd_conditions_add_term(struct srd_conditions *conds);
+SRD_PRIV void srd_conditions_copy(struct srd_conditions *dst,
+	const struct srd_conditions *src);
 SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
-		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		gboolean wait);
+SRD_PRIV int srd_inst_decode_rle(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, const uint64_t *run_lengths,
+		const uint8_t *run_values, uint64_t num_runs, uint64_t unitsize,
+		gboolean wait);
+SRD_PRIV int srd_inst_decode_wait(struct srd_decoder_inst *di);
+SRD_PRIV struct srd_ann_batch *srd_inst_ann_batch_get(struct srd_decoder_inst *di);
+SRD_PRIV gboolean srd_ann_batch_add(struct srd_ann_batch *batch,
+		const struct srd_proto_data *pdata, int ann_class);
+SRD_PRIV void srd_inst_ann_batch_flush(struct srd_decoder_inst *di);
+SRD_PRIV void srd_inst_old_pins_set(struct srd_decoder_inst *di,
+		const uint8_t *sample_pos);
+SRD_PRIV void srd_inst_initial_pins_apply(struct srd_decoder_inst *di);
+SRD_PRIV const uint8_t *srd_inst_sample_pos(struct srd_decoder_inst *di,
+		uint64_t abs_samplenum);
 SRD_PRIV int process_samples_until_condition_match(struct srd_decoder_inst *di, gboolean *found_match);
 SRD_PRIV int srd_inst_flush(struct srd_decoder_inst *di);
+SRD_PRIV void srd_inst_stats_busy(struct srd_decoder_inst *di, gboolean busy);
+SRD_PRIV void srd_inst_stats_log(const struct srd_decoder_inst *di);
 SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di);
 SRD_PRIV int srd_inst_terminate_reset(struct srd_decoder_inst *di);
+SRD_PRIV int srd_inst_checkpoint(struct srd_decoder_inst *di);
+SRD_PRIV int srd_inst_resume_point(const struct srd_decoder_inst *di,
+		uint64_t abs_samplenum, uint64_t *samplenum);
+SRD_PRIV int srd_inst_resume(struct srd_decoder_inst *di,
+		uint64_t abs_samplenum);
 SRD_PRIV void srd_inst_free(struct srd_decoder_inst *di);
 SRD_PRIV void srd_inst_free_all(struct srd_session *sess);
 
@@ -119,16 +286,47 @@ SRD_PRIV int srd_log(int loglevel, const char *format, ...) G_GNUC_PRINTF(2, 3);
 
 /* decoder.c */
 SRD_PRIV long srd_decoder_apiver(const struct srd_decoder *d);
+SRD_PRIV int srd_decoder_import(struct srd_decoder *dec);
+SRD_PRIV char *srd_decoder_module_name(const struct srd_decoder *dec);
+
+/* decoder_cache.c */
+struct srd_decoder_cache;
+SRD_PRIV struct srd_decoder_cache *srd_decoder_cache_open(const char *path);
+SRD_PRIV gboolean srd_decoder_cache_lookup(struct srd_decoder_cache *cache,
+		const char *module_name, struct srd_decoder **dec, char **doc);
+SRD_PRIV void srd_decoder_cache_store(struct srd_decoder_cache *cache,
+		const char *module_name, const struct srd_decoder *dec,
+		const char *doc);
+SRD_PRIV void srd_decoder_cache_close(struct srd_decoder_cache *cache);
 
 /* type_decoder.c */
 SRD_PRIV PyObject *srd_Decoder_type_new(void);
+SRD_PRIV void srd_Decoder_inst_set(PyObject *obj, struct srd_decoder_inst *di);
 SRD_PRIV const char *output_type_name(unsigned int idx);
+SRD_PRIV int srd_wait_op_arm(struct srd_decoder_inst *di,
+		PyObject *py_yielded);
+SRD_PRIV gboolean srd_wait_op_armed(const struct srd_decoder_inst *di);
+SRD_PRIV gboolean srd_wait_op_run(struct srd_decoder_inst *di);
+SRD_PRIV PyObject *srd_wait_op_finish(struct srd_decoder_inst *di);
+SRD_PRIV void srd_wait_op_clear(struct srd_decoder_inst *di);
+SRD_PRIV void srd_wait_op_free(struct srd_decoder_inst *di);
 
 /* type_logic.c */
 SRD_PRIV PyObject *srd_logic_type_new(void);
 
 /* module_sigrokdecode.c */
 PyMODINIT_FUNC PyInit_sigrokdecode(void);
+SRD_PRIV PyObject *srd_module_array_type(PyObject *mod);
+
+/* interpreter.c */
+struct srd_interp;
+SRD_PRIV PyGILState_STATE srd_gil_ensure(const struct srd_session *sess);
+SRD_PRIV void srd_gil_release(PyGILState_STATE gstate);
+SRD_PRIV int srd_interp_new(struct srd_interp **interp);
+SRD_PRIV void srd_interp_free(struct srd_interp *interp);
+SRD_PRIV PyObject *srd_interp_module_get(const struct srd_interp *interp);
+SRD_PRIV PyObject *srd_interp_decoder_get(struct srd_interp *interp,
+		const struct srd_decoder *dec, const char *module_name);
 
 /* util.c */
 SRD_PRIV PyObject *py_import_by_name(const char *name);
@@ -125,7 +125,7 @@ enum srd_loglevel {
 
 /*
  * When adding an output type, don't forget to...
- *   - expose it to PDs in module_sigrokdecode.c:PyInit_sigrokdecode()
+ *   - expose it to PDs in module_sigrokdecode.c:sigrokdecode_exec()
  *   - add a check in type_decoder.c:Decoder_put()
  *   - add a debug string in type_decoder.c:output_type_name()
  */
@@ -259,8 +259,11 @@ struct srd_decoder_inst {
 	uint8_t *channel_samples;
 	GSList *next_di;
 
-	/** List of conditions a PD wants to wait for. */
-	GSList *condition_list;
+	/** The bound decode() method, which gets the Python output of the PD below. */
+	void *py_decode;
+
+	/** Conditions a PD wants to wait for. */
+	struct srd_conditions *conditions;
 
 	/** Array of booleans denoting which conditions matched. */
 	GArray *match_array;
@@ -277,15 +280,85 @@ struct srd_decoder_inst {
 	/** Length (in bytes) of the input sample buffer. */
 	uint64_t inbuflen;
 
+	/**
+	 * Run lengths of run-length encoded input, NULL for plain sample
+	 * data. When set, inbuf holds one sample value per run.
+	 */
+	const uint64_t *in_run_lengths;
+
+	/** Number of runs in run-length encoded input. */
+	uint64_t in_num_runs;
+
+	/** Index and absolute start sample number of the current run. */
+	uint64_t in_run_idx;
+	uint64_t in_run_start;
+
 	/** Absolute current samplenumber. */
 	uint64_t abs_cur_samplenum;
 
 	/** Array of "old" (previous sample) pin values. */
 	GArray *old_pins_array;
 
+	/**
+	 * Snapshots of the stack's state, newest first, see
+	 * srd_session_checkpoint_interval_set(). Only the instance at the
+	 * bottom of a stack keeps them.
+	 */
+	GSList *checkpoints;
+
+	/**
+	 * Set after srd_session_resume(), until a chunk which reaches past
+	 * the current sample number arrives. Such chunks may start before it.
+	 */
+	gboolean resuming;
+
+	/**
+	 * The recorded Python output of the instance, NULL if there is
+	 * none, see srd_session_record_set().
+	 */
+	void *recording;
+
+	/** Pin value tuples returned by wait(), indexed by pin states. */
+	void **py_pinvalues_cache;
+
+	/** Tuples for self.matched, indexed by count and match states. */
+	void **py_matched_cache;
+
+	/** Per sample byte mask of the bits which carry mapped channels. */
+	uint8_t *edge_mask;
+
+	/** The edge mask replicated to 64 bits (unitsize 1, 2, 4, or 8). */
+	uint64_t edge_mask_word;
+
+	/** No channel changes in [edge_scan_start, edge_scan_end). */
+	uint64_t edge_scan_start;
+	uint64_t edge_scan_end;
+
+	/** The instance at the bottom of this instance's stack. */
+	struct srd_decoder_inst *stack_bottom;
+
+	/** Annotations of the whole stack for the batch callback. */
+	void *ann_batch;
+
+	/** Per annotation class: non-zero if disabled. NULL if none are. */
+	GArray *ann_disabled;
+
+	/** Performance counters, see srd_inst_stats_get(). */
+	void *stats;
+
 	/** Handle for this PD stack's worker thread. */
 	GThread *thread_handle;
 
+	/**
+	 * The generator of a decode() method which is a generator function,
+	 * and its send() method. Such PD stacks have no worker thread.
+	 */
+	void *py_gen;
+	void *py_gen_send;
+
+	/** The operation which a generator based decode() waits for. */
+	void *wait_op;
+
 	/** Indicates whether new samples are available for processing. */
 	gboolean got_new_samples;
 
@@ -347,6 +420,89 @@ struct srd_pd_callback {
 	void *cb_data;
 };
 
+struct srd_proto_data_annotation_record {
+	uint64_t start_sample;
+	uint64_t end_sample;
+	struct srd_pd_output *pdo;
+	int ann_class; /* Index into "struct srd_decoder"->annotations. */
+	unsigned int text_idx; /* Index into the batch's ann_texts. */
+};
+struct srd_proto_data_annotation_batch {
+	uint64_t num_records;
+	const struct srd_proto_data_annotation_record *records;
+	/* Distinct lists of annotation texts, records share them. */
+	unsigned int num_texts;
+	char ***ann_texts;
+};
+
+typedef void (*srd_pd_annotation_batch_callback)(
+		const struct srd_proto_data_annotation_batch *batch,
+		void *cb_data);
+
+/**
+ * Callback which learns about congestion of a session's buffered input,
+ * see srd_session_backpressure_callback_set().
+ */
+typedef void (*srd_session_backpressure_callback)(struct srd_session *sess,
+		gboolean congested, uint64_t queued_bytes, void *cb_data);
+
+/**
+ * Callback which learns about a snapshot of a decoder stack's state, see
+ * srd_session_checkpoint_callback_set().
+ */
+typedef void (*srd_session_checkpoint_callback)(struct srd_decoder_inst *di,
+		uint64_t samplenum, void *cb_data);
+
+/** Statistics of a session's buffered input, see srd_session_stream_stats_get(). */
+struct srd_session_stream_stats {
+	/** Chunks which went into the buffer. */
+	uint64_t chunks;
+	/** Sample data bytes which went into the buffer. */
+	uint64_t bytes;
+	/** Sample data bytes in the buffer right now. */
+	uint64_t queued_bytes;
+	/** The most sample data bytes which were in the buffer at once. */
+	uint64_t max_queued_bytes;
+	/** Times the buffer reached the high-water mark. */
+	uint64_t congestions;
+	/** Times the sending of a chunk waited for room in the buffer. */
+	uint64_t stalls;
+	/** Time spent waiting for room in the buffer, in microseconds. */
+	uint64_t stall_time;
+	/**
+	 * Average and maximum time from sending a chunk until the decoders
+	 * processed it, in microseconds.
+	 */
+	uint64_t latency_avg;
+	uint64_t latency_max;
+};
+
+/** Performance counters of a decoder instance, see srd_inst_stats_get(). */
+struct srd_inst_stats {
+	/** Calls of wait() and its variants wait_many(), sample_at(), shift_in(). */
+	uint64_t wait_calls;
+	/** Condition matches, several per wait_many() or shift_in() call. */
+	uint64_t matches;
+	/** Samples which the condition matching advanced over. */
+	uint64_t samples_scanned;
+	/** Time spent looking for condition matches, in microseconds. */
+	uint64_t match_time;
+	/**
+	 * Time spent in the decoder's Python code, in microseconds. This
+	 * is the decode() time without the condition matching, waiting for
+	 * input data, and the decode() calls of stacked decoders.
+	 */
+	uint64_t decode_time;
+	/** put() calls per output type (SRD_OUTPUT_ANN etc.). */
+	uint64_t put_calls[SRD_OUTPUT_META + 1];
+	/** Data bytes put() per output type, only SRD_OUTPUT_BINARY has any. */
+	uint64_t put_bytes[SRD_OUTPUT_META + 1];
+	/** Number of entries of ann_put_calls. */
+	uint64_t num_ann_classes;
+	/** put() calls per annotation class, including disabled classes. */
+	uint64_t *ann_put_calls;
+};
+
 /* srd.c */
 SRD_API int srd_init(const char *path);
 SRD_API int srd_exit(void);
@@ -357,14 +513,43 @@ SRD_API int srd_session_new(struct srd_session **sess);
 SRD_API int srd_session_start(struct srd_session *sess);
 SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 		GVariant *data);
+SRD_API int srd_session_parallel_set(struct srd_session *sess,
+		gboolean parallel);
+SRD_API int srd_session_stats_set(struct srd_session *sess,
+		gboolean enable);
+SRD_API int srd_session_isolated_set(struct srd_session *sess,
+		gboolean isolated);
+SRD_API int srd_session_stream_set(struct srd_session *sess,
+		uint64_t size, uint64_t high_water);
+SRD_API int srd_session_backpressure_callback_set(struct srd_session *sess,
+		srd_session_backpressure_callback cb, void *cb_data);
+SRD_API int srd_session_stream_stats_get(struct srd_session *sess,
+		struct srd_session_stream_stats *stats);
+SRD_API int srd_session_checkpoint_interval_set(struct srd_session *sess,
+		uint64_t interval);
+SRD_API int srd_session_checkpoint_callback_set(struct srd_session *sess,
+		srd_session_checkpoint_callback cb, void *cb_data);
+SRD_API int srd_session_resume(struct srd_session *sess,
+		uint64_t abs_samplenum, uint64_t *resume_samplenum);
+SRD_API int srd_session_record_set(struct srd_session *sess, gboolean enable);
+SRD_API int srd_session_replay(struct srd_session *sess,
+		struct srd_decoder_inst *di);
 SRD_API int srd_session_send(struct srd_session *sess,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_API int srd_session_send_rle(struct srd_session *sess,
+		uint64_t abs_start_samplenum, const uint64_t *run_lengths,
+		const uint8_t *run_values, uint64_t num_runs, uint64_t unitsize);
+SRD_API int srd_session_send_file(struct srd_session *sess, int fd,
+		uint64_t offset, uint64_t abs_start_samplenum,
+		uint64_t num_samples, uint64_t unitsize);
 SRD_API int srd_session_send_eof(struct srd_session *sess);
 SRD_API int srd_session_terminate_reset(struct srd_session *sess);
 SRD_API int srd_session_destroy(struct srd_session *sess);
 SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 		int output_type, srd_pd_output_callback cb, void *cb_data);
+SRD_API int srd_pd_annotation_batch_callback_add(struct srd_session *sess,
+		srd_pd_annotation_batch_callback cb, void *cb_data);
 
 /* decoder.c */
 SRD_API const GSList *srd_decoder_list(void);
@@ -388,6 +573,13 @@ SRD_API struct srd_decoder_inst *srd_inst_find_by_id(struct srd_session *sess,
 		const char *inst_id);
 SRD_API int srd_inst_initial_pins_set_all(struct srd_decoder_inst *di,
 		GArray *initial_pins);
+SRD_API int srd_inst_ann_class_enable(struct srd_decoder_inst *di,
+		int ann_class, gboolean enable);
+SRD_API int srd_inst_ann_row_enable(struct srd_decoder_inst *di,
+		const char *row_id, gboolean enable);
+SRD_API struct srd_inst_stats *srd_inst_stats_get(
+		const struct srd_decoder_inst *di);
+SRD_API int srd_inst_stats_reset(struct srd_decoder_inst *di);
 
 /* log.c */
 typedef int (*srd_log_callback)(void *cb_data, int loglevel,
@@ -17,6 +17,18 @@
  * along with this program.  If not, see <http://www.gnu.org/licenses/>.
  */
 
+/*
+ * Multi-phase initialization (PEP 489) is part of the limited API as of
+ * Python 3.5, support for interpreters with a GIL of their own can be
+ * declared as of Python 3.12.
+ */
+#include <patchlevel.h>
+#if PY_VERSION_HEX >= 0x030C0000
+#define SRD_PYTHON_LIMITED_API 0x030C0000
+#elif PY_VERSION_HEX >= 0x03050000
+#define SRD_PYTHON_LIMITED_API 0x03050000
+#endif
+
 #include <config.h>
 #include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
@@ -24,65 +36,140 @@
 /** @cond PRIVATE */
 
 /*
- * When initialized, a reference to this module inside the Python interpreter
- * lives here.
+ * When initialized, a reference to the main interpreter's module lives
+ * here, see srd_init().
  */
 SRD_PRIV PyObject *mod_sigrokdecode = NULL;
 
+/* The state of a sigrokdecode module, there is one per interpreter. */
+struct module_state {
+	/* The array.array type, for the results of wait_many() etc. */
+	PyObject *py_array_type;
+};
+
 /** @endcond */
 
-static struct PyModuleDef sigrokdecode_module = {
-	PyModuleDef_HEAD_INIT,
-	.m_name = "sigrokdecode",
-	.m_doc = "sigrokdecode module",
-	.m_size = -1,
-};
+static int sigrokdecode_traverse(PyObject *mod, visitproc visit, void *arg)
+{
+	struct module_state *state;
 
-/** @cond PRIVATE */
-PyMODINIT_FUNC PyInit_sigrokdecode(void)
+	if ((state = PyModule_GetState(mod)))
+		Py_VISIT(state->py_array_type);
+
+	return 0;
+}
+
+static int sigrokdecode_clear(PyObject *mod)
 {
-	PyObject *mod, *Decoder_type;
-	PyGILState_STATE gstate;
+	struct module_state *state;
 
-	gstate = PyGILState_Ensure();
+	if ((state = PyModule_GetState(mod)))
+		Py_CLEAR(state->py_array_type);
 
-	mod = PyModule_Create(&sigrokdecode_module);
-	if (!mod)
-		goto err_out;
+	return 0;
+}
+
+static void sigrokdecode_free(void *mod)
+{
+	sigrokdecode_clear(mod);
+}
+
+/*
+ * Populate a new sigrokdecode module. Every interpreter which imports
+ * the module gets one of its own: the main interpreter, and the
+ * sub-interpreters of isolated sessions.
+ */
+static int sigrokdecode_exec(PyObject *mod)
+{
+	PyObject *Decoder_type, *py_array;
+	struct module_state *state;
+
+	/* Look up the types which the decoder methods use only once. */
+	state = PyModule_GetState(mod);
+	if (!(py_array = py_import_by_name("array")))
+		return -1;
+	state->py_array_type = PyObject_GetAttrString(py_array, "array");
+	Py_DECREF(py_array);
+	if (!state->py_array_type)
+		return -1;
 
 	Decoder_type = srd_Decoder_type_new();
 	if (!Decoder_type)
-		goto err_out;
-	if (PyModule_AddObject(mod, "Decoder", Decoder_type) < 0)
-		goto err_out;
+		return -1;
+	if (PyModule_AddObject(mod, "Decoder", Decoder_type) < 0) {
+		Py_DECREF(Decoder_type);
+		return -1;
+	}
 
 	/* Expose output types as symbols in the sigrokdecode module */
 	if (PyModule_AddIntConstant(mod, "OUTPUT_ANN", SRD_OUTPUT_ANN) < 0)
-		goto err_out;
+		return -1;
 	if (PyModule_AddIntConstant(mod, "OUTPUT_PYTHON", SRD_OUTPUT_PYTHON) < 0)
-		goto err_out;
+		return -1;
 	if (PyModule_AddIntConstant(mod, "OUTPUT_BINARY", SRD_OUTPUT_BINARY) < 0)
-		goto err_out;
+		return -1;
 	if (PyModule_AddIntConstant(mod, "OUTPUT_LOGIC", SRD_OUTPUT_LOGIC) < 0)
-		goto err_out;
+		return -1;
 	if (PyModule_AddIntConstant(mod, "OUTPUT_META", SRD_OUTPUT_META) < 0)
-		goto err_out;
+		return -1;
 	/* Expose meta input symbols. */
 	if (PyModule_AddIntConstant(mod, "SRD_CONF_SAMPLERATE", SRD_CONF_SAMPLERATE) < 0)
-		goto err_out;
+		return -1;
 
-	mod_sigrokdecode = mod;
+	return 0;
+}
 
-	PyGILState_Release(gstate);
+#if PY_VERSION_HEX >= 0x03050000
+static PyModuleDef_Slot sigrokdecode_slots[] = {
+	{ Py_mod_exec, (void *)sigrokdecode_exec },
+#if PY_VERSION_HEX >= 0x030C0000
+	{ Py_mod_multiple_interpreters, Py_MOD_PER_INTERPRETER_GIL_SUPPORTED },
+#endif
+	ALL_ZERO,
+};
+#endif
 
-	return mod;
+static struct PyModuleDef sigrokdecode_module = {
+	PyModuleDef_HEAD_INIT,
+	.m_name = "sigrokdecode",
+	.m_doc = "sigrokdecode module",
+	.m_size = sizeof(struct module_state),
+#if PY_VERSION_HEX >= 0x03050000
+	.m_slots = sigrokdecode_slots,
+#endif
+	.m_traverse = sigrokdecode_traverse,
+	.m_clear = sigrokdecode_clear,
+	.m_free = sigrokdecode_free,
+};
 
-err_out:
-	Py_XDECREF(mod);
-	srd_exception_catch("Failed to initialize module");
-	PyGILState_Release(gstate);
+/**
+ * Get the array.array type, which a sigrokdecode module looked up.
+ *
+ * @param mod The sigrokdecode module of an interpreter. Must not be NULL.
+ *
+ * @return A borrowed reference to the type.
+ *
+ * @private
+ */
+SRD_PRIV PyObject *srd_module_array_type(PyObject *mod)
+{
+	return ((struct module_state *)PyModule_GetState(mod))->py_array_type;
+}
 
-	return NULL;
+/** @cond PRIVATE */
+PyMODINIT_FUNC PyInit_sigrokdecode(void)
+{
+#if PY_VERSION_HEX >= 0x03050000
+	return PyModuleDef_Init(&sigrokdecode_module);
+#else
+	PyObject *mod;
+
+	mod = PyModule_Create(&sigrokdecode_module);
+	if (mod && sigrokdecode_exec(mod) < 0)
+		Py_CLEAR(mod);
+
+	return mod;
+#endif
 }
 
 /** @endcond */
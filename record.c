@@ -0,0 +1,363 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <config.h>
+#include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
+#include "libsigrokdecode.h"
+#include <glib.h>
+
+/**
+ * @file
+ *
+ * Recordings of the Python output of decoder instances.
+ *
+ * While a session records (see srd_session_record_set()), every put()
+ * of SRD_OUTPUT_PYTHON data gets pickled as a (start sample, end sample,
+ * data) tuple. The packets are pickled when they are put, a decoder
+ * may change the objects afterwards. A recording is a list of blocks of
+ * pickled packets, which bounds the size of the buffer that gets copied
+ * when a block is complete. The pickler's memo gets cleared after every
+ * packet, objects which a decoder puts repeatedly are pickled with their
+ * state at the time.
+ *
+ * srd_session_replay() unpickles the packets, and feeds them to the
+ * decode() method of a stacked instance, like put() would have. It
+ * stops at the first packet which decode() fails on.
+ *
+ * All functions expect the GIL of the instance's session, unless noted
+ * otherwise.
+ *
+ * @private
+ */
+
+/** @cond PRIVATE */
+
+/* Packets per block. */
+#define BLOCK_PACKETS 4096
+
+struct srd_recording {
+	/* The complete blocks, a list of bytes objects. */
+	PyObject *py_blocks;
+	/* The block being written, and the methods of its pickler. */
+	PyObject *py_file;
+	PyObject *py_dump;
+	PyObject *py_clear_memo;
+	/* Packets in the block being written. */
+	unsigned int block_packets;
+	/* A packet could not be recorded, the recording is incomplete. */
+	gboolean failed;
+};
+
+/** @endcond */
+
+static int block_open(struct srd_recording *rec)
+{
+	PyObject *py_io, *py_pickle, *py_pickler;
+
+	py_io = py_import_by_name("io");
+	py_pickle = py_import_by_name("pickle");
+	py_pickler = NULL;
+	if (py_io && py_pickle)
+		rec->py_file = PyObject_CallMethod(py_io, "BytesIO", NULL);
+	if (rec->py_file)
+		py_pickler = PyObject_CallMethod(py_pickle, "Pickler", "Oi",
+			rec->py_file, -1);
+	if (py_pickler) {
+		rec->py_dump = PyObject_GetAttrString(py_pickler, "dump");
+		rec->py_clear_memo = PyObject_GetAttrString(py_pickler,
+			"clear_memo");
+	}
+	Py_XDECREF(py_pickler);
+	Py_XDECREF(py_pickle);
+	Py_XDECREF(py_io);
+
+	if (!rec->py_dump || !rec->py_clear_memo) {
+		Py_CLEAR(rec->py_file);
+		Py_CLEAR(rec->py_dump);
+		Py_CLEAR(rec->py_clear_memo);
+		return SRD_ERR_PYTHON;
+	}
+	rec->block_packets = 0;
+
+	return SRD_OK;
+}
+
+/* Append the block being written to the complete ones, if any. */
+static int block_close(struct srd_recording *rec)
+{
+	PyObject *py_block;
+	int ret;
+
+	if (!rec->py_file)
+		return SRD_OK;
+
+	ret = SRD_ERR_PYTHON;
+	if ((py_block = PyObject_CallMethod(rec->py_file, "getvalue", NULL))) {
+		if (PyList_Append(rec->py_blocks, py_block) == 0)
+			ret = SRD_OK;
+		Py_DECREF(py_block);
+	}
+	Py_CLEAR(rec->py_file);
+	Py_CLEAR(rec->py_dump);
+	Py_CLEAR(rec->py_clear_memo);
+
+	return ret;
+}
+
+/* Give up on a recording after an error, and keep it from replays. */
+static void recording_fail(struct srd_decoder_inst *di)
+{
+	struct srd_recording *rec;
+
+	srd_exception_catch("Cannot record the Python output of instance %s",
+		di->inst_id);
+
+	rec = di->recording;
+	block_close(rec);
+	PyErr_Clear();
+	PyList_SetSlice(rec->py_blocks, 0, PY_SSIZE_T_MAX, NULL);
+	rec->failed = TRUE;
+}
+
+/**
+ * Record a packet of Python output of a decoder instance.
+ *
+ * @param di The instance which put the packet. Must not be NULL.
+ * @param start_sample The packet's start sample number.
+ * @param end_sample The packet's end sample number.
+ * @param py_data The packet's data. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_recording_put(struct srd_decoder_inst *di,
+		uint64_t start_sample, uint64_t end_sample, PyObject *py_data)
+{
+	struct srd_recording *rec;
+	PyObject *py_res;
+
+	if (!(rec = di->recording)) {
+		rec = g_malloc0(sizeof(struct srd_recording));
+		if (!(rec->py_blocks = PyList_New(0))) {
+			g_free(rec);
+			srd_exception_catch("Cannot record the Python output "
+				"of instance %s", di->inst_id);
+			return;
+		}
+		di->recording = rec;
+	}
+	if (rec->failed)
+		return;
+
+	if (!rec->py_file && block_open(rec) != SRD_OK) {
+		recording_fail(di);
+		return;
+	}
+	py_res = PyObject_CallFunction(rec->py_dump, "((KKO))",
+		(unsigned long long)start_sample,
+		(unsigned long long)end_sample, py_data);
+	if (!py_res) {
+		recording_fail(di);
+		return;
+	}
+	Py_DECREF(py_res);
+	if (!(py_res = PyObject_CallObject(rec->py_clear_memo, NULL))) {
+		recording_fail(di);
+		return;
+	}
+	Py_DECREF(py_res);
+
+	if (++rec->block_packets == BLOCK_PACKETS && block_close(rec) != SRD_OK)
+		recording_fail(di);
+}
+
+/**
+ * Mark the current end of the recording of a decoder instance.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @return The mark to pass to srd_recording_truncate().
+ *
+ * @private
+ */
+SRD_PRIV Py_ssize_t srd_recording_mark(struct srd_decoder_inst *di)
+{
+	struct srd_recording *rec;
+
+	if (!(rec = di->recording) || rec->failed)
+		return 0;
+
+	if (block_close(rec) != SRD_OK) {
+		recording_fail(di);
+		return 0;
+	}
+
+	return PyList_Size(rec->py_blocks);
+}
+
+/**
+ * Drop the packets which were recorded after a mark.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param mark The mark which srd_recording_mark() returned.
+ *
+ * @private
+ */
+SRD_PRIV void srd_recording_truncate(struct srd_decoder_inst *di,
+		Py_ssize_t mark)
+{
+	struct srd_recording *rec;
+
+	if (!(rec = di->recording) || rec->failed)
+		return;
+
+	if (block_close(rec) != SRD_OK ||
+			PyList_SetSlice(rec->py_blocks, mark, PY_SSIZE_T_MAX,
+				NULL) < 0)
+		recording_fail(di);
+}
+
+/**
+ * Drop the recording of a decoder instance. Acquires the GIL.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_recording_free(struct srd_decoder_inst *di)
+{
+	struct srd_recording *rec;
+	PyGILState_STATE gstate;
+
+	if (!(rec = di->recording))
+		return;
+
+	gstate = srd_gil_ensure(di->sess);
+	Py_XDECREF(rec->py_file);
+	Py_XDECREF(rec->py_dump);
+	Py_XDECREF(rec->py_clear_memo);
+	Py_DECREF(rec->py_blocks);
+	srd_gil_release(gstate);
+
+	g_free(rec);
+	di->recording = NULL;
+}
+
+/* Feed the packets of one block to decode(). */
+static int block_replay(PyObject *py_block, PyObject *py_decode,
+		const struct srd_decoder_inst *next_di, uint64_t *count)
+{
+	PyObject *py_io, *py_pickle, *py_file, *py_unpickler, *py_load;
+	PyObject *py_packet, *py_res;
+	int ret;
+
+	py_io = py_import_by_name("io");
+	py_pickle = py_import_by_name("pickle");
+	py_file = py_unpickler = py_load = NULL;
+	if (py_io && py_pickle)
+		py_file = PyObject_CallMethod(py_io, "BytesIO", "O", py_block);
+	if (py_file)
+		py_unpickler = PyObject_CallMethod(py_pickle, "Unpickler", "O",
+			py_file);
+	if (py_unpickler)
+		py_load = PyObject_GetAttrString(py_unpickler, "load");
+	Py_XDECREF(py_unpickler);
+	Py_XDECREF(py_file);
+	Py_XDECREF(py_pickle);
+	Py_XDECREF(py_io);
+	if (!py_load)
+		return SRD_ERR_PYTHON;
+
+	ret = SRD_OK;
+	while (TRUE) {
+		if (!(py_packet = PyObject_CallObject(py_load, NULL))) {
+			if (PyErr_ExceptionMatches(PyExc_EOFError))
+				PyErr_Clear();
+			else
+				ret = SRD_ERR_PYTHON;
+			break;
+		}
+		/* The packet is the (start, end, data) argument tuple. */
+		py_res = PyObject_CallObject(py_decode, py_packet);
+		Py_DECREF(py_packet);
+		if (!py_res) {
+			srd_exception_catch("Calling %s decode() failed",
+				next_di->inst_id);
+			ret = SRD_ERR_PYTHON;
+			break;
+		}
+		Py_DECREF(py_res);
+		(*count)++;
+	}
+	Py_DECREF(py_load);
+
+	return ret;
+}
+
+/**
+ * Feed the recorded Python output of a decoder instance to an instance
+ * which is stacked on top of it. Acquires the GIL.
+ *
+ * @param di The instance whose output was recorded. Must not be NULL.
+ * @param next_di The stacked instance, which srd_inst_start() started.
+ *                Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_recording_replay(struct srd_decoder_inst *di,
+		struct srd_decoder_inst *next_di)
+{
+	struct srd_recording *rec;
+	PyGILState_STATE gstate;
+	PyObject *py_decode, *py_block;
+	Py_ssize_t i;
+	uint64_t count;
+	int ret;
+
+	if ((rec = di->recording) && rec->failed) {
+		srd_err("The recorded output of instance %s is incomplete.",
+			di->inst_id);
+		return SRD_ERR;
+	}
+
+	gstate = srd_gil_ensure(di->sess);
+	ret = rec ? block_close(rec) : SRD_OK;
+	/* Use the decode() method which srd_inst_start() looked up. */
+	if ((py_decode = next_di->py_decode))
+		Py_INCREF(py_decode);
+	else if (!(py_decode = PyObject_GetAttrString(next_di->py_inst, "decode")))
+		ret = SRD_ERR_PYTHON;
+	count = 0;
+	for (i = 0; rec && ret == SRD_OK && i < PyList_Size(rec->py_blocks); i++) {
+		/* Keep the block, in case decode() drops the recording. */
+		py_block = PyList_GetItem(rec->py_blocks, i);
+		Py_INCREF(py_block);
+		ret = block_replay(py_block, py_decode, next_di, &count);
+		Py_DECREF(py_block);
+	}
+	Py_XDECREF(py_decode);
+	if (ret != SRD_OK)
+		srd_exception_catch("Cannot replay the Python output of "
+			"instance %s", di->inst_id);
+	srd_gil_release(gstate);
+
+	srd_dbg("Replayed %" PRIu64 " packets of instance %s to instance %s.",
+		count, di->inst_id, next_di->inst_id);
+
+	return ret;
+}
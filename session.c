@@ -21,7 +21,14 @@
 #include <config.h>
 #include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
+#include <errno.h>
+#include <fcntl.h>
 #include <inttypes.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#ifdef HAVE_SYS_MMAN_H
+#include <sys/mman.h>
+#endif
 #include <glib.h>
 
 /**
@@ -43,6 +50,9 @@
 SRD_PRIV GSList *sessions = NULL;
 SRD_PRIV int max_session_id = -1;
 
+/* Isolated sessions get created and destroyed in different threads. */
+static GMutex sessions_mutex;
+
 /** @endcond */
 
 /**
@@ -64,11 +74,27 @@ SRD_API int srd_session_new(struct srd_session **sess)
 		return SRD_ERR_ARG;
 
 	*sess = g_malloc(sizeof(struct srd_session));
-	(*sess)->session_id = ++max_session_id;
 	(*sess)->di_list = (*sess)->callbacks = NULL;
+	(*sess)->parallel = FALSE;
+	(*sess)->gen_pool = NULL;
+	(*sess)->stats = FALSE;
+	(*sess)->ann_batch_cb = NULL;
+	(*sess)->ann_batch_cb_data = NULL;
+	(*sess)->interp = NULL;
+	(*sess)->stream = NULL;
+	(*sess)->backpressure_cb = NULL;
+	(*sess)->backpressure_cb_data = NULL;
+	(*sess)->checkpoint_interval = 0;
+	(*sess)->checkpoint_cb = NULL;
+	(*sess)->checkpoint_cb_data = NULL;
+	(*sess)->record = FALSE;
+	(*sess)->samplerate = 0;
 
 	/* Keep a list of all sessions, so we can clean up as needed. */
+	g_mutex_lock(&sessions_mutex);
+	(*sess)->session_id = ++max_session_id;
 	sessions = g_slist_append(sessions, *sess);
+	g_mutex_unlock(&sessions_mutex);
 
 	srd_dbg("Creating session %d.", (*sess)->session_id);
 
@@ -122,7 +148,7 @@ static int srd_inst_send_meta(struct srd_decoder_inst *di, int key,
 		/* This is the only key we pass on to the decoder for now. */
 		return SRD_OK;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(di->sess);
 
 	if (PyObject_HasAttrString(di->py_inst, "metadata")) {
 		py_ret = PyObject_CallMethod(di->py_inst, "metadata", "lK",
@@ -131,7 +157,7 @@ static int srd_inst_send_meta(struct srd_decoder_inst *di, int key,
 		Py_XDECREF(py_ret);
 	}
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	/* Push metadata to all the PDs stacked on top of this one. */
 	for (l = di->next_di; l; l = l->next) {
@@ -190,17 +216,382 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 	srd_dbg("Setting session %d samplerate to %"G_GUINT64_FORMAT".",
 			sess->session_id, g_variant_get_uint64(data));
 
+	/* The buffered chunks get decoded with the previous value. */
 	ret = SRD_OK;
-	for (l = sess->di_list; l; l = l->next) {
-		if ((ret = srd_inst_send_meta(l->data, key, data)) != SRD_OK)
-			break;
-	}
+	if (sess->stream)
+		ret = srd_stream_flush(sess->stream, FALSE);
+	sess->samplerate = g_variant_get_uint64(data);
+	for (l = sess->di_list; l && ret == SRD_OK; l = l->next)
+		ret = srd_inst_send_meta(l->data, key, data);
 
 	g_variant_unref(data);
 
 	return ret;
 }
 
+/**
+ * Enable or disable parallel decoding of a session's decoder stacks.
+ *
+ * By default srd_session_send() hands a chunk to one decoder stack after
+ * the other, and waits for each stack to process the chunk before the
+ * next stack gets to see it. With parallel decoding enabled, the chunk
+ * is handed to the worker threads of all stacks at once, and the call
+ * returns when all of them are done. Independent stacks on the same
+ * input (several UARTs, SPI and I2C on a wide capture) then spread
+ * across CPU cores as far as the Python runtime permits it.
+ *
+ * In this mode output callbacks of different stacks run concurrently
+ * in the stacks' worker threads, frontends must protect shared state
+ * in their callbacks. Within one stack the order of output is unaffected.
+ *
+ * Stacks whose bottom decoder has a generator based decode() method
+ * have no worker thread. In this mode they process the chunk on a
+ * thread of a pool which the session keeps, concurrently with the
+ * other stacks, too.
+ *
+ * @param sess The session to configure. Must not be NULL.
+ * @param parallel TRUE to process all decoder stacks concurrently,
+ *                 FALSE to process them one after another (default).
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_parallel_set(struct srd_session *sess,
+		gboolean parallel)
+{
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	srd_dbg("%s parallel decoding for session %d.",
+		parallel ? "Enabling" : "Disabling", sess->session_id);
+	sess->parallel = parallel;
+
+	return SRD_OK;
+}
+
+/**
+ * Enable or disable the performance counters of a session's decoders.
+ *
+ * While enabled, all decoder instances of the session count their
+ * wait() calls, condition matches, scanned samples and put() calls,
+ * and measure the time which they spend looking for condition matches
+ * and in their Python code. Frontends get the counters of an instance
+ * with srd_inst_stats_get(). Measuring the times has a small cost per
+ * wait() call, which is why this is disabled by default.
+ *
+ * The counters of all instances also get logged at the info level when
+ * srd_session_send_eof() is done.
+ *
+ * @param sess The session to configure. Must not be NULL.
+ * @param enable TRUE to collect the counters, FALSE to not collect them
+ *               (default).
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_stats_set(struct srd_session *sess,
+		gboolean enable)
+{
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	srd_dbg("%s performance counters for session %d.",
+		enable ? "Enabling" : "Disabling", sess->session_id);
+	sess->stats = enable;
+
+	return SRD_OK;
+}
+
+/**
+ * Give a session a Python interpreter of its own, or take it away.
+ *
+ * All sessions share the Python interpreter which srd_init() created
+ * by default, and with it the interpreter's global lock (GIL): sessions
+ * which decode in different application threads take turns running
+ * their decoders. An isolated session has a sub-interpreter of its own,
+ * which imports its own copies of the decoder modules. With Python 3.12
+ * and later the sub-interpreter also has a GIL of its own (PEP 684), and
+ * isolated sessions which are fed from different threads decode in
+ * parallel. Older Python versions share the GIL between all interpreters,
+ * isolated sessions don't see each other's module state but still take
+ * turns.
+ *
+ * The interpreter can only be changed while the session has no decoder
+ * instances. The Python objects which an isolated session's decoders pass
+ * to SRD_OUTPUT_PYTHON callbacks belong to the session's interpreter.
+ * The output callbacks of an isolated session must not call into other
+ * sessions, and the callbacks of other sessions must not call into an
+ * isolated session. Decoders which use Python extension modules that
+ * don't support sub-interpreters fail to load in isolated sessions.
+ *
+ * @param sess The session to configure. Must not be NULL.
+ * @param isolated TRUE to give the session an interpreter of its own,
+ *                 FALSE to use the shared interpreter (default).
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_isolated_set(struct srd_session *sess,
+		gboolean isolated)
+{
+	int ret;
+
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	if (!isolated == !sess->interp)
+		return SRD_OK;
+
+	if (sess->di_list) {
+		srd_err("Session %d has decoder instances, cannot change "
+			"its interpreter.", sess->session_id);
+		return SRD_ERR;
+	}
+
+	srd_dbg("%s isolation of session %d.",
+		isolated ? "Enabling" : "Disabling", sess->session_id);
+	if (!isolated) {
+		srd_interp_free(sess->interp);
+		sess->interp = NULL;
+		return SRD_OK;
+	}
+	if ((ret = srd_interp_new(&sess->interp)) != SRD_OK)
+		sess->interp = NULL;
+
+	return ret;
+}
+
+/**
+ * Buffer the input of a session, or stop buffering it.
+ *
+ * By default srd_session_send() and its variants return when the
+ * decoders have processed the chunk. A frontend which acquires samples
+ * live then can't take the next chunk from the device while a slow
+ * decoder falls behind. With buffering enabled, the sending functions
+ * copy the chunk into a ring buffer of the session and return right
+ * away, a thread of the session hands the buffered chunks to the
+ * decoders at their own pace.
+ *
+ * When the buffered sample data reaches 'high_water' bytes the session
+ * is congested, and the backpressure callback (see
+ * srd_session_backpressure_callback_set()) gets called. The congestion
+ * ends when the decoders have brought the buffered data down to half of
+ * the high-water mark. When the buffer is full, sending waits for room
+ * in the buffer. A chunk which is larger than the whole buffer gets
+ * decoded right away, after the buffered chunks. The sending functions
+ * must be called from one thread at a time.
+ *
+ * Output callbacks run in the session's thread, or the decoders' worker
+ * threads. Errors of the decoders get returned by the next call of a
+ * sending function or srd_session_send_eof(), after which the session
+ * drops all chunks until srd_session_terminate_reset(). The functions
+ * which depend on the order of the input (srd_session_send_eof(),
+ * srd_session_metadata_set()) first wait until the decoders have
+ * processed all buffered chunks, srd_session_terminate_reset() drops
+ * the chunks which the decoders didn't get to yet.
+ *
+ * Changing the buffer or stopping the buffering waits until the
+ * decoders have processed all buffered chunks.
+ *
+ * @param sess The session to configure. Must not be NULL.
+ * @param size The size of the buffer in bytes, 0 to stop buffering
+ *             (default). Every chunk takes up a few bytes more than its
+ *             sample data.
+ * @param high_water The number of buffered sample data bytes at which the
+ *                   session is congested. Must not exceed 'size'. 0 for
+ *                   never.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_stream_set(struct srd_session *sess,
+		uint64_t size, uint64_t high_water)
+{
+	int ret;
+
+	if (!sess || high_water > size)
+		return SRD_ERR_ARG;
+
+	ret = SRD_OK;
+	if (sess->stream) {
+		ret = srd_stream_flush(sess->stream, FALSE);
+		srd_stream_free(sess->stream);
+		sess->stream = NULL;
+	}
+	if (!size || ret != SRD_OK) {
+		srd_dbg("Disabled buffered input for session %d.",
+			sess->session_id);
+		return ret;
+	}
+
+	if (!(sess->stream = srd_stream_new(sess, size, high_water))) {
+		srd_err("Failed to allocate a buffer of %" PRIu64 " bytes "
+			"for session %d.", size, sess->session_id);
+		return SRD_ERR_MALLOC;
+	}
+	srd_dbg("Enabled buffered input for session %d: %" PRIu64 " bytes, "
+		"high-water mark %" PRIu64 ".", sess->session_id, size,
+		high_water);
+
+	return SRD_OK;
+}
+
+/**
+ * Set the callback which learns about congestion of a session's
+ * buffered input.
+ *
+ * The callback gets called with 'congested' set when the buffered sample
+ * data reaches the high-water mark of srd_session_stream_set(), from the
+ * thread which sends the chunk. Frontends may then lower the sample rate,
+ * drop channels, or stop the acquisition before sending has to wait for
+ * room in the buffer. The callback gets called with 'congested' cleared
+ * from the session's thread when the decoders have caught up again.
+ * 'queued_bytes' is the amount of buffered sample data at that moment.
+ *
+ * The callback must return quickly, the session's thread waits for it,
+ * and it must not call into the session. Set it before the first chunk
+ * gets sent. Only one callback can be registered, later calls
+ * replace it.
+ *
+ * @param sess The session. Must not be NULL.
+ * @param cb The function to call, NULL for none.
+ * @param cb_data Private data for the callback function. Can be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_backpressure_callback_set(struct srd_session *sess,
+		srd_session_backpressure_callback cb, void *cb_data)
+{
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	sess->backpressure_cb = cb;
+	sess->backpressure_cb_data = cb_data;
+
+	return SRD_OK;
+}
+
+/**
+ * Get the statistics of a session's buffered input.
+ *
+ * The statistics cover the time since buffering was enabled with
+ * srd_session_stream_set(), they can be taken while decoding runs.
+ *
+ * @param sess The session. Must not be NULL.
+ * @param stats The statistics, on return. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *         SRD_ERR if the session's input isn't buffered.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_stream_stats_get(struct srd_session *sess,
+		struct srd_session_stream_stats *stats)
+{
+	if (!sess || !stats)
+		return SRD_ERR_ARG;
+
+	if (!sess->stream) {
+		srd_err("Session %d has no buffered input.", sess->session_id);
+		return SRD_ERR;
+	}
+	srd_stream_stats_get(sess->stream, stats);
+
+	return SRD_OK;
+}
+
+/**
+ * Have a session take snapshots of its decoder stacks' state, which
+ * decoding can resume from.
+ *
+ * The stacks take a snapshot (checkpoint) before their first sample, and
+ * whenever their decoder calls self.checkpoint() after at least
+ * 'interval' samples since the previous one. Decoders call it where the
+ * protocol resynchronizes, e.g. while the bus is idle. Only the decoders
+ * at the bottom of the stacks take checkpoints, the snapshots hold the
+ * state of the decoders stacked on top of them as well.
+ *
+ * Checkpoints are kept until srd_session_terminate_reset(), a larger
+ * interval takes less memory but means a longer way to resume.
+ *
+ * @param sess The session. Must not be NULL.
+ * @param interval The minimum number of samples between checkpoints, 0 to
+ *                 take none (default).
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_checkpoint_interval_set(struct srd_session *sess,
+		uint64_t interval)
+{
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	sess->checkpoint_interval = interval;
+	srd_dbg("Session %d checkpoint interval: %" PRIu64 " samples.",
+		sess->session_id, interval);
+
+	return SRD_OK;
+}
+
+/**
+ * Set the callback which learns about the checkpoints of a session's
+ * decoder stacks.
+ *
+ * The callback gets called with the instance at the bottom of the stack
+ * and the checkpoint's sample number, from the thread which runs the
+ * stack's decoder. It is ordered with the stack's output, the output
+ * which a resume from the checkpoint repeats follows the callback. The
+ * callback must return quickly, and it must not call into the session.
+ * Only one callback can be registered, later calls replace it.
+ *
+ * @param sess The session. Must not be NULL.
+ * @param cb The function to call, NULL for none.
+ * @param cb_data Private data for the callback function. Can be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_checkpoint_callback_set(struct srd_session *sess,
+		srd_session_checkpoint_callback cb, void *cb_data)
+{
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	sess->checkpoint_cb = cb;
+	sess->checkpoint_cb_data = cb_data;
+
+	return SRD_OK;
+}
+
+/*
+ * Wait for the decoder stacks which a parallel send has handed the
+ * current chunk to, that is all stacks up to (excluding) 'end'. Keeps
+ * the first error that was seen.
+ */
+static int session_decode_wait(struct srd_session *sess, GSList *end,
+		int ret)
+{
+	GSList *d;
+	int wait_ret;
+
+	for (d = sess->di_list; d != end; d = d->next) {
+		wait_ret = srd_inst_decode_wait(d->data);
+		if (ret == SRD_OK)
+			ret = wait_ret;
+	}
+
+	return ret;
+}
+
 /**
  * Send a chunk of logic sample data to a running decoder session.
  *
@@ -229,6 +620,8 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
  *   srd_session_send(s, 3072, 4095, inbuf, 1024, 1);
  *
  * The chunk size ('inbuflen') can be arbitrary and can differ between calls.
+ * With buffered input (see srd_session_stream_set()) the chunk gets copied,
+ * and the call returns before the decoders processed it.
  *
  * Correct example (4096 samples total, 7 chunks @ various samples each):
  *   srd_session_send(s, 0,    1023, inbuf, 1024, 1);
@@ -262,20 +655,286 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 SRD_API int srd_session_send(struct srd_session *sess,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	if (sess->stream) {
+		if (!inbuf || !inbuflen || !unitsize)
+			return SRD_ERR_ARG;
+		return srd_stream_push(sess->stream, abs_start_samplenum,
+			abs_end_samplenum, NULL, 0, inbuf, inbuflen, unitsize);
+	}
+
+	return srd_session_decode(sess, abs_start_samplenum,
+		abs_end_samplenum, inbuf, inbuflen, unitsize);
+}
+
+/**
+ * Hand a chunk of logic sample data to the decoders of a session, and
+ * wait until they processed it.
+ *
+ * See srd_session_send() for the parameters.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_session_decode(struct srd_session *sess,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
 {
 	GSList *d;
 	int ret;
 
+	ret = SRD_OK;
+	for (d = sess->di_list; d; d = d->next) {
+		if ((ret = srd_inst_decode(d->data, abs_start_samplenum,
+				abs_end_samplenum, inbuf, inbuflen, unitsize,
+				!sess->parallel)) != SRD_OK)
+			break;
+	}
+
+	if (sess->parallel)
+		ret = session_decode_wait(sess, d, ret);
+
+	return ret;
+}
+
+/**
+ * Send a chunk of run-length encoded logic sample data to a running
+ * decoder session.
+ *
+ * This is an alternative to srd_session_send() for frontends which
+ * keep their sample data as a sequence of runs of identical samples.
+ * Run N consists of 'run_lengths'[N] samples, which all have the value
+ * found at 'run_values' + N * 'unitsize'. Decoders process runs without
+ * expanding them, long stretches of unchanged input are cheap.
+ *
+ * The same rules as for srd_session_send() apply: chunks must be sent
+ * in order, starting from sample zero, without gaps. Plain and run-length
+ * encoded chunks may be mixed within a session. The chunk ends at
+ * 'abs_start_samplenum' plus the sum of all run lengths.
+ *
+ * Correct example (4096 samples total, all low except for samples
+ * 1000 to 1999, sent in 2 chunks):
+ *   uint64_t len1[] = { 1000, 1000 }, len2[] = { 2096 };
+ *   uint8_t val1[] = { 0x00, 0x01 }, val2[] = { 0x00 };
+ *   srd_session_send_rle(s, 0,    len1, val1, 2, 1);
+ *   srd_session_send_rle(s, 2000, len2, val2, 1, 1);
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param abs_start_samplenum The absolute starting sample number for the
+ *              chunk's sample set, relative to the start of capture.
+ * @param run_lengths The number of samples in each run. Must not be NULL.
+ *              Each run length must be > 0.
+ * @param run_values The sample values of the runs, 'unitsize' bytes each.
+ *              Must not be NULL.
+ * @param num_runs The number of runs in the chunk. Must be > 0.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_rle(struct srd_session *sess,
+		uint64_t abs_start_samplenum, const uint64_t *run_lengths,
+		const uint8_t *run_values, uint64_t num_runs, uint64_t unitsize)
+{
 	if (!sess)
 		return SRD_ERR_ARG;
 
+	if (sess->stream) {
+		if (!run_lengths || !run_values || !num_runs || !unitsize)
+			return SRD_ERR_ARG;
+		/* The end of the chunk follows from the run lengths. */
+		return srd_stream_push(sess->stream, abs_start_samplenum, 0,
+			run_lengths, num_runs, run_values, num_runs * unitsize,
+			unitsize);
+	}
+
+	return srd_session_decode_rle(sess, abs_start_samplenum,
+		run_lengths, run_values, num_runs, unitsize);
+}
+
+/**
+ * Hand a chunk of run-length encoded logic sample data to the decoders
+ * of a session, and wait until they processed it.
+ *
+ * See srd_session_send_rle() for the parameters.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_session_decode_rle(struct srd_session *sess,
+		uint64_t abs_start_samplenum, const uint64_t *run_lengths,
+		const uint8_t *run_values, uint64_t num_runs, uint64_t unitsize)
+{
+	GSList *d;
+	int ret;
+
+	ret = SRD_OK;
 	for (d = sess->di_list; d; d = d->next) {
-		if ((ret = srd_inst_decode(d->data, abs_start_samplenum,
-				abs_end_samplenum, inbuf, inbuflen, unitsize)) != SRD_OK)
-			return ret;
+		if ((ret = srd_inst_decode_rle(d->data, abs_start_samplenum,
+				run_lengths, run_values, num_runs, unitsize,
+				!sess->parallel)) != SRD_OK)
+			break;
 	}
 
-	return SRD_OK;
+	if (sess->parallel)
+		ret = session_decode_wait(sess, d, ret);
+
+	return ret;
+}
+
+#ifdef HAVE_SYS_MMAN_H
+/* Map the file window by window and pass the mappings on as chunks. */
+static int session_send_mapped(struct srd_session *sess, int fd,
+		uint64_t offset, uint64_t abs_start_samplenum,
+		uint64_t num_samples, uint64_t unitsize)
+{
+	struct stat st;
+	uint64_t page_size, pos, end, map_start, map_len, count;
+	uint8_t *addr;
+	int ret;
+
+	end = offset + num_samples * unitsize;
+	if (fstat(fd, &st) < 0) {
+		srd_err("Cannot stat sample file: %s.", g_strerror(errno));
+		return SRD_ERR;
+	}
+	if ((uint64_t)st.st_size < end) {
+		srd_err("Sample file holds %" PRIu64 " bytes, %" PRIu64
+			" are needed.", (uint64_t)st.st_size, end);
+		return SRD_ERR_ARG;
+	}
+
+#ifdef HAVE_POSIX_FADVISE
+	posix_fadvise(fd, offset, end - offset, POSIX_FADV_SEQUENTIAL);
+#endif
+
+	page_size = sysconf(_SC_PAGESIZE);
+	ret = SRD_OK;
+	for (pos = offset; pos < end && ret == SRD_OK; pos += count * unitsize) {
+		/*
+		 * Mappings must start on a page boundary. Every window holds
+		 * whole samples only, at least one of them.
+		 */
+		map_start = pos - pos % page_size;
+		map_len = MIN(end - map_start, SRD_FILE_WINDOW_SIZE);
+		count = MAX((map_start + map_len - pos) / unitsize, 1);
+		map_len = pos - map_start + count * unitsize;
+
+		addr = mmap(NULL, map_len, PROT_READ, MAP_PRIVATE, fd, map_start);
+		if (addr == MAP_FAILED) {
+			srd_err("Cannot map sample file: %s.", g_strerror(errno));
+			return SRD_ERR;
+		}
+#ifdef HAVE_MADVISE
+		madvise(addr, map_len, MADV_SEQUENTIAL);
+		madvise(addr, map_len, MADV_WILLNEED);
+#endif
+		ret = srd_session_send(sess, abs_start_samplenum,
+				abs_start_samplenum + count,
+				addr + (pos - map_start), count * unitsize, unitsize);
+		munmap(addr, map_len);
+		abs_start_samplenum += count;
+	}
+
+	return ret;
+}
+#else
+/* Without mmap() support, read the file window by window. */
+static int session_send_mapped(struct srd_session *sess, int fd,
+		uint64_t offset, uint64_t abs_start_samplenum,
+		uint64_t num_samples, uint64_t unitsize)
+{
+	uint64_t count, len, done;
+	uint8_t *buf;
+	ssize_t n;
+	int ret;
+
+	if (lseek(fd, offset, SEEK_SET) == (off_t)-1) {
+		srd_err("Cannot seek in sample file: %s.", g_strerror(errno));
+		return SRD_ERR;
+	}
+
+	count = MAX(SRD_FILE_WINDOW_SIZE / unitsize, 1);
+	if (!(buf = g_try_malloc(MIN(count, num_samples) * unitsize)))
+		return SRD_ERR_MALLOC;
+
+	ret = SRD_OK;
+	while (num_samples > 0 && ret == SRD_OK) {
+		count = MIN(count, num_samples);
+		len = count * unitsize;
+		for (done = 0; done < len; done += n) {
+			n = read(fd, buf + done, len - done);
+			if (n <= 0) {
+				srd_err("Cannot read sample file: %s.",
+					n ? g_strerror(errno) : "Unexpected EOF");
+				g_free(buf);
+				return SRD_ERR;
+			}
+		}
+		ret = srd_session_send(sess, abs_start_samplenum,
+				abs_start_samplenum + count, buf, len, unitsize);
+		abs_start_samplenum += count;
+		num_samples -= count;
+	}
+	g_free(buf);
+
+	return ret;
+}
+#endif
+
+/**
+ * Send logic sample data from a file to a running decoder session.
+ *
+ * This is an alternative to srd_session_send() for frontends which
+ * decode (uncompressed) sample data which is stored in a file. The
+ * samples are not copied: the library maps the file into memory window
+ * by window and passes the mappings on to the decoders, hinting the
+ * operating system at the sequential access. The samples are laid out
+ * like the 'inbuf' of srd_session_send(), i.e. 'num_samples' times
+ * 'unitsize' bytes, starting at byte 'offset' of the file.
+ *
+ * The same rules as for srd_session_send() apply: chunks must be sent
+ * in order, starting from sample zero, without gaps. The function may
+ * be mixed with the other ways of sending sample data, and the caller
+ * keeps ownership of 'fd'. The file must not be truncated while the
+ * function runs. Platforms without mmap() support read the file instead.
+ *
+ * Correct example (the first 1000 samples of a file with 2 bytes per
+ * sample which starts with a 64 byte header, then 24 more samples from
+ * memory):
+ *   srd_session_send_file(s, fd, 64, 0, 1000, 2);
+ *   srd_session_send(s, 1000, 1023, inbuf, 48, 2);
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param fd A file descriptor of the sample file, opened for reading.
+ *              Must be >= 0.
+ * @param offset The position in the file of the first sample, in bytes.
+ * @param abs_start_samplenum The absolute starting sample number for the
+ *              file's sample set, relative to the start of capture.
+ * @param num_samples The number of samples to decode. Must be > 0.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_file(struct srd_session *sess, int fd,
+		uint64_t offset, uint64_t abs_start_samplenum,
+		uint64_t num_samples, uint64_t unitsize)
+{
+	if (!sess || fd < 0 || !num_samples || !unitsize)
+		return SRD_ERR_ARG;
+	if (num_samples > (G_MAXUINT64 - offset) / unitsize)
+		return SRD_ERR_ARG;
+
+	return session_send_mapped(sess, fd, offset, abs_start_samplenum,
+			num_samples, unitsize);
 }
 
 /**
@@ -289,18 +948,41 @@ SRD_API int srd_session_send(struct srd_session *sess,
  */
 SRD_API int srd_session_send_eof(struct srd_session *sess)
 {
+	struct srd_session_stream_stats stream_stats;
 	GSList *d;
 	int ret;
 
 	if (!sess)
 		return SRD_ERR_ARG;
 
+	if (sess->stream) {
+		if ((ret = srd_stream_flush(sess->stream, FALSE)) != SRD_OK)
+			return ret;
+	}
+
 	for (d = sess->di_list; d; d = d->next) {
 		ret = srd_inst_send_eof(d->data);
 		if (ret != SRD_OK)
 			return ret;
 	}
 
+	if (sess->stats) {
+		for (d = sess->di_list; d; d = d->next)
+			srd_inst_stats_log(d->data);
+	}
+	if (sess->stats && sess->stream) {
+		srd_stream_stats_get(sess->stream, &stream_stats);
+		srd_info("Session %d: %" PRIu64 " chunks (%" PRIu64 " bytes) "
+			"buffered, at most %" PRIu64 " bytes at once, %" PRIu64
+			" congestions, %" PRIu64 " stalls (%" PRIu64 " us), "
+			"latency %" PRIu64 " us average, %" PRIu64 " us max.",
+			sess->session_id, stream_stats.chunks,
+			stream_stats.bytes, stream_stats.max_queued_bytes,
+			stream_stats.congestions, stream_stats.stalls,
+			stream_stats.stall_time, stream_stats.latency_avg,
+			stream_stats.latency_max);
+	}
+
 	return SRD_OK;
 }
 
@@ -334,6 +1016,9 @@ SRD_API int srd_session_terminate_reset(struct srd_session *sess)
 	if (!sess)
 		return SRD_ERR_ARG;
 
+	if (sess->stream)
+		srd_stream_flush(sess->stream, TRUE);
+
 	for (d = sess->di_list; d; d = d->next) {
 		ret = srd_inst_terminate_reset(d->data);
 		if (ret != SRD_OK)
@@ -343,6 +1028,219 @@ SRD_API int srd_session_terminate_reset(struct srd_session *sess)
 	return SRD_OK;
 }
 
+/**
+ * Resume decoding from the checkpoints of a session's decoder stacks.
+ *
+ * Every stack returns to the state of its latest checkpoint at or before
+ * 'abs_samplenum', see srd_session_checkpoint_interval_set(). Later
+ * checkpoints get dropped, chunks in the session's input buffer get
+ * discarded. The decoders' decode() methods start anew with the
+ * attributes they had at the checkpoint, self.samplenum set to the
+ * checkpoint's sample number, and self.resumed set to True.
+ *
+ * The caller then sends the samples from 'resume_samplenum' on again,
+ * the earliest checkpoint of all stacks. Stacks skip the samples before
+ * their own checkpoint. Output which the stacks emitted after their
+ * checkpoints gets emitted again.
+ *
+ * This allows e.g. to re-decode part of a capture with other options
+ * for the stacked decoders, or to continue after the frontend dropped
+ * data, without decoding from the beginning.
+ *
+ * @param sess The session. Must not be NULL.
+ * @param abs_samplenum The sample number to resume at, at the latest.
+ * @param resume_samplenum The sample number to send samples from, on
+ *                         return. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *         SRD_ERR if the session takes no checkpoints, or a stack has
+ *         none at or before 'abs_samplenum'. The stacks keep their
+ *         state then.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_resume(struct srd_session *sess,
+		uint64_t abs_samplenum, uint64_t *resume_samplenum)
+{
+	GSList *d;
+	uint64_t samplenum, earliest;
+	int ret;
+
+	if (!sess || !resume_samplenum)
+		return SRD_ERR_ARG;
+
+	if (!sess->checkpoint_interval) {
+		srd_err("Session %d takes no checkpoints.", sess->session_id);
+		return SRD_ERR;
+	}
+
+	if (sess->stream)
+		srd_stream_flush(sess->stream, TRUE);
+
+	/* Check all stacks first, to not resume just some of them. */
+	earliest = abs_samplenum;
+	for (d = sess->di_list; d; d = d->next) {
+		ret = srd_inst_resume_point(d->data, abs_samplenum, &samplenum);
+		if (ret != SRD_OK)
+			return ret;
+		earliest = MIN(earliest, samplenum);
+	}
+
+	for (d = sess->di_list; d; d = d->next) {
+		ret = srd_inst_resume(d->data, abs_samplenum);
+		if (ret != SRD_OK)
+			return ret;
+	}
+	*resume_samplenum = earliest;
+
+	srd_dbg("Session %d resumes at sample %" PRIu64 ".",
+		sess->session_id, earliest);
+
+	return SRD_OK;
+}
+
+static void stack_recordings_free(struct srd_decoder_inst *di)
+{
+	GSList *l;
+
+	srd_recording_free(di);
+	for (l = di->next_di; l; l = l->next)
+		stack_recordings_free(l->data);
+}
+
+/**
+ * Have a session record the Python output of its decoder instances, to
+ * replay it later.
+ *
+ * While enabled, every SRD_OUTPUT_PYTHON packet which an instance puts
+ * gets stored in a compact (pickled) form, whether or not an instance is
+ * stacked on top of it. srd_session_replay() then feeds the recording to
+ * the instances above, which re-runs them without decoding the samples
+ * again. The packets take memory until srd_session_terminate_reset() or
+ * until recording gets disabled. Data which can't be pickled stops the
+ * instance's recording, its replays then fail.
+ *
+ * Enable recording before the first chunk gets sent, replays only hold
+ * the output since then.
+ *
+ * @param sess The session. Must not be NULL.
+ * @param enable TRUE to record, FALSE to stop recording (default) and drop
+ *               the recordings.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_record_set(struct srd_session *sess, gboolean enable)
+{
+	GSList *d;
+
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	/* The buffered chunks still get recorded, or not. */
+	if (sess->stream)
+		srd_stream_flush(sess->stream, FALSE);
+	sess->record = enable;
+	if (!enable) {
+		for (d = sess->di_list; d; d = d->next)
+			stack_recordings_free(d->data);
+	}
+	srd_dbg("Session %d %s the Python output.", sess->session_id,
+		enable ? "records" : "doesn't record");
+
+	return SRD_OK;
+}
+
+/* Find the instance which a stacked instance is stacked on top of. */
+static struct srd_decoder_inst *inst_below(GSList *di_list,
+		const struct srd_decoder_inst *di)
+{
+	struct srd_decoder_inst *below, *found;
+	GSList *l;
+
+	for (l = di_list; l; l = l->next) {
+		below = l->data;
+		if (g_slist_find(below->next_di, di))
+			return below;
+		if ((found = inst_below(below->next_di, di)))
+			return found;
+	}
+
+	return NULL;
+}
+
+/**
+ * Re-run a stacked decoder instance on the recorded Python output of the
+ * instance below it.
+ *
+ * The instance and the instances stacked on top of it get reset and
+ * started again, they get the session's samplerate, then the packets
+ * which srd_session_record_set() recorded, and get flushed. Only these
+ * instances run, the samples aren't decoded again.
+ * This is useful after srd_inst_option_set() changed the options of the
+ * instance, or after srd_inst_stack() stacked it on top of an instance
+ * which already decoded the samples, e.g. after srd_session_send_eof().
+ *
+ * The decoders below must be idle, i.e. decoding must not go on while
+ * this runs. The output of the instance gets recorded anew. Replaying
+ * stops at the first packet which the instance's decode() fails on.
+ *
+ * @param sess The session. Must not be NULL.
+ * @param di The stacked instance to re-run. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_replay(struct srd_session *sess,
+		struct srd_decoder_inst *di)
+{
+	struct srd_decoder_inst *below;
+	GVariant *data;
+	int ret;
+
+	if (!sess || !di || di->sess != sess)
+		return SRD_ERR_ARG;
+
+	if (!(below = inst_below(sess->di_list, di))) {
+		srd_err("Instance %s is not stacked on another instance.",
+			di->inst_id);
+		return SRD_ERR_ARG;
+	}
+
+	if (!sess->record) {
+		srd_err("Session %d doesn't record.", sess->session_id);
+		return SRD_ERR;
+	}
+
+	if (sess->stream)
+		srd_stream_flush(sess->stream, FALSE);
+
+	srd_dbg("Replaying the output of instance %s to instance %s.",
+		below->inst_id, di->inst_id);
+
+	/* Instances stacked after the start don't know their stack yet. */
+	di->stack_bottom = below->stack_bottom;
+	if ((ret = srd_inst_terminate_reset(di)) != SRD_OK)
+		return ret;
+	if ((ret = srd_inst_start(di)) != SRD_OK)
+		return ret;
+	if (sess->samplerate) {
+		data = g_variant_ref_sink(g_variant_new_uint64(sess->samplerate));
+		ret = srd_inst_send_meta(di, SRD_CONF_SAMPLERATE, data);
+		g_variant_unref(data);
+		if (ret != SRD_OK)
+			return ret;
+	}
+
+	if ((ret = srd_recording_replay(below, di)) == SRD_OK)
+		ret = srd_inst_flush(di);
+	srd_inst_ann_batch_flush(di);
+
+	return ret;
+}
+
 /**
  * Destroy a decoding session.
  *
@@ -362,11 +1260,21 @@ SRD_API int srd_session_destroy(struct srd_session *sess)
 		return SRD_ERR_ARG;
 
 	session_id = sess->session_id;
+	if (sess->stream) {
+		srd_stream_flush(sess->stream, TRUE);
+		srd_stream_free(sess->stream);
+	}
+	if (sess->gen_pool)
+		g_thread_pool_free(sess->gen_pool, FALSE, TRUE);
 	if (sess->di_list)
 		srd_inst_free_all(sess);
 	if (sess->callbacks)
 		g_slist_free_full(sess->callbacks, g_free);
+	if (sess->interp)
+		srd_interp_free(sess->interp);
+	g_mutex_lock(&sessions_mutex);
 	sessions = g_slist_remove(sessions, sess);
+	g_mutex_unlock(&sessions_mutex);
 	g_free(sess);
 
 	srd_dbg("Destroyed session %d.", session_id);
@@ -410,6 +1318,49 @@ SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 	return SRD_OK;
 }
 
+/**
+ * Register a callback function which receives annotations in batches.
+ *
+ * This is an alternative to an SRD_OUTPUT_ANN callback, for frontends
+ * which receive many annotations. Every decoder stack collects its
+ * annotations, and passes them on when a chunk of sample data has been
+ * handled, when the end of the data was communicated, or when
+ * enough annotations are pending to fill a batch.
+ *
+ * A batch holds the annotations of the instances of one stack in the
+ * order in which the decoders submitted them. Every record refers to
+ * one of the batch's distinct lists of annotation texts; annotations
+ * with the same texts share a list. The batch, including the texts, is
+ * only valid during the callback. When parallel decoding is enabled,
+ * the callback can run in several threads at the same time.
+ *
+ * A callback for SRD_OUTPUT_ANN still receives every single annotation
+ * if both kinds of callbacks are registered.
+ *
+ * @param sess The output session in which to register the callback.
+ *             Must not be NULL.
+ * @param cb The function to call. Must not be NULL. Only one batch
+ *           callback can be registered, it replaces a previous one.
+ * @param cb_data Private data for the callback function. Can be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_pd_annotation_batch_callback_add(struct srd_session *sess,
+		srd_pd_annotation_batch_callback cb, void *cb_data)
+{
+	if (!sess || !cb)
+		return SRD_ERR_ARG;
+
+	srd_dbg("Registering new callback for annotation batches.");
+
+	sess->ann_batch_cb = cb;
+	sess->ann_batch_cb_data = cb_data;
+
+	return SRD_OK;
+}
+
 /** @private */
 SRD_PRIV struct srd_pd_callback *srd_pd_output_callback_find(
 		struct srd_session *sess, int output_type)
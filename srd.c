@@ -31,6 +31,7 @@ SRD_PRIV GSList *searchpaths = NULL;
 /* session.c */
 extern SRD_PRIV GSList *sessions;
 extern SRD_PRIV int max_session_id;
+extern SRD_PRIV PyObject *mod_sigrokdecode;
 
 /** @endcond */
 
@@ -160,7 +161,7 @@ static int print_searchpaths(void)
 	srd_dbg("%s", s->str);
 	g_string_free(s, TRUE);
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	py_paths = PySys_GetObject("path");
 	if (!py_paths)
@@ -178,13 +179,13 @@ static int print_searchpaths(void)
 	srd_dbg("%s", s->str);
 	g_string_free(s, TRUE);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
 err:
 	srd_err("Unable to query Python system search paths.");
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -196,7 +197,9 @@ err:
  * a "sigrokdecode" Python module.
  *
  * Then, it searches for sigrok protocol decoders in the "decoders"
- * subdirectory of the the libsigrokdecode installation directory.
+ * subdirectory of the the libsigrokdecode installation directory. The
+ * "decoders.zip" archive next to it, if that exists, comes first: the
+ * directory then contributes the decoders which the archive lacks.
  * All decoders that are found are loaded into memory and added to an
  * internal list of decoders, which can be queried via srd_decoder_list().
  *
@@ -238,6 +241,16 @@ SRD_API int srd_init(const char *path)
 	/* Initialize the Python interpreter. */
 	Py_InitializeEx(0);
 
+	/*
+	 * Import our own module. The decoders of the main interpreter get
+	 * this one, isolated sessions import one of their own.
+	 */
+	if (!(mod_sigrokdecode = py_import_by_name("sigrokdecode"))) {
+		srd_exception_catch("Failed to import the sigrokdecode module");
+		Py_Finalize();
+		return SRD_ERR_PYTHON;
+	}
+
 	/* Locations relative to the XDG system data directories. */
 	sys_datadirs = g_get_system_data_dirs();
 	for (i = g_strv_length((char **)sys_datadirs); i > 0; i--) {
@@ -248,8 +261,22 @@ SRD_API int srd_init(const char *path)
 		}
 	}
 #ifdef DECODERS_DIR
-	/* Hardcoded decoders install location, if defined. */
-	if ((ret = srd_decoder_searchpath_add(DECODERS_DIR)) != SRD_OK) {
+	/*
+	 * Hardcoded decoders install location, if defined. The archive of
+	 * precompiled decoders, if it was installed, goes in front of it.
+	 * Decoders which were added to the directory later are found there,
+	 * edits of the ones in the archive have no effect, so say so.
+	 */
+	ret = srd_decoder_searchpath_add(DECODERS_DIR);
+#ifdef DECODERS_ARCHIVE
+	if (ret == SRD_OK &&
+			g_file_test(DECODERS_ARCHIVE, G_FILE_TEST_IS_REGULAR)) {
+		srd_info("Using the installed decoders in %s, before the "
+			"ones in %s.", DECODERS_ARCHIVE, DECODERS_DIR);
+		ret = srd_decoder_searchpath_add(DECODERS_ARCHIVE);
+	}
+#endif
+	if (ret != SRD_OK) {
 		Py_Finalize();
 		return ret;
 	}
@@ -357,8 +384,10 @@ SRD_API int srd_exit(void)
 	 * Acquire the GIL, otherwise Py_Finalize() might have issues.
 	 * Ignore the return value, we don't need it here.
 	 */
-	if (Py_IsInitialized())
+	if (Py_IsInitialized()) {
 		(void)PyGILState_Ensure();
+		Py_CLEAR(mod_sigrokdecode);
+	}
 
 	/* Py_Finalize() returns void, any finalization errors are ignored. */
 	Py_Finalize();
@@ -394,7 +423,7 @@ SRD_PRIV int srd_decoder_searchpath_add(const char *path)
 
 	srd_dbg("Adding '%s' to module path.", path);
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	py_cur_path = PySys_GetObject("path");
 	if (!py_cur_path)
@@ -412,14 +441,14 @@ SRD_PRIV int srd_decoder_searchpath_add(const char *path)
 	}
 	Py_DECREF(py_item);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	searchpaths = g_slist_prepend(searchpaths, g_strdup(path));
 
 	return SRD_OK;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -0,0 +1,414 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <config.h>
+#include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
+#include "libsigrokdecode.h"
+#include <string.h>
+#include <glib.h>
+
+/**
+ * @file
+ *
+ * Streaming input of sessions.
+ *
+ * A streaming session copies the chunks which the frontend sends into a
+ * ring buffer, and a thread of the session hands them to the decoders.
+ * Every chunk occupies a record in the buffer: a struct stream_chunk,
+ * followed by the chunk's data. Records are contiguous, a record which
+ * doesn't fit at the end of the buffer starts at its beginning again.
+ *
+ * The frontend thread is the only writer, the session's thread the only
+ * reader of the buffer.
+ *
+ * @private
+ */
+
+/** @cond PRIVATE */
+
+struct srd_stream {
+	struct srd_session *sess;
+
+	uint8_t *buf;
+	uint64_t size;
+	/* The write and read positions. */
+	uint64_t head;
+	uint64_t tail;
+	/* The end of the records, before the writer wrapped around. */
+	uint64_t end;
+	/* Records in the buffer, including the one being decoded. */
+	uint64_t num_chunks;
+	/* Sample data bytes in the buffer. */
+	uint64_t queued_bytes;
+
+	uint64_t high_water;
+	gboolean congested;
+
+	/* Drop chunks instead of decoding them. */
+	gboolean discard;
+	gboolean quit;
+	/* The first error of the decoders. */
+	int error;
+
+	struct srd_session_stream_stats stats;
+	/* The sum of the latencies, and the number of decoded chunks. */
+	uint64_t latency_total;
+	uint64_t latency_count;
+
+	GThread *thread;
+	GMutex mutex;
+	/* Signalled whenever a record was added or removed. */
+	GCond cond;
+};
+
+/* A chunk of sample data in the ring buffer. */
+struct stream_chunk {
+	uint64_t abs_start_samplenum;
+	uint64_t abs_end_samplenum;
+	/* Data bytes after the header, run lengths first for RLE chunks. */
+	uint64_t len;
+	/* The number of runs of RLE chunks, 0 for plain chunks. */
+	uint64_t num_runs;
+	uint64_t unitsize;
+	int64_t queued_at;
+};
+
+/** @endcond */
+
+/* The size of the record of a chunk, records start 8 byte aligned. */
+static uint64_t chunk_record_size(uint64_t len)
+{
+	return (sizeof(struct stream_chunk) + len + 7) & ~(uint64_t)7;
+}
+
+/*
+ * Find room for a record of 'size' bytes and advance the write position
+ * past it. Returns the position of the record, or -1 if the buffer is
+ * too full. Expects the mutex.
+ */
+static int64_t ring_reserve(struct srd_stream *stream, uint64_t size)
+{
+	uint64_t pos;
+
+	if (!stream->num_chunks) {
+		/* Empty, start over for the most contiguous room. */
+		stream->head = stream->tail = 0;
+		stream->end = stream->size;
+	}
+
+	pos = stream->head;
+	if (stream->head > stream->tail || !stream->num_chunks) {
+		if (stream->size - stream->head < size) {
+			/* Wrap around, the record must fit before the tail. */
+			if (stream->tail < size)
+				return -1;
+			stream->end = stream->head;
+			pos = 0;
+		}
+	} else if (stream->tail - stream->head < size) {
+		return -1;
+	}
+	stream->head = pos + size;
+
+	return pos;
+}
+
+/*
+ * Enter or leave the congested state, and tell the frontend. Expects the
+ * mutex, which keeps the callbacks in order.
+ */
+static void congestion_set(struct srd_stream *stream, gboolean congested)
+{
+	struct srd_session *sess;
+
+	stream->congested = congested;
+	if (congested)
+		stream->stats.congestions++;
+
+	sess = stream->sess;
+	if (sess->backpressure_cb)
+		sess->backpressure_cb(sess, congested, stream->queued_bytes,
+			sess->backpressure_cb_data);
+}
+
+static int chunk_decode(struct srd_stream *stream,
+		const struct stream_chunk *chunk)
+{
+	const uint8_t *data;
+
+	data = (const uint8_t *)(chunk + 1);
+	if (!chunk->num_runs)
+		return srd_session_decode(stream->sess,
+			chunk->abs_start_samplenum, chunk->abs_end_samplenum,
+			data, chunk->len, chunk->unitsize);
+
+	return srd_session_decode_rle(stream->sess, chunk->abs_start_samplenum,
+		(const uint64_t *)data, data + chunk->num_runs * sizeof(uint64_t),
+		chunk->num_runs, chunk->unitsize);
+}
+
+/* The session's thread, which hands the buffered chunks to the decoders. */
+static gpointer stream_thread(gpointer data)
+{
+	struct srd_stream *stream;
+	struct stream_chunk *chunk;
+	gboolean decode;
+	uint64_t latency;
+	int ret;
+
+	stream = data;
+	g_mutex_lock(&stream->mutex);
+	while (TRUE) {
+		while (!stream->num_chunks && !stream->quit)
+			g_cond_wait(&stream->cond, &stream->mutex);
+		if (!stream->num_chunks)
+			break;
+
+		if (stream->tail == stream->end) {
+			stream->tail = 0;
+			stream->end = stream->size;
+		}
+		chunk = (struct stream_chunk *)(stream->buf + stream->tail);
+		decode = !stream->discard && stream->error == SRD_OK;
+
+		/* The writer doesn't touch the record until it was removed. */
+		g_mutex_unlock(&stream->mutex);
+		ret = decode ? chunk_decode(stream, chunk) : SRD_OK;
+		latency = g_get_monotonic_time() - chunk->queued_at;
+		g_mutex_lock(&stream->mutex);
+
+		if (ret != SRD_OK && stream->error == SRD_OK) {
+			srd_err("Decoding a buffered chunk of session %d failed.",
+				stream->sess->session_id);
+			stream->error = ret;
+		}
+		if (decode) {
+			stream->latency_total += latency;
+			stream->latency_count++;
+			stream->stats.latency_max = MAX(stream->stats.latency_max,
+				latency);
+		}
+		stream->queued_bytes -= chunk->len;
+
+		/* The congestion ends at half of the high-water mark. */
+		if (stream->congested &&
+				stream->queued_bytes <= stream->high_water / 2)
+			congestion_set(stream, FALSE);
+
+		stream->tail += chunk_record_size(chunk->len);
+		stream->num_chunks--;
+		g_cond_broadcast(&stream->cond);
+	}
+	g_mutex_unlock(&stream->mutex);
+
+	return NULL;
+}
+
+/**
+ * Create the ring buffer and the thread of a streaming session.
+ *
+ * @param sess The session. Must not be NULL.
+ * @param size The size of the buffer in bytes. Must be > 0.
+ * @param high_water The number of buffered sample data bytes at which the
+ *                   session is congested, 0 for never.
+ *
+ * @return The stream, or NULL if there is not enough memory.
+ *
+ * @private
+ */
+SRD_PRIV struct srd_stream *srd_stream_new(struct srd_session *sess,
+		uint64_t size, uint64_t high_water)
+{
+	struct srd_stream *stream;
+
+	stream = g_malloc0(sizeof(struct srd_stream));
+	if (!(stream->buf = g_try_malloc(size))) {
+		g_free(stream);
+		return NULL;
+	}
+	stream->sess = sess;
+	stream->size = stream->end = size;
+	stream->high_water = high_water;
+	stream->error = SRD_OK;
+	g_mutex_init(&stream->mutex);
+	g_cond_init(&stream->cond);
+	stream->thread = g_thread_new("srd-stream", stream_thread, stream);
+
+	return stream;
+}
+
+/**
+ * Decode the remaining chunks of a streaming session, and end the
+ * session's thread.
+ *
+ * @param stream The stream. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_stream_free(struct srd_stream *stream)
+{
+	g_mutex_lock(&stream->mutex);
+	stream->quit = TRUE;
+	g_cond_broadcast(&stream->cond);
+	g_mutex_unlock(&stream->mutex);
+	g_thread_join(stream->thread);
+
+	g_cond_clear(&stream->cond);
+	g_mutex_clear(&stream->mutex);
+	g_free(stream->buf);
+	g_free(stream);
+}
+
+/**
+ * Wait until all chunks of a streaming session were decoded.
+ *
+ * @param stream The stream. Must not be NULL.
+ * @param discard TRUE to drop the chunks which the decoders didn't get
+ *                to yet. This also clears the decoders' error.
+ *
+ * @return SRD_OK upon success, or the first error of the decoders.
+ *
+ * @private
+ */
+SRD_PRIV int srd_stream_flush(struct srd_stream *stream, gboolean discard)
+{
+	int ret;
+
+	g_mutex_lock(&stream->mutex);
+	stream->discard = discard;
+	while (stream->num_chunks)
+		g_cond_wait(&stream->cond, &stream->mutex);
+	stream->discard = FALSE;
+	if (discard)
+		stream->error = SRD_OK;
+	ret = stream->error;
+	g_mutex_unlock(&stream->mutex);
+
+	return ret;
+}
+
+/**
+ * Copy a chunk into the ring buffer of a streaming session.
+ *
+ * Waits for room if the buffer is full. A chunk which is larger than the
+ * whole buffer gets decoded right away, after the buffered chunks.
+ *
+ * @param stream The stream. Must not be NULL.
+ * @param abs_start_samplenum The absolute number of the chunk's first sample.
+ * @param abs_end_samplenum The absolute number after the chunk's last sample,
+ *                          unused for RLE chunks.
+ * @param run_lengths The run lengths of an RLE chunk, NULL for plain chunks.
+ * @param num_runs The number of runs of an RLE chunk.
+ * @param data The samples, or the run values of an RLE chunk.
+ * @param len The size of 'data' in bytes.
+ * @param unitsize The number of bytes per sample.
+ *
+ * @return SRD_OK upon success, or the first error of the decoders.
+ *
+ * @private
+ */
+SRD_PRIV int srd_stream_push(struct srd_stream *stream,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint64_t *run_lengths, uint64_t num_runs,
+		const uint8_t *data, uint64_t len, uint64_t unitsize)
+{
+	struct stream_chunk *chunk;
+	uint64_t runs_len, size;
+	int64_t pos, stall_start;
+	int ret;
+
+	runs_len = num_runs * sizeof(uint64_t);
+	size = chunk_record_size(runs_len + len);
+	if (size > stream->size) {
+		if ((ret = srd_stream_flush(stream, FALSE)) != SRD_OK)
+			return ret;
+		srd_dbg("Chunk of %" PRIu64 " bytes exceeds the buffer of "
+			"session %d, decoding it directly.", len,
+			stream->sess->session_id);
+		if (run_lengths)
+			return srd_session_decode_rle(stream->sess,
+				abs_start_samplenum, run_lengths, data,
+				num_runs, unitsize);
+		return srd_session_decode(stream->sess, abs_start_samplenum,
+			abs_end_samplenum, data, len, unitsize);
+	}
+
+	g_mutex_lock(&stream->mutex);
+	pos = stall_start = 0;
+	while (stream->error == SRD_OK &&
+			(pos = ring_reserve(stream, size)) < 0) {
+		if (!stall_start)
+			stall_start = g_get_monotonic_time();
+		g_cond_wait(&stream->cond, &stream->mutex);
+	}
+	if (stall_start) {
+		stream->stats.stalls++;
+		stream->stats.stall_time += g_get_monotonic_time() - stall_start;
+	}
+	if ((ret = stream->error) != SRD_OK) {
+		g_mutex_unlock(&stream->mutex);
+		return ret;
+	}
+	g_mutex_unlock(&stream->mutex);
+
+	/* The reader doesn't see the record until it was counted. */
+	chunk = (struct stream_chunk *)(stream->buf + pos);
+	chunk->abs_start_samplenum = abs_start_samplenum;
+	chunk->abs_end_samplenum = abs_end_samplenum;
+	chunk->len = runs_len + len;
+	chunk->num_runs = num_runs;
+	chunk->unitsize = unitsize;
+	if (run_lengths)
+		memcpy(chunk + 1, run_lengths, runs_len);
+	memcpy((uint8_t *)(chunk + 1) + runs_len, data, len);
+	chunk->queued_at = g_get_monotonic_time();
+
+	g_mutex_lock(&stream->mutex);
+	stream->num_chunks++;
+	stream->queued_bytes += chunk->len;
+	stream->stats.chunks++;
+	stream->stats.bytes += chunk->len;
+	stream->stats.max_queued_bytes = MAX(stream->stats.max_queued_bytes,
+		stream->queued_bytes);
+	if (!stream->congested && stream->high_water &&
+			stream->queued_bytes >= stream->high_water)
+		congestion_set(stream, TRUE);
+	g_cond_broadcast(&stream->cond);
+	g_mutex_unlock(&stream->mutex);
+
+	return SRD_OK;
+}
+
+/**
+ * Get the statistics of a streaming session.
+ *
+ * @param stream The stream. Must not be NULL.
+ * @param stats The statistics, on return. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_stream_stats_get(struct srd_stream *stream,
+		struct srd_session_stream_stats *stats)
+{
+	g_mutex_lock(&stream->mutex);
+	*stats = stream->stats;
+	stats->queued_bytes = stream->queued_bytes;
+	if (stream->latency_count)
+		stats->latency_avg = stream->latency_total /
+			stream->latency_count;
+	g_mutex_unlock(&stream->mutex);
+}
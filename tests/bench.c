@@ -0,0 +1,514 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, see <http://www.gnu.org/licenses/>.
+ */
+
+/*
+ * Micro-benchmarks for the library's hot paths.
+ *
+ * These are not run by "make check". Build them with "make bench", then
+ * run "tests/bench [-n samples] [-c chunksize] [-s idle sessions]
+ * [case ...]". Every case prints one line of key=value pairs, which is
+ * easy to compare between builds and to post-process by scripts. The
+ * idle sessions hold the same decoder stack as the measured session,
+ * but never receive any samples.
+ *
+ * The benchmarks use small decoders which get written to a temporary
+ * directory, so that the measurements are not dominated by the work
+ * of "real" decoders.
+ */
+
+#include <config.h>
+#include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <glib.h>
+#include <glib/gstdio.h>
+#include <inttypes.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+struct bench_decoder {
+	const char *id;
+	const char *code;
+};
+
+static const struct bench_decoder bench_decoders[] = {
+	{ "bench_wait",
+	  "import sigrokdecode as srd\n"
+	  "\n"
+	  "class Decoder(srd.Decoder):\n"
+	  "    api_version = 3\n"
+	  "    id = 'bench_wait'\n"
+	  "    name = 'Bench wait'\n"
+	  "    longname = 'Benchmark for wait()'\n"
+	  "    desc = 'Call wait() in a tight loop.'\n"
+	  "    license = 'gplv2+'\n"
+	  "    inputs = ['logic']\n"
+	  "    outputs = []\n"
+	  "    tags = ['Debug/trace']\n"
+	  "    channels = (\n"
+	  "        {'id': 'data', 'name': 'Data', 'desc': 'Data line'},\n"
+	  "    )\n"
+	  "    options = (\n"
+	  "        {'id': 'cond', 'desc': 'Condition', 'default': 'edge',\n"
+	  "            'values': ('edge', 'rise_fall', 'skip', 'none', 'bit',\n"
+	  "                'compiled_edge', 'compiled_rise_fall', 'compiled_bit',\n"
+	  "                'sample_at', 'shift_in')},\n"
+	  "        {'id': 'batch', 'desc': 'Matches per wait_many() call',\n"
+	  "            'default': 0},\n"
+	  "    )\n"
+	  "\n"
+	  "    def reset(self):\n"
+	  "        pass\n"
+	  "\n"
+	  "    def start(self):\n"
+	  "        pass\n"
+	  "\n"
+	  "    def decode(self):\n"
+	  "        name = self.options['cond']\n"
+	  "        compiled = name.startswith('compiled_')\n"
+	  "        if compiled:\n"
+	  "            name = name[len('compiled_'):]\n"
+	  "        if name == 'sample_at':\n"
+	  "            # Every sample, like 'skip', 1024 at a time.\n"
+	  "            while True:\n"
+	  "                s = self.samplenum + 1\n"
+	  "                self.sample_at(range(s, s + 1024))\n"
+	  "        if name == 'shift_in':\n"
+	  "            # A bit per rising edge, 1024 bits at a time.\n"
+	  "            while True:\n"
+	  "                self.shift_in(0, 'r', (0,), 1024)\n"
+	  "        if name == 'bit':\n"
+	  "            # A bit time or an edge, like can waits for every bit.\n"
+	  "            if compiled:\n"
+	  "                cond = self.compile_conditions([{'skip': 0}, {0: 'f'}])\n"
+	  "                while True:\n"
+	  "                    self.wait(cond, skip=1)\n"
+	  "            while True:\n"
+	  "                self.wait([{'skip': 1}, {0: 'f'}])\n"
+	  "        cond = {\n"
+	  "            'edge': {0: 'e'},\n"
+	  "            'rise_fall': [{0: 'r'}, {0: 'f'}],\n"
+	  "            'skip': {'skip': 1},\n"
+	  "            'none': None,\n"
+	  "        }[name]\n"
+	  "        if compiled:\n"
+	  "            cond = self.compile_conditions(cond)\n"
+	  "        batch = self.options['batch']\n"
+	  "        if batch > 0:\n"
+	  "            while True:\n"
+	  "                self.wait_many(cond, batch)\n"
+	  "        while True:\n"
+	  "            self.wait(cond)\n"
+	},
+	{ "bench_put",
+	  "import sigrokdecode as srd\n"
+	  "\n"
+	  "class Decoder(srd.Decoder):\n"
+	  "    api_version = 3\n"
+	  "    id = 'bench_put'\n"
+	  "    name = 'Bench put'\n"
+	  "    longname = 'Benchmark for put()'\n"
+	  "    desc = 'Pass one Python object or annotation per edge.'\n"
+	  "    license = 'gplv2+'\n"
+	  "    inputs = ['logic']\n"
+	  "    outputs = ['bench']\n"
+	  "    tags = ['Debug/trace']\n"
+	  "    channels = (\n"
+	  "        {'id': 'data', 'name': 'Data', 'desc': 'Data line'},\n"
+	  "    )\n"
+	  "    options = (\n"
+	  "        {'id': 'output', 'desc': 'Output', 'default': 'python',\n"
+	  "            'values': ('python', 'ann', 'text', 'lazy')},\n"
+	  "    )\n"
+	  "    annotations = (\n"
+	  "        ('edge', 'Edge'),\n"
+	  "    )\n"
+	  "\n"
+	  "    def reset(self):\n"
+	  "        pass\n"
+	  "\n"
+	  "    def start(self):\n"
+	  "        self.out_python = self.register(srd.OUTPUT_PYTHON)\n"
+	  "        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	  "\n"
+	  "    def decode(self):\n"
+	  "        output = self.options['output']\n"
+	  "        if output == 'ann':\n"
+	  "            out, data = self.out_ann, [0, ['Edge', 'E']]\n"
+	  "        else:\n"
+	  "            out, data = self.out_python, None\n"
+	  "        while True:\n"
+	  "            samplenums, _, _ = self.wait_many({0: 'e'}, 1024)\n"
+	  "            if output == 'text':\n"
+	  "                for s in samplenums:\n"
+	  "                    self.put(s, s + 1, self.out_ann, [0, ['Edge at %d' % s,\n"
+	  "                        'Edge %d' % s, '%d' % s]])\n"
+	  "            elif output == 'lazy':\n"
+	  "                for s in samplenums:\n"
+	  "                    self.put(s, s + 1, self.out_ann, [0, ['Edge at {}',\n"
+	  "                        'Edge {}', '{}'], (s,)])\n"
+	  "            else:\n"
+	  "                for s in samplenums:\n"
+	  "                    self.put(s, s + 1, out, data)\n"
+	},
+	{ "bench_relay",
+	  "import sigrokdecode as srd\n"
+	  "\n"
+	  "class Decoder(srd.Decoder):\n"
+	  "    api_version = 3\n"
+	  "    id = 'bench_relay'\n"
+	  "    name = 'Bench relay'\n"
+	  "    longname = 'Benchmark for stacked put()'\n"
+	  "    desc = 'Pass Python objects on, annotate them on request.'\n"
+	  "    license = 'gplv2+'\n"
+	  "    inputs = ['bench']\n"
+	  "    outputs = ['bench']\n"
+	  "    tags = ['Debug/trace']\n"
+	  "    annotations = (\n"
+	  "        ('data', 'Data'),\n"
+	  "    )\n"
+	  "    options = (\n"
+	  "        {'id': 'annotate', 'desc': 'Annotate', 'default': 'no',\n"
+	  "            'values': ('yes', 'no')},\n"
+	  "    )\n"
+	  "\n"
+	  "    def reset(self):\n"
+	  "        pass\n"
+	  "\n"
+	  "    def start(self):\n"
+	  "        self.out_python = self.register(srd.OUTPUT_PYTHON)\n"
+	  "        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	  "        self.annotate = self.options['annotate'] == 'yes'\n"
+	  "\n"
+	  "    def decode(self, ss, es, data):\n"
+	  "        if self.annotate:\n"
+	  "            self.put(ss, es, self.out_ann, [0, ['x']])\n"
+	  "        else:\n"
+	  "            self.put(ss, es, self.out_python, data)\n"
+	},
+};
+
+struct bench_case {
+	const char *name;
+	const char *decoder;
+	const char *option_id;
+	const char *option_value;
+	/* Optional integer option. */
+	const char *int_option_id;
+	int64_t int_option_value;
+	/* Number of samples per event (wait() call, match, ...). */
+	uint64_t stride;
+	/*
+	 * Number of bench_relay instances stacked on top of the decoder,
+	 * the topmost one annotates what it receives.
+	 */
+	unsigned int relays;
+	/* How the frontend receives annotations. */
+	enum {
+		ANN_CB,
+		/* In batches instead of one by one. */
+		ANN_BATCH,
+		/* Not at all, like a headless consumer of Python output. */
+		ANN_NONE,
+	} ann;
+};
+
+static const struct bench_case bench_cases[] = {
+	{ "wait_edge", "bench_wait", "cond", "edge", NULL, 0, 1, 0, ANN_CB },
+	{ "wait_rise_fall", "bench_wait", "cond", "rise_fall", NULL, 0, 1, 0, ANN_CB },
+	{ "wait_skip", "bench_wait", "cond", "skip", NULL, 0, 1, 0, ANN_CB },
+	{ "wait_none", "bench_wait", "cond", "none", NULL, 0, 1, 0, ANN_CB },
+	{ "wait_bit", "bench_wait", "cond", "bit", NULL, 0, 1, 0, ANN_CB },
+	{ "sample_at", "bench_wait", "cond", "sample_at", NULL, 0, 1, 0, ANN_CB },
+	{ "shift_in", "bench_wait", "cond", "shift_in", NULL, 0, 2, 0, ANN_CB },
+	{ "wait_compiled_edge", "bench_wait", "cond", "compiled_edge", NULL, 0, 1, 0, ANN_CB },
+	{ "wait_compiled_rise_fall", "bench_wait", "cond", "compiled_rise_fall", NULL, 0, 1, 0, ANN_CB },
+	{ "wait_compiled_bit", "bench_wait", "cond", "compiled_bit", NULL, 0, 1, 0, ANN_CB },
+	{ "wait_many_edge", "bench_wait", "cond", "edge", "batch", 1024, 1, 0, ANN_CB },
+	{ "wait_many_rise_fall", "bench_wait", "cond", "rise_fall", "batch", 1024, 1, 0, ANN_CB },
+	{ "put_depth1", "bench_put", NULL, NULL, NULL, 0, 1, 1, ANN_CB },
+	{ "put_depth4", "bench_put", NULL, NULL, NULL, 0, 1, 4, ANN_CB },
+	{ "put_depth8", "bench_put", NULL, NULL, NULL, 0, 1, 8, ANN_CB },
+	{ "put_depth1_python", "bench_put", NULL, NULL, NULL, 0, 1, 1, ANN_NONE },
+	{ "put_depth4_python", "bench_put", NULL, NULL, NULL, 0, 1, 4, ANN_NONE },
+	{ "put_depth8_python", "bench_put", NULL, NULL, NULL, 0, 1, 8, ANN_NONE },
+	{ "put_ann", "bench_put", "output", "ann", NULL, 0, 1, 0, ANN_CB },
+	{ "put_ann_batch", "bench_put", "output", "ann", NULL, 0, 1, 0, ANN_BATCH },
+	{ "put_ann_text", "bench_put", "output", "text", NULL, 0, 1, 0, ANN_CB },
+	{ "put_ann_lazy", "bench_put", "output", "lazy", NULL, 0, 1, 0, ANN_CB },
+	{ "put_ann_text_none", "bench_put", "output", "text", NULL, 0, 1, 0, ANN_NONE },
+	{ "put_ann_lazy_none", "bench_put", "output", "lazy", NULL, 0, 1, 0, ANN_NONE },
+};
+
+static char *bench_dir;
+
+/* Write the benchmark decoders to a temporary directory. */
+static int write_decoders(void)
+{
+	unsigned int i;
+	char *dir, *file;
+	GError *error;
+
+	error = NULL;
+	if (!(bench_dir = g_dir_make_tmp("srd-bench-XXXXXX", &error))) {
+		fprintf(stderr, "Cannot create directory: %s\n", error->message);
+		g_error_free(error);
+		return SRD_ERR;
+	}
+
+	for (i = 0; i < G_N_ELEMENTS(bench_decoders); i++) {
+		dir = g_build_filename(bench_dir, bench_decoders[i].id, NULL);
+		g_mkdir_with_parents(dir, 0755);
+		file = g_build_filename(dir, "__init__.py", NULL);
+		g_file_set_contents(file, "from .pd import Decoder\n", -1, NULL);
+		g_free(file);
+		file = g_build_filename(dir, "pd.py", NULL);
+		g_file_set_contents(file, bench_decoders[i].code, -1, NULL);
+		g_free(file);
+		g_free(dir);
+	}
+
+	return SRD_OK;
+}
+
+static void remove_dir(const char *path)
+{
+	GDir *dir;
+	const char *name;
+	char *child;
+
+	if ((dir = g_dir_open(path, 0, NULL))) {
+		while ((name = g_dir_read_name(dir))) {
+			child = g_build_filename(path, name, NULL);
+			if (g_file_test(child, G_FILE_TEST_IS_DIR))
+				remove_dir(child);
+			else
+				g_remove(child);
+			g_free(child);
+		}
+		g_dir_close(dir);
+	}
+	g_rmdir(path);
+}
+
+/* A square wave on bit 0 which toggles with every sample. */
+static uint8_t *make_toggle_samples(uint64_t num_samples)
+{
+	uint8_t *samples;
+	uint64_t i;
+
+	samples = g_malloc(num_samples);
+	for (i = 0; i < num_samples; i++)
+		samples[i] = i & 1;
+
+	return samples;
+}
+
+static void count_ann_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	(void)pdata;
+
+	(*(uint64_t *)cb_data)++;
+}
+
+static void count_ann_batch_cb(
+		const struct srd_proto_data_annotation_batch *batch, void *cb_data)
+{
+	*(uint64_t *)cb_data += batch->num_records;
+}
+
+static struct srd_decoder_inst *new_inst(struct srd_session *sess,
+		const char *decoder, const char *option_id,
+		const char *option_value, const char *int_option_id,
+		int64_t int_option_value)
+{
+	struct srd_decoder_inst *di;
+	GHashTable *options;
+
+	if (srd_decoder_load(decoder) != SRD_OK) {
+		fprintf(stderr, "Cannot load decoder %s.\n", decoder);
+		return NULL;
+	}
+
+	options = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)g_variant_unref);
+	if (option_id)
+		g_hash_table_insert(options, g_strdup(option_id),
+			g_variant_ref_sink(g_variant_new_string(option_value)));
+	if (int_option_id)
+		g_hash_table_insert(options, g_strdup(int_option_id),
+			g_variant_ref_sink(g_variant_new_int64(int_option_value)));
+	di = srd_inst_new(sess, decoder, options);
+	g_hash_table_destroy(options);
+
+	return di;
+}
+
+/* Create the decoder stack of a benchmark case in a new session. */
+static struct srd_session *new_session(const struct bench_case *bc)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *di, *di_top;
+	unsigned int i;
+
+	srd_session_new(&sess);
+	if (!(di = new_inst(sess, bc->decoder, bc->option_id,
+			bc->option_value, bc->int_option_id,
+			bc->int_option_value))) {
+		srd_session_destroy(sess);
+		return NULL;
+	}
+	for (i = 0; i < bc->relays; i++) {
+		di_top = new_inst(sess, "bench_relay", "annotate",
+				(i == bc->relays - 1) ? "yes" : "no", NULL, 0);
+		if (!di_top || srd_inst_stack(sess, di, di_top) != SRD_OK) {
+			srd_session_destroy(sess);
+			return NULL;
+		}
+		di = di_top;
+	}
+
+	return sess;
+}
+
+static int run_case(const struct bench_case *bc, const uint8_t *samples,
+		uint64_t num_samples, uint64_t chunksize, unsigned int num_idle)
+{
+	struct srd_session *sess, **idle;
+	uint64_t pos, len, num_ann;
+	gint64 start, elapsed;
+	unsigned int i;
+	int ret;
+
+	/*
+	 * Idle sessions with the same stack, created before the one which
+	 * gets measured. They must not affect the results.
+	 */
+	idle = g_new0(struct srd_session *, num_idle);
+	for (i = 0; i < num_idle; i++)
+		idle[i] = new_session(bc);
+
+	if (!(sess = new_session(bc))) {
+		ret = SRD_ERR;
+		goto out;
+	}
+	num_ann = 0;
+	if (bc->ann == ANN_BATCH)
+		srd_pd_annotation_batch_callback_add(sess, count_ann_batch_cb, &num_ann);
+	else if (bc->ann == ANN_CB)
+		srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_ann_cb, &num_ann);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(1000000));
+	srd_session_start(sess);
+
+	ret = SRD_OK;
+	start = g_get_monotonic_time();
+	for (pos = 0; pos < num_samples; pos += len) {
+		len = MIN(chunksize, num_samples - pos);
+		if ((ret = srd_session_send(sess, pos, pos + len,
+				samples + pos, len, 1)) != SRD_OK)
+			break;
+	}
+	srd_session_send_eof(sess);
+	elapsed = g_get_monotonic_time() - start;
+	srd_session_destroy(sess);
+
+	if (ret != SRD_OK)
+		goto out;
+
+	printf("case=%s samples=%" PRIu64 " chunksize=%" PRIu64
+		" idle_sessions=%u events=%" PRIu64 " ns_per_event=%.1f"
+		" msamples_per_s=%.2f annotations=%" PRIu64 "\n",
+		bc->name, num_samples, chunksize, num_idle,
+		num_samples / bc->stride,
+		elapsed * 1000.0 / (num_samples / bc->stride),
+		num_samples / (double)MAX(elapsed, 1), num_ann);
+
+out:
+	for (i = 0; i < num_idle; i++) {
+		if (idle[i])
+			srd_session_destroy(idle[i]);
+	}
+	g_free(idle);
+
+	return ret;
+}
+
+static gboolean case_selected(const char *name, int argc, char **argv)
+{
+	int i;
+
+	if (argc == 0)
+		return TRUE;
+	for (i = 0; i < argc; i++) {
+		if (g_str_has_prefix(name, argv[i]))
+			return TRUE;
+	}
+
+	return FALSE;
+}
+
+int main(int argc, char **argv)
+{
+	uint64_t num_samples, chunksize;
+	uint8_t *samples;
+	unsigned int i, num_idle;
+	int opt, ret;
+
+	num_samples = 1000000;
+	chunksize = 4096;
+	num_idle = 0;
+	for (opt = 1; opt < argc && argv[opt][0] == '-'; opt++) {
+		if (!strcmp(argv[opt], "-n") && opt + 1 < argc) {
+			num_samples = g_ascii_strtoull(argv[++opt], NULL, 0);
+		} else if (!strcmp(argv[opt], "-c") && opt + 1 < argc) {
+			chunksize = g_ascii_strtoull(argv[++opt], NULL, 0);
+		} else if (!strcmp(argv[opt], "-s") && opt + 1 < argc) {
+			num_idle = g_ascii_strtoull(argv[++opt], NULL, 0);
+		} else {
+			fprintf(stderr, "Usage: %s [-n samples] [-c chunksize] "
+				"[-s idle sessions] [case ...]\n", argv[0]);
+			return EXIT_FAILURE;
+		}
+	}
+	if (!num_samples || !chunksize)
+		return EXIT_FAILURE;
+
+	if (write_decoders() != SRD_OK)
+		return EXIT_FAILURE;
+
+	srd_log_loglevel_set(SRD_LOG_ERR);
+	if (srd_init(bench_dir) != SRD_OK) {
+		remove_dir(bench_dir);
+		return EXIT_FAILURE;
+	}
+
+	samples = make_toggle_samples(num_samples);
+	ret = SRD_OK;
+	for (i = 0; i < G_N_ELEMENTS(bench_cases) && ret == SRD_OK; i++) {
+		if (!case_selected(bench_cases[i].name, argc - opt, argv + opt))
+			continue;
+		ret = run_case(&bench_cases[i], samples, num_samples,
+				chunksize, num_idle);
+	}
+	g_free(samples);
+
+	srd_exit();
+	remove_dir(bench_dir);
+	g_free(bench_dir);
+
+	return (ret == SRD_OK) ? EXIT_SUCCESS : EXIT_FAILURE;
+}
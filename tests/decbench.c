@@ -0,0 +1,756 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, see <http://www.gnu.org/licenses/>.
+ */
+
+/*
+ * Throughput benchmarks of the protocol decoders.
+ *
+ * These are not run by "make check". Build them with "make bench", then
+ * run "tests/decbench [-n samples] [-c chunksize] [case ...]".
+ *
+ * Every case generates a deterministic synthetic capture of a protocol,
+ * and sends it through srd_session_send() to a stack of the real
+ * decoders in chunks of the given size. Every case prints one line of
+ * key=value pairs with the throughput of the whole stack, followed by
+ * one line per decoder instance with the time spent in it (taken from
+ * the instance's performance counters, which are enabled for this).
+ *
+ * The peak RSS is the one of the whole process so far, run a single
+ * case per process to get the peak of that case.
+ */
+
+#include <config.h>
+#include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <glib.h>
+#include <inttypes.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#ifdef HAVE_SYS_RESOURCE_H
+#include <sys/resource.h>
+#endif
+
+#define MAX_STACK 4
+
+/* Append n samples of the same value. */
+static void hold(GByteArray *buf, uint8_t value, uint64_t n)
+{
+	guint len;
+
+	len = buf->len;
+	g_byte_array_set_size(buf, len + n);
+	memset(buf->data + len, value, n);
+}
+
+/*
+ * UART, 8N1, on rx (bit 0) with 'spb' samples per bit. The tx line
+ * (bit 1) idles.
+ */
+static void gen_uart(GByteArray *buf, GRand *rand, uint64_t num_samples,
+		uint64_t spb)
+{
+	unsigned int i, byte;
+
+	hold(buf, 0x03, 10 * spb);
+	while (buf->len < num_samples) {
+		byte = g_rand_int_range(rand, 0, 256);
+		hold(buf, 0x02, spb);
+		for (i = 0; i < 8; i++)
+			hold(buf, 0x02 | ((byte >> i) & 1), spb);
+		hold(buf, 0x03, spb * g_rand_int_range(rand, 1, 4));
+	}
+}
+
+/*
+ * SPI mode 0 transactions with 'spb' samples per clock phase: clk
+ * (bit 0), miso (bit 1), mosi (bit 2), cs# (bit 3). The host reads
+ * (command 0x03) from a random address, the device returns random
+ * data.
+ */
+static void gen_spi(GByteArray *buf, GRand *rand, uint64_t num_samples,
+		uint64_t spb)
+{
+	unsigned int i, n, len, mosi, miso;
+	uint8_t level;
+
+	while (buf->len < num_samples) {
+		hold(buf, 0x08, 8 * spb);
+		len = g_rand_int_range(rand, 8, 68);
+		for (n = 0; n < len; n++) {
+			mosi = (n == 0) ? 0x03 :
+				(n < 4) ? g_rand_int_range(rand, 0, 256) : 0;
+			miso = g_rand_int_range(rand, 0, 256);
+			for (i = 0; i < 8; i++) {
+				level = ((miso >> (7 - i)) & 1) << 1 |
+					((mosi >> (7 - i)) & 1) << 2;
+				hold(buf, level, spb);
+				hold(buf, level | 0x01, spb);
+			}
+		}
+		hold(buf, 0x00, spb);
+	}
+}
+
+/* An I2C byte and the (N)ACK bit, 'q' samples per quarter bit. */
+static void i2c_byte(GByteArray *buf, unsigned int byte, unsigned int ack,
+		uint64_t q)
+{
+	unsigned int i, sda;
+
+	for (i = 0; i < 9; i++) {
+		sda = (i < 8) ? (byte >> (7 - i)) & 1 : ack;
+		hold(buf, sda << 1, q);
+		hold(buf, sda << 1 | 0x01, 2 * q);
+		hold(buf, sda << 1, q);
+	}
+}
+
+/*
+ * I2C transactions with an EEPROM at 0x50 and 'q' samples per quarter
+ * bit: scl (bit 0), sda (bit 1). Page writes and random reads take
+ * turns.
+ */
+static void gen_i2c(GByteArray *buf, GRand *rand, uint64_t num_samples,
+		uint64_t q)
+{
+	unsigned int i, len;
+	gboolean read;
+
+	read = FALSE;
+	while (buf->len < num_samples) {
+		hold(buf, 0x03, 8 * q);
+		/* START */
+		hold(buf, 0x01, q);
+		hold(buf, 0x00, q);
+		i2c_byte(buf, 0xa0, 0, q);
+		/* Writes stay within a page of 8 bytes. */
+		i2c_byte(buf, read ? g_rand_int_range(rand, 0, 128) :
+			g_rand_int_range(rand, 0, 16) * 8, 0, q);
+		len = g_rand_int_range(rand, 1, 9);
+		if (read) {
+			/* Repeated START */
+			hold(buf, 0x02, q);
+			hold(buf, 0x03, q);
+			hold(buf, 0x01, q);
+			hold(buf, 0x00, q);
+			i2c_byte(buf, 0xa1, 0, q);
+		}
+		for (i = 0; i < len; i++)
+			i2c_byte(buf, g_rand_int_range(rand, 0, 256),
+				read && i == len - 1, q);
+		/* STOP */
+		hold(buf, 0x00, q);
+		hold(buf, 0x01, q);
+		hold(buf, 0x03, q);
+		read = !read;
+	}
+}
+
+static unsigned int can_dlc2len(unsigned int dlc)
+{
+	static const unsigned int len[] = {
+		0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64,
+	};
+
+	return len[dlc & 0x0f];
+}
+
+/* Feed bits into a (non-reflected) CRC register. */
+static uint32_t crc_bits(uint32_t reg, unsigned int width, uint32_t poly,
+		const uint8_t *bits, unsigned int n)
+{
+	unsigned int i;
+
+	for (i = 0; i < n; i++) {
+		if (bits[i] ^ ((reg >> (width - 1)) & 1))
+			reg = ((reg << 1) ^ poly) & ((1u << width) - 1);
+		else
+			reg = (reg << 1) & ((1u << width) - 1);
+	}
+
+	return reg;
+}
+
+static unsigned int put_bits(uint8_t *bits, unsigned int n,
+		uint32_t value, unsigned int width)
+{
+	while (width--)
+		bits[n++] = (value >> width) & 1;
+
+	return n;
+}
+
+/*
+ * CAN data frames with standard identifiers, 'spb' samples per bit on
+ * can_rx (bit 0). CAN FD frames (without a bitrate switch) if 'fd' is
+ * set.
+ */
+static void gen_can_frames(GByteArray *buf, GRand *rand,
+		uint64_t num_samples, uint64_t spb, gboolean fd)
+{
+	static const uint8_t gray[] = { 0, 1, 3, 2, 6, 7, 5, 4 };
+	uint8_t bits[640], raw[1024];
+	unsigned int i, n, nraw, run, nstuff, dlc, width;
+	uint32_t crc;
+
+	hold(buf, 0x01, 20 * spb);
+	while (buf->len < num_samples) {
+		dlc = g_rand_int_range(rand, 0, fd ? 16 : 9);
+		n = put_bits(bits, 0, 0, 1);
+		n = put_bits(bits, n, g_rand_int_range(rand, 0, 1 << 11), 11);
+		/* RTR/RRS, IDE, r0/FDF (and res, BRS, ESI for CAN FD). */
+		n = fd ? put_bits(bits, n, 0x0a, 6) : put_bits(bits, n, 0, 3);
+		n = put_bits(bits, n, dlc, 4);
+		for (i = 0; i < can_dlc2len(dlc); i++)
+			n = put_bits(bits, n, g_rand_int_range(rand, 0, 256), 8);
+		if (!fd)
+			n = put_bits(bits, n,
+				crc_bits(0, 15, 0x4599, bits, n), 15);
+
+		/* Dynamic stuff bits after 5 identical bits. */
+		nraw = run = nstuff = 0;
+		for (i = 0; i < n; i++) {
+			raw[nraw] = bits[i];
+			run = (nraw && raw[nraw - 1] == bits[i]) ? run + 1 : 1;
+			nraw++;
+			if (run == 5) {
+				raw[nraw++] = !bits[i];
+				run = 1;
+				nstuff++;
+			}
+		}
+
+		if (fd) {
+			/*
+			 * Stuff count and CRC, with a fixed stuff bit before
+			 * every fourth bit. The CRC covers the stuffed bits.
+			 */
+			width = (can_dlc2len(dlc) <= 16) ? 17 : 21;
+			n = put_bits(bits, 0, gray[nstuff % 8], 3);
+			bits[n] = bits[0] ^ bits[1] ^ bits[2];
+			n++;
+			crc = (width == 17) ?
+				crc_bits(1 << 16, 17, 0x1685b, raw, nraw) :
+				crc_bits(1 << 20, 21, 0x102899, raw, nraw);
+			crc = (width == 17) ?
+				crc_bits(crc, 17, 0x1685b, bits, n) :
+				crc_bits(crc, 21, 0x102899, bits, n);
+			n = put_bits(bits, n, crc, width);
+			for (i = 0; i < n; i++) {
+				if (i % 4 == 0) {
+					raw[nraw] = !raw[nraw - 1];
+					nraw++;
+				}
+				raw[nraw++] = bits[i];
+			}
+		}
+
+		for (i = 0; i < nraw; i++)
+			hold(buf, raw[i], spb);
+		/* CRC delimiter, ACK, ACK delimiter, EOF, IFS. */
+		hold(buf, 0x01, spb);
+		hold(buf, 0x00, spb);
+		hold(buf, 0x01, (1 + 7 + 3) * spb);
+		hold(buf, 0x01, g_rand_int_range(rand, 0, 4 * spb));
+	}
+}
+
+static void gen_can(GByteArray *buf, GRand *rand, uint64_t num_samples,
+		uint64_t spb)
+{
+	gen_can_frames(buf, rand, num_samples, spb, FALSE);
+}
+
+static void gen_can_fd(GByteArray *buf, GRand *rand, uint64_t num_samples,
+		uint64_t spb)
+{
+	gen_can_frames(buf, rand, num_samples, spb, TRUE);
+}
+
+enum {
+	USB_OUT = 0x1, USB_ACK = 0x2, USB_DATA0 = 0x3, USB_SOF = 0x5,
+	USB_IN = 0x9, USB_NAK = 0xa, USB_DATA1 = 0xb, USB_SETUP = 0xd,
+};
+
+#define USB_J 0x01
+#define USB_K 0x02
+
+/*
+ * A full-speed USB packet with 'spb' samples per bit: SYNC, PID, 'len'
+ * bytes of 'data', the CRC (for tokens and data packets) and EOP.
+ */
+static void usb_packet(GByteArray *buf, GRand *rand, unsigned int pid,
+		const uint8_t *data, unsigned int len, uint64_t spb)
+{
+	uint8_t bytes[2 + 64 + 2], level;
+	unsigned int i, n, bit, ones;
+	uint32_t crc;
+
+	bytes[0] = 0x80;
+	bytes[1] = pid | ((~pid & 0x0f) << 4);
+	memcpy(bytes + 2, data, len);
+	n = 2 + len;
+	if (pid == USB_OUT || pid == USB_IN || pid == USB_SETUP ||
+			pid == USB_SOF) {
+		/* CRC5 over the 11 bits of address and endpoint (or frame). */
+		crc = 0x1f;
+		for (i = 0; i < 11; i++) {
+			bit = (data[i / 8] >> (i % 8)) & 1;
+			crc = ((crc ^ bit) & 1) ? (crc >> 1) ^ 0x14 : crc >> 1;
+		}
+		bytes[3] |= (crc ^ 0x1f) << 3;
+	} else if (pid == USB_DATA0 || pid == USB_DATA1) {
+		crc = 0xffff;
+		for (i = 0; i < len * 8; i++) {
+			bit = (data[i / 8] >> (i % 8)) & 1;
+			crc = ((crc ^ bit) & 1) ? (crc >> 1) ^ 0xa001 : crc >> 1;
+		}
+		crc ^= 0xffff;
+		bytes[n++] = crc & 0xff;
+		bytes[n++] = crc >> 8;
+	}
+
+	/* NRZI, with a stuff bit after six ones. */
+	level = USB_J;
+	ones = 0;
+	for (i = 0; i < n * 8; i++) {
+		bit = (bytes[i / 8] >> (i % 8)) & 1;
+		if (!bit)
+			level ^= USB_J | USB_K;
+		hold(buf, level, spb);
+		ones = bit ? ones + 1 : 0;
+		if (ones == 6) {
+			level ^= USB_J | USB_K;
+			hold(buf, level, spb);
+			ones = 0;
+		}
+	}
+	hold(buf, 0x00, 2 * spb);
+	hold(buf, USB_J, spb * g_rand_int_range(rand, 9, 21));
+}
+
+static void usb_token(GByteArray *buf, GRand *rand, unsigned int pid,
+		unsigned int addr, unsigned int ep, uint64_t spb)
+{
+	uint8_t data[2];
+
+	data[0] = addr | (ep << 7);
+	data[1] = ep >> 1;
+	usb_packet(buf, rand, pid, data, 2, spb);
+}
+
+static void usb_data(GByteArray *buf, GRand *rand, unsigned int pid,
+		unsigned int len, uint64_t spb)
+{
+	uint8_t data[64];
+	unsigned int i;
+
+	for (i = 0; i < len; i++)
+		data[i] = g_rand_int_range(rand, 0, 256);
+	usb_packet(buf, rand, pid, data, len, spb);
+}
+
+/*
+ * Full-speed USB traffic with 'spb' samples per bit: D+ (bit 0), D-
+ * (bit 1). Start of frame packets, control transfers and bulk IN and
+ * OUT transactions.
+ */
+static void gen_usb(GByteArray *buf, GRand *rand, uint64_t num_samples,
+		uint64_t spb)
+{
+	uint8_t setup[8], frame[2];
+	unsigned int i, addr, ep, r;
+
+	hold(buf, USB_J, 20 * spb);
+	while (buf->len < num_samples) {
+		addr = g_rand_int_range(rand, 0, 128);
+		ep = g_rand_int_range(rand, 1, 16);
+		r = g_rand_int_range(rand, 0, 10);
+		if (r == 0) {
+			i = g_rand_int_range(rand, 0, 2048);
+			frame[0] = i & 0xff;
+			frame[1] = i >> 8;
+			usb_packet(buf, rand, USB_SOF, frame, 2, spb);
+		} else if (r < 3) {
+			setup[0] = g_rand_boolean(rand) ? 0x80 : 0x00;
+			for (i = 1; i < 6; i++)
+				setup[i] = g_rand_int_range(rand, 0, 256);
+			setup[6] = g_rand_int_range(rand, 0, 65);
+			setup[7] = 0;
+			usb_token(buf, rand, USB_SETUP, addr, 0, spb);
+			usb_packet(buf, rand, USB_DATA0, setup, 8, spb);
+			usb_packet(buf, rand, USB_ACK, NULL, 0, spb);
+			if (setup[0] & 0x80) {
+				usb_token(buf, rand, USB_IN, addr, 0, spb);
+				usb_data(buf, rand, USB_DATA1, setup[6], spb);
+				usb_packet(buf, rand, USB_ACK, NULL, 0, spb);
+				usb_token(buf, rand, USB_OUT, addr, 0, spb);
+			} else {
+				if (setup[6]) {
+					usb_token(buf, rand, USB_OUT, addr, 0, spb);
+					usb_data(buf, rand, USB_DATA1, setup[6], spb);
+					usb_packet(buf, rand, USB_ACK, NULL, 0, spb);
+				}
+				usb_token(buf, rand, USB_IN, addr, 0, spb);
+			}
+			usb_data(buf, rand, USB_DATA1, 0, spb);
+			usb_packet(buf, rand, USB_ACK, NULL, 0, spb);
+		} else if (r < 6) {
+			usb_token(buf, rand, USB_IN, addr, ep, spb);
+			if (r == 3) {
+				usb_packet(buf, rand, USB_NAK, NULL, 0, spb);
+				continue;
+			}
+			usb_data(buf, rand, g_rand_boolean(rand) ?
+				USB_DATA0 : USB_DATA1,
+				g_rand_int_range(rand, 0, 65), spb);
+			usb_packet(buf, rand, USB_ACK, NULL, 0, spb);
+		} else {
+			usb_token(buf, rand, USB_OUT, addr, ep, spb);
+			usb_data(buf, rand, USB_DATA0,
+				g_rand_int_range(rand, 0, 65), spb);
+			usb_packet(buf, rand, USB_ACK, NULL, 0, spb);
+		}
+	}
+}
+
+/* A 1-Wire time slot with 'us' samples per µs, on owr (bit 0). */
+static void onewire_bit(GByteArray *buf, unsigned int bit, uint64_t us)
+{
+	hold(buf, 0x00, (bit ? 6 : 60) * us);
+	hold(buf, 0x01, (bit ? 64 : 10) * us);
+}
+
+static void onewire_byte(GByteArray *buf, unsigned int byte, uint64_t us)
+{
+	unsigned int i;
+
+	for (i = 0; i < 8; i++)
+		onewire_bit(buf, (byte >> i) & 1, us);
+}
+
+/*
+ * 1-Wire transactions with 'us' samples per µs on owr (bit 0): reset
+ * and presence pulse, a ROM command (read ROM or match ROM with the ROM
+ * code of a DS18B20), then a few function command or data bytes.
+ */
+static void gen_onewire(GByteArray *buf, GRand *rand, uint64_t num_samples,
+		uint64_t us)
+{
+	uint8_t rom[8], crc;
+	unsigned int i, j, len;
+
+	rom[0] = 0x28;
+	for (i = 1; i < 7; i++)
+		rom[i] = g_rand_int_range(rand, 0, 256);
+	crc = 0;
+	for (i = 0; i < 7; i++) {
+		crc ^= rom[i];
+		for (j = 0; j < 8; j++)
+			crc = (crc & 1) ? (crc >> 1) ^ 0x8c : crc >> 1;
+	}
+	rom[7] = crc;
+
+	hold(buf, 0x01, 100 * us);
+	while (buf->len < num_samples) {
+		hold(buf, 0x00, 500 * us);
+		hold(buf, 0x01, 30 * us);
+		hold(buf, 0x00, 120 * us);
+		hold(buf, 0x01, 400 * us);
+		onewire_byte(buf, g_rand_boolean(rand) ? 0x33 : 0x55, us);
+		for (i = 0; i < 8; i++)
+			onewire_byte(buf, rom[i], us);
+		len = g_rand_int_range(rand, 1, 10);
+		for (i = 0; i < len; i++)
+			onewire_byte(buf, g_rand_int_range(rand, 0, 256), us);
+		hold(buf, 0x01, 100 * us);
+	}
+}
+
+/*
+ * I2S, 16 bits per channel, with 'spb' samples per clock phase: sck
+ * (bit 0), ws (bit 1), sd (bit 2). Word select changes one clock before
+ * the MSB of the next word.
+ */
+static void gen_i2s(GByteArray *buf, GRand *rand, uint64_t num_samples,
+		uint64_t spb)
+{
+	unsigned int i, word, next, ws;
+	uint8_t level;
+
+	ws = 0;
+	word = g_rand_int_range(rand, 0, 1 << 16);
+	while (buf->len < num_samples) {
+		next = g_rand_int_range(rand, 0, 1 << 16);
+		for (i = 0; i < 16; i++) {
+			level = ((word >> (15 - i)) & 1) << 2 |
+				((i == 15) ? !ws : ws) << 1;
+			hold(buf, level, spb);
+			hold(buf, level | 0x01, spb);
+		}
+		word = next;
+		ws = !ws;
+	}
+}
+
+struct decbench_case {
+	const char *name;
+	void (*generate)(GByteArray *buf, GRand *rand, uint64_t num_samples,
+		uint64_t param);
+	/* Generator parameter, usually the number of samples per bit. */
+	uint64_t param;
+	uint64_t samplerate;
+	/*
+	 * The decoder stack, bottom first, as "id[:option=value...]".
+	 * Option values get the type of the option's default value.
+	 */
+	const char *stack[MAX_STACK];
+};
+
+static const struct decbench_case decbench_cases[] = {
+	{ "uart_os4", gen_uart, 4, 1000000,
+		{ "uart:baudrate=250000" } },
+	{ "uart_os16", gen_uart, 16, 1000000,
+		{ "uart:baudrate=62500" } },
+	{ "uart_os100", gen_uart, 100, 1000000,
+		{ "uart:baudrate=10000" } },
+	{ "spi", gen_spi, 4, 8000000,
+		{ "spi" } },
+	{ "spi_spiflash", gen_spi, 4, 8000000,
+		{ "spi", "spiflash" } },
+	{ "i2c", gen_i2c, 5, 2000000,
+		{ "i2c" } },
+	{ "i2c_eeprom24xx", gen_i2c, 5, 2000000,
+		{ "i2c", "eeprom24xx" } },
+	{ "can", gen_can, 8, 1000000,
+		{ "can:nominal_bitrate=125000" } },
+	{ "can_fd", gen_can_fd, 8, 1000000,
+		{ "can:nominal_bitrate=125000:fast_bitrate=125000" } },
+	{ "usb_fs", gen_usb, 4, 48000000,
+		{ "usb_signalling:signalling=full-speed", "usb_packet:signalling=full-speed",
+		  "usb_request" } },
+	{ "onewire", gen_onewire, 1, 1000000,
+		{ "onewire_link", "onewire_network" } },
+	{ "i2s", gen_i2s, 4, 8000000,
+		{ "i2s" } },
+};
+
+/* Get an option value with the type of the option's default value. */
+static GVariant *option_value(const struct srd_decoder *dec,
+		const char *id, const char *value)
+{
+	const struct srd_decoder_option *o;
+	GSList *l;
+
+	for (l = dec->options; l; l = l->next) {
+		o = l->data;
+		if (strcmp(o->id, id))
+			continue;
+		if (g_variant_is_of_type(o->def, G_VARIANT_TYPE_INT64))
+			return g_variant_new_int64(g_ascii_strtoll(value, NULL, 0));
+		if (g_variant_is_of_type(o->def, G_VARIANT_TYPE_DOUBLE))
+			return g_variant_new_double(g_ascii_strtod(value, NULL));
+		return g_variant_new_string(value);
+	}
+	fprintf(stderr, "Decoder %s has no option %s.\n", dec->id, id);
+
+	return NULL;
+}
+
+static struct srd_decoder_inst *new_inst(struct srd_session *sess,
+		const char *spec)
+{
+	struct srd_decoder *dec;
+	struct srd_decoder_inst *di;
+	GHashTable *options;
+	GVariant *value;
+	char **tokens, **kv;
+	unsigned int i;
+
+	tokens = g_strsplit(spec, ":", 0);
+	if (srd_decoder_load(tokens[0]) != SRD_OK ||
+			!(dec = srd_decoder_get_by_id(tokens[0]))) {
+		fprintf(stderr, "Cannot load decoder %s.\n", tokens[0]);
+		g_strfreev(tokens);
+		return NULL;
+	}
+
+	di = NULL;
+	options = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)g_variant_unref);
+	for (i = 1; tokens[i]; i++) {
+		kv = g_strsplit(tokens[i], "=", 2);
+		value = kv[1] ? option_value(dec, kv[0], kv[1]) : NULL;
+		if (value)
+			g_hash_table_insert(options, g_strdup(kv[0]),
+				g_variant_ref_sink(value));
+		g_strfreev(kv);
+		if (!value)
+			goto out;
+	}
+	di = srd_inst_new(sess, tokens[0], options);
+
+out:
+	g_hash_table_destroy(options);
+	g_strfreev(tokens);
+
+	return di;
+}
+
+static void count_ann_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	(void)pdata;
+
+	(*(uint64_t *)cb_data)++;
+}
+
+static long peak_rss_kb(void)
+{
+#ifdef HAVE_SYS_RESOURCE_H
+	struct rusage usage;
+
+	if (getrusage(RUSAGE_SELF, &usage) == 0)
+		return usage.ru_maxrss;
+#endif
+
+	return -1;
+}
+
+static int run_case(const struct decbench_case *bc, uint64_t num_samples,
+		uint64_t chunksize)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *di[MAX_STACK];
+	struct srd_inst_stats *stats;
+	GByteArray *buf;
+	GRand *rand;
+	uint64_t pos, len, num_ann;
+	gint64 start, elapsed;
+	unsigned int i, n;
+	int ret;
+
+	rand = g_rand_new_with_seed(1);
+	buf = g_byte_array_sized_new(num_samples);
+	bc->generate(buf, rand, num_samples, bc->param);
+	g_rand_free(rand);
+
+	srd_session_new(&sess);
+	for (n = 0; n < MAX_STACK && bc->stack[n]; n++) {
+		if (!(di[n] = new_inst(sess, bc->stack[n])) || (n > 0 &&
+				srd_inst_stack(sess, di[n - 1], di[n]) != SRD_OK)) {
+			srd_session_destroy(sess);
+			g_byte_array_free(buf, TRUE);
+			return SRD_ERR;
+		}
+	}
+	num_ann = 0;
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_ann_cb, &num_ann);
+	srd_session_stats_set(sess, TRUE);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(bc->samplerate));
+	srd_session_start(sess);
+
+	ret = SRD_OK;
+	start = g_get_monotonic_time();
+	for (pos = 0; pos < num_samples; pos += len) {
+		len = MIN(chunksize, num_samples - pos);
+		if ((ret = srd_session_send(sess, pos, pos + len,
+				buf->data + pos, len, 1)) != SRD_OK)
+			break;
+	}
+	srd_session_send_eof(sess);
+	elapsed = MAX(g_get_monotonic_time() - start, 1);
+	g_byte_array_free(buf, TRUE);
+
+	if (ret == SRD_OK) {
+		printf("case=%s samples=%" PRIu64 " chunksize=%" PRIu64
+			" samplerate=%" PRIu64 " elapsed_us=%" PRId64
+			" msamples_per_s=%.2f annotations=%" PRIu64
+			" annotations_per_s=%.0f peak_rss_kb=%ld\n",
+			bc->name, num_samples, chunksize, bc->samplerate,
+			(int64_t)elapsed, num_samples / (double)elapsed,
+			num_ann, num_ann * 1000000.0 / elapsed, peak_rss_kb());
+		for (i = 0; i < n; i++) {
+			if (!(stats = srd_inst_stats_get(di[i])))
+				continue;
+			printf("case=%s inst=%s decode_us=%" PRIu64
+				" match_us=%" PRIu64 " wait_calls=%" PRIu64
+				" matches=%" PRIu64 " annotations=%" PRIu64
+				" python=%" PRIu64 " binary=%" PRIu64 "\n",
+				bc->name, di[i]->inst_id, stats->decode_time,
+				stats->match_time, stats->wait_calls,
+				stats->matches, stats->put_calls[SRD_OUTPUT_ANN],
+				stats->put_calls[SRD_OUTPUT_PYTHON],
+				stats->put_calls[SRD_OUTPUT_BINARY]);
+			g_free(stats);
+		}
+	}
+	srd_session_destroy(sess);
+
+	return ret;
+}
+
+static gboolean case_selected(const char *name, int argc, char **argv)
+{
+	int i;
+
+	if (argc == 0)
+		return TRUE;
+	for (i = 0; i < argc; i++) {
+		if (g_str_has_prefix(name, argv[i]))
+			return TRUE;
+	}
+
+	return FALSE;
+}
+
+int main(int argc, char **argv)
+{
+	uint64_t num_samples, chunksize;
+	unsigned int i;
+	int opt, ret;
+
+	num_samples = 4000000;
+	chunksize = 4096;
+	for (opt = 1; opt < argc && argv[opt][0] == '-'; opt++) {
+		if (!strcmp(argv[opt], "-n") && opt + 1 < argc) {
+			num_samples = g_ascii_strtoull(argv[++opt], NULL, 0);
+		} else if (!strcmp(argv[opt], "-c") && opt + 1 < argc) {
+			chunksize = g_ascii_strtoull(argv[++opt], NULL, 0);
+		} else {
+			fprintf(stderr, "Usage: %s [-n samples] [-c chunksize] "
+				"[case ...]\n", argv[0]);
+			return EXIT_FAILURE;
+		}
+	}
+	if (!num_samples || !chunksize)
+		return EXIT_FAILURE;
+
+	srd_log_loglevel_set(SRD_LOG_ERR);
+	if (srd_init(DECODERS_TESTDIR) != SRD_OK)
+		return EXIT_FAILURE;
+
+	ret = SRD_OK;
+	for (i = 0; i < G_N_ELEMENTS(decbench_cases) && ret == SRD_OK; i++) {
+		if (!case_selected(decbench_cases[i].name, argc - opt, argv + opt))
+			continue;
+		ret = run_case(&decbench_cases[i], num_samples, chunksize);
+	}
+
+	srd_exit();
+
+	return (ret == SRD_OK) ? EXIT_SUCCESS : EXIT_FAILURE;
+}
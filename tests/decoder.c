@@ -19,7 +19,9 @@
 
 #include <config.h>
 #include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <glib/gstdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include <check.h>
 #include "lib.h"
 
@@ -256,6 +258,287 @@ START_TEST(test_unload_null_no_init)
 }
 END_TEST
 
+/*
+ * Check whether srd_decoder_load_all() lists the decoders from the
+ * metadata cache on the second run, and imports a decoder's module
+ * when an instance of it gets created.
+ * If the decoders differ, or the decoder cannot be instantiated (or it
+ * segfaults) this test will fail.
+ */
+START_TEST(test_load_all_cache)
+{
+	struct srd_session *sess;
+	struct srd_decoder *dec;
+	GDir *dir;
+	const char *name;
+	char *cache_dir, *file, *doc;
+	guint num_decoders;
+
+	cache_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(cache_dir != NULL, "Cannot create cache directory.");
+	g_setenv("SIGROKDECODE_CACHE_DIR", cache_dir, TRUE);
+
+	/* Import all decoders, and fill the cache. */
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load_all();
+	num_decoders = g_slist_length((GSList *)srd_decoder_list());
+	srd_exit();
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load_all();
+	fail_unless(g_slist_length((GSList *)srd_decoder_list()) == num_decoders,
+		"Got %u decoders from the cache, expected %u.",
+		g_slist_length((GSList *)srd_decoder_list()), num_decoders);
+	dec = srd_decoder_get_by_id("uart");
+	fail_unless(dec != NULL, "uart decoder not found.");
+	fail_unless(dec->py_dec == NULL, "uart decoder was imported.");
+	fail_unless(g_slist_length(dec->opt_channels) == 2 &&
+		dec->options && dec->annotations && dec->annotation_rows,
+		"uart decoder metadata missing.");
+	doc = srd_decoder_doc_get(dec);
+	fail_unless(doc != NULL, "uart decoder docstring missing.");
+	g_free(doc);
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL,
+		"Cannot create an instance of a cached decoder.");
+	fail_unless(dec->py_dec != NULL, "uart decoder was not imported.");
+	srd_session_destroy(sess);
+	srd_exit();
+
+	g_setenv("SIGROKDECODE_CACHE_DIR", "", TRUE);
+	dir = g_dir_open(cache_dir, 0, NULL);
+	while ((name = g_dir_read_name(dir))) {
+		file = g_build_filename(cache_dir, name, NULL);
+		g_remove(file);
+		g_free(file);
+	}
+	g_dir_close(dir);
+	g_rmdir(cache_dir);
+	g_free(cache_dir);
+}
+END_TEST
+
+/* A minimal protocol decoder, its id is the module name. */
+static const char zip_decoder[] =
+	"import sigrokdecode as srd\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Util']\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def start(self):\n"
+	"        pass\n"
+	"    def decode(self):\n"
+	"        pass\n";
+
+static void zip_put16(GString *s, guint16 v)
+{
+	g_string_append_c(s, v & 0xff);
+	g_string_append_c(s, v >> 8);
+}
+
+static void zip_put32(GString *s, guint32 v)
+{
+	zip_put16(s, v & 0xffff);
+	zip_put16(s, v >> 16);
+}
+
+static guint32 zip_crc32(const char *data, gsize len)
+{
+	guint32 crc;
+	gsize i;
+	int bit;
+
+	crc = 0xffffffff;
+	for (i = 0; i < len; i++) {
+		crc ^= (guint8)data[i];
+		for (bit = 0; bit < 8; bit++)
+			crc = (crc >> 1) ^ (crc & 1 ? 0xedb88320 : 0);
+	}
+
+	return ~crc;
+}
+
+/*
+ * Write a zip archive with uncompressed files, from a NULL terminated
+ * list of file names and contents.
+ */
+static void zip_write(const char *filename, const char *const *files)
+{
+	GString *s, *dir;
+	guint32 crc, len, offset;
+	guint16 count;
+	gboolean ret;
+
+	s = g_string_new(NULL);
+	dir = g_string_new(NULL);
+	for (count = 0; files[0]; files += 2, count++) {
+		crc = zip_crc32(files[1], strlen(files[1]));
+		len = strlen(files[1]);
+		offset = s->len;
+		/* Local file header. */
+		zip_put32(s, 0x04034b50);
+		zip_put16(s, 20);
+		zip_put16(s, 0);
+		zip_put16(s, 0);
+		zip_put16(s, 0);
+		zip_put16(s, (1 << 5) | 1);
+		zip_put32(s, crc);
+		zip_put32(s, len);
+		zip_put32(s, len);
+		zip_put16(s, strlen(files[0]));
+		zip_put16(s, 0);
+		g_string_append(s, files[0]);
+		g_string_append(s, files[1]);
+		/* Central directory entry. */
+		zip_put32(dir, 0x02014b50);
+		zip_put16(dir, 20);
+		zip_put16(dir, 20);
+		zip_put16(dir, 0);
+		zip_put16(dir, 0);
+		zip_put16(dir, 0);
+		zip_put16(dir, (1 << 5) | 1);
+		zip_put32(dir, crc);
+		zip_put32(dir, len);
+		zip_put32(dir, len);
+		zip_put16(dir, strlen(files[0]));
+		zip_put16(dir, 0);
+		zip_put16(dir, 0);
+		zip_put16(dir, 0);
+		zip_put16(dir, 0);
+		zip_put32(dir, 0);
+		zip_put32(dir, offset);
+		g_string_append(dir, files[0]);
+	}
+	offset = s->len;
+	g_string_append_len(s, dir->str, dir->len);
+	/* End of central directory record. */
+	zip_put32(s, 0x06054b50);
+	zip_put16(s, 0);
+	zip_put16(s, 0);
+	zip_put16(s, count);
+	zip_put16(s, count);
+	zip_put32(s, dir->len);
+	zip_put32(s, offset);
+	zip_put16(s, 0);
+
+	ret = g_file_set_contents(filename, s->str, s->len, NULL);
+	fail_unless(ret, "Cannot write %s.", filename);
+	g_string_free(dir, TRUE);
+	g_string_free(s, TRUE);
+}
+
+/*
+ * Check whether srd_decoder_load_all() loads the decoders from a zip
+ * archive, as listed by the archive's index, and whether it uses the
+ * metadata cache for archives.
+ * If a listed decoder is missing, an unlisted decoder gets loaded, or the
+ * decoder from the cache cannot be instantiated (or it segfaults) this
+ * test will fail.
+ */
+START_TEST(test_load_all_zip)
+{
+	const char *const files[] = {
+		"zipdec/__init__.py", zip_decoder,
+		"zipskip/__init__.py", zip_decoder,
+		"decoders.index", "# Decoder modules.\nzipdec\n",
+		NULL,
+	};
+	struct srd_session *sess;
+	struct srd_decoder *dec;
+	GDir *dir;
+	const char *name;
+	char *tmp_dir, *archive, *file;
+	int i;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create temporary directory.");
+	archive = g_build_filename(tmp_dir, "decoders.zip", NULL);
+	zip_write(archive, files);
+
+	/* List the decoders from the cache on the second run. */
+	g_setenv("SIGROKDECODE_CACHE_DIR", tmp_dir, TRUE);
+	for (i = 0; i < 2; i++) {
+		srd_init(archive);
+		srd_decoder_load_all();
+		dec = srd_decoder_get_by_id("zipdec");
+		fail_unless(dec != NULL, "zipdec decoder not found.");
+		fail_unless(srd_decoder_get_by_id("zipskip") == NULL,
+			"zipskip decoder is not in the index, but got loaded.");
+		fail_unless((dec->py_dec == NULL) == (i == 1),
+			"zipdec decoder was %simported.", i ? "" : "not ");
+		srd_session_new(&sess);
+		fail_unless(srd_inst_new(sess, "zipdec", NULL) != NULL,
+			"Cannot create an instance of the zipdec decoder.");
+		srd_session_destroy(sess);
+		srd_exit();
+	}
+	g_setenv("SIGROKDECODE_CACHE_DIR", "", TRUE);
+
+	dir = g_dir_open(tmp_dir, 0, NULL);
+	while ((name = g_dir_read_name(dir))) {
+		file = g_build_filename(tmp_dir, name, NULL);
+		g_remove(file);
+		g_free(file);
+	}
+	g_dir_close(dir);
+	g_rmdir(tmp_dir);
+	g_free(archive);
+	g_free(tmp_dir);
+}
+END_TEST
+
+/*
+ * Check whether srd_decoder_load_all() also loads the decoders from a
+ * directory behind an archive on the search path, which the archive
+ * does not have.
+ * If the decoder from the directory is missing, or it cannot be
+ * instantiated (or it segfaults) this test will fail.
+ */
+START_TEST(test_load_all_zip_dir)
+{
+	const char *const files[] = {
+		"zipdec/__init__.py", zip_decoder,
+		"decoders.index", "zipdec\n",
+		NULL,
+	};
+	struct srd_session *sess;
+	char *tmp_dir, *archive, *dec_dir;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create temporary directory.");
+	archive = g_build_filename(tmp_dir, "decoders.zip", NULL);
+	zip_write(archive, files);
+	dec_dir = g_build_filename(tmp_dir, "decoders", NULL);
+	g_mkdir(dec_dir, 0755);
+	srdtest_decoder_write(dec_dir, "dirdec", zip_decoder);
+
+	/* The same order as srd_init() uses for the installed decoders. */
+	g_setenv("SIGROKDECODE_DIR", archive, TRUE);
+	srd_init(dec_dir);
+	g_unsetenv("SIGROKDECODE_DIR");
+	srd_decoder_load_all();
+	fail_unless(srd_decoder_get_by_id("zipdec") != NULL,
+		"zipdec decoder not found.");
+	fail_unless(srd_decoder_get_by_id("dirdec") != NULL,
+		"dirdec decoder not found.");
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "dirdec", NULL) != NULL,
+		"Cannot create an instance of the dirdec decoder.");
+	srd_session_destroy(sess);
+	srd_exit();
+
+	srdtest_dir_remove(tmp_dir);
+	g_free(dec_dir);
+	g_free(archive);
+	g_free(tmp_dir);
+}
+END_TEST
+
 /*
  * Check whether srd_decoder_list() returns a non-empty list.
  * If it returns an empty list (or segfaults) this test will fail.
@@ -421,6 +704,36 @@ START_TEST(test_doc_get_null)
 }
 END_TEST
 
+/*
+ * Check whether sigrokdecode.Decoder objects, and objects of subclasses,
+ * release the values of .samplenum and .matched when they go.
+ * If a value is kept alive (or it segfaults) this test will fail.
+ */
+START_TEST(test_decoder_dealloc)
+{
+	char *alive;
+
+	srd_init(DECODERS_TESTDIR);
+	alive = srdtest_python_run(
+		"import sigrokdecode, weakref\n"
+		"class Value:\n"
+		"    pass\n"
+		"class Sub(sigrokdecode.Decoder):\n"
+		"    pass\n"
+		"refs = []\n"
+		"for cls in (sigrokdecode.Decoder, Sub):\n"
+		"    dec = cls()\n"
+		"    dec.samplenum, dec.matched = Value(), Value()\n"
+		"    refs += [weakref.ref(dec.samplenum), weakref.ref(dec.matched)]\n"
+		"    del dec\n"
+		"alive = sum(ref() is not None for ref in refs)\n", "alive");
+	fail_unless(alive != NULL, "Cannot run the Python code.");
+	fail_unless(!strcmp(alive, "0"), "%s values are alive.", alive);
+	g_free(alive);
+	srd_exit();
+}
+END_TEST
+
 Suite *suite_decoder(void)
 {
 	Suite *s;
@@ -458,6 +771,9 @@ Suite *suite_decoder(void)
 	tcase_add_test(tc, test_decoder_list_no_init);
 	tcase_add_test(tc, test_decoder_list_no_init_no_load);
 	tcase_add_test(tc, test_decoder_list_correct_numbers);
+	tcase_add_test(tc, test_load_all_cache);
+	tcase_add_test(tc, test_load_all_zip);
+	tcase_add_test(tc, test_load_all_zip_dir);
 	suite_add_tcase(s, tc);
 
 	tc = tcase_create("get_by_id");
@@ -471,5 +787,9 @@ Suite *suite_decoder(void)
 	tcase_add_test(tc, test_doc_get_null);
 	suite_add_tcase(s, tc);
 
+	tc = tcase_create("type");
+	tcase_add_test(tc, test_decoder_dealloc);
+	suite_add_tcase(s, tc);
+
 	return s;
 }
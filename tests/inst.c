@@ -140,6 +140,55 @@ START_TEST(test_inst_option_set_bogus)
 }
 END_TEST
 
+/*
+ * Check whether srd_inst_ann_class_enable() and srd_inst_ann_row_enable()
+ * reject bogus input and accept valid classes and rows.
+ * If any of them returns the wrong result (or segfaults) this test will fail.
+ */
+START_TEST(test_inst_ann_enable)
+{
+	int ret;
+	struct srd_session *sess;
+	struct srd_decoder_inst *inst;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load_all();
+	srd_session_new(&sess);
+	inst = srd_inst_new(sess, "uart", NULL);
+
+	ret = srd_inst_ann_class_enable(NULL, 0, FALSE);
+	fail_unless(ret != SRD_OK, "srd_inst_ann_class_enable() with NULL "
+			"instance failed: %d.", ret);
+	ret = srd_inst_ann_class_enable(inst, -1, FALSE);
+	fail_unless(ret != SRD_OK, "srd_inst_ann_class_enable() with "
+			"negative class failed: %d.", ret);
+	ret = srd_inst_ann_class_enable(inst, 1000, FALSE);
+	fail_unless(ret != SRD_OK, "srd_inst_ann_class_enable() with "
+			"bogus class failed: %d.", ret);
+	ret = srd_inst_ann_class_enable(inst, 0, FALSE);
+	fail_unless(ret == SRD_OK, "srd_inst_ann_class_enable() with "
+			"valid class failed: %d.", ret);
+	ret = srd_inst_ann_class_enable(inst, 0, TRUE);
+	fail_unless(ret == SRD_OK, "srd_inst_ann_class_enable() with "
+			"valid class failed: %d.", ret);
+
+	ret = srd_inst_ann_row_enable(NULL, "rx-data-vals", FALSE);
+	fail_unless(ret != SRD_OK, "srd_inst_ann_row_enable() with NULL "
+			"instance failed: %d.", ret);
+	ret = srd_inst_ann_row_enable(inst, NULL, FALSE);
+	fail_unless(ret != SRD_OK, "srd_inst_ann_row_enable() with NULL "
+			"row failed: %d.", ret);
+	ret = srd_inst_ann_row_enable(inst, "nonexistent", FALSE);
+	fail_unless(ret != SRD_OK, "srd_inst_ann_row_enable() with "
+			"bogus row failed: %d.", ret);
+	ret = srd_inst_ann_row_enable(inst, "rx-data-vals", FALSE);
+	fail_unless(ret == SRD_OK, "srd_inst_ann_row_enable() with "
+			"valid row failed: %d.", ret);
+
+	srd_exit();
+}
+END_TEST
+
 Suite *suite_inst(void)
 {
 	Suite *s;
@@ -159,5 +208,10 @@ Suite *suite_inst(void)
 	tcase_add_test(tc, test_inst_option_set_bogus);
 	suite_add_tcase(s, tc);
 
+	tc = tcase_create("annotations");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_inst_ann_enable);
+	suite_add_tcase(s, tc);
+
 	return s;
 }
@@ -22,10 +22,18 @@
 
 void srdtest_setup(void);
 void srdtest_teardown(void);
+char *srdtest_str_replace(const char *str, const char *from, const char *to);
+void srdtest_dir_remove(const char *path);
+void srdtest_decoder_write(const char *dir, const char *name,
+		const char *code);
+void srdtest_text_ann_cb(struct srd_proto_data *pdata, void *cb_data);
+char *srdtest_python_run(const char *code, const char *name);
 
 Suite *suite_core(void);
 Suite *suite_decoder(void);
 Suite *suite_inst(void);
+Suite *suite_pd(void);
 Suite *suite_session(void);
+Suite *suite_wait(void);
 
 #endif
@@ -18,7 +18,10 @@
  */
 
 #include <config.h>
-#include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <libsigrokdecode-internal.h> /* First, to avoid compiler warning. */
+#include <libsigrokdecode.h>
+#include <glib/gstdio.h>
+#include <inttypes.h>
 #include <stdlib.h>
 #include <check.h>
 #include "lib.h"
@@ -33,12 +36,114 @@ void srdtest_teardown(void)
 {
 }
 
+/* Replace all occurrences of 'from' in 'str'. */
+char *srdtest_str_replace(const char *str, const char *from, const char *to)
+{
+	char **parts, *ret;
+
+	parts = g_strsplit(str, from, -1);
+	ret = g_strjoinv(to, parts);
+	g_strfreev(parts);
+
+	return ret;
+}
+
+/* Remove a directory with all of its contents. */
+void srdtest_dir_remove(const char *path)
+{
+	GDir *dir;
+	const char *name;
+	char *file;
+
+	if ((dir = g_dir_open(path, 0, NULL))) {
+		while ((name = g_dir_read_name(dir))) {
+			file = g_build_filename(path, name, NULL);
+			if (g_file_test(file, G_FILE_TEST_IS_DIR))
+				srdtest_dir_remove(file);
+			else
+				g_remove(file);
+			g_free(file);
+		}
+		g_dir_close(dir);
+	}
+	g_rmdir(path);
+}
+
+/* Write the decoder 'code' as module 'name' into 'dir'. */
+void srdtest_decoder_write(const char *dir, const char *name,
+		const char *code)
+{
+	char *path;
+	gboolean ret;
+
+	path = g_build_filename(dir, name, NULL);
+	g_mkdir(path, 0755);
+	g_free(path);
+	path = g_build_filename(dir, name, "__init__.py", NULL);
+	ret = g_file_set_contents(path, code, -1, NULL);
+	fail_unless(ret, "Cannot write %s.", path);
+	g_free(path);
+}
+
+/* Append "<start sample> <first text>" lines to the GString 'cb_data'. */
+void srdtest_text_ann_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_proto_data_annotation *pda;
+
+	pda = pdata->data;
+	g_string_append_printf(cb_data, "%" PRIu64 " %s\n",
+		pdata->start_sample, pda->ann_text[0]);
+}
+
+/*
+ * Run the Python 'code' in a namespace of its own, in the interpreter
+ * which srd_init() created. Returns str() of the variable 'name' after
+ * the run, or NULL if the code raised an exception.
+ */
+char *srdtest_python_run(const char *code, const char *name)
+{
+	PyGILState_STATE gstate;
+	PyObject *py_code, *py_globals, *py_res, *py_str, *py_bytes;
+	char *ret;
+
+	gstate = PyGILState_Ensure();
+	ret = NULL;
+	py_res = py_str = py_bytes = NULL;
+	py_globals = PyDict_New();
+	py_code = Py_CompileString(code, "<test>", Py_file_input);
+	if (py_globals && py_code && PyDict_SetItemString(py_globals,
+			"__builtins__", PyEval_GetBuiltins()) == 0)
+		py_res = PyEval_EvalCode(py_code, py_globals, NULL);
+	if (py_res && (py_str = PyDict_GetItemString(py_globals, name)))
+		py_str = PyObject_Str(py_str);
+	if (py_str)
+		py_bytes = PyUnicode_AsUTF8String(py_str);
+	if (py_bytes)
+		ret = g_strdup(PyBytes_AsString(py_bytes));
+	if (!ret && PyErr_Occurred())
+		PyErr_Print();
+	Py_XDECREF(py_bytes);
+	Py_XDECREF(py_str);
+	Py_XDECREF(py_res);
+	Py_XDECREF(py_code);
+	Py_XDECREF(py_globals);
+	PyGILState_Release(gstate);
+
+	return ret;
+}
+
 int main(void)
 {
 	int ret;
 	Suite *s;
 	SRunner *srunner;
 
+	/*
+	 * Don't use (or fill) the user's decoder metadata cache, tests
+	 * which need the cache set up their own.
+	 */
+	g_setenv("SIGROKDECODE_CACHE_DIR", "", TRUE);
+
 	s = suite_create("mastersuite");
 	srunner = srunner_create(s);
 
@@ -46,7 +151,9 @@ int main(void)
 	srunner_add_suite(srunner, suite_core());
 	srunner_add_suite(srunner, suite_decoder());
 	srunner_add_suite(srunner, suite_inst());
+	srunner_add_suite(srunner, suite_pd());
 	srunner_add_suite(srunner, suite_session());
+	srunner_add_suite(srunner, suite_wait());
 
 	srunner_run_all(srunner, CK_VERBOSE);
 	ret = srunner_ntests_failed(srunner);
@@ -0,0 +1,408 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <config.h>
+#include <libsigrokdecode-internal.h> /* First, to avoid compiler warning. */
+#include <libsigrokdecode.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <check.h>
+#include "lib.h"
+
+/*
+ * Check the CRC presets of the common.crc module against their check
+ * values (the CRC of "123456789"), and a bit at a time implementation.
+ * All the ways to compute a CRC must agree: calc(), calc_bits(),
+ * calc_int() and the incremental update*() functions, fed in chunks
+ * of random sizes.
+ */
+static const char crc_check[] =
+	"import random\n"
+	"import common.crc as crc\n"
+	"# Name, width, poly, init, reflected, xorout, check value.\n"
+	"MODELS = (\n"
+	"    ('CRC5_USB', 5, 0x05, 0x1f, True, 0x1f, 0x19),\n"
+	"    ('CRC16_USB', 16, 0x8005, 0xffff, True, 0xffff, 0xb4c8),\n"
+	"    ('CRC16_MODBUS', 16, 0x8005, 0xffff, True, 0, 0x4b37),\n"
+	"    ('CRC16_MAXIM', 16, 0x8005, 0, True, 0xffff, 0x44c2),\n"
+	"    ('CRC8_PJON', 8, 0xe9, 0, True, 0, 0xc2),\n"
+	"    ('CRC32', 32, 0x04c11db7, 0xffffffff, True, 0xffffffff, 0xcbf43926),\n"
+	"    ('CRC15_CAN', 15, 0x4599, 0, False, 0, 0x059e),\n"
+	"    ('CRC17_CAN_FD', 17, 0x1685b, 1 << 16, False, 0, 0x09d9b),\n"
+	"    ('CRC21_CAN_FD', 21, 0x102899, 1 << 20, False, 0, 0x1323d8),\n"
+	"    ('CRC7_SD', 7, 0x09, 0, False, 0, 0x75),\n"
+	"    ('CRC16_SD', 16, 0x1021, 0, False, 0, 0x31c3),\n"
+	"    # Without the leading one of ISO 11898-1, like the catalogues.\n"
+	"    (None, 17, 0x1685b, 0, False, 0, 0x04f03),\n"
+	"    (None, 21, 0x102899, 0, False, 0, 0x0ed841),\n"
+	")\n"
+	"def reference(width, poly, init, refl, xorout, bits):\n"
+	"    reg, top, mask = init, 1 << (width - 1), (1 << width) - 1\n"
+	"    for b in bits:\n"
+	"        reg = ((reg << 1) & mask) ^ (poly if bool(reg & top) != b else 0)\n"
+	"    return (crc.reflect(reg, width) if refl else reg) ^ xorout\n"
+	"def transmitted(data, refl):\n"
+	"    return [(b >> (i if refl else 7 - i)) & 1 for b in data for i in range(8)]\n"
+	"def bits_int(bits):\n"
+	"    return int(''.join(map(str, bits)) or '0', 2)\n"
+	"rnd = random.Random(1)\n"
+	"errors = []\n"
+	"for name, width, poly, init, refl, xorout, check in MODELS:\n"
+	"    c = getattr(crc, name) if name else crc.Crc(width, poly, init)\n"
+	"    name = name or 'CRC%d' % width\n"
+	"    if (c.width, c.poly, c.refin, c.refout, c.xorout) != \\\n"
+	"            (width, poly, refl, refl, xorout):\n"
+	"        errors.append(name + ' parameters')\n"
+	"    for data in (b'123456789', bytes(rnd.randrange(256) for _ in range(37))):\n"
+	"        bits = transmitted(data, refl)\n"
+	"        want = reference(width, poly, init, refl, xorout, bits)\n"
+	"        if data == b'123456789' and want != check:\n"
+	"            errors.append('%s check %#x' % (name, want))\n"
+	"        got = {\n"
+	"            'calc': c.calc(data),\n"
+	"            'calc_bits': c.calc_bits(bits),\n"
+	"            'calc_bits str': c.calc_bits(''.join(map(str, bits))),\n"
+	"            'calc_int': c.calc_int(bits_int(bits), len(bits)),\n"
+	"        }\n"
+	"        reg, i = None, 0\n"
+	"        while i < len(data):\n"
+	"            n = rnd.randrange(4)\n"
+	"            reg = c.update(data[i:i + n], reg)\n"
+	"            i += n\n"
+	"        got['update'] = c.finish(reg)\n"
+	"        reg, i = None, 0\n"
+	"        while i < len(bits):\n"
+	"            chunk = bits[i:i + rnd.randrange(12)]\n"
+	"            if rnd.randrange(2):\n"
+	"                reg = c.update_bits(chunk, reg)\n"
+	"            else:\n"
+	"                reg = c.update_int(bits_int(chunk), len(chunk), reg)\n"
+	"            i += len(chunk)\n"
+	"        got['update_bits'] = c.finish(reg)\n"
+	"        errors.extend('%s %s %#x != %#x' % (name, k, v, want)\n"
+	"            for k, v in got.items() if v != want)\n"
+	"result = ', '.join(errors) or 'ok'\n";
+
+START_TEST(test_pd_crc)
+{
+	char *result;
+
+	srd_init(DECODERS_TESTDIR);
+	result = srdtest_python_run(crc_check, "result");
+	fail_unless(result != NULL, "Cannot check the CRCs.");
+	fail_unless(!strcmp(result, "ok"), "CRC mismatch: %s.", result);
+	g_free(result);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Encode CAN frames, with the bit stuffing of ISO 11898-1:2015: dynamic
+ * stuff bits up to the end of the data field (or of the CRC in classic
+ * frames), then in CAN FD frames the stuff count and the CRC, with a
+ * fixed stuff bit before every four bits. The frames end with 5 equal
+ * bits before the CRC field, where the fixed stuff bit replaces the
+ * dynamic one. 'result' is the annotations which the frames should get,
+ * and their bits ('0' or '1').
+ */
+#define SAMPLES_PER_BIT 10
+
+static const char can_frames[] =
+	"from common.crc import CRC15_CAN, CRC17_CAN_FD, CRC21_CAN_FD\n"
+	"DLC = {12: 9, 16: 10, 20: 11, 24: 12, 32: 13, 48: 14, 64: 15}\n"
+	"FRAMES = (\n"
+	"    (0x123, b'\\x12\\x34\\xe0', False),\n"
+	"    (0x123, b'\\x12\\x34\\xe0', True),\n"
+	"    (0x7e0, bytes(range(15)) + b'\\x9f', True),\n"
+	"    (0x155, bytes(range(19)) + b'\\xe0', True),\n"
+	")\n"
+	"def bits_of(v, n):\n"
+	"    return [(v >> i) & 1 for i in range(n - 1, -1, -1)]\n"
+	"def stuff(bits, raw):\n"
+	"    for b in bits:\n"
+	"        if len(raw) >= 5 and len(set(raw[-5:])) == 1:\n"
+	"            raw.append(1 - raw[-1])\n"
+	"        raw.append(b)\n"
+	"def frame(ident, data, fd):\n"
+	"    bits = [0] + bits_of(ident, 11)\n"
+	"    # RRS/RTR, IDE, FDF/r0, and with FD: res, BRS, ESI.\n"
+	"    bits += [0, 0, 1, 0, 0, 0] if fd else [0, 0, 0]\n"
+	"    bits += bits_of(DLC.get(len(data), len(data)), 4)\n"
+	"    for b in data:\n"
+	"        bits += bits_of(b, 8)\n"
+	"    raw = []\n"
+	"    if not fd:\n"
+	"        stuff(bits + bits_of(CRC15_CAN.calc_bits(bits), 15), raw)\n"
+	"        if len(set(raw[-5:])) == 1:\n"
+	"            raw.append(1 - raw[-1])\n"
+	"    else:\n"
+	"        stuff(bits, raw)\n"
+	"        assert len(set(raw[-5:])) == 1\n"
+	"        n = (len(raw) - len(bits)) % 8\n"
+	"        field = bits_of(n ^ (n >> 1), 3)\n"
+	"        field.append(sum(field) % 2)\n"
+	"        crc = CRC17_CAN_FD if len(data) <= 16 else CRC21_CAN_FD\n"
+	"        field += bits_of(crc.calc_bits(raw + field), crc.width)\n"
+	"        for i in range(0, len(field), 4):\n"
+	"            raw += [1 - raw[-1]] + field[i:i + 4]\n"
+	"    # CRC delimiter, ACK, ACK delimiter, EOF, intermission.\n"
+	"    return raw + [1, 0, 1] + [1] * 7 + [1] * 3\n"
+	"anns, bits = [], [1] * 10\n"
+	"for ident, data, fd in FRAMES:\n"
+	"    anns.append('Identifier: {0} (0x{0:x})'.format(ident))\n"
+	"    anns.extend('Data byte %d: 0x%02x' % b for b in enumerate(data))\n"
+	"    anns.append('End of frame')\n"
+	"    bits += frame(ident, data, fd)\n"
+	"result = ''.join(a + '\\n' for a in anns) + '|' + ''.join(map(str, bits))\n";
+
+/* Collect the identifier, data byte, EOF and warning annotations. */
+static void can_ann_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_proto_data_annotation *pda;
+
+	pda = pdata->data;
+	if (pda->ann_class == 0 || pda->ann_class == 2 ||
+			pda->ann_class == 3 || pda->ann_class == 16)
+		g_string_append_printf(cb_data, "%s\n", pda->ann_text[0]);
+}
+
+/*
+ * Check whether the CAN decoder decodes classic and CAN FD frames,
+ * with CRC-15, CRC-17 and CRC-21, which end with stuffed bits.
+ * If it warns, or decodes other data (or segfaults) this test will fail.
+ */
+START_TEST(test_pd_can_fd)
+{
+	struct srd_session *sess;
+	GHashTable *options;
+	GString *anns;
+	char *result, *bits;
+	uint8_t *buf;
+	size_t i, len;
+
+	srd_init(DECODERS_TESTDIR);
+	result = srdtest_python_run(can_frames, "result");
+	fail_unless(result != NULL, "Cannot encode the frames.");
+	bits = strchr(result, '|');
+	*bits++ = '\0';
+	len = strlen(bits) * SAMPLES_PER_BIT;
+	buf = g_malloc(len);
+	for (i = 0; i < len; i++)
+		buf[i] = bits[i / SAMPLES_PER_BIT] == '1';
+
+	srd_decoder_load("can");
+	srd_session_new(&sess);
+	options = g_hash_table_new(g_str_hash, g_str_equal);
+	srd_inst_new(sess, "can", options);
+	g_hash_table_destroy(options);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(SAMPLES_PER_BIT * 1000000));
+	anns = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, can_ann_cb, anns);
+	srd_session_start(sess);
+	srd_session_send(sess, 0, len, buf, len, 1);
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+	fail_unless(!strcmp(anns->str, result),
+		"Got:\n%s\nexpected:\n%s", anns->str, result);
+
+	g_string_free(anns, TRUE);
+	g_free(buf);
+	g_free(result);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Encode full-speed USB traffic: a GET_DESCRIPTOR control transfer with
+ * three IN data packets, one of them all ones (bit stuffing), and two
+ * bulk OUT transfers, the first data packet of the second one with a bad
+ * CRC16. 'result' is the NRZI symbols (D+ in bit 0, D- in bit 1).
+ */
+static const char usb_traffic[] =
+	"from common.crc import CRC5_USB, CRC16_USB\n"
+	"J, K, SE0 = 1, 2, 0\n"
+	"PIDS = {'OUT': 0xe1, 'IN': 0x69, 'SETUP': 0x2d, 'DATA0': 0xc3,\n"
+	"    'DATA1': 0x4b, 'ACK': 0xd2, 'NAK': 0x5a}\n"
+	"TRAFFIC = (\n"
+	"    ('SETUP', 3, 0, 'DATA0', b'\\x80\\x06\\x00\\x01\\x00\\x00\\x12\\x00', 'ACK'),\n"
+	"    ('IN', 3, 0, 'DATA1', b'\\x12\\x01\\x00\\x02\\x00\\x00\\x00\\x40', 'ACK'),\n"
+	"    ('IN', 3, 0, 'DATA0', b'\\xff' * 8, 'ACK'),\n"
+	"    ('IN', 3, 0, 'DATA1', b'\\x01\\x01', 'ACK'),\n"
+	"    ('OUT', 3, 0, 'DATA1', b'', 'ACK'),\n"
+	"    ('OUT', 3, 2, 'DATA0', b'\\xde\\xad\\xbe\\xef', 'ACK'),\n"
+	"    ('OUT', 3, 2, 'DATA1', b'\\x55\\xaa', 'NAK'),\n"
+	"    ('OUT', 3, 2, 'DATA1', b'\\x55\\xaa', 'ACK'),\n"
+	")\n"
+	"def bits_of(v, n):\n"
+	"    return [(v >> i) & 1 for i in range(n)]\n"
+	"def packet(pid, bits=()):\n"
+	"    bits = bits_of(0x80, 8) + bits_of(PIDS[pid], 8) + list(bits)\n"
+	"    syms, level, ones = [], J, 0\n"
+	"    for b in bits:\n"
+	"        level = level if b else J + K - level\n"
+	"        syms.append(level)\n"
+	"        ones = ones + 1 if b else 0\n"
+	"        if ones == 6:\n"
+	"            level, ones = J + K - level, 0\n"
+	"            syms.append(level)\n"
+	"    return syms + [SE0, SE0, J] + [J] * 8\n"
+	"def token(pid, addr, ep):\n"
+	"    bits = bits_of(addr, 7) + bits_of(ep, 4)\n"
+	"    return packet(pid, bits + bits_of(CRC5_USB.calc_bits(bits), 5))\n"
+	"def data(pid, payload, bad_crc):\n"
+	"    bits = [b for byte in payload for b in bits_of(byte, 8)]\n"
+	"    crc = CRC16_USB.calc(payload) ^ (0x100 if bad_crc else 0)\n"
+	"    return packet(pid, bits + bits_of(crc, 16))\n"
+	"syms = [J] * 16\n"
+	"for pid, addr, ep, data_pid, payload, handshake in TRAFFIC:\n"
+	"    syms += token(pid, addr, ep)\n"
+	"    syms += data(data_pid, payload, handshake == 'NAK')\n"
+	"    syms += packet(handshake)\n"
+	"result = ''.join(map(str, syms))\n";
+
+#define USB_SAMPLES_PER_BIT 4
+
+/*
+ * The packets, the requests which they make up, and the CRC16 error of
+ * the first bulk OUT data packet with the bad CRC16.
+ */
+static const char usb_expected[] =
+	"usb_packet: SETUP ADDR 3 EP 0\n"
+	"usb_packet: DATA0 [ 80 06 00 01 00 00 12 00 ]\n"
+	"usb_packet: ACK\n"
+	"usb_packet: IN ADDR 3 EP 0\n"
+	"usb_packet: DATA1 [ 12 01 00 02 00 00 00 40 ]\n"
+	"usb_packet: ACK\n"
+	"usb_packet: IN ADDR 3 EP 0\n"
+	"usb_packet: DATA0 [ FF FF FF FF FF FF FF FF ]\n"
+	"usb_packet: ACK\n"
+	"usb_packet: IN ADDR 3 EP 0\n"
+	"usb_packet: DATA1 [ 01 01 ]\n"
+	"usb_packet: ACK\n"
+	"usb_packet: OUT ADDR 3 EP 0\n"
+	"usb_packet: DATA1 [ ]\n"
+	"usb_request: SETUP in: [ 80 06 00 01 00 00 12 00 ][ 12 01 00 02 "
+	"00 00 00 40 FF FF FF FF FF FF FF FF 01 01 ] : ACK\n"
+	"usb_packet: ACK\n"
+	"usb_packet: OUT ADDR 3 EP 2\n"
+	"usb_packet: DATA0 [ DE AD BE EF ]\n"
+	"usb_request: BULK out: [ DE AD BE EF ] : ACK\n"
+	"usb_packet: ACK\n"
+	"usb_packet: OUT ADDR 3 EP 2\n"
+	"usb_packet: CRC16 ERROR: 0x6141\n"
+	"usb_packet: DATA1 [ 55 AA ]\n"
+	"usb_packet: NAK\n"
+	"usb_packet: OUT ADDR 3 EP 2\n"
+	"usb_packet: DATA1 [ 55 AA ]\n"
+	"usb_request: BULK out: [ 55 AA ] : ACK\n"
+	"usb_packet: ACK\n";
+
+/* Collect the errors, and the packets and requests. */
+static void usb_ann_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_proto_data_annotation *pda;
+	const char *id;
+
+	pda = pdata->data;
+	id = pdata->pdo->di->decoder->id;
+	if ((!strcmp(id, "usb_signalling") && pda->ann_class == 8) ||
+			(!strcmp(id, "usb_packet") && (pda->ann_class == 1 ||
+			pda->ann_class == 7 || pda->ann_class >= 10)) ||
+			!strcmp(id, "usb_request"))
+		g_string_append_printf(cb_data, "%s: %s\n", id,
+			pda->ann_text[0]);
+}
+
+/*
+ * Check whether the USB decoders decode packets, their CRCs, and the
+ * requests which they make up.
+ * If the annotations differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_pd_usb)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *di, *prev_di;
+	GHashTable *options;
+	GString *anns;
+	const char *ids[] = { "usb_signalling", "usb_packet", "usb_request" };
+	char *syms;
+	uint8_t *buf;
+	size_t i, len;
+
+	srd_init(DECODERS_TESTDIR);
+	syms = srdtest_python_run(usb_traffic, "result");
+	fail_unless(syms != NULL, "Cannot encode the traffic.");
+	len = strlen(syms) * USB_SAMPLES_PER_BIT;
+	buf = g_malloc(len);
+	for (i = 0; i < len; i++)
+		buf[i] = syms[i / USB_SAMPLES_PER_BIT] - '0';
+
+	srd_session_new(&sess);
+	options = g_hash_table_new(g_str_hash, g_str_equal);
+	prev_di = NULL;
+	for (i = 0; i < G_N_ELEMENTS(ids); i++) {
+		srd_decoder_load(ids[i]);
+		di = srd_inst_new(sess, ids[i], options);
+		if (prev_di)
+			srd_inst_stack(sess, prev_di, di);
+		prev_di = di;
+	}
+	g_hash_table_destroy(options);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(USB_SAMPLES_PER_BIT * 12000000));
+	anns = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, usb_ann_cb, anns);
+	srd_session_start(sess);
+	srd_session_send(sess, 0, len, buf, len, 1);
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+	fail_unless(!strcmp(anns->str, usb_expected),
+		"Got:\n%s\nexpected:\n%s", anns->str, usb_expected);
+
+	g_string_free(anns, TRUE);
+	g_free(buf);
+	g_free(syms);
+	srd_exit();
+}
+END_TEST
+
+Suite *suite_pd(void)
+{
+	Suite *s;
+	TCase *tc;
+
+	s = suite_create("pd");
+
+	tc = tcase_create("common");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_pd_crc);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("can");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_pd_can_fd);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("usb");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_pd_usb);
+	suite_add_tcase(s, tc);
+
+	return s;
+}
@@ -20,8 +20,11 @@
 #include <config.h>
 #include <libsigrokdecode-internal.h> /* First, to avoid compiler warning. */
 #include <libsigrokdecode.h>
+#include <glib/gstdio.h>
 #include <stdint.h>
 #include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
 #include <check.h>
 #include "lib.h"
 
@@ -260,6 +263,1693 @@ START_TEST(test_session_reset_nodata)
 }
 END_TEST
 
+/*
+ * Check whether srd_session_send_rle() fails with invalid input.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_send_rle_bogus)
+{
+	struct srd_session *sess;
+	uint64_t lengths[] = { 10, 0 };
+	uint8_t values[] = { 0x01, 0x00 };
+	int ret;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	srd_inst_new(sess, "uart", NULL);
+
+	ret = srd_session_send_rle(NULL, 0, lengths, values, 1, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_rle(NULL) worked.");
+	ret = srd_session_send_rle(sess, 0, NULL, values, 1, 1);
+	fail_unless(ret != SRD_OK, "NULL run lengths worked.");
+	ret = srd_session_send_rle(sess, 0, lengths, NULL, 1, 1);
+	fail_unless(ret != SRD_OK, "NULL run values worked.");
+	ret = srd_session_send_rle(sess, 0, lengths, values, 0, 1);
+	fail_unless(ret != SRD_OK, "Zero runs worked.");
+	ret = srd_session_send_rle(sess, 0, lengths, values, 1, 0);
+	fail_unless(ret != SRD_OK, "Unitsize 0 worked.");
+	ret = srd_session_send_rle(sess, 0, lengths, values, 2, 1);
+	fail_unless(ret != SRD_OK, "Empty run worked.");
+	ret = srd_session_send_rle(sess, 5, lengths, values, 1, 1);
+	fail_unless(ret != SRD_OK, "Gap in sample numbers worked.");
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_session_send_file() fails with invalid input.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_send_file_bogus)
+{
+	struct srd_session *sess;
+	char *name;
+	int fd, ret;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	srd_inst_new(sess, "uart", NULL);
+	fd = g_file_open_tmp("srd-test-XXXXXX", &name, NULL);
+	fail_unless(fd >= 0, "Cannot create temporary file.");
+	fail_unless(write(fd, "\x01\x01\x01\x01", 4) == 4,
+		"Cannot write temporary file.");
+
+	ret = srd_session_send_file(NULL, fd, 0, 0, 4, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_file(NULL) worked.");
+	ret = srd_session_send_file(sess, -1, 0, 0, 4, 1);
+	fail_unless(ret != SRD_OK, "Invalid file descriptor worked.");
+	ret = srd_session_send_file(sess, fd, 0, 0, 0, 1);
+	fail_unless(ret != SRD_OK, "Zero samples worked.");
+	ret = srd_session_send_file(sess, fd, 0, 0, 4, 0);
+	fail_unless(ret != SRD_OK, "Unitsize 0 worked.");
+	ret = srd_session_send_file(sess, fd, 0, 0, 5, 1);
+	fail_unless(ret != SRD_OK, "Samples beyond the end of file worked.");
+	ret = srd_session_send_file(sess, fd, 2, 0, 3, 1);
+	fail_unless(ret != SRD_OK, "Offset beyond the end of file worked.");
+
+	close(fd);
+	g_remove(name);
+	g_free(name);
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+static void count_ann_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	(void)pdata;
+
+	g_atomic_int_inc((int *)cb_data);
+}
+
+static void count_ann_batch_cb(const struct srd_proto_data_annotation_batch *batch,
+		void *cb_data)
+{
+	uint64_t i;
+
+	for (i = 0; i < batch->num_records; i++) {
+		if (batch->records[i].text_idx >= batch->num_texts ||
+				!batch->ann_texts[batch->records[i].text_idx][0])
+			return;
+		g_atomic_int_inc((int *)cb_data);
+	}
+}
+
+enum {
+	INPUT_PLAIN,
+	INPUT_RLE,
+	INPUT_FILE,
+};
+
+/*
+ * Have 'num_stacks' independent UART instances decode the byte 0x55
+ * at 1kbps, return the total annotation count. The samples are sent
+ * in the way that 'input' selects, annotations are received one by one
+ * or in batches.
+ */
+static int uart_ann_count(int input, gboolean parallel, int num_stacks,
+		gboolean batch)
+{
+	struct srd_session *sess;
+	GHashTable *options;
+	uint64_t lengths[12];
+	uint8_t values[12], *samples;
+	char *name;
+	int i, n, fd, count;
+
+	srd_session_new(&sess);
+	srd_session_parallel_set(sess, parallel);
+	for (i = 0; i < num_stacks; i++) {
+		/* srd_inst_new() consumes the options it handles. */
+		options = g_hash_table_new_full(g_str_hash, g_str_equal,
+				g_free, (GDestroyNotify)g_variant_unref);
+		g_hash_table_insert(options, g_strdup("baudrate"),
+				g_variant_ref_sink(g_variant_new_int64(1000)));
+		srd_inst_new(sess, "uart", options);
+		g_hash_table_destroy(options);
+	}
+	count = 0;
+	if (batch)
+		srd_pd_annotation_batch_callback_add(sess, count_ann_batch_cb, &count);
+	else
+		srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_ann_cb, &count);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(1000000));
+	srd_session_start(sess);
+
+	/* Idle, start bit, 8 data bits (LSB first), stop bit, idle. */
+	lengths[0] = 5000;
+	values[0] = 1;
+	for (i = 0; i < 10; i++) {
+		lengths[i + 1] = 1000;
+		values[i + 1] = (i == 0) ? 0 : (i == 9) ? 1 : (i & 1);
+	}
+	lengths[11] = 5000;
+	values[11] = 1;
+
+	if (input == INPUT_RLE) {
+		srd_session_send_rle(sess, 0, lengths, values, 12, 1);
+	} else {
+		samples = g_malloc(20000);
+		for (i = 0, n = 0; i < 12; i++) {
+			memset(samples + n, values[i], lengths[i]);
+			n += lengths[i];
+		}
+		if (input == INPUT_FILE) {
+			/* Put a header in front, the samples are not page aligned. */
+			fd = g_file_open_tmp("srd-test-XXXXXX", &name, NULL);
+			if (write(fd, "header", 6) == 6 &&
+					write(fd, samples, n) == n)
+				srd_session_send_file(sess, fd, 6, 0, n, 1);
+			close(fd);
+			g_remove(name);
+			g_free(name);
+		} else {
+			srd_session_send(sess, 0, n, samples, n, 1);
+		}
+		g_free(samples);
+	}
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+
+	return count;
+}
+
+/*
+ * Check whether run-length encoded input decodes like plain input.
+ * If the annotation counts differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_send_rle)
+{
+	int plain, rle;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	plain = uart_ann_count(INPUT_PLAIN, FALSE, 1, FALSE);
+	rle = uart_ann_count(INPUT_RLE, FALSE, 1, FALSE);
+	fail_unless(plain > 0, "No annotations for plain input.");
+	fail_unless(plain == rle, "Plain input got %d annotations, "
+		"run-length encoded input got %d.", plain, rle);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether sample input from a file decodes like plain input.
+ * If the annotation counts differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_send_file)
+{
+	int plain, file;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	plain = uart_ann_count(INPUT_PLAIN, FALSE, 1, FALSE);
+	file = uart_ann_count(INPUT_FILE, FALSE, 1, FALSE);
+	fail_unless(plain > 0, "No annotations for plain input.");
+	fail_unless(plain == file, "Plain input got %d annotations, "
+		"file input got %d.", plain, file);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_pd_annotation_batch_callback_add() fails with
+ * invalid input.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_ann_batch_bogus)
+{
+	struct srd_session *sess;
+	int ret, count;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_session_new(&sess);
+	ret = srd_pd_annotation_batch_callback_add(NULL, count_ann_batch_cb, &count);
+	fail_unless(ret != SRD_OK, "NULL session worked.");
+	ret = srd_pd_annotation_batch_callback_add(sess, NULL, &count);
+	fail_unless(ret != SRD_OK, "NULL callback worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether annotation batches hold all annotations.
+ * If the annotation counts differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_ann_batch)
+{
+	int single, batch;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	single = uart_ann_count(INPUT_PLAIN, FALSE, 1, FALSE);
+	batch = uart_ann_count(INPUT_PLAIN, FALSE, 1, TRUE);
+	fail_unless(single > 0, "No annotations for plain input.");
+	fail_unless(batch == single, "Batches held %d annotations, "
+		"expected %d.", batch, single);
+	batch = uart_ann_count(INPUT_RLE, TRUE, 3, TRUE);
+	fail_unless(batch == 3 * single, "Batches of parallel stacks held "
+		"%d annotations, expected %d.", batch, 3 * single);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * A protocol decoder which puts malformed annotations, and records in
+ * RESULTS whether put() raised exceptions for them.
+ */
+static const char bad_ann_decoder[] =
+	"import sigrokdecode as srd\n"
+	"RESULTS = []\n"
+	"BAD = ('text', [0], [0, 'text'], [0, [1]], [5, ['x']],\n"
+	"    [0, lambda: 'x'], [0, ['{}'], 7], [0, ['{x}'], {}])\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Util']\n"
+	"    channels = ({'id': 'data', 'name': 'DATA', 'desc': 'Data'},)\n"
+	"    annotations = (('text', 'Text'),)\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def start(self):\n"
+	"        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	"    def decode(self):\n"
+	"        self.wait()\n"
+	"        for ann in BAD:\n"
+	"            try:\n"
+	"                self.put(0, 0, self.out_ann, ann)\n"
+	"                RESULTS.append('accepted')\n"
+	"            except Exception as e:\n"
+	"                RESULTS.append(type(e).__name__)\n"
+	"        self.put(0, 0, self.out_ann, [0, ['good']])\n"
+	"        RESULTS.append('good')\n"
+	"        while True:\n"
+	"            self.wait({'skip': 100})\n";
+
+/* Count the errors which the log reports for the 'badann' decoder. */
+static int bad_ann_log_cb(void *cb_data, int loglevel, const char *format,
+		va_list args)
+{
+	char *msg;
+
+	msg = g_strdup_vprintf(format, args);
+	if (loglevel == SRD_LOG_ERR && strstr(msg, "Protocol decoder badann"))
+		(*(int *)cb_data)++;
+	g_free(msg);
+
+	return SRD_OK;
+}
+
+/*
+ * Have the malformed annotation decoder run, with the annotations going
+ * to a regular callback and/or to a batch callback. Returns whether
+ * put() raised exceptions, and checks that each malformed annotation
+ * got logged once and dropped.
+ */
+static char *bad_ann_decoder_run(gboolean single, gboolean batch)
+{
+	struct srd_session *sess;
+	uint8_t samples[1000];
+	char *results;
+	int count, errors;
+
+	memset(samples, 0, sizeof(samples));
+	srd_session_new(&sess);
+	srd_inst_new(sess, "badann", NULL);
+	count = 0;
+	if (single)
+		srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_ann_cb, &count);
+	if (batch)
+		srd_pd_annotation_batch_callback_add(sess, count_ann_batch_cb, &count);
+	srd_session_start(sess);
+	errors = 0;
+	srd_log_loglevel_set(SRD_LOG_ERR);
+	srd_log_callback_set(bad_ann_log_cb, &errors);
+	srd_session_send(sess, 0, sizeof(samples), samples, sizeof(samples), 1);
+	srd_log_callback_set_default();
+	srd_log_loglevel_set(SRD_LOG_NONE);
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+	fail_unless(count == (single ? 1 : 0) + (batch ? 1 : 0),
+		"Got %d annotations.", count);
+	fail_unless(errors == 8, "Got %d errors for 8 malformed "
+		"annotations.", errors);
+
+	results = srdtest_python_run("import badann\n"
+		"results = ' '.join(badann.RESULTS)\n"
+		"badann.RESULTS.clear()\n", "results");
+	fail_unless(results != NULL, "Cannot get the results.");
+
+	return results;
+}
+
+/*
+ * Check whether put() logs and drops malformed annotations, without
+ * raising exceptions, no matter whether they go to a regular callback
+ * or to a batch callback.
+ * If put() raises, a callback gets one, or they don't get logged (or it
+ * segfaults) this test will fail.
+ */
+START_TEST(test_session_ann_malformed)
+{
+	const char *expected = "accepted accepted accepted accepted "
+		"accepted accepted accepted accepted good";
+	gboolean single[] = { TRUE, FALSE, TRUE };
+	gboolean batch[] = { FALSE, TRUE, TRUE };
+	char *tmp_dir, *results;
+	unsigned int i;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	srdtest_decoder_write(tmp_dir, "badann", bad_ann_decoder);
+	srd_init(tmp_dir);
+	srd_decoder_load("badann");
+
+	for (i = 0; i < G_N_ELEMENTS(single); i++) {
+		results = bad_ann_decoder_run(single[i], batch[i]);
+		fail_unless(!strcmp(results, expected), "put() raised %s, "
+			"expected %s (callback %d, batch callback %d).",
+			results, expected, single[i], batch[i]);
+		g_free(results);
+	}
+
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+END_TEST
+
+/*
+ * Check whether srd_session_parallel_set() fails with invalid input.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_parallel_set_bogus)
+{
+	int ret;
+
+	ret = srd_session_parallel_set(NULL, TRUE);
+	fail_unless(ret != SRD_OK, "srd_session_parallel_set(NULL) worked.");
+}
+END_TEST
+
+/*
+ * Check whether parallel decoding of several stacks yields the same
+ * output as decoding them one after another.
+ * If the annotation counts differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_send_parallel)
+{
+	int single, serial, parallel;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	single = uart_ann_count(INPUT_PLAIN, FALSE, 1, FALSE);
+	serial = uart_ann_count(INPUT_PLAIN, FALSE, 3, FALSE);
+	parallel = uart_ann_count(INPUT_PLAIN, TRUE, 3, FALSE);
+	fail_unless(serial == 3 * single, "Three stacks got %d annotations, "
+		"expected %d.", serial, 3 * single);
+	fail_unless(parallel == serial, "Parallel stacks got %d annotations, "
+		"serial stacks got %d.", parallel, serial);
+	parallel = uart_ann_count(INPUT_RLE, TRUE, 3, FALSE);
+	fail_unless(parallel == serial, "Parallel run-length encoded input "
+		"got %d annotations, expected %d.", parallel, serial);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * A protocol decoder with a generator decode(), whose instances meet
+ * at a barrier before they annotate. This only works for instances
+ * which run concurrently.
+ */
+static const char rendezvous_decoder[] =
+	"import sigrokdecode as srd\n"
+	"import threading\n"
+	"barrier = threading.Barrier(2, timeout=5)\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Util']\n"
+	"    channels = ({'id': 'data', 'name': 'DATA', 'desc': 'Data'},)\n"
+	"    annotations = (('met', 'Met'),)\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def start(self):\n"
+	"        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	"    def decode(self):\n"
+	"        try:\n"
+	"            while True:\n"
+	"                yield {0: 'e'}\n"
+	"                barrier.wait()\n"
+	"                self.put(self.samplenum, self.samplenum, self.out_ann,\n"
+	"                    [0, ['met']])\n"
+	"        except (EOFError, threading.BrokenBarrierError):\n"
+	"            pass\n";
+
+/*
+ * Check whether parallel decoding runs stacks with a generator decode()
+ * concurrently.
+ * If the instances don't meet at each edge (or it segfaults) this test
+ * will fail.
+ */
+START_TEST(test_session_send_parallel_generator)
+{
+	struct srd_session *sess;
+	uint8_t samples[8] = { 0, 1, 1, 0, 0, 0, 1, 1 };
+	char *tmp_dir;
+	int i, count;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	srdtest_decoder_write(tmp_dir, "rendezvous", rendezvous_decoder);
+	srd_init(tmp_dir);
+	srd_decoder_load("rendezvous");
+
+	srd_session_new(&sess);
+	srd_session_parallel_set(sess, TRUE);
+	srd_inst_new(sess, "rendezvous", NULL);
+	srd_inst_new(sess, "rendezvous", NULL);
+	count = 0;
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_ann_cb, &count);
+	srd_session_start(sess);
+	/* Edges at samples 1, 3 and 6, in two chunks. */
+	for (i = 0; i < 8; i += 4)
+		srd_session_send(sess, i, i + 4, samples + i, 4, 1);
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+	fail_unless(count == 6, "Got %d annotations, expected 6.", count);
+
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+END_TEST
+
+/*
+ * A protocol decoder which uses all variants of wait(). Its decode()
+ * is a generator when "$Y" becomes "yield " and "$W" becomes "", and
+ * blocks in the calls when "$Y" becomes "" and "$W" becomes "self.wait".
+ */
+static const char wait_decoder[] =
+	"import sigrokdecode as srd\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Util']\n"
+	"    channels = ({'id': 'clk', 'name': 'CLK', 'desc': 'Clock'},\n"
+	"        {'id': 'data', 'name': 'DATA', 'desc': 'Data'})\n"
+	"    annotations = (('result', 'Result'),)\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def start(self):\n"
+	"        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	"    def putr(self, *args):\n"
+	"        self.put(self.samplenum, self.samplenum, self.out_ann,\n"
+	"            [0, [repr(args)]])\n"
+	"    def decode(self):\n"
+	"        try:\n"
+	"            pins = $Y self.wait()\n"
+	"            self.putr('first', pins)\n"
+	"            while True:\n"
+	"                pins = $Y $W({0: 'r'})\n"
+	"                self.putr('edge', pins, self.matched)\n"
+	"                pins = $Y self.wait([{1: 'e'}, {'skip': 5}])\n"
+	"                self.putr('data', pins, self.matched)\n"
+	"                n, words, nums = $Y self.shift_in(0, 'f', (1,), 4,\n"
+	"                    samplenums=True)\n"
+	"                self.putr('shift', n, words, list(nums), self.matched)\n"
+	"                s, p, m = $Y self.wait_many({0: 'e'}, 3)\n"
+	"                self.putr('many', list(s), list(p), list(m))\n"
+	"                pins = $Y self.sample_at((self.samplenum + 3,\n"
+	"                    self.samplenum + 17))\n"
+	"                self.putr('at', pins)\n"
+	"        except EOFError:\n"
+	"            self.putr('eof')\n";
+
+/* Write the wait() decoder as module 'name' into 'dir'. */
+static void wait_decoder_write(const char *dir, const char *name,
+		gboolean generator)
+{
+	char *tmp, *code;
+
+	tmp = srdtest_str_replace(wait_decoder, "$Y", generator ? "yield " : "");
+	code = srdtest_str_replace(tmp, "$W", generator ? "" : "self.wait");
+	srdtest_decoder_write(dir, name, code);
+	g_free(code);
+	g_free(tmp);
+}
+
+/*
+ * Have decoder 'id' decode a clock and a data signal, which are sent
+ * in chunks of 'chunk' samples. With 'reset' set, the session gets
+ * reset halfway and all samples are sent again. With 'isolated' set,
+ * the session has an interpreter of its own. A 'buffer_size' other
+ * than 0 buffers the input. Returns the text of the annotations.
+ */
+static char *wait_decoder_run(const char *id, uint64_t chunk, gboolean reset,
+		gboolean isolated, uint64_t buffer_size)
+{
+	struct srd_session *sess;
+	GString *text;
+	uint8_t samples[3000];
+	uint64_t i, start, len;
+	int pass;
+
+	for (i = 0; i < sizeof(samples); i++) {
+		samples[i] = (i / 3) & 1;
+		if ((i * 7919) % 23 < 11)
+			samples[i] |= 2;
+	}
+
+	srd_session_new(&sess);
+	srd_session_isolated_set(sess, isolated);
+	srd_session_stream_set(sess, buffer_size, 0);
+	srd_inst_new(sess, id, NULL);
+	text = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_text_ann_cb, text);
+	srd_session_start(sess);
+	for (pass = reset ? 0 : 1; pass < 2; pass++) {
+		for (start = 0; start < sizeof(samples); start += len) {
+			len = MIN(chunk, sizeof(samples) - start);
+			if (pass == 0 && start >= sizeof(samples) / 2)
+				break;
+			srd_session_send(sess, start, start + len,
+				samples + start, len, 1);
+		}
+		if (pass == 0) {
+			srd_session_terminate_reset(sess);
+			g_string_truncate(text, 0);
+			srd_session_start(sess);
+		}
+	}
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+
+	return g_string_free(text, FALSE);
+}
+
+/*
+ * Check whether decode() methods which are generators get the same
+ * results from wait() and its variants as decode() methods which block
+ * in these calls, regardless of how the samples are split into chunks,
+ * and whether they get EOF and restart after a reset.
+ * If the annotations differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_send_generator)
+{
+	char *tmp_dir, *blocking, *text;
+	uint64_t chunks[] = { 3000, 1, 7, 1024 };
+	unsigned int i;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	wait_decoder_write(tmp_dir, "gendec", TRUE);
+	wait_decoder_write(tmp_dir, "blockdec", FALSE);
+	srd_init(tmp_dir);
+	srd_decoder_load("gendec");
+	srd_decoder_load("blockdec");
+
+	/* wait_many() returns fewer matches at the end of a chunk. */
+	for (i = 0; i < G_N_ELEMENTS(chunks); i++) {
+		blocking = wait_decoder_run("blockdec", chunks[i], FALSE, FALSE, 0);
+		fail_unless(strstr(blocking, "'shift'") &&
+			strstr(blocking, "'at'") &&
+			g_str_has_suffix(blocking, "('eof',)\n"),
+			"Unexpected annotations:\n%s", blocking);
+		text = wait_decoder_run("gendec", chunks[i], FALSE, FALSE, 0);
+		fail_unless(!strcmp(text, blocking), "Generator got "
+			"(%" PRIu64 " samples per chunk):\n%s\nexpected:\n%s",
+			chunks[i], text, blocking);
+		g_free(text);
+		text = wait_decoder_run("gendec", chunks[i], TRUE, FALSE, 0);
+		fail_unless(!strcmp(text, blocking), "Generator got after "
+			"reset:\n%s\nexpected:\n%s", text, blocking);
+		g_free(text);
+		g_free(blocking);
+	}
+
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+END_TEST
+
+/*
+ * A protocol decoder with a generator decode(), whose start() fails.
+ */
+static const char start_fail_decoder[] =
+	"import sigrokdecode as srd\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Util']\n"
+	"    channels = ({'id': 'data', 'name': 'DATA', 'desc': 'Data'},)\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def start(self):\n"
+	"        raise ValueError('start() failed')\n"
+	"    def decode(self):\n"
+	"        while True:\n"
+	"            yield self.wait({0: 'e'})\n";
+
+/*
+ * Check whether sending samples to an instance with a generator decode()
+ * whose start() failed doesn't crash.
+ * If srd_session_start() works (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_send_generator_start_fail)
+{
+	struct srd_session *sess;
+	uint8_t samples[4] = { 0, 1, 0, 1 };
+	char *tmp_dir;
+	int ret;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	srdtest_decoder_write(tmp_dir, "failstart", start_fail_decoder);
+	srd_init(tmp_dir);
+	srd_decoder_load("failstart");
+
+	srd_session_new(&sess);
+	srd_inst_new(sess, "failstart", NULL);
+	ret = srd_session_start(sess);
+	fail_unless(ret != SRD_OK, "srd_session_start() worked.");
+	srd_session_send(sess, 0, sizeof(samples), samples, sizeof(samples), 1);
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+END_TEST
+
+/*
+ * A protocol decoder with a generator decode(), which calls wait() and
+ * its variants while an operation is pending, and yields a stale one.
+ */
+static const char pending_decoder[] =
+	"import sigrokdecode as srd\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Util']\n"
+	"    channels = ({'id': 'data', 'name': 'DATA', 'desc': 'Data'},)\n"
+	"    annotations = (('result', 'Result'),)\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def start(self):\n"
+	"        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	"    def putr(self, text):\n"
+	"        self.put(self.samplenum, self.samplenum, self.out_ann,\n"
+	"            [0, [text]])\n"
+	"    def decode(self):\n"
+	"        fall = self.wait({0: 'f'})\n"
+	"        calls = (('wait', lambda: self.wait({0: 'r'})),\n"
+	"            ('wait_many', lambda: self.wait_many({0: 'r'}, 2)),\n"
+	"            ('sample_at', lambda: self.sample_at((3,))),\n"
+	"            ('shift_in', lambda: self.shift_in(0, 'r', (0,), 1)))\n"
+	"        for name, call in calls:\n"
+	"            try:\n"
+	"                call()\n"
+	"            except RuntimeError:\n"
+	"                self.putr(name)\n"
+	"        try:\n"
+	"            yield {0: 'r'}\n"
+	"        except RuntimeError:\n"
+	"            self.putr('yield')\n"
+	"        yield fall\n"
+	"        self.putr('fall')\n"
+	"        try:\n"
+	"            yield fall\n"
+	"        except RuntimeError:\n"
+	"            self.putr('stale')\n"
+	"        try:\n"
+	"            yield {'skip': 100}\n"
+	"        except EOFError:\n"
+	"            pass\n";
+
+/*
+ * Check whether a generator decode() gets RuntimeError when it starts
+ * a wait operation before it yielded the pending one, and when it
+ * yields an operation which is not pending, and whether the pending
+ * operation is kept.
+ * If the annotations differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_send_generator_pending)
+{
+	struct srd_session *sess;
+	uint8_t samples[4] = { 0, 1, 0, 1 };
+	GString *text;
+	char *tmp_dir;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	srdtest_decoder_write(tmp_dir, "pendingdec", pending_decoder);
+	srd_init(tmp_dir);
+	srd_decoder_load("pendingdec");
+
+	srd_session_new(&sess);
+	srd_inst_new(sess, "pendingdec", NULL);
+	text = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_text_ann_cb, text);
+	srd_session_start(sess);
+	srd_session_send(sess, 0, sizeof(samples), samples, sizeof(samples), 1);
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+	fail_unless(!strcmp(text->str, "0 wait\n0 wait_many\n0 sample_at\n"
+		"0 shift_in\n0 yield\n2 fall\n2 stale\n"),
+		"Unexpected annotations:\n%s", text->str);
+	g_string_free(text, TRUE);
+
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+END_TEST
+
+/*
+ * A protocol decoder which numbers its instances in a module variable,
+ * and puts the number of every instance as an annotation.
+ */
+static const char count_decoder[] =
+	"import sigrokdecode as srd\n"
+	"instances = 0\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Util']\n"
+	"    channels = ({'id': 'data', 'name': 'DATA', 'desc': 'Data'},)\n"
+	"    annotations = (('number', 'Number'),)\n"
+	"    def __init__(self):\n"
+	"        global instances\n"
+	"        instances += 1\n"
+	"        self.number = instances\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def start(self):\n"
+	"        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	"    def decode(self):\n"
+	"        self.wait({'skip': 1})\n"
+	"        self.put(0, 0, self.out_ann, [0, [str(self.number)]])\n"
+	"        while True:\n"
+	"            self.wait({0: 'e'})\n";
+
+/*
+ * Have two instances of the counting decoder decode a few samples,
+ * return the text of their annotations.
+ */
+static char *count_decoder_run(gboolean isolated)
+{
+	struct srd_session *sess;
+	GString *text;
+	uint8_t samples[4] = { 0, 1, 0, 1 };
+
+	srd_session_new(&sess);
+	srd_session_isolated_set(sess, isolated);
+	srd_inst_new(sess, "countdec", NULL);
+	srd_inst_new(sess, "countdec", NULL);
+	text = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_text_ann_cb, text);
+	srd_session_start(sess);
+	srd_session_send(sess, 0, sizeof(samples), samples, sizeof(samples), 1);
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+
+	return g_string_free(text, FALSE);
+}
+
+/*
+ * Check whether srd_session_isolated_set() fails with invalid input,
+ * and in sessions which have decoder instances.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_isolated_set_bogus)
+{
+	struct srd_session *sess;
+	int ret;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	ret = srd_session_isolated_set(NULL, TRUE);
+	fail_unless(ret != SRD_OK, "srd_session_isolated_set(NULL) worked.");
+	srd_session_new(&sess);
+	srd_inst_new(sess, "uart", NULL);
+	ret = srd_session_isolated_set(sess, TRUE);
+	fail_unless(ret != SRD_OK, "Isolating a session with instances worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether isolated sessions import decoder modules of their own.
+ * If the instances of an isolated session see the module of another
+ * session (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_isolated)
+{
+	struct srd_session *sess;
+	char *tmp_dir, *text;
+	int ret;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	srdtest_decoder_write(tmp_dir, "countdec", count_decoder);
+	srd_init(tmp_dir);
+	srd_decoder_load("countdec");
+
+	/* Isolation can be switched on and off again. */
+	srd_session_new(&sess);
+	ret = srd_session_isolated_set(sess, TRUE);
+	fail_unless(ret == SRD_OK, "Cannot isolate a session.");
+	ret = srd_session_isolated_set(sess, FALSE);
+	fail_unless(ret == SRD_OK, "Cannot end the isolation of a session.");
+	srd_session_destroy(sess);
+
+	text = count_decoder_run(FALSE);
+	fail_unless(!strcmp(text, "0 1\n0 2\n"), "Shared session got:\n%s", text);
+	g_free(text);
+	text = count_decoder_run(TRUE);
+	fail_unless(!strcmp(text, "0 1\n0 2\n"), "Isolated session got:\n%s", text);
+	g_free(text);
+	text = count_decoder_run(FALSE);
+	fail_unless(!strcmp(text, "0 3\n0 4\n"), "Shared session got:\n%s", text);
+	g_free(text);
+
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+END_TEST
+
+struct wait_decoder_thread {
+	const char *id;
+	gboolean isolated;
+	char *text;
+};
+
+static gpointer wait_decoder_thread_run(gpointer data)
+{
+	struct wait_decoder_thread *t;
+	char *text;
+	int i;
+
+	t = data;
+	for (i = 0; i < 3; i++) {
+		text = wait_decoder_run(t->id, 256, i == 1, t->isolated, 0);
+		if (i == 0)
+			t->text = text;
+		else if (strcmp(text, t->text))
+			return text;
+		else
+			g_free(text);
+	}
+
+	return NULL;
+}
+
+/*
+ * Check whether isolated sessions decode in several threads at the same
+ * time, next to a shared session, and get the same results as a shared
+ * session on its own. Both decoders which block in wait() and generator
+ * decoders are used.
+ * If the annotations differ (or it segfaults, or hangs) this test will fail.
+ */
+START_TEST(test_session_send_isolated)
+{
+	struct wait_decoder_thread threads[5];
+	GThread *handles[G_N_ELEMENTS(threads)];
+	char *tmp_dir, *expected[2], *text;
+	unsigned int i;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	wait_decoder_write(tmp_dir, "gendec", TRUE);
+	wait_decoder_write(tmp_dir, "blockdec", FALSE);
+	srd_init(tmp_dir);
+	srd_decoder_load("gendec");
+	srd_decoder_load("blockdec");
+
+	expected[0] = wait_decoder_run("gendec", 256, FALSE, FALSE, 0);
+	expected[1] = wait_decoder_run("blockdec", 256, FALSE, FALSE, 0);
+	for (i = 0; i < G_N_ELEMENTS(threads); i++) {
+		threads[i].id = (i & 1) ? "blockdec" : "gendec";
+		threads[i].isolated = i > 0;
+		threads[i].text = NULL;
+		handles[i] = g_thread_new("decode", wait_decoder_thread_run,
+			&threads[i]);
+	}
+	for (i = 0; i < G_N_ELEMENTS(threads); i++) {
+		text = g_thread_join(handles[i]);
+		fail_unless(!text, "Thread %u got different results in "
+			"a later run:\n%s", i, text);
+		fail_unless(!strcmp(threads[i].text, expected[i & 1]),
+			"Thread %u got:\n%s\nexpected:\n%s", i,
+			threads[i].text, expected[i & 1]);
+		g_free(threads[i].text);
+	}
+	g_free(expected[0]);
+	g_free(expected[1]);
+
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+END_TEST
+
+/*
+ * Check whether srd_session_stream_set() and its companions fail with
+ * invalid input.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_stream_bogus)
+{
+	struct srd_session *sess;
+	struct srd_session_stream_stats stats;
+	int ret;
+
+	srd_init(DECODERS_TESTDIR);
+	ret = srd_session_stream_set(NULL, 4096, 1024);
+	fail_unless(ret != SRD_OK, "srd_session_stream_set(NULL) worked.");
+	ret = srd_session_backpressure_callback_set(NULL, NULL, NULL);
+	fail_unless(ret != SRD_OK, "srd_session_backpressure_callback_set(NULL) worked.");
+	srd_session_new(&sess);
+	ret = srd_session_stream_set(sess, 1024, 4096);
+	fail_unless(ret != SRD_OK, "High-water mark beyond the buffer worked.");
+	ret = srd_session_stream_stats_get(sess, &stats);
+	fail_unless(ret != SRD_OK, "Stats of unbuffered input worked.");
+	ret = srd_session_stream_set(sess, 4096, 1024);
+	fail_unless(ret == SRD_OK, "Cannot buffer the input.");
+	ret = srd_session_stream_stats_get(sess, NULL);
+	fail_unless(ret != SRD_OK, "srd_session_stream_stats_get(NULL) worked.");
+	ret = srd_session_send(sess, 0, 1, NULL, 1, 1);
+	fail_unless(ret != SRD_OK, "Buffering a NULL chunk worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether buffered input decodes like unbuffered input, with
+ * chunks which wrap around the end of the buffer, chunks which exceed
+ * the whole buffer, and resets which drop buffered chunks. Both
+ * decoders which block in wait() and generator decoders are used.
+ * If the annotations differ (or it segfaults, or hangs) this test will fail.
+ */
+START_TEST(test_session_stream)
+{
+	char *tmp_dir, *expected, *text;
+	const char *ids[] = { "gendec", "blockdec" };
+	uint64_t chunks[] = { 1, 7, 100, 3000 };
+	uint64_t sizes[] = { 200, 1000 };
+	unsigned int i, j, k;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	wait_decoder_write(tmp_dir, "gendec", TRUE);
+	wait_decoder_write(tmp_dir, "blockdec", FALSE);
+	srd_init(tmp_dir);
+	srd_decoder_load("gendec");
+	srd_decoder_load("blockdec");
+
+	for (i = 0; i < G_N_ELEMENTS(ids); i++) {
+		for (j = 0; j < G_N_ELEMENTS(chunks); j++) {
+			expected = wait_decoder_run(ids[i], chunks[j], FALSE,
+				FALSE, 0);
+			for (k = 0; k < G_N_ELEMENTS(sizes); k++) {
+				text = wait_decoder_run(ids[i], chunks[j],
+					j & 1, FALSE, sizes[k]);
+				fail_unless(!strcmp(text, expected),
+					"%s with chunk size %" PRIu64 " and "
+					"buffer size %" PRIu64 " got:\n%s\n"
+					"expected:\n%s", ids[i], chunks[j],
+					sizes[k], text, expected);
+				g_free(text);
+			}
+			g_free(expected);
+		}
+	}
+
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+END_TEST
+
+static void backpressure_cb(struct srd_session *sess, gboolean congested,
+		uint64_t queued_bytes, void *cb_data)
+{
+	(void)sess;
+
+	g_string_append_printf(cb_data, "%d %" PRIu64 "\n", congested,
+		queued_bytes);
+}
+
+/*
+ * Check whether buffered input tells the frontend about congestion,
+ * and keeps its statistics. Run-length encoded input is used.
+ * If the callback or the statistics are off (or it segfaults) this
+ * test will fail.
+ */
+START_TEST(test_session_stream_backpressure)
+{
+	struct srd_session *sess;
+	struct srd_session_stream_stats stats;
+	GHashTable *options;
+	GString *events;
+	uint64_t lengths[12];
+	uint8_t values[12];
+	int i, count;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	options = g_hash_table_new_full(g_str_hash, g_str_equal,
+			g_free, (GDestroyNotify)g_variant_unref);
+	g_hash_table_insert(options, g_strdup("baudrate"),
+			g_variant_ref_sink(g_variant_new_int64(1000)));
+	srd_inst_new(sess, "uart", options);
+	g_hash_table_destroy(options);
+	count = 0;
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_ann_cb, &count);
+	events = g_string_new(NULL);
+	srd_session_backpressure_callback_set(sess, backpressure_cb, events);
+	srd_session_stream_set(sess, 1024, 100);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(1000000));
+	srd_session_start(sess);
+
+	/* The byte 0x55 at 1kbps, see uart_ann_count(). */
+	lengths[0] = lengths[11] = 5000;
+	values[0] = values[11] = 1;
+	for (i = 0; i < 10; i++) {
+		lengths[i + 1] = 1000;
+		values[i + 1] = (i == 0) ? 0 : (i == 9) ? 1 : (i & 1);
+	}
+
+	/* The chunk takes 12 * 8 + 12 bytes, past the high-water mark. */
+	srd_session_send_rle(sess, 0, lengths, values, 12, 1);
+	srd_session_send_eof(sess);
+	fail_unless(!strcmp(events->str, "1 108\n0 0\n"),
+		"Got backpressure events:\n%s", events->str);
+	fail_unless(count == uart_ann_count(INPUT_RLE, FALSE, 1, FALSE),
+		"Buffered input got %d annotations.", count);
+
+	srd_session_stream_stats_get(sess, &stats);
+	fail_unless(stats.chunks == 1 && stats.bytes == 108,
+		"Got %" PRIu64 " chunks, %" PRIu64 " bytes.", stats.chunks,
+		stats.bytes);
+	fail_unless(stats.queued_bytes == 0 && stats.max_queued_bytes == 108,
+		"Got %" PRIu64 " queued bytes, %" PRIu64 " at most.",
+		stats.queued_bytes, stats.max_queued_bytes);
+	fail_unless(stats.congestions == 1 && stats.stalls == 0,
+		"Got %" PRIu64 " congestions, %" PRIu64 " stalls.",
+		stats.congestions, stats.stalls);
+	fail_unless(stats.latency_avg == stats.latency_max,
+		"Got average latency %" PRIu64 ", max %" PRIu64 ".",
+		stats.latency_avg, stats.latency_max);
+
+	srd_session_destroy(sess);
+	g_string_free(events, TRUE);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_session_resume() and its companions fail with
+ * invalid input, and without checkpoints.
+ * If they return SRD_OK (or segfault) this test will fail.
+ */
+START_TEST(test_session_resume_bogus)
+{
+	struct srd_session *sess;
+	uint64_t samplenum;
+	int ret;
+
+	srd_init(DECODERS_TESTDIR);
+	ret = srd_session_checkpoint_interval_set(NULL, 1000);
+	fail_unless(ret != SRD_OK, "srd_session_checkpoint_interval_set(NULL) worked.");
+	ret = srd_session_checkpoint_callback_set(NULL, NULL, NULL);
+	fail_unless(ret != SRD_OK, "srd_session_checkpoint_callback_set(NULL) worked.");
+	ret = srd_session_resume(NULL, 0, &samplenum);
+	fail_unless(ret != SRD_OK, "srd_session_resume(NULL) worked.");
+	srd_session_new(&sess);
+	ret = srd_session_resume(sess, 0, NULL);
+	fail_unless(ret != SRD_OK, "Resuming without a sample number worked.");
+	ret = srd_session_resume(sess, 0, &samplenum);
+	fail_unless(ret != SRD_OK, "Resuming without checkpoints worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+static void checkpoint_cb(struct srd_decoder_inst *di, uint64_t samplenum,
+		void *cb_data)
+{
+	(void)di;
+
+	g_string_append_printf(cb_data, "checkpoint %" PRIu64 "\n", samplenum);
+}
+
+/*
+ * Send samples [start, end) in chunks of 'chunk' samples. Chunks start
+ * at multiples of 'chunk', like in the initial run.
+ */
+static void send_chunks(struct srd_session *sess, const uint8_t *samples,
+		uint64_t start, uint64_t end, uint64_t chunk)
+{
+	uint64_t len;
+
+	for (; start < end; start += len) {
+		len = MIN(chunk - start % chunk, end - start);
+		srd_session_send(sess, start, start + len, samples + start,
+			len, 1);
+	}
+}
+
+/*
+ * Check whether decoding which resumes from a checkpoint repeats the
+ * output which followed the checkpoint. A UART decodes three bytes, and
+ * resumes within the second one after EOF. The samples get sent again
+ * from the resume point on, or from the start, which the UART has to
+ * skip up to its checkpoint.
+ * If the annotations differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_resume)
+{
+	struct srd_session *sess;
+	GHashTable *options;
+	GString *text;
+	uint8_t bytes[] = { 0x55, 0x41, 0x7e };
+	uint8_t samples[50000];
+	uint64_t chunks[] = { 1000, 4321, 50000 };
+	uint64_t n, samplenum;
+	char *full, *marker, *pos;
+	unsigned int i, j;
+	int ret;
+
+	/* Idle, start bit, 8 data bits (LSB first), stop bit, per byte. */
+	n = 0;
+	for (i = 0; i < G_N_ELEMENTS(bytes); i++) {
+		memset(samples + n, 1, 5000);
+		n += 5000;
+		for (j = 0; j < 10; j++) {
+			memset(samples + n, j == 0 ? 0 : j == 9 ? 1 :
+				(bytes[i] >> (j - 1)) & 1, 1000);
+			n += 1000;
+		}
+	}
+	memset(samples + n, 1, sizeof(samples) - n);
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	for (i = 0; i < G_N_ELEMENTS(chunks); i++) {
+		srd_session_new(&sess);
+		options = g_hash_table_new_full(g_str_hash, g_str_equal,
+				g_free, (GDestroyNotify)g_variant_unref);
+		g_hash_table_insert(options, g_strdup("baudrate"),
+				g_variant_ref_sink(g_variant_new_int64(1000)));
+		srd_inst_new(sess, "uart", options);
+		g_hash_table_destroy(options);
+		text = g_string_new(NULL);
+		srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_text_ann_cb, text);
+		srd_session_checkpoint_callback_set(sess, checkpoint_cb, text);
+		srd_session_checkpoint_interval_set(sess, 1000);
+		srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+				g_variant_new_uint64(1000000));
+		srd_session_start(sess);
+		send_chunks(sess, samples, 0, sizeof(samples), chunks[i]);
+		srd_session_send_eof(sess);
+		full = g_strdup(text->str);
+
+		ret = srd_session_resume(sess, 27500, &samplenum);
+		fail_unless(ret == SRD_OK, "Cannot resume.");
+		fail_unless(samplenum > 0 && samplenum <= 27500,
+			"Resumed at sample %" PRIu64 ".", samplenum);
+		marker = g_strdup_printf("checkpoint %" PRIu64 "\n", samplenum);
+		pos = strstr(full, marker);
+		fail_unless(pos != NULL, "No checkpoint at sample %" PRIu64
+			" in:\n%s", samplenum, full);
+
+		g_string_truncate(text, 0);
+		send_chunks(sess, samples, (i & 1) ? 0 : samplenum,
+			sizeof(samples), chunks[i]);
+		srd_session_send_eof(sess);
+		fail_unless(!strcmp(text->str, pos + strlen(marker)),
+			"Chunk size %" PRIu64 ", resumed at sample %" PRIu64
+			" got:\n%s\nexpected:\n%s", chunks[i], samplenum,
+			text->str, pos + strlen(marker));
+
+		g_free(marker);
+		g_free(full);
+		g_string_free(text, TRUE);
+		srd_session_destroy(sess);
+	}
+	srd_exit();
+}
+END_TEST
+
+/*
+ * A protocol decoder which annotates whether its decode() resumes, and
+ * takes a checkpoint on every rising edge.
+ */
+static const char resumed_decoder[] =
+	"import sigrokdecode as srd\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Util']\n"
+	"    channels = ({'id': 'data', 'name': 'DATA', 'desc': 'Data'},)\n"
+	"    annotations = (('state', 'State'),)\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def start(self):\n"
+	"        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	"    def decode(self):\n"
+	"        self.put(self.samplenum, self.samplenum, self.out_ann,\n"
+	"            [0, ['resumed' if self.resumed else 'started']])\n"
+	"        while True:\n"
+	"            self.wait({0: 'r'})\n"
+	"            self.checkpoint()\n";
+
+/*
+ * Check whether self.resumed tells decode() that it resumes from a
+ * checkpoint, also from the one at the start of the input, and whether
+ * a reset clears it.
+ * If the annotations differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_resumed)
+{
+	struct srd_session *sess;
+	uint8_t samples[8] = { 0, 1, 0, 1, 0, 1, 0, 0 };
+	uint64_t samplenum;
+	GString *text;
+	char *tmp_dir;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	srdtest_decoder_write(tmp_dir, "resumeddec", resumed_decoder);
+	srd_init(tmp_dir);
+	srd_decoder_load("resumeddec");
+
+	srd_session_new(&sess);
+	srd_inst_new(sess, "resumeddec", NULL);
+	text = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_text_ann_cb, text);
+	srd_session_checkpoint_interval_set(sess, 1);
+	srd_session_start(sess);
+	srd_session_send(sess, 0, sizeof(samples), samples, sizeof(samples), 1);
+	srd_session_send_eof(sess);
+
+	srd_session_resume(sess, 0, &samplenum);
+	fail_unless(samplenum == 0, "Resumed at sample %" PRIu64 ".",
+		samplenum);
+	srd_session_send(sess, 0, sizeof(samples), samples, sizeof(samples), 1);
+	srd_session_send_eof(sess);
+	srd_session_resume(sess, 4, &samplenum);
+	fail_unless(samplenum == 3, "Resumed at sample %" PRIu64 ".",
+		samplenum);
+	srd_session_send(sess, 3, sizeof(samples), samples + 3,
+		sizeof(samples) - 3, 1);
+	srd_session_send_eof(sess);
+
+	srd_session_terminate_reset(sess);
+	srd_session_start(sess);
+	srd_session_send(sess, 0, sizeof(samples), samples, sizeof(samples), 1);
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+	fail_unless(!strcmp(text->str, "0 started\n0 resumed\n3 resumed\n"
+		"0 started\n"), "Unexpected annotations:\n%s", text->str);
+	g_string_free(text, TRUE);
+
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+END_TEST
+
+/*
+ * A protocol decoder which puts Python output on every edge, and one
+ * which annotates it, with an offset added to the edge count.
+ */
+static const char record_src_decoder[] =
+	"import sigrokdecode as srd\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = ['edges']\n"
+	"    tags = ['Util']\n"
+	"    channels = ({'id': 'data', 'name': 'DATA', 'desc': 'Data'},)\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def start(self):\n"
+	"        self.out_python = self.register(srd.OUTPUT_PYTHON)\n"
+	"    def decode(self):\n"
+	"        n = 0\n"
+	"        while True:\n"
+	"            pins = self.wait({0: 'e'})\n"
+	"            n += 1\n"
+	"            self.put(self.samplenum, self.samplenum + 1,\n"
+	"                self.out_python, {'n': n, 'pins': list(pins)})\n";
+
+static const char record_dst_decoder[] =
+	"import sigrokdecode as srd\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['edges']\n"
+	"    outputs = []\n"
+	"    tags = ['Util']\n"
+	"    options = ({'id': 'offset', 'desc': 'Offset', 'default': 0},\n"
+	"        {'id': 'fail_at', 'desc': 'Failing edge', 'default': 0})\n"
+	"    annotations = (('edge', 'Edge'),)\n"
+	"    samplerate = 0\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def metadata(self, key, value):\n"
+	"        self.samplerate = value\n"
+	"    def start(self):\n"
+	"        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	"    def decode(self, ss, es, data):\n"
+	"        if data['n'] == self.options['fail_at']:\n"
+	"            raise ValueError('failing edge')\n"
+	"        self.put(ss, es, self.out_ann, [0, ['%d %d %r' % (\n"
+	"            data['n'] + self.options['offset'], self.samplerate,\n"
+	"            data['pins'])]])\n";
+
+static GHashTable *offset_options(int64_t offset)
+{
+	GHashTable *options;
+
+	options = g_hash_table_new_full(g_str_hash, g_str_equal,
+			g_free, (GDestroyNotify)g_variant_unref);
+	g_hash_table_insert(options, g_strdup("offset"),
+			g_variant_ref_sink(g_variant_new_int64(offset)));
+
+	return options;
+}
+
+/*
+ * Set up a session with the edge decoder, and the annotating decoder
+ * with 'offset' stacked on top of it, and have it decode a few edges.
+ */
+static struct srd_session *record_session_run(int64_t offset,
+		gboolean record, struct srd_decoder_inst **dst, GString *text)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *src;
+	GHashTable *options;
+	uint8_t samples[1000];
+	uint64_t i;
+
+	for (i = 0; i < sizeof(samples); i++)
+		samples[i] = ((i * 7919) % 23) < 11;
+
+	srd_session_new(&sess);
+	srd_session_record_set(sess, record);
+	src = srd_inst_new(sess, "recsrc", NULL);
+	options = offset_options(offset);
+	*dst = srd_inst_new(sess, "recdst", options);
+	g_hash_table_destroy(options);
+	srd_inst_stack(sess, src, *dst);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(1000));
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_text_ann_cb, text);
+	srd_session_start(sess);
+	for (i = 0; i < sizeof(samples); i += 100)
+		srd_session_send(sess, i, i + 100, samples + i, 100, 1);
+	srd_session_send_eof(sess);
+
+	return sess;
+}
+
+/*
+ * Check whether srd_session_record_set() and srd_session_replay() fail
+ * with invalid input, for instances at the bottom of a stack, and in
+ * sessions which don't record.
+ * If they return SRD_OK (or segfault) this test will fail.
+ */
+START_TEST(test_session_replay_bogus)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *dst;
+	GString *text;
+	char *tmp_dir;
+	int ret;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	srdtest_decoder_write(tmp_dir, "recsrc", record_src_decoder);
+	srdtest_decoder_write(tmp_dir, "recdst", record_dst_decoder);
+	srd_init(tmp_dir);
+	srd_decoder_load("recsrc");
+	srd_decoder_load("recdst");
+
+	ret = srd_session_record_set(NULL, TRUE);
+	fail_unless(ret != SRD_OK, "srd_session_record_set(NULL) worked.");
+	ret = srd_session_replay(NULL, NULL);
+	fail_unless(ret != SRD_OK, "srd_session_replay(NULL) worked.");
+
+	text = g_string_new(NULL);
+	sess = record_session_run(0, FALSE, &dst, text);
+	ret = srd_session_replay(sess, NULL);
+	fail_unless(ret != SRD_OK, "Replaying no instance worked.");
+	ret = srd_session_replay(sess, sess->di_list->data);
+	fail_unless(ret != SRD_OK, "Replaying a bottom instance worked.");
+	ret = srd_session_replay(sess, dst);
+	fail_unless(ret != SRD_OK, "Replaying without a recording worked.");
+	srd_session_destroy(sess);
+	g_string_free(text, TRUE);
+
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+END_TEST
+
+/*
+ * Check whether stacked instances which get the recorded output of the
+ * instance below them annotate like they would have when decoding the
+ * samples: after an option changed, and when stacked after EOF. Replaying
+ * must stop at the first packet which decode() fails on.
+ * If the annotations differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_replay)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *dst, *dst2;
+	GHashTable *options;
+	GString *text;
+	char *tmp_dir, *expected;
+	gsize i, lines;
+	int ret;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	srdtest_decoder_write(tmp_dir, "recsrc", record_src_decoder);
+	srdtest_decoder_write(tmp_dir, "recdst", record_dst_decoder);
+	srd_init(tmp_dir);
+	srd_decoder_load("recsrc");
+	srd_decoder_load("recdst");
+
+	text = g_string_new(NULL);
+	sess = record_session_run(100, FALSE, &dst, text);
+	srd_session_destroy(sess);
+	expected = g_string_free(text, FALSE);
+	fail_unless(strstr(expected, "\n") != NULL, "No annotations.");
+
+	text = g_string_new(NULL);
+	sess = record_session_run(0, TRUE, &dst, text);
+	fail_unless(strcmp(text->str, expected) != 0, "The offset is ignored.");
+
+	/* Re-run the stacked instance with another option. */
+	g_string_truncate(text, 0);
+	options = offset_options(100);
+	srd_inst_option_set(dst, options);
+	g_hash_table_destroy(options);
+	ret = srd_session_replay(sess, dst);
+	fail_unless(ret == SRD_OK, "Cannot replay.");
+	fail_unless(!strcmp(text->str, expected),
+		"Replay got:\n%s\nexpected:\n%s", text->str, expected);
+
+	/* Stack another instance after EOF. */
+	g_string_truncate(text, 0);
+	options = offset_options(100);
+	dst2 = srd_inst_new(sess, "recdst", options);
+	g_hash_table_destroy(options);
+	srd_inst_stack(sess, sess->di_list->data, dst2);
+	ret = srd_session_replay(sess, dst2);
+	fail_unless(ret == SRD_OK, "Cannot replay to a new instance.");
+	fail_unless(!strcmp(text->str, expected),
+		"Replay to a new instance got:\n%s\nexpected:\n%s",
+		text->str, expected);
+
+	/* Replaying stops at the first packet which decode() fails on. */
+	g_string_truncate(text, 0);
+	options = offset_options(100);
+	g_hash_table_insert(options, g_strdup("fail_at"),
+			g_variant_ref_sink(g_variant_new_int64(3)));
+	srd_inst_option_set(dst, options);
+	g_hash_table_destroy(options);
+	ret = srd_session_replay(sess, dst);
+	fail_unless(ret == SRD_ERR_PYTHON, "Replaying a failing decode() "
+		"returned %d.", ret);
+	for (i = 0, lines = 0; i < text->len; i++)
+		lines += text->str[i] == '\n';
+	fail_unless(lines == 2 && !strncmp(text->str, expected, text->len),
+		"Replaying a failing decode() got:\n%s", text->str);
+
+	/* Without a recording there is nothing to replay. */
+	srd_session_record_set(sess, FALSE);
+	ret = srd_session_replay(sess, dst);
+	fail_unless(ret != SRD_OK, "Replaying a dropped recording worked.");
+
+	srd_session_destroy(sess);
+	g_string_free(text, TRUE);
+	g_free(expected);
+
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+END_TEST
+
+/*
+ * Check whether srd_session_stats_set() and the srd_inst_stats_*()
+ * functions fail with invalid input.
+ * If they return SRD_OK (or segfault) this test will fail.
+ */
+START_TEST(test_session_stats_bogus)
+{
+	int ret;
+
+	ret = srd_session_stats_set(NULL, TRUE);
+	fail_unless(ret != SRD_OK, "srd_session_stats_set(NULL) worked.");
+	fail_unless(srd_inst_stats_get(NULL) == NULL,
+		"srd_inst_stats_get(NULL) worked.");
+	ret = srd_inst_stats_reset(NULL);
+	fail_unless(ret != SRD_OK, "srd_inst_stats_reset(NULL) worked.");
+}
+END_TEST
+
+/*
+ * Check whether the performance counters of an instance count its
+ * work, only while the session collects them, and can be reset.
+ * If the counts are off (or it segfaults) this test will fail.
+ */
+START_TEST(test_session_stats)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *di;
+	struct srd_inst_stats *stats;
+	GHashTable *options;
+	uint64_t lengths[12], ann_puts, i;
+	uint8_t values[12];
+	int count;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	options = g_hash_table_new_full(g_str_hash, g_str_equal,
+			g_free, (GDestroyNotify)g_variant_unref);
+	g_hash_table_insert(options, g_strdup("baudrate"),
+			g_variant_ref_sink(g_variant_new_int64(1000)));
+	di = srd_inst_new(sess, "uart", options);
+	g_hash_table_destroy(options);
+	count = 0;
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, count_ann_cb, &count);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(1000000));
+	srd_session_start(sess);
+
+	/* Idle, start bit, 8 data bits (LSB first), stop bit, idle. */
+	lengths[0] = 5000;
+	values[0] = 1;
+	for (i = 0; i < 10; i++) {
+		lengths[i + 1] = 1000;
+		values[i + 1] = (i == 0) ? 0 : (i == 9) ? 1 : (i & 1);
+	}
+	lengths[11] = 5000;
+	values[11] = 1;
+
+	/* Nothing gets counted by default. */
+	srd_session_send_rle(sess, 0, lengths, values, 12, 1);
+	stats = srd_inst_stats_get(di);
+	fail_unless(stats != NULL, "No counters.");
+	fail_unless(count > 0, "No annotations.");
+	fail_unless(stats->wait_calls == 0 && stats->matches == 0 &&
+		stats->put_calls[SRD_OUTPUT_ANN] == 0,
+		"Counted without srd_session_stats_set().");
+	g_free(stats);
+
+	srd_session_stats_set(sess, TRUE);
+	count = 0;
+	srd_session_send_rle(sess, 20000, lengths, values, 12, 1);
+	stats = srd_inst_stats_get(di);
+	fail_unless(stats->wait_calls > 0, "No wait() calls counted.");
+	fail_unless(stats->matches > 0 && stats->matches <= stats->wait_calls,
+		"Counted %" PRIu64 " matches for %" PRIu64 " wait() calls.",
+		stats->matches, stats->wait_calls);
+	fail_unless(stats->samples_scanned > 0 &&
+		stats->samples_scanned <= 20000,
+		"Counted %" PRIu64 " scanned samples.", stats->samples_scanned);
+	fail_unless(stats->put_calls[SRD_OUTPUT_ANN] == (uint64_t)count,
+		"Counted %" PRIu64 " annotations, expected %d.",
+		stats->put_calls[SRD_OUTPUT_ANN], count);
+	fail_unless(stats->num_ann_classes ==
+		g_slist_length(di->decoder->annotations),
+		"Wrong number of annotation classes.");
+	ann_puts = 0;
+	for (i = 0; i < stats->num_ann_classes; i++)
+		ann_puts += stats->ann_put_calls[i];
+	fail_unless(ann_puts == (uint64_t)count, "Annotation classes got "
+		"%" PRIu64 " annotations, expected %d.", ann_puts, count);
+	g_free(stats);
+
+	fail_unless(srd_inst_stats_reset(di) == SRD_OK, "Reset failed.");
+	stats = srd_inst_stats_get(di);
+	fail_unless(stats->wait_calls == 0 && stats->samples_scanned == 0 &&
+		stats->put_calls[SRD_OUTPUT_ANN] == 0 &&
+		stats->ann_put_calls[0] == 0, "Counters not reset.");
+	g_free(stats);
+
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
 Suite *suite_session(void)
 {
 	Suite *s;
@@ -282,6 +1972,36 @@ Suite *suite_session(void)
 	tcase_add_test(tc, test_session_metadata_set_bogus);
 	suite_add_tcase(s, tc);
 
+	tc = tcase_create("send");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_send_rle_bogus);
+	tcase_add_test(tc, test_session_send_rle);
+	tcase_add_test(tc, test_session_send_file_bogus);
+	tcase_add_test(tc, test_session_send_file);
+	tcase_add_test(tc, test_session_ann_batch_bogus);
+	tcase_add_test(tc, test_session_ann_batch);
+	tcase_add_test(tc, test_session_ann_malformed);
+	tcase_add_test(tc, test_session_parallel_set_bogus);
+	tcase_add_test(tc, test_session_send_parallel);
+	tcase_add_test(tc, test_session_send_parallel_generator);
+	tcase_add_test(tc, test_session_send_generator);
+	tcase_add_test(tc, test_session_send_generator_start_fail);
+	tcase_add_test(tc, test_session_send_generator_pending);
+	tcase_add_test(tc, test_session_isolated_set_bogus);
+	tcase_add_test(tc, test_session_isolated);
+	tcase_add_test(tc, test_session_send_isolated);
+	tcase_add_test(tc, test_session_stream_bogus);
+	tcase_add_test(tc, test_session_stream);
+	tcase_add_test(tc, test_session_stream_backpressure);
+	tcase_add_test(tc, test_session_resume_bogus);
+	tcase_add_test(tc, test_session_resume);
+	tcase_add_test(tc, test_session_resumed);
+	tcase_add_test(tc, test_session_replay_bogus);
+	tcase_add_test(tc, test_session_replay);
+	tcase_add_test(tc, test_session_stats_bogus);
+	tcase_add_test(tc, test_session_stats);
+	suite_add_tcase(s, tc);
+
 	tc = tcase_create("reset");
 	tcase_add_test(tc, test_session_reset_nodata);
 	suite_add_tcase(s, tc);
@@ -0,0 +1,588 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <config.h>
+#include <libsigrokdecode-internal.h> /* First, to avoid compiler warning. */
+#include <libsigrokdecode.h>
+#include <inttypes.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <check.h>
+#include "lib.h"
+
+#define NUM_SAMPLES 6000
+
+/* How the samples get sent to the session. */
+enum {
+	INPUT_PLAIN,
+	INPUT_RLE,
+};
+
+/*
+ * A protocol decoder which waits for the conditions that its 'conds'
+ * option selects, and annotates the pins and matches of every match.
+ */
+static const char match_decoder[] =
+	"import sigrokdecode as srd\n"
+	"CONDS = {\n"
+	"    'edge': [{0: 'e'}],\n"
+	"    'level': [{0: 'r', 1: 'h'}, {1: 'f'}],\n"
+	"    'skip': [{'skip': 37}],\n"
+	"    'edge_skip': [{0: 'e'}, {'skip': 25}],\n"
+	"    'mixed': [{1: 'l', 'skip': 9}, {0: 'f'}],\n"
+	"}\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Util']\n"
+	"    channels = ({'id': 'clk', 'name': 'CLK', 'desc': 'Clock'},\n"
+	"        {'id': 'data', 'name': 'DATA', 'desc': 'Data'})\n"
+	"    options = ({'id': 'conds', 'desc': 'Conditions',\n"
+	"        'default': 'edge'},)\n"
+	"    annotations = (('match', 'Match'),)\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def start(self):\n"
+	"        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	"    def decode(self):\n"
+	"        conds = CONDS[self.options['conds']]\n"
+	"        while True:\n"
+	"            pins = self.wait(conds)\n"
+	"            self.put(self.samplenum, self.samplenum, self.out_ann,\n"
+	"                [0, ['%r %r' % (pins, self.matched)]])\n";
+
+/*
+ * A protocol decoder which runs the method of its 'mode' option. The
+ * modes come in pairs, the one uses a variant of wait(), the other
+ * gets the same annotations from plain wait() calls.
+ */
+static const char variant_decoder[] =
+	"import sigrokdecode as srd\n"
+	"CONDS = [{0: 'e'}, {1: 'r'}, {'skip': 50}]\n"
+	"def bits(value, n, kind):\n"
+	"    return tuple(kind(value >> i & 1) for i in range(n))\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = name = longname = desc = __name__\n"
+	"    license = 'gplv3+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Util']\n"
+	"    channels = ({'id': 'clk', 'name': 'CLK', 'desc': 'Clock'},\n"
+	"        {'id': 'data', 'name': 'DATA', 'desc': 'Data'})\n"
+	"    options = ({'id': 'mode', 'desc': 'Mode', 'default': 'wait'},)\n"
+	"    annotations = (('result', 'Result'),)\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"    def start(self):\n"
+	"        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	"    def putl(self, samplenum, *args):\n"
+	"        self.put(samplenum, samplenum, self.out_ann,\n"
+	"            [0, [' '.join(repr(arg) for arg in args)]])\n"
+	"    def decode(self):\n"
+	"        try:\n"
+	"            getattr(self, 'run_' + self.options['mode'])()\n"
+	"        except EOFError:\n"
+	"            self.putl(self.samplenum, 'eof')\n"
+	/* wait_many(): Matches of conditions, and of none. */
+	"    def run_wait(self):\n"
+	"        while True:\n"
+	"            pins = self.wait(CONDS)\n"
+	"            self.putl(self.samplenum, pins, self.matched)\n"
+	"    def run_wait_many(self):\n"
+	"        while True:\n"
+	"            s, p, m = self.wait_many(CONDS, 7)\n"
+	"            assert 0 < len(s) <= 7 and self.samplenum == s[-1]\n"
+	"            for i in range(len(s)):\n"
+	"                self.putl(s[i], bits(p[i], 2, int), bits(m[i], 3, bool))\n"
+	"    def run_wait_none(self):\n"
+	"        while True:\n"
+	"            pins = self.wait()\n"
+	"            self.putl(self.samplenum, pins)\n"
+	"    def run_wait_many_none(self):\n"
+	"        while True:\n"
+	"            s, p, m = self.wait_many(None, 1000)\n"
+	"            for i in range(len(s)):\n"
+	"                self.putl(s[i], bits(p[i], 2, int))\n"
+	/* compile_conditions(): The same matches as the conditions. */
+	"    def run_compiled(self):\n"
+	"        conds = self.compile_conditions(CONDS)\n"
+	"        while True:\n"
+	"            pins = self.wait(conds)\n"
+	"            self.putl(self.samplenum, pins, self.matched)\n"
+	"    def run_wait_many_compiled(self):\n"
+	"        conds = self.compile_conditions(CONDS)\n"
+	"        while True:\n"
+	"            s, p, m = self.wait_many(conds, 5)\n"
+	"            for i in range(len(s)):\n"
+	"                self.putl(s[i], bits(p[i], 2, int), bits(m[i], 3, bool))\n"
+	"    def run_compiled_none(self):\n"
+	"        conds = self.compile_conditions(None)\n"
+	"        while True:\n"
+	"            pins = self.wait(conds)\n"
+	"            self.putl(self.samplenum, pins)\n"
+	"    def run_skip(self):\n"
+	"        while True:\n"
+	"            n = 3 + self.samplenum % 50\n"
+	"            pins = self.wait([{0: 'f'}, {1: 'h', 'skip': n}])\n"
+	"            self.putl(self.samplenum, pins, self.matched)\n"
+	"    def run_skip_compiled(self):\n"
+	"        conds = self.compile_conditions([{0: 'f'}, {1: 'h', 'skip': 1}])\n"
+	"        while True:\n"
+	"            n = 3 + self.samplenum % 50\n"
+	"            pins = self.wait(conds, skip=n)\n"
+	"            self.putl(self.samplenum, pins, self.matched)\n"
+	/* sample_at(): The pins of a series of skips. */
+	"    def run_sample_at(self):\n"
+	"        self.putl(self.samplenum, 'at', self.sample_at((0,))[0])\n"
+	"        while True:\n"
+	"            pins = self.wait({0: 'r'})\n"
+	"            self.putl(self.samplenum, pins, self.matched)\n"
+	"            n = self.samplenum\n"
+	"            offsets = (3, 17, 17, 40)\n"
+	"            values = self.sample_at([n + i for i in offsets])\n"
+	"            for i, pins in zip(offsets, values):\n"
+	"                self.putl(n + i, 'at', pins)\n"
+	"    def run_skip_at(self):\n"
+	"        self.putl(self.samplenum, 'at', self.wait({'skip': 0}))\n"
+	"        while True:\n"
+	"            pins = self.wait({0: 'r'})\n"
+	"            self.putl(self.samplenum, pins, self.matched)\n"
+	"            n = self.samplenum\n"
+	"            offsets = (3, 17, 17, 40)\n"
+	"            values = []\n"
+	"            for i in offsets:\n"
+	"                if n + i > self.samplenum:\n"
+	"                    pins = self.wait({'skip': n + i - self.samplenum})\n"
+	"                values.append(pins)\n"
+	"            for i, pins in zip(offsets, values):\n"
+	"                self.putl(n + i, 'at', pins)\n"
+	/* shift_in(): The bits of a series of clock edges, up to a stop. */
+	"    def shift_in_run(self, stop):\n"
+	"        while True:\n"
+	"            n, words, nums = self.shift_in(0, 'r', (1,), 8, stop=stop,\n"
+	"                samplenums=True)\n"
+	"            self.putl(self.samplenum, n, words, list(nums), self.matched)\n"
+	"    def shift_wait_run(self, stop):\n"
+	"        while True:\n"
+	"            word, nums = 0, []\n"
+	"            for i in range(8):\n"
+	"                pins = self.wait([{0: 'r'}, stop])\n"
+	"                if self.matched[1]:\n"
+	"                    break\n"
+	"                word = word << 1 | pins[1]\n"
+	"                nums.append(self.samplenum)\n"
+	"            self.putl(self.samplenum, len(nums), (word,), nums, self.matched)\n"
+	"    def run_shift_in_edge(self):\n"
+	"        self.shift_in_run({1: 'f'})\n"
+	"    def run_shift_wait_edge(self):\n"
+	"        self.shift_wait_run({1: 'f'})\n"
+	"    def run_shift_in_skip(self):\n"
+	"        self.shift_in_run({'skip': 40})\n"
+	"    def run_shift_wait_skip(self):\n"
+	"        self.shift_wait_run({'skip': 40})\n";
+
+/* The CLK and DATA signals, one sample per byte in bits 0 and 1. */
+static uint8_t signals[NUM_SAMPLES];
+
+/* Runs of 1 to 200 samples, in which CLK, DATA, or both change. */
+static void signals_fill(void)
+{
+	uint32_t rnd;
+	uint64_t i, len;
+	uint8_t state;
+
+	rnd = 12345;
+	state = 0;
+	for (i = 0; i < NUM_SAMPLES; i += len) {
+		rnd = rnd * 1103515245 + 12345;
+		len = (rnd >> 16) & 1 ? 1 + (rnd >> 8) % 200 : 1 + (rnd >> 8) % 4;
+		len = MIN(len, NUM_SAMPLES - i);
+		memset(signals + i, state, len);
+		state ^= 1 + (rnd >> 24) % 3;
+	}
+}
+
+/* The bit of a sample with 'unitsize' bytes which carries CLK. */
+static int clk_bit(uint64_t unitsize)
+{
+	return 8 * unitsize - 5;
+}
+
+/* Put the CLK and DATA signals of 'state' into a sample, with noise. */
+static void sample_put(uint8_t *sample, uint64_t unitsize, uint8_t state,
+		uint32_t noise)
+{
+	uint64_t i;
+	int clk;
+
+	clk = clk_bit(unitsize);
+	for (i = 0; i < unitsize; i++)
+		sample[i] = (noise >> (8 * (i % 4))) & 0xff;
+	sample[0] &= ~0x02;
+	sample[0] |= (state & 2);
+	sample[clk / 8] &= ~(1 << (clk % 8));
+	sample[clk / 8] |= (state & 1) << (clk % 8);
+}
+
+/*
+ * Have decoder 'id' with 'option' set to 'value' decode the signals.
+ * The samples have 'unitsize' bytes, and are sent in chunks of 'chunk'
+ * samples, or as runs of equal samples. Unless 'initial_pins' is NULL
+ * it holds the initial pin values. Returns the text of the annotations.
+ */
+static char *decoder_run(const char *id, const char *option,
+		const char *value, GArray *initial_pins, int input,
+		uint64_t unitsize, uint64_t chunk)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *di;
+	GHashTable *options, *channels;
+	GString *text;
+	uint8_t *samples, *values;
+	uint64_t *lengths, i, start, len, num_runs;
+	uint32_t noise;
+
+	srd_session_new(&sess);
+	options = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)g_variant_unref);
+	g_hash_table_insert(options, g_strdup(option),
+			g_variant_ref_sink(g_variant_new_string(value)));
+	di = srd_inst_new(sess, id, options);
+	g_hash_table_destroy(options);
+	fail_unless(di != NULL, "Cannot create the instance.");
+	channels = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)g_variant_unref);
+	g_hash_table_insert(channels, g_strdup("clk"),
+			g_variant_ref_sink(g_variant_new_int32(clk_bit(unitsize))));
+	g_hash_table_insert(channels, g_strdup("data"),
+			g_variant_ref_sink(g_variant_new_int32(1)));
+	fail_unless(srd_inst_channel_set_all(di, channels) == SRD_OK,
+			"Cannot map the channels.");
+	g_hash_table_destroy(channels);
+	if (initial_pins)
+		srd_inst_initial_pins_set_all(di, initial_pins);
+	text = g_string_new(NULL);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_text_ann_cb, text);
+	srd_session_start(sess);
+
+	if (input == INPUT_RLE) {
+		lengths = g_malloc(NUM_SAMPLES * sizeof(uint64_t));
+		values = g_malloc(NUM_SAMPLES * unitsize);
+		num_runs = 0;
+		for (i = 0; i < NUM_SAMPLES; i += len) {
+			for (len = 1; i + len < NUM_SAMPLES; len++)
+				if (signals[i + len] != signals[i])
+					break;
+			lengths[num_runs] = len;
+			sample_put(values + num_runs * unitsize, unitsize,
+				signals[i], 0);
+			num_runs++;
+		}
+		srd_session_send_rle(sess, 0, lengths, values, num_runs,
+			unitsize);
+		g_free(values);
+		g_free(lengths);
+	} else {
+		samples = g_malloc(NUM_SAMPLES * unitsize);
+		noise = 1;
+		for (i = 0; i < NUM_SAMPLES; i++) {
+			noise = noise * 1664525 + 1013904223;
+			sample_put(samples + i * unitsize, unitsize, signals[i],
+				noise);
+		}
+		for (start = 0; start < NUM_SAMPLES; start += len) {
+			len = MIN(chunk, NUM_SAMPLES - start);
+			srd_session_send(sess, start, start + len,
+				samples + start * unitsize, len * unitsize,
+				unitsize);
+		}
+		g_free(samples);
+	}
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+
+	return g_string_free(text, FALSE);
+}
+
+/* Initialize the library with the decoder 'code' as module 'name'. */
+static char *decoder_init(const char *name, const char *code)
+{
+	char *tmp_dir;
+
+	tmp_dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(tmp_dir != NULL, "Cannot create a directory.");
+	srdtest_decoder_write(tmp_dir, name, code);
+	srd_init(tmp_dir);
+	fail_unless(srd_decoder_load(name) == SRD_OK, "Cannot load %s.", name);
+
+	return tmp_dir;
+}
+
+static void decoder_exit(char *tmp_dir)
+{
+	srd_exit();
+	srdtest_dir_remove(tmp_dir);
+	g_free(tmp_dir);
+}
+
+/*
+ * Check whether edge, skip and mixed conditions match at the same
+ * samples when the samples are skipped in bulk, regardless of the
+ * unitsize, of noise in the unused channels, of the chunk boundaries,
+ * and of run-length encoding. One sample per chunk disables skipping,
+ * which makes for the reference.
+ * If the matches differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_wait_match)
+{
+	const char *conds[] = { "edge", "level", "skip", "edge_skip", "mixed" };
+	uint64_t unitsizes[] = { 1, 2, 4 };
+	uint64_t chunks[] = { 7, 64, 1000, NUM_SAMPLES };
+	char *tmp_dir, *ref, *text;
+	unsigned int i, j, k;
+
+	tmp_dir = decoder_init("matchdec", match_decoder);
+	signals_fill();
+
+	for (i = 0; i < G_N_ELEMENTS(conds); i++) {
+		ref = decoder_run("matchdec", "conds", conds[i], NULL,
+			INPUT_PLAIN, 1, 1);
+		fail_unless(strlen(ref) > 1000, "Few '%s' matches:\n%s",
+			conds[i], ref);
+		for (j = 0; j < G_N_ELEMENTS(unitsizes); j++) {
+			for (k = 0; k < G_N_ELEMENTS(chunks); k++) {
+				text = decoder_run("matchdec", "conds", conds[i],
+					NULL, INPUT_PLAIN, unitsizes[j], chunks[k]);
+				fail_unless(!strcmp(text, ref), "'%s' matches with "
+					"unitsize %" PRIu64 ", %" PRIu64 " samples "
+					"per chunk:\n%s\nexpected:\n%s", conds[i],
+					unitsizes[j], chunks[k], text, ref);
+				g_free(text);
+			}
+			text = decoder_run("matchdec", "conds", conds[i],
+				NULL, INPUT_RLE, unitsizes[j], 0);
+			fail_unless(!strcmp(text, ref), "'%s' matches with unitsize "
+				"%" PRIu64 ", run-length encoded:\n%s\nexpected:\n%s",
+				conds[i], unitsizes[j], text, ref);
+			g_free(text);
+		}
+		g_free(ref);
+	}
+
+	decoder_exit(tmp_dir);
+}
+END_TEST
+
+/*
+ * Check whether edges which are a chunk boundary apart, or right at
+ * one, are found at their sample numbers.
+ * If an edge is missed or misplaced (or it segfaults) this test will fail.
+ */
+START_TEST(test_wait_match_edges)
+{
+	uint64_t unitsizes[] = { 1, 2, 4 };
+	uint64_t chunks[] = { 5, 10, 64, NUM_SAMPLES };
+	char *tmp_dir, *text, **lines;
+	uint64_t i, j, k, samplenum;
+
+	tmp_dir = decoder_init("matchdec", match_decoder);
+	for (i = 0; i < NUM_SAMPLES; i++)
+		signals[i] = (i / 10) & 1;
+
+	for (i = 0; i < G_N_ELEMENTS(unitsizes); i++) {
+		for (j = 0; j < G_N_ELEMENTS(chunks); j++) {
+			text = decoder_run("matchdec", "conds", "edge", NULL,
+				INPUT_PLAIN, unitsizes[i], chunks[j]);
+			lines = g_strsplit(text, "\n", -1);
+			for (k = 0; k < NUM_SAMPLES / 10 - 1; k++) {
+				samplenum = 0;
+				if (lines[k])
+					sscanf(lines[k], "%" SCNu64, &samplenum);
+				fail_unless(samplenum == 10 * (k + 1), "Edge %"
+					PRIu64 " at sample %" PRIu64 " with unitsize %"
+					PRIu64 ", %" PRIu64 " samples per chunk:\n%s",
+					k, samplenum, unitsizes[i], chunks[j], text);
+			}
+			fail_unless(!lines[k] || !*lines[k], "Extra matches:\n%s",
+				text);
+			g_strfreev(lines);
+			g_free(text);
+		}
+	}
+
+	decoder_exit(tmp_dir);
+}
+END_TEST
+
+/*
+ * Have the variant decoder decode the signals in 'fast' mode, and
+ * compare the annotations to the ones of its 'ref' mode, for several
+ * chunk sizes, unitsizes and for run-length encoded input. Unless
+ * 'initial_pins' is NULL it holds the initial pin values.
+ */
+static void variant_check(const char *fast, const char *ref,
+		GArray *initial_pins)
+{
+	uint64_t unitsizes[] = { 1, 2 };
+	uint64_t chunks[] = { 1, 7, 64, 1000, NUM_SAMPLES };
+	char *expected, *text;
+	unsigned int i, j;
+
+	expected = decoder_run("variantdec", "mode", ref, initial_pins,
+		INPUT_PLAIN, 1, NUM_SAMPLES);
+	fail_unless(strlen(expected) > 1000 &&
+		g_str_has_suffix(expected, " 'eof'\n"),
+		"Unexpected '%s' annotations:\n%s", ref, expected);
+	for (i = 0; i < G_N_ELEMENTS(unitsizes); i++) {
+		for (j = 0; j < G_N_ELEMENTS(chunks); j++) {
+			text = decoder_run("variantdec", "mode", fast,
+				initial_pins, INPUT_PLAIN, unitsizes[i], chunks[j]);
+			fail_unless(!strcmp(text, expected), "'%s' got with "
+				"unitsize %" PRIu64 ", %" PRIu64 " samples per "
+				"chunk:\n%s\nexpected:\n%s", fast, unitsizes[i],
+				chunks[j], text, expected);
+			g_free(text);
+		}
+		text = decoder_run("variantdec", "mode", fast, initial_pins,
+			INPUT_RLE, unitsizes[i], 0);
+		fail_unless(!strcmp(text, expected), "'%s' got with unitsize %"
+			PRIu64 ", run-length encoded:\n%s\nexpected:\n%s",
+			fast, unitsizes[i], text, expected);
+		g_free(text);
+	}
+	g_free(expected);
+}
+
+/*
+ * Check whether wait_many() returns the matches of a series of wait()
+ * calls, also when they span chunks, up to EOF.
+ * If the matches differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_wait_many)
+{
+	char *tmp_dir;
+
+	tmp_dir = decoder_init("variantdec", variant_decoder);
+	signals_fill();
+	variant_check("wait_many", "wait", NULL);
+	variant_check("wait_many_none", "wait_none", NULL);
+	decoder_exit(tmp_dir);
+}
+END_TEST
+
+/*
+ * Check whether compiled conditions match like the conditions they
+ * were compiled from, with wait() and wait_many(), and whether a skip
+ * count for a compiled 'skip' term counts like the term of a dict.
+ * If the matches differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_wait_compiled)
+{
+	char *tmp_dir;
+
+	tmp_dir = decoder_init("variantdec", variant_decoder);
+	signals_fill();
+	variant_check("compiled", "wait", NULL);
+	variant_check("wait_many_compiled", "wait", NULL);
+	variant_check("compiled_none", "wait_none", NULL);
+	variant_check("skip_compiled", "skip", NULL);
+	decoder_exit(tmp_dir);
+}
+END_TEST
+
+/*
+ * Check whether sample_at() gets the pins of a series of wait() calls
+ * which skip to the sample numbers, and whether edges are found after
+ * it like after these calls, also from sample 0 on, with and without
+ * initial pin values.
+ * If the pins or the matches differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_wait_sample_at)
+{
+	GArray *initial_pins;
+	char *tmp_dir;
+	uint8_t pin;
+	int i;
+
+	tmp_dir = decoder_init("variantdec", variant_decoder);
+	signals_fill();
+	variant_check("sample_at", "skip_at", NULL);
+
+	/* A rising CLK edge at sample 0, after an initial low. */
+	for (i = 0; i < NUM_SAMPLES; i++)
+		signals[i] ^= 1;
+	initial_pins = g_array_new(FALSE, TRUE, sizeof(uint8_t));
+	pin = 0;
+	g_array_append_val(initial_pins, pin);
+	pin = SRD_INITIAL_PIN_SAME_AS_SAMPLE0;
+	g_array_append_val(initial_pins, pin);
+	variant_check("sample_at", "skip_at", NULL);
+	variant_check("sample_at", "skip_at", initial_pins);
+	g_array_free(initial_pins, TRUE);
+
+	decoder_exit(tmp_dir);
+}
+END_TEST
+
+/*
+ * Check whether shift_in() captures the bits of a series of wait()
+ * calls for the clock edge or the stop condition, with an edge and with
+ * a 'skip' term as the stop condition, which counts anew for every bit.
+ * If the bits or the matches differ (or it segfaults) this test will fail.
+ */
+START_TEST(test_wait_shift_in)
+{
+	char *tmp_dir;
+
+	tmp_dir = decoder_init("variantdec", variant_decoder);
+	signals_fill();
+	variant_check("shift_in_edge", "shift_wait_edge", NULL);
+	variant_check("shift_in_skip", "shift_wait_skip", NULL);
+	decoder_exit(tmp_dir);
+}
+END_TEST
+
+Suite *suite_wait(void)
+{
+	Suite *s;
+	TCase *tc;
+
+	s = suite_create("wait");
+
+	tc = tcase_create("match");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_set_timeout(tc, 60);
+	tcase_add_test(tc, test_wait_match);
+	tcase_add_test(tc, test_wait_match_edges);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("variants");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_set_timeout(tc, 60);
+	tcase_add_test(tc, test_wait_many);
+	tcase_add_test(tc, test_wait_compiled);
+	tcase_add_test(tc, test_wait_sample_at);
+	tcase_add_test(tc, test_wait_shift_in);
+	suite_add_tcase(s, tc);
+
+	return s;
+}
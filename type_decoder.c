@@ -21,15 +21,27 @@
 #include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
 #include <inttypes.h>
-
-/** @cond PRIVATE */
-extern SRD_PRIV GSList *sessions;
-/** @endcond */
+#include <string.h>
+#include <structmember.h>
 
 typedef struct {
         PyObject_HEAD
+	/* Storage for .samplenum and .matched, updated by wait(). */
+	PyObject *samplenum;
+	PyObject *matched;
+	/* Storage for .resumed, see srd_inst_resume(). */
+	PyObject *resumed;
+	/* The decoder instance which owns this object, see srd_inst_new(). */
+	struct srd_decoder_inst *di;
 } srd_Decoder;
 
+/** @cond PRIVATE */
+
+/* module_sigrokdecode.c */
+extern SRD_PRIV PyObject *mod_sigrokdecode;
+
+/** @endcond */
+
 /* This is only used for nicer srd_dbg() output. */
 SRD_PRIV const char *output_type_name(unsigned int idx)
 {
@@ -53,31 +65,95 @@ static void release_annotation(struct srd_proto_data_annotation *pda)
 		g_strfreev(pda->ann_text);
 }
 
-static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
-		struct srd_proto_data *pdata)
+/*
+ * Render the texts of a lazy annotation, [class, [format, ...], args].
+ * Each format string gets str.format()'ed with args, a tuple of positional
+ * or a dict of keyword arguments.
+ * Returns a new reference to a list of strings, or NULL on error.
+ */
+static PyObject *render_annotation(struct srd_decoder_inst *di,
+		PyObject *py_fmts, PyObject *py_args)
 {
-	PyObject *py_tmp;
-	struct srd_pd_output *pdo;
-	struct srd_proto_data_annotation *pda;
-	int ann_class;
-	char **ann_text;
-	PyGILState_STATE gstate;
+	PyObject *py_texts, *py_posargs, *py_kwargs, *py_name, *py_format;
+	PyObject *py_text;
+	ssize_t i, num_fmts;
+
+	if (PyTuple_Check(py_args)) {
+		py_posargs = py_args;
+		py_kwargs = NULL;
+		Py_INCREF(py_posargs);
+	} else if (PyDict_Check(py_args)) {
+		py_posargs = PyTuple_New(0);
+		py_kwargs = py_args;
+	} else {
+		srd_err("Protocol decoder %s submitted annotation list, but third element was neither a tuple nor a dict.",
+				di->decoder->name);
+		return NULL;
+	}
+	py_name = PyUnicode_FromString("format");
+	if (!py_posargs || !py_name)
+		goto err;
+
+	num_fmts = PyList_Size(py_fmts);
+	if (!(py_texts = PyList_New(num_fmts)))
+		goto err;
+	for (i = 0; i < num_fmts; i++) {
+		py_format = PyObject_GetAttr(PyList_GetItem(py_fmts, i), py_name);
+		if (!py_format)
+			goto err_texts;
+		py_text = PyObject_Call(py_format, py_posargs, py_kwargs);
+		Py_DECREF(py_format);
+		if (!py_text)
+			goto err_texts;
+		PyList_SetItem(py_texts, i, py_text);
+	}
+	Py_DECREF(py_name);
+	Py_DECREF(py_posargs);
+
+	return py_texts;
+
+err_texts:
+	Py_DECREF(py_texts);
+err:
+	Py_XDECREF(py_name);
+	Py_XDECREF(py_posargs);
+	srd_exception_catch("Protocol decoder %s failed to format annotation",
+			di->decoder->name);
+
+	return NULL;
+}
 
-	gstate = PyGILState_Ensure();
+/*
+ * Check an annotation, return its class and its list of strings.
+ * Lazy annotations get their texts rendered here, the caller owns a
+ * reference to the returned list. Malformed annotations, and errors
+ * while rendering their texts, get logged. Both kinds of callbacks
+ * receive the same annotations this way.
+ * Must be called with the GIL held.
+ */
+static int check_annotation(struct srd_decoder_inst *di, PyObject *obj,
+		int *ann_class, PyObject **py_texts)
+{
+	PyObject *py_tmp;
+	ssize_t sz, i;
 
-	/* Should be a list of [annotation class, [string, ...]]. */
+	/*
+	 * Should be a list of [annotation class, [string, ...]],
+	 * [annotation class, [format, ...], args] or
+	 * [annotation class, callable].
+	 */
 	if (!PyList_Check(obj)) {
 		srd_err("Protocol decoder %s submitted an annotation that is not a list",
 				di->decoder->name);
-		goto err;
+		return SRD_ERR_PYTHON;
 	}
 
-	/* Should have 2 elements. */
-	if (PyList_Size(obj) != 2) {
-		ssize_t sz = PyList_Size(obj);
-		srd_err("Protocol decoder %s submitted annotation list with %zd elements instead of 2",
+	/* Should have 2 or 3 elements. */
+	sz = PyList_Size(obj);
+	if (sz != 2 && sz != 3) {
+		srd_err("Protocol decoder %s submitted annotation list with %zd elements instead of 2 or 3",
 				di->decoder->name, sz);
-		goto err;
+		return SRD_ERR_PYTHON;
 	}
 
 	/*
@@ -88,23 +164,66 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 	if (!PyLong_Check(py_tmp)) {
 		srd_err("Protocol decoder %s submitted annotation list, but first element was not an integer.",
 				di->decoder->name);
-		goto err;
+		return SRD_ERR_PYTHON;
 	}
-	ann_class = PyLong_AsLong(py_tmp);
-	if (!(pdo = g_slist_nth_data(di->decoder->annotations, ann_class))) {
+	*ann_class = PyLong_AsLong(py_tmp);
+	if (!g_slist_nth_data(di->decoder->annotations, *ann_class)) {
 		srd_err("Protocol decoder %s submitted data to unregistered annotation class %d.",
-				di->decoder->name, ann_class);
-		goto err;
+				di->decoder->name, *ann_class);
+		return SRD_ERR_PYTHON;
 	}
 
-	/* Second element must be a list. */
+	/* Second element must be a list, or a callable which returns one. */
 	py_tmp = PyList_GetItem(obj, 1);
+	if (sz == 2 && !PyList_Check(py_tmp) && PyCallable_Check(py_tmp)) {
+		py_tmp = PyObject_CallObject(py_tmp, NULL);
+		if (!py_tmp) {
+			srd_exception_catch("Protocol decoder %s failed to format annotation",
+					di->decoder->name);
+			return SRD_ERR_PYTHON;
+		}
+	} else {
+		Py_INCREF(py_tmp);
+	}
 	if (!PyList_Check(py_tmp)) {
 		srd_err("Protocol decoder %s submitted annotation list, but second element was not a list.",
 				di->decoder->name);
-		goto err;
+		Py_DECREF(py_tmp);
+		return SRD_ERR_PYTHON;
+	}
+	if (sz == 3) {
+		*py_texts = render_annotation(di, py_tmp,
+				PyList_GetItem(obj, 2));
+		Py_DECREF(py_tmp);
+		if (!*py_texts)
+			return SRD_ERR_PYTHON;
+	} else {
+		*py_texts = py_tmp;
+	}
+
+	/* The texts must be strings. */
+	for (i = 0; i < PyList_Size(*py_texts); i++) {
+		if (!PyUnicode_Check(PyList_GetItem(*py_texts, i))) {
+			srd_err("Protocol decoder %s submitted annotation list, but second element was malformed.",
+					di->decoder->name);
+			Py_CLEAR(*py_texts);
+			return SRD_ERR_PYTHON;
+		}
 	}
-	if (py_strseq_to_char(py_tmp, &ann_text) != SRD_OK) {
+
+	return SRD_OK;
+}
+
+static int convert_annotation(struct srd_decoder_inst *di, int ann_class,
+		PyObject *py_texts, struct srd_proto_data *pdata)
+{
+	struct srd_proto_data_annotation *pda;
+	char **ann_text;
+	PyGILState_STATE gstate;
+
+	gstate = srd_gil_ensure(NULL);
+
+	if (py_strseq_to_char(py_texts, &ann_text) != SRD_OK) {
 		srd_err("Protocol decoder %s submitted annotation list, but second element was malformed.",
 				di->decoder->name);
 		goto err;
@@ -114,16 +233,68 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 	pda->ann_class = ann_class;
 	pda->ann_text = ann_text;
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
 
+/*
+ * Check whether an annotation is of a class which the frontend disabled.
+ * Malformed annotations are left to the conversion, which reports them.
+ */
+static gboolean annotation_disabled(const struct srd_decoder_inst *di,
+		PyObject *obj)
+{
+	PyObject *py_tmp;
+
+	if (!di->ann_disabled)
+		return FALSE;
+	if (!PyList_Check(obj) || PyList_Size(obj) < 2)
+		return FALSE;
+	py_tmp = PyList_GetItem(obj, 0);
+	if (!PyLong_Check(py_tmp))
+		return FALSE;
+
+	return !srd_inst_ann_wanted(di, PyLong_AsLong(py_tmp));
+}
+
+/*
+ * Add an annotation to the batch of the instance's stack.
+ * Must be called with the GIL held.
+ *
+ * Returns TRUE when the batch is full and should get flushed.
+ */
+static gboolean batch_annotation(struct srd_decoder_inst *di, int ann_class,
+		PyObject *py_texts, const struct srd_proto_data *pdata)
+{
+	PyObject *py_item, *py_bytes;
+	struct srd_ann_batch *batch;
+	ssize_t i;
+
+	batch = srd_inst_ann_batch_get(di);
+	g_string_truncate(batch->texts, 0);
+	for (i = 0; i < PyList_Size(py_texts); i++) {
+		py_item = PyList_GetItem(py_texts, i);
+		if (!PyUnicode_Check(py_item) ||
+				!(py_bytes = PyUnicode_AsUTF8String(py_item))) {
+			srd_err("Protocol decoder %s submitted annotation list, but second element was malformed.",
+					di->decoder->name);
+			PyErr_Clear();
+			return FALSE;
+		}
+		g_string_append(batch->texts, PyBytes_AsString(py_bytes));
+		g_string_append_c(batch->texts, '\0');
+		Py_DECREF(py_bytes);
+	}
+
+	return srd_ann_batch_add(batch, pdata, ann_class);
+}
+
 static void release_logic(struct srd_proto_data_logic *pdl)
 {
 	if (!pdl)
@@ -141,7 +312,7 @@ static int convert_logic(struct srd_decoder_inst *di, PyObject *obj,
 	char *group_name, *buf;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	/* Should be a list of [logic group, bytes]. */
 	if (!PyList_Check(obj)) {
@@ -190,7 +361,7 @@ static int convert_logic(struct srd_decoder_inst *di, PyObject *obj,
 	if (PyBytes_AsStringAndSize(py_tmp, &buf, &size) == -1)
 		goto err;
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	pdl = pdata->data;
 	pdl->logic_group = logic_group;
@@ -202,7 +373,7 @@ static int convert_logic(struct srd_decoder_inst *di, PyObject *obj,
 	return SRD_OK;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -224,7 +395,7 @@ static int convert_binary(struct srd_decoder_inst *di, PyObject *obj,
 	char *class_name, *buf;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	/* Should be a list of [binary class, bytes]. */
 	if (!PyList_Check(obj)) {
@@ -273,7 +444,7 @@ static int convert_binary(struct srd_decoder_inst *di, PyObject *obj,
 	if (PyBytes_AsStringAndSize(py_tmp, &buf, &size) == -1)
 		goto err;
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	pdb = pdata->data;
 	pdb->bin_class = bin_class;
@@ -285,68 +456,28 @@ static int convert_binary(struct srd_decoder_inst *di, PyObject *obj,
 	return SRD_OK;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
 
-static inline struct srd_decoder_inst *srd_sess_inst_find_by_obj(
-	struct srd_session *sess, const GSList *stack, const PyObject *obj)
-{
-	const GSList *l;
-	struct srd_decoder_inst *tmp, *di;
-
-	if (!sess)
-		return NULL;
-
-	di = NULL;
-	for (l = stack ? stack : sess->di_list; di == NULL && l != NULL; l = l->next) {
-		tmp = l->data;
-		if (tmp->py_inst == obj)
-			di = tmp;
-		else if (tmp->next_di)
-			di = srd_sess_inst_find_by_obj(sess, tmp->next_di, obj);
-	}
-
-	return di;
-}
-
 /**
  * Find a decoder instance by its Python object.
  *
  * I.e. find that instance's instantiation of the sigrokdecode.Decoder class.
- * This will recurse to find the instance anywhere in the stack tree of all
- * sessions.
+ * The object keeps a reference to its instance, which srd_inst_new() sets
+ * up, so this does not depend on the number of sessions or the depth of
+ * the decoder stacks.
  *
- * @param stack Pointer to a GSList of struct srd_decoder_inst, indicating the
- *              stack to search. To start searching at the bottom level of
- *              decoder instances, pass NULL.
  * @param obj The Python class instantiation.
  *
  * @return Pointer to struct srd_decoder_inst, or NULL if not found.
  *
  * @since 0.1.0
  */
-static inline struct srd_decoder_inst *srd_inst_find_by_obj(
-		const GSList *stack, const PyObject *obj)
+static inline struct srd_decoder_inst *srd_inst_find_by_obj(PyObject *obj)
 {
-	struct srd_decoder_inst *di;
-	struct srd_session *sess;
-	GSList *l;
-
-	/* Performance shortcut: Handle the most common case first. */
-	sess = sessions->data;
-	di = sess->di_list->data;
-	if (di->py_inst == obj)
-		return di;
-
-	di = NULL;
-	for (l = sessions; di == NULL && l != NULL; l = l->next) {
-		sess = l->data;
-		di = srd_sess_inst_find_by_obj(sess, stack, obj);
-	}
-
-	return di;
+	return ((srd_Decoder *)obj)->di;
 }
 
 static int convert_meta(struct srd_proto_data *pdata, PyObject *obj)
@@ -355,7 +486,7 @@ static int convert_meta(struct srd_proto_data *pdata, PyObject *obj)
 	double dvalue;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (g_variant_type_equal(pdata->pdo->meta_type, G_VARIANT_TYPE_INT64)) {
 		if (!PyLong_Check(obj)) {
@@ -379,12 +510,12 @@ static int convert_meta(struct srd_proto_data *pdata, PyObject *obj)
 		pdata->data = g_variant_new_double(dvalue);
 	}
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -396,17 +527,50 @@ static void release_meta(GVariant *gvar)
 	g_variant_unref(gvar);
 }
 
+/*
+ * Count a put() call. The annotation class and the size of binary data
+ * are taken from well-formed output, the conversion reports bad output.
+ */
+static void count_put(struct srd_inst_counters *c, int output_type,
+		PyObject *obj)
+{
+	PyObject *py_tmp;
+	long ann_class;
+
+	if (output_type < 0 || output_type > SRD_OUTPUT_META)
+		return;
+	c->put_calls[output_type]++;
+
+	if (!PyList_Check(obj) || PyList_Size(obj) < 2)
+		return;
+	py_tmp = PyList_GetItem(obj, 0);
+	if (output_type == SRD_OUTPUT_ANN && PyLong_Check(py_tmp)) {
+		ann_class = PyLong_AsLong(py_tmp);
+		if (ann_class >= 0 && (unsigned long)ann_class < c->num_ann_classes)
+			c->ann_put_calls[ann_class]++;
+		else if (ann_class == -1 && PyErr_Occurred())
+			PyErr_Clear();
+	} else if (output_type == SRD_OUTPUT_BINARY) {
+		py_tmp = PyList_GetItem(obj, 1);
+		if (PyBytes_Check(py_tmp))
+			c->put_bytes[output_type] += PyBytes_Size(py_tmp);
+	}
+}
+
 PyDoc_STRVAR(Decoder_put_doc,
 	"Put an annotation for the specified span of samples.\n"
 	"\n"
 	"Arguments: start and end sample number, stream id, annotation data.\n"
-	"Annotation data's layout depends on the output stream type."
+	"Annotation data's layout depends on the output stream type.\n"
+	"Annotations can be [class, [format, ...], args] or [class, callable]\n"
+	"to only format their texts when a frontend receives them. Malformed\n"
+	"annotations get logged and dropped."
 );
 
 static PyObject *Decoder_put(PyObject *self, PyObject *args)
 {
 	GSList *l;
-	PyObject *py_data, *py_res;
+	PyObject *py_data, *py_res, *py_texts, *py_start, *py_end;
 	struct srd_decoder_inst *di, *next_di;
 	struct srd_pd_output *pdo;
 	struct srd_proto_data pdata;
@@ -414,15 +578,18 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 	struct srd_proto_data_binary pdb;
 	struct srd_proto_data_logic pdl;
 	uint64_t start_sample, end_sample;
-	int output_id;
+	int output_id, ann_class;
 	struct srd_pd_callback *cb;
+	struct srd_inst_counters *c, *next_c;
+	int64_t start_time, elapsed;
 	PyGILState_STATE gstate;
 
 	py_data = NULL;
+	start_time = 0;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		/* Shouldn't happen. */
 		srd_dbg("put(): self instance not found.");
 		goto err;
@@ -458,23 +625,56 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 	pdata.pdo = pdo;
 	pdata.data = NULL;
 
+	if ((c = srd_inst_counters_get(di)))
+		count_put(c, pdo->output_type, py_data);
+
 	switch (pdo->output_type) {
 	case SRD_OUTPUT_ANN:
-		/* Annotations are only fed to callbacks. */
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
-			pdata.data = &pda;
-			/* Convert from PyDict to srd_proto_data_annotation. */
-			if (convert_annotation(di, py_data, &pdata) != SRD_OK) {
-				/* An error was already logged. */
-				break;
-			}
+		/* Drop annotations of disabled classes early. */
+		if (annotation_disabled(di, py_data))
+			break;
+		/*
+		 * Annotations are only fed to callbacks. Without any, lazy
+		 * annotations don't even get their texts rendered.
+		 */
+		cb = srd_pd_output_callback_find(di->sess, pdo->output_type);
+		if (!cb && !di->sess->ann_batch_cb)
+			break;
+		if (check_annotation(di, py_data, &ann_class, &py_texts) != SRD_OK) {
+			/* An error was already logged. */
+			break;
+		}
+		if (di->sess->ann_batch_cb &&
+				batch_annotation(di, ann_class, py_texts, &pdata)) {
+			Py_BEGIN_ALLOW_THREADS
+			srd_inst_ann_batch_flush(di);
+			Py_END_ALLOW_THREADS
+		}
+		pdata.data = &pda;
+		/* Convert from PyList to srd_proto_data_annotation. */
+		if (cb && convert_annotation(di, ann_class, py_texts,
+				&pdata) == SRD_OK) {
 			Py_BEGIN_ALLOW_THREADS
 			cb->cb(&pdata, cb->cb_data);
 			Py_END_ALLOW_THREADS
 			release_annotation(pdata.data);
 		}
+		Py_DECREF(py_texts);
 		break;
 	case SRD_OUTPUT_PYTHON:
+		if (di->sess->record)
+			srd_recording_put(di, start_sample, end_sample, py_data);
+		/* The sample numbers get converted once for all stacked PDs. */
+		py_start = py_end = NULL;
+		if (di->next_di) {
+			py_start = PyLong_FromUnsignedLongLong(start_sample);
+			py_end = PyLong_FromUnsignedLongLong(end_sample);
+			if (!py_start || !py_end) {
+				Py_XDECREF(py_start);
+				Py_XDECREF(py_end);
+				goto err;
+			}
+		}
 		for (l = di->next_di; l; l = l->next) {
 			next_di = l->data;
 			srd_spew("Instance %s put %" PRIu64 "-%" PRIu64 " %s "
@@ -482,14 +682,32 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 				 start_sample,
 				 end_sample, output_type_name(pdo->output_type),
 				 output_id, pdo->proto_id, next_di->inst_id);
-			py_res = PyObject_CallMethod(next_di->py_inst, "decode",
-				"KKO", start_sample, end_sample, py_data);
+			if (c)
+				start_time = g_get_monotonic_time();
+			/* Use the decode() method which srd_inst_start() looked up. */
+			if (next_di->py_decode)
+				py_res = PyObject_CallFunctionObjArgs(
+					next_di->py_decode, py_start, py_end,
+					py_data, NULL);
+			else
+				py_res = PyObject_CallMethod(next_di->py_inst,
+					"decode", "KKO", start_sample,
+					end_sample, py_data);
+			if (c) {
+				/* The caller is busy while the stacked PD is. */
+				elapsed = g_get_monotonic_time() - start_time;
+				c->stacked_time += elapsed;
+				if ((next_c = srd_inst_counters_get(next_di)))
+					next_c->busy_time += elapsed;
+			}
 			if (!py_res) {
 				srd_exception_catch("Calling %s decode() failed",
 							next_di->inst_id);
 			}
 			Py_XDECREF(py_res);
 		}
+		Py_XDECREF(py_start);
+		Py_XDECREF(py_end);
 		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
 			/*
 			 * Frontends aren't really supposed to get Python
@@ -551,12 +769,12 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 		break;
 	}
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	Py_RETURN_NONE;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return NULL;
 }
@@ -581,13 +799,13 @@ static PyObject *Decoder_register(PyObject *self,
 	GSList *l;
 	struct srd_pd_output *cmp;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	meta_type_py = NULL;
 	meta_type_gv = NULL;
 	meta_name = meta_descr = NULL;
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -632,7 +850,7 @@ static PyObject *Decoder_register(PyObject *self,
 	}
 	if (pdo) {
 		py_new_output_id = Py_BuildValue("i", pdo->pdo_id);
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return py_new_output_id;
 	}
 
@@ -653,7 +871,7 @@ static PyObject *Decoder_register(PyObject *self,
 	di->pd_output = g_slist_append(di->pd_output, pdo);
 	py_new_output_id = Py_BuildValue("i", pdo->pdo_id);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	srd_dbg("Instance %s creating new output type %s as oid %d (%s).",
 		di->inst_id, output_type_name(output_type), pdo->pdo_id,
@@ -662,7 +880,7 @@ static PyObject *Decoder_register(PyObject *self,
 	return py_new_output_id;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return NULL;
 }
@@ -689,66 +907,167 @@ static int get_term_type(const char *v)
 	return -1;
 }
 
+/**
+ * Get the pin states of a sample as a bit mask.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param sample_pos The sample to inspect. Must not be NULL.
+ *
+ * @return The pin states, bit N holds channel N. Unused channels read
+ *         as 0, channels beyond the 64th are ignored.
+ */
+static uint64_t get_pin_states(const struct srd_decoder_inst *di,
+	const uint8_t *sample_pos)
+{
+	int i, ch;
+	uint64_t states;
+
+	states = 0;
+	for (i = 0; i < MIN(di->dec_num_channels, 64); i++) {
+		ch = di->dec_channelmap[i];
+		if (ch != -1 && sample_pos[ch / 8] & (1 << (ch % 8)))
+			states |= (uint64_t)1 << i;
+	}
+
+	return states;
+}
+
 /**
  * Get the pin values at the current sample number.
  *
+ * Decoders with few channels see a small number of different pin value
+ * combinations, the tuples for these are created once and get re-used.
+ * Must be called with the GIL held.
+ *
  * @param di The decoder instance to use. Must not be NULL.
  *           The number of channels must be >= 1.
  *
- * @return A newly allocated PyTuple containing the pin values at the
+ * @return A new reference to a PyTuple containing the pin values at the
  *         current sample number.
  */
-static PyObject *get_current_pinvalues(const struct srd_decoder_inst *di)
+static PyObject *get_current_pinvalues(struct srd_decoder_inst *di)
 {
-	int i;
-	uint8_t sample;
+	int i, ch;
+	uint64_t states;
 	const uint8_t *sample_pos;
-	int byte_offset, bit_offset;
 	PyObject *py_pinvalues;
-	PyGILState_STATE gstate;
+	gboolean cacheable;
 
 	if (!di) {
 		srd_err("Invalid decoder instance.");
 		return NULL;
 	}
 
-	gstate = PyGILState_Ensure();
+	sample_pos = srd_inst_sample_pos(di, di->abs_cur_samplenum);
+	cacheable = di->dec_num_channels <= SRD_PINVALUES_CACHE_CHANNELS;
+
+	/* Look up the pin states, try to find a previously created tuple. */
+	states = 0;
+	if (cacheable) {
+		states = get_pin_states(di, sample_pos);
+		if (!di->py_pinvalues_cache)
+			di->py_pinvalues_cache = g_malloc0(sizeof(PyObject *)
+				<< di->dec_num_channels);
+		if ((py_pinvalues = di->py_pinvalues_cache[states])) {
+			Py_INCREF(py_pinvalues);
+			return py_pinvalues;
+		}
+	}
 
 	py_pinvalues = PyTuple_New(di->dec_num_channels);
 
 	for (i = 0; i < di->dec_num_channels; i++) {
+		ch = di->dec_channelmap[i];
 		/* A channelmap value of -1 means "unused optional channel". */
-		if (di->dec_channelmap[i] == -1) {
+		if (ch == -1) {
 			/* Value of unused channel is 0xff, instead of 0 or 1. */
 			PyTuple_SetItem(py_pinvalues, i, PyLong_FromUnsignedLong(0xff));
 		} else {
-			sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
-			byte_offset = di->dec_channelmap[i] / 8;
-			bit_offset = di->dec_channelmap[i] % 8;
-			sample = *(sample_pos + byte_offset) & (1 << bit_offset) ? 1 : 0;
-			PyTuple_SetItem(py_pinvalues, i, PyLong_FromUnsignedLong(sample));
+			PyTuple_SetItem(py_pinvalues, i, PyLong_FromUnsignedLong(
+				(sample_pos[ch / 8] & (1 << (ch % 8))) ? 1 : 0));
 		}
 	}
 
-	PyGILState_Release(gstate);
+	if (cacheable) {
+		Py_INCREF(py_pinvalues);
+		di->py_pinvalues_cache[states] = py_pinvalues;
+	}
 
 	return py_pinvalues;
 }
 
 /**
- * Create a list of terms in the specified condition.
+ * Get the .matched tuple for the most recent match.
+ *
+ * Like the pin values, the tuples for short condition lists are kept
+ * for re-use. Must be called with the GIL held.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ *
+ * @return A new reference to a PyTuple of PyBool values, one for each
+ *         condition, or a new reference to None when there are no
+ *         match results.
+ */
+static PyObject *get_matched(struct srd_decoder_inst *di)
+{
+	unsigned int i, len, key;
+	PyObject *py_matched;
+
+	len = di->match_array ? di->match_array->len : 0;
+	if (len == 0)
+		Py_RETURN_NONE;
+
+	key = 0;
+	if (len <= SRD_MATCHED_CACHE_CONDITIONS) {
+		key = 1U << len;
+		for (i = 0; i < len; i++) {
+			if (di->match_array->data[i])
+				key |= 1U << i;
+		}
+		if (!di->py_matched_cache)
+			di->py_matched_cache = g_malloc0(sizeof(PyObject *)
+				<< (SRD_MATCHED_CACHE_CONDITIONS + 1));
+		if ((py_matched = di->py_matched_cache[key])) {
+			Py_INCREF(py_matched);
+			return py_matched;
+		}
+	}
+
+	py_matched = PyTuple_New(len);
+	for (i = 0; i < len; i++)
+		PyTuple_SetItem(py_matched, i, PyBool_FromLong(di->match_array->data[i]));
+
+	if (key) {
+		Py_INCREF(py_matched);
+		di->py_matched_cache[key] = py_matched;
+	}
+
+	return py_matched;
+}
+
+/* Replace a reference which is held by the decoder object. */
+static void set_decoder_slot(PyObject **slot, PyObject *value)
+{
+	PyObject *old;
+
+	old = *slot;
+	*slot = value;
+	Py_XDECREF(old);
+}
+
+/**
+ * Append a condition with the terms of a Python dict.
  *
- * If there are no terms in the condition, 'term_list' will be NULL.
+ * If there are no terms in the dict, the condition has no terms.
  *
  * @param di The decoder instance to use. Must not be NULL.
  * @param py_dict A Python dict containing terms. Must not be NULL.
- * @param term_list Pointer to a GSList which will be set to the newly
- *                  created list of terms. Must not be NULL.
+ * @param conds The conditions to append to. Must not be NULL.
  *
  * @return SRD_OK upon success, a negative error code otherwise.
  */
 static int create_term_list(struct srd_decoder_inst *di,
-	PyObject *py_dict, GSList **term_list)
+	PyObject *py_dict, struct srd_conditions *conds)
 {
 	Py_ssize_t pos = 0;
 	PyObject *py_key, *py_value;
@@ -757,13 +1076,12 @@ static int create_term_list(struct srd_decoder_inst *di,
 	char *term_str;
 	PyGILState_STATE gstate;
 
-	if (!py_dict || !term_list)
+	if (!py_dict || !conds)
 		return SRD_ERR_ARG;
 
-	/* "Create" an empty GSList of terms. */
-	*term_list = NULL;
+	srd_conditions_add(conds);
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	/* Iterate over all items in the current dict. */
 	while (PyDict_Next(py_dict, &pos, &py_key, &py_value)) {
@@ -775,7 +1093,7 @@ static int create_term_list(struct srd_decoder_inst *di,
 				srd_err("Failed to get the value.");
 				goto err;
 			}
-			term = g_malloc(sizeof(struct srd_term));
+			term = srd_conditions_add_term(conds);
 			term->type = get_term_type(term_str);
 			term->channel = PyLong_AsLong(py_key);
 			if (term->channel < 0 || term->channel >= di->dec_num_channels)
@@ -788,7 +1106,7 @@ static int create_term_list(struct srd_decoder_inst *di,
 				srd_err("Failed to get number of samples to skip.");
 				goto err;
 			}
-			term = g_malloc(sizeof(struct srd_term));
+			term = srd_conditions_add_term(conds);
 			term->type = SRD_TERM_SKIP;
 			term->num_samples_to_skip = num_samples_to_skip;
 			term->num_samples_already_skipped = 0;
@@ -798,47 +1116,138 @@ static int create_term_list(struct srd_decoder_inst *di,
 			srd_err("Term key is neither a string nor a number.");
 			goto err;
 		}
-
-		/* Add the term to the list of terms. */
-		*term_list = g_slist_append(*term_list, term);
 	}
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR;
 }
 
+/**
+ * Convert the conditions argument of self.wait() to a list of conditions.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param py_conds A dict, a list of dicts, or None. Must not be NULL.
+ * @param conds The conditions to set. Must not be NULL.
+ *
+ * @retval SRD_OK The conditions were converted successfully.
+ * @retval SRD_ERR The conditions were invalid. The contents of 'conds'
+ *                 are undefined.
+ * @retval 9999 There are no conditions, 'conds' was left untouched.
+ */
+static int parse_conditions(struct srd_decoder_inst *di, PyObject *py_conds,
+	struct srd_conditions *conds)
+{
+	PyObject *py_dict;
+	int i, num_conditions, ret;
+
+	/*
+	 * Check the data type of the self.wait() argument. None or an
+	 * empty dict or an empty list mean that there is no condition,
+	 * and the next available sample shall get returned to the caller.
+	 */
+	if (py_conds == Py_None)
+		return 9999;
+
+	if (PyDict_Check(py_conds)) {
+		if (PyDict_Size(py_conds) == 0)
+			return 9999; /* The PD invoked self.wait({}). */
+		srd_conditions_clear(conds);
+		return create_term_list(di, py_conds, conds);
+	}
+
+	if (!PyList_Check(py_conds)) {
+		srd_err("Condition list is neither a list nor a dict.");
+		return SRD_ERR;
+	}
+	num_conditions = PyList_Size(py_conds);
+	if (num_conditions == 0)
+		return 9999; /* The PD invoked self.wait([]). */
+
+	srd_conditions_clear(conds);
+
+	/* Iterate over the conditions, append each of them to 'conds'. */
+	for (i = 0; i < num_conditions; i++) {
+		/* Get a condition (dict) from the condition list. */
+		py_dict = PyList_GetItem(py_conds, i);
+		if (!PyDict_Check(py_dict)) {
+			srd_err("Condition is not a dict.");
+			return SRD_ERR;
+		}
+
+		/* Add the terms of this condition. */
+		if ((ret = create_term_list(di, py_dict, conds)) < 0)
+			return ret;
+	}
+
+	return SRD_OK;
+}
+
+#define CONDITIONS_CAPSULE "sigrokdecode.conditions"
+
+static void conditions_capsule_free(PyObject *py_capsule)
+{
+	srd_conditions_free(PyCapsule_GetPointer(py_capsule, CONDITIONS_CAPSULE));
+}
+
+/*
+ * Apply the skip count which was passed along with compiled conditions.
+ * Returns the number of 'skip' terms.
+ */
+static unsigned int rebind_skip_count(struct srd_conditions *conds,
+	int64_t count)
+{
+	struct srd_term *term;
+	unsigned int t, num_skip;
+
+	num_skip = 0;
+	for (t = 0; t < conds->num_terms; t++) {
+		term = &conds->terms[t];
+		if (term->type != SRD_TERM_SKIP)
+			continue;
+		term->num_samples_to_skip = count;
+		if (count < 0)
+			term->type = SRD_TERM_ALWAYS_FALSE;
+		num_skip++;
+	}
+
+	return num_skip;
+}
+
 /**
  * Replace the current condition list with the new one.
  *
- * @param self TODO. Must not be NULL.
- * @param args TODO. Must not be NULL.
+ * @param self The decoder object. Must not be NULL.
+ * @param py_conds The conditions argument of self.wait(). A dict, a list
+ *                 of dicts, compiled conditions, or None. Must not be NULL.
+ * @param py_skip The skip count for compiled conditions, or NULL.
  *
  * @retval SRD_OK The new condition list was set successfully.
  * @retval SRD_ERR There was an error setting the new condition list.
- *                 The contents of di->condition_list are undefined.
- * @retval 9999 TODO.
+ *                 The contents of di->conditions are undefined.
+ * @retval 9999 There are no conditions.
  */
-static int set_new_condition_list(PyObject *self, PyObject *args)
+static int set_new_condition_list(PyObject *self, PyObject *py_conds,
+	PyObject *py_skip)
 {
 	struct srd_decoder_inst *di;
-	GSList *term_list;
-	PyObject *py_conditionlist, *py_conds, *py_dict;
-	int i, num_conditions, ret;
+	const struct srd_conditions *compiled;
+	int64_t skip_count;
+	int ret;
 	PyGILState_STATE gstate;
 
-	if (!self || !args)
+	if (!self || !py_conds)
 		return SRD_ERR_ARG;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	/* Get the decoder instance. */
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -852,80 +1261,45 @@ static int set_new_condition_list(PyObject *self, PyObject *args)
 		goto err;
 	}
 
-	/*
-	 * Parse the argument of self.wait() into 'py_conds', and check
-	 * the data type. The argument is optional, None is assumed in
-	 * its absence. None or an empty dict or an empty list mean that
-	 * there is no condition, and the next available sample shall
-	 * get returned to the caller.
-	 */
-	py_conds = Py_None;
-	if (!PyArg_ParseTuple(args, "|O", &py_conds)) {
-		/* Let Python raise this exception. */
-		goto err;
-	}
-	if (py_conds == Py_None) {
-		/* 'py_conds' is None. */
-		goto ret_9999;
-	} else if (PyList_Check(py_conds)) {
-		/* 'py_conds' is a list. */
-		py_conditionlist = py_conds;
-		num_conditions = PyList_Size(py_conditionlist);
-		if (num_conditions == 0)
-			goto ret_9999; /* The PD invoked self.wait([]). */
-		Py_INCREF(py_conditionlist);
-	} else if (PyDict_Check(py_conds)) {
-		/* 'py_conds' is a dict. */
-		if (PyDict_Size(py_conds) == 0)
-			goto ret_9999; /* The PD invoked self.wait({}). */
-		/* Make a list and put the dict in there for convenience. */
-		py_conditionlist = PyList_New(1);
-		Py_INCREF(py_conds);
-		PyList_SetItem(py_conditionlist, 0, py_conds);
-		num_conditions = 1;
-	} else {
-		srd_err("Condition list is neither a list nor a dict.");
-		goto err;
-	}
-
-	/* Free the old condition list. */
-	condition_list_free(di);
+	/* The condition buffers are kept across wait() calls. */
+	if (!di->conditions)
+		di->conditions = srd_conditions_new();
 
-	ret = SRD_OK;
-
-	/* Iterate over the conditions, set di->condition_list accordingly. */
-	for (i = 0; i < num_conditions; i++) {
-		/* Get a condition (dict) from the condition list. */
-		py_dict = PyList_GetItem(py_conditionlist, i);
-		if (!PyDict_Check(py_dict)) {
-			srd_err("Condition is not a dict.");
-			ret = SRD_ERR;
-			break;
+	if (PyCapsule_IsValid(py_conds, CONDITIONS_CAPSULE)) {
+		/* Compiled conditions only need to get copied. */
+		compiled = PyCapsule_GetPointer(py_conds, CONDITIONS_CAPSULE);
+		if (!compiled->num_conditions) {
+			srd_gil_release(gstate);
+			return 9999;
 		}
-
-		/* Create the list of terms in this condition. */
-		if ((ret = create_term_list(di, py_dict, &term_list)) < 0)
-			break;
-
-		/* Add the new condition to the PD instance's condition list. */
-		di->condition_list = g_slist_append(di->condition_list, term_list);
+		srd_conditions_copy(di->conditions, compiled);
+		if (py_skip && py_skip != Py_None) {
+			skip_count = PyLong_AsLongLong(py_skip);
+			if (skip_count == -1 && PyErr_Occurred())
+				goto err;
+			if (!rebind_skip_count(di->conditions, skip_count)) {
+				PyErr_SetString(PyExc_ValueError,
+					"conditions have no 'skip' term");
+				goto err;
+			}
+		}
+		ret = SRD_OK;
+	} else if (py_skip && py_skip != Py_None) {
+		PyErr_SetString(PyExc_TypeError,
+			"skip count requires compiled conditions");
+		goto err;
+	} else {
+		ret = parse_conditions(di, py_conds, di->conditions);
 	}
 
-	Py_DecRef(py_conditionlist);
-
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return ret;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR;
-
-ret_9999:
-	PyGILState_Release(gstate);
-
-	return 9999;
 }
 
 /**
@@ -936,7 +1310,7 @@ ret_9999:
  *
  * @retval SRD_OK The new condition list was set successfully.
  * @retval SRD_ERR There was an error setting the new condition list.
- *                 The contents of di->condition_list are undefined.
+ *                 The contents of di->conditions are undefined.
  *
  * This routine is a reduced and specialized version of the @ref
  * set_new_condition_list() and @ref create_term_list() routines which
@@ -950,188 +1324,1340 @@ ret_9999:
 static int set_skip_condition(struct srd_decoder_inst *di, uint64_t count)
 {
 	struct srd_term *term;
-	GSList *term_list;
 
-	condition_list_free(di);
-	term = g_malloc(sizeof(*term));
+	if (!di->conditions)
+		di->conditions = srd_conditions_new();
+	srd_conditions_clear(di->conditions);
+	srd_conditions_add(di->conditions);
+	term = srd_conditions_add_term(di->conditions);
 	term->type = SRD_TERM_SKIP;
 	term->num_samples_to_skip = count;
 	term->num_samples_already_skipped = 0;
-	term_list = g_slist_append(NULL, term);
-	di->condition_list = g_slist_append(di->condition_list, term_list);
 
 	return SRD_OK;
 }
 
-PyDoc_STRVAR(Decoder_wait_doc,
-	"Wait for one or more conditions to occur.\n"
-	"\n"
-	"Returns the sample data at the next position where the condition\n"
-	"is seen. When the optional condition is missing or empty, the next\n"
-	"sample number is used. The condition can be a dictionary with one\n"
-	"condition's details, or a list of dictionaries specifying multiple\n"
-	"conditions of which at least one condition must be true. Dicts can\n"
-	"contain one or more key/value pairs, all of which must be true for\n"
-	"the dict's condition to be considered true. The key either is a\n"
-	"channel index or a keyword, the value is the operation's parameter.\n"
-	"\n"
+/**
+ * Set up the condition list for a wait() or wait_many() call.
+ *
+ * @param self The decoder object. Must not be NULL.
+ * @param di The decoder instance. Must not be NULL.
+ * @param py_conds The conditions argument of the call. Must not be NULL.
+ * @param py_skip The skip count for compiled conditions, or NULL.
+ * @param no_conditions Will be set to TRUE when the caller did not
+ *                      specify any conditions. Must not be NULL.
+ *
+ * @retval SRD_OK The conditions were set up successfully.
+ * @retval SRD_ERR The conditions were invalid or termination was requested.
+ */
+static int setup_conditions(PyObject *self, struct srd_decoder_inst *di,
+	PyObject *py_conds, PyObject *py_skip, gboolean *no_conditions)
+{
+	int ret;
+	uint64_t skip_count;
+
+	*no_conditions = FALSE;
+
+	ret = set_new_condition_list(self, py_conds, py_skip);
+	if (ret < 0)
+		return SRD_ERR;
+	if (ret == 9999) {
+		/*
+		 * Empty condition list, automatic match. Arrange for the
+		 * execution of regular match handling code paths such that
+		 * the next available sample is returned to the caller.
+		 * Make sure to skip one sample when "anywhere within the
+		 * stream", yet make sure to not skip sample number 0.
+		 */
+		if (di->abs_cur_samplenum)
+			skip_count = 1;
+		else if (!di->conditions || !di->conditions->num_conditions)
+			skip_count = 0;
+		else
+			skip_count = 1;
+		ret = set_skip_condition(di, skip_count);
+		if (ret < 0) {
+			srd_dbg("%s: %s: Cannot setup condition-less wait().",
+				di->inst_id, __func__);
+			return SRD_ERR;
+		}
+		*no_conditions = TRUE;
+	}
+
+	return SRD_OK;
+}
+
+/*
+ * Wait for new samples to process, or a termination request. Returns
+ * with the data mutex held. The stack is idle while it waits.
+ */
+static void wait_for_samples(struct srd_decoder_inst *di)
+{
+	g_mutex_lock(&di->data_mutex);
+	if (di->got_new_samples || di->want_wait_terminate)
+		return;
+
+	srd_inst_stats_busy(di, FALSE);
+	while (!di->got_new_samples && !di->want_wait_terminate)
+		g_cond_wait(&di->got_new_samples_cond, &di->data_mutex);
+	srd_inst_stats_busy(di, TRUE);
+}
+
+/* Count a call of wait() or one of its variants. */
+static void count_wait_call(struct srd_decoder_inst *di)
+{
+	struct srd_inst_counters *c;
+
+	if ((c = srd_inst_counters_get(di)))
+		c->wait_calls++;
+}
+
+/**
+ * Hand the current chunk back to the main thread.
+ *
+ * Gets called when all samples of the chunk were inspected. Must be
+ * called with the data mutex held, which gets released.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param py_dec The decoder object. Must not be NULL.
+ *
+ * @retval SRD_OK Wait for the next chunk.
+ * @retval SRD_ERR Return from wait(), an EOFError was raised upon EOF.
+ */
+static int release_chunk(struct srd_decoder_inst *di, srd_Decoder *py_dec)
+{
+	/* No match, reset state for the next chunk. */
+	di->got_new_samples = FALSE;
+	di->handled_all_samples = TRUE;
+	di->abs_start_samplenum = 0;
+	di->abs_end_samplenum = 0;
+	di->inbuf = NULL;
+	di->inbuflen = 0;
+	di->in_run_lengths = NULL;
+	di->in_num_runs = 0;
+
+	/* Signal the main thread that we handled all samples. */
+	g_cond_signal(&di->handled_all_samples_cond);
+
+	/*
+	 * When EOF was provided externally, communicate the
+	 * Python EOFError exception to .decode() and return
+	 * from the .wait() method call. This is motivated by
+	 * the use of Python context managers, so that .decode()
+	 * methods can "close" incompletely accumulated data
+	 * when the sample data is exhausted.
+	 */
+	if (di->communicate_eof) {
+		/* Advance self.samplenum to the (absolute) last sample number. */
+		set_decoder_slot(&py_dec->samplenum,
+			PyLong_FromUnsignedLongLong(di->abs_cur_samplenum));
+		/* Raise an EOFError Python exception. */
+		srd_dbg("%s: %s: Raising EOF from wait().",
+			di->inst_id, __func__);
+		g_mutex_unlock(&di->data_mutex);
+		PyErr_SetString(PyExc_EOFError, "samples exhausted");
+		return SRD_ERR;
+	}
+
+	/*
+	 * When termination of wait() and decode() was requested,
+	 * then exit the loop after releasing the mutex.
+	 */
+	if (di->want_wait_terminate) {
+		srd_dbg("%s: %s: Will return from wait().",
+			di->inst_id, __func__);
+		g_mutex_unlock(&di->data_mutex);
+		return SRD_ERR;
+	}
+
+	g_mutex_unlock(&di->data_mutex);
+
+	return SRD_OK;
+}
+
+/* The operations of wait() and its variants. */
+enum {
+	WAIT_OP_WAIT,
+	WAIT_OP_WAIT_MANY,
+	WAIT_OP_SAMPLE_AT,
+	WAIT_OP_SHIFT_IN,
+};
+
+#define WAIT_OP_CAPSULE "sigrokdecode.wait_op"
+
+/*
+ * The state of a wait() call, or of one of its variants, while it looks
+ * for matches in the input data. Blocking calls keep it on their stack.
+ * For a generator based decode() the instance keeps it, from the call
+ * which yields it until the operation completes, possibly several
+ * chunks later.
+ */
+struct srd_wait_op {
+	int kind;
+	/* A generator based decode() yielded (or is about to yield) this. */
+	gboolean armed;
+	/* wait_many() without conditions, see rearm_conditions(). */
+	gboolean no_conditions;
+	/* Matches (wait_many) or clock edges (shift_in) wanted and seen. */
+	Py_ssize_t max_count;
+	Py_ssize_t count;
+	/* The condition results of the most recent match. */
+	uint64_t mask;
+	/* shift_in(): The stop condition matched. */
+	gboolean stopped;
+	GArray *samplenums;
+	GArray *pins;
+	GArray *matches;
+	/* sample_at(): The sample numbers, and the tuple of pin values. */
+	GArray *positions;
+	PyObject *py_values;
+	/* shift_in(): The data channels, and how to pack their bits. */
+	guint8 data[64];
+	unsigned int num_data;
+	int lsb_first;
+	int parallel;
+	int want_samplenums;
+	/* What wait() returns to a generator based decode(). */
+	PyObject *py_capsule;
+};
+
+/* Release the resources of an operation, and reset it. */
+static void wait_op_clear(struct srd_wait_op *op)
+{
+	PyObject *py_capsule;
+
+	if (op->samplenums)
+		g_array_free(op->samplenums, TRUE);
+	if (op->pins)
+		g_array_free(op->pins, TRUE);
+	if (op->matches)
+		g_array_free(op->matches, TRUE);
+	if (op->positions)
+		g_array_free(op->positions, TRUE);
+	Py_XDECREF(op->py_values);
+
+	py_capsule = op->py_capsule;
+	memset(op, 0, sizeof(*op));
+	op->py_capsule = py_capsule;
+}
+
+/* Get the instance's (reset) state for the next operation of a generator. */
+static struct srd_wait_op *wait_op_next(struct srd_decoder_inst *di)
+{
+	if (!di->wait_op)
+		di->wait_op = g_malloc0(sizeof(struct srd_wait_op));
+	wait_op_clear(di->wait_op);
+
+	return di->wait_op;
+}
+
+/*
+ * Get the state for a new operation. A generator based decode() gets
+ * the instance's state, blocking calls use the caller's 'local' one.
+ * A generator has to yield an operation before it starts the next one,
+ * raises RuntimeError and returns NULL otherwise.
+ */
+static struct srd_wait_op *wait_op_new(struct srd_decoder_inst *di,
+	struct srd_wait_op *local, int kind)
+{
+	struct srd_wait_op *op;
+
+	if (di->py_gen) {
+		if (srd_wait_op_armed(di)) {
+			PyErr_SetString(PyExc_RuntimeError,
+				"another wait operation was not yielded yet");
+			return NULL;
+		}
+		op = wait_op_next(di);
+	} else {
+		op = local;
+		memset(op, 0, sizeof(*op));
+	}
+	op->kind = kind;
+
+	return op;
+}
+
+/* Get the results of the most recent match as a bit mask, and reset them. */
+static uint64_t take_match_mask(struct srd_decoder_inst *di)
+{
+	unsigned int i;
+	uint64_t mask;
+
+	mask = 0;
+	if (!di->match_array)
+		return mask;
+	for (i = 0; i < di->match_array->len; i++) {
+		if (di->match_array->data[i])
+			mask |= (uint64_t)1 << i;
+	}
+	g_array_set_size(di->match_array, 0);
+
+	return mask;
+}
+
+/* Set self.matched from a bit mask of 'num_conditions' results. */
+static void set_matched_mask(struct srd_decoder_inst *di, srd_Decoder *py_dec,
+	uint64_t mask, unsigned int num_conditions)
+{
+	unsigned int i;
+
+	if (!di->match_array)
+		di->match_array = g_array_sized_new(FALSE, TRUE,
+			sizeof(gboolean), num_conditions);
+	g_array_set_size(di->match_array, num_conditions);
+	for (i = 0; i < num_conditions; i++)
+		di->match_array->data[i] = (mask >> i) & 1;
+	set_decoder_slot(&py_dec->matched, get_matched(di));
+	g_array_set_size(di->match_array, 0);
+}
+
+/* Create an array('Q') object from a GArray of uint64_t values. */
+static PyObject *uint64_array_new(PyObject *py_array_type, GArray *values)
+{
+	PyObject *py_bytes, *py_array;
+
+	py_bytes = PyBytes_FromStringAndSize(values->data,
+		values->len * sizeof(uint64_t));
+	if (!py_bytes)
+		return NULL;
+	py_array = PyObject_CallFunction(py_array_type, "sO", "Q", py_bytes);
+	Py_DECREF(py_bytes);
+
+	return py_array;
+}
+
+/*
+ * Get the array.array type, for the results of wait_many() etc. The
+ * sigrokdecode module of the instance's interpreter holds it. Returns
+ * a borrowed reference.
+ */
+static PyObject *array_type_get(const struct srd_decoder_inst *di)
+{
+	PyObject *py_mod;
+
+	if (di->sess->interp)
+		py_mod = srd_interp_module_get(di->sess->interp);
+	else
+		py_mod = mod_sigrokdecode;
+
+	return srd_module_array_type(py_mod);
+}
+
+/*
+ * Prepare the condition list for the next match of a wait_many() call,
+ * like a subsequent wait() call with the same conditions would.
+ */
+static void rearm_conditions(struct srd_decoder_inst *di,
+	gboolean no_conditions)
+{
+	unsigned int t;
+
+	if (no_conditions) {
+		set_skip_condition(di, 1);
+		return;
+	}
+
+	for (t = 0; t < di->conditions->num_terms; t++) {
+		if (di->conditions->terms[t].type == SRD_TERM_SKIP)
+			di->conditions->terms[t].num_samples_already_skipped = 0;
+	}
+}
+
+/*
+ * Pack the captured bits of a word into a Python integer. Clock edge
+ * 'i' contributed the 'width' bits ((pins[i] >> shift) & mask).
+ */
+static PyObject *pack_bits(const GArray *pins, unsigned int shift,
+	unsigned int width, gboolean lsb_first)
+{
+	PyObject *py_value, *py_limb, *py_shift, *py_tmp;
+	uint64_t limb, mask, group;
+	unsigned int i, idx, num_bits;
+
+	mask = width < 64 ? ((uint64_t)1 << width) - 1 : ~(uint64_t)0;
+	py_value = PyLong_FromLong(0);
+	limb = 0;
+	num_bits = 0;
+	for (i = 0; py_value && i <= pins->len; i++) {
+		/* Fold the limb into the value when it's full, and at the end. */
+		if (num_bits && (i == pins->len || num_bits + width > 64)) {
+			py_shift = PyLong_FromUnsignedLong(num_bits);
+			py_limb = PyLong_FromUnsignedLongLong(limb);
+			py_tmp = PyNumber_Lshift(py_value, py_shift);
+			Py_DECREF(py_value);
+			py_value = py_tmp ? PyNumber_Or(py_tmp, py_limb) : NULL;
+			Py_XDECREF(py_tmp);
+			Py_DECREF(py_limb);
+			Py_DECREF(py_shift);
+			limb = 0;
+			num_bits = 0;
+		}
+		if (i == pins->len)
+			break;
+		idx = lsb_first ? pins->len - 1 - i : i;
+		group = (g_array_index(pins, uint64_t, idx) >> shift) & mask;
+		limb = width < 64 ? (limb << width) | group : group;
+		num_bits += width;
+	}
+
+	return py_value;
+}
+
+/* Collect the matches of a wait_many() call within the current chunk. */
+static gboolean scan_wait_many(struct srd_decoder_inst *di,
+	struct srd_wait_op *op)
+{
+	gboolean found_match;
+	uint64_t states, last;
+
+	while (op->count < op->max_count) {
+		found_match = FALSE;
+		(void)process_samples_until_condition_match(di, &found_match);
+		if (!found_match) {
+			/*
+			 * Return to the last match. The next call searches
+			 * from there with fresh 'skip' counts, like a wait()
+			 * after the match would.
+			 */
+			if (op->count) {
+				last = g_array_index(op->samplenums, uint64_t,
+					op->count - 1);
+				di->abs_cur_samplenum = last;
+				srd_inst_old_pins_set(di,
+					srd_inst_sample_pos(di, last));
+			}
+			break;
+		}
+
+		states = get_pin_states(di,
+			srd_inst_sample_pos(di, di->abs_cur_samplenum));
+		op->mask = take_match_mask(di);
+		g_array_append_val(op->samplenums, di->abs_cur_samplenum);
+		g_array_append_val(op->pins, states);
+		g_array_append_val(op->matches, op->mask);
+		op->count++;
+
+		rearm_conditions(di, op->no_conditions);
+	}
+
+	/*
+	 * Return the matches found so far. The chunk stays with the
+	 * decoder, the next wait() picks up where this call left off.
+	 */
+	return op->count > 0;
+}
+
+/* Sample the data channels on clock edges within the current chunk. */
+static gboolean scan_shift_in(struct srd_decoder_inst *di,
+	struct srd_wait_op *op)
+{
+	gboolean found_match;
+	unsigned int i;
+	uint64_t states, bits;
+
+	while (op->count < op->max_count) {
+		found_match = FALSE;
+		(void)process_samples_until_condition_match(di, &found_match);
+		if (!found_match)
+			break;
+
+		op->mask = take_match_mask(di);
+		if (op->mask & 2) {
+			op->stopped = TRUE;
+			break;
+		}
+
+		states = get_pin_states(di,
+			srd_inst_sample_pos(di, di->abs_cur_samplenum));
+		bits = 0;
+		for (i = 0; i < op->num_data; i++)
+			bits |= ((states >> op->data[i]) & 1) << (op->num_data - 1 - i);
+		g_array_append_val(op->samplenums, di->abs_cur_samplenum);
+		g_array_append_val(op->pins, bits);
+		op->count++;
+
+		/* 'skip' terms of the stop condition count from this bit. */
+		rearm_conditions(di, FALSE);
+	}
+
+	return op->stopped || op->count == op->max_count;
+}
+
+/* Take the pin values of all sample numbers within the current chunk. */
+static gboolean scan_sample_at(struct srd_decoder_inst *di,
+	struct srd_wait_op *op)
+{
+	uint64_t samplenum;
+
+	while (op->count < (Py_ssize_t)op->positions->len) {
+		samplenum = g_array_index(op->positions, uint64_t, op->count);
+		if (samplenum >= di->abs_end_samplenum)
+			break;
+		di->abs_cur_samplenum = samplenum;
+		/* Sample 0: Like wait(), set up the initial pin values. */
+		if (samplenum == 0)
+			srd_inst_initial_pins_apply(di);
+		PyTuple_SetItem(op->py_values, op->count++,
+			get_current_pinvalues(di));
+	}
+	if (op->count == (Py_ssize_t)op->positions->len)
+		return TRUE;
+
+	/* The remaining sample numbers are in upcoming chunks. */
+	if (di->abs_cur_samplenum < di->abs_end_samplenum)
+		di->abs_cur_samplenum = di->abs_end_samplenum;
+
+	return FALSE;
+}
+
+/*
+ * Run an operation on the current chunk.
+ *
+ * Must be called without the GIL, except for sample_at() which creates
+ * Python objects while it inspects the chunk.
+ *
+ * Termination requests take a code path which won't find new samples
+ * to process, pretends to have processed the chunk, and lets the caller
+ * return to the main thread.
+ *
+ * @retval TRUE The operation is complete.
+ * @retval FALSE All samples of the chunk were inspected.
+ */
+static gboolean wait_op_scan(struct srd_decoder_inst *di,
+	struct srd_wait_op *op)
+{
+	gboolean found_match;
+
+	switch (op->kind) {
+	case WAIT_OP_WAIT_MANY:
+		return scan_wait_many(di, op);
+	case WAIT_OP_SAMPLE_AT:
+		return scan_sample_at(di, op);
+	case WAIT_OP_SHIFT_IN:
+		return scan_shift_in(di, op);
+	default:
+		/* Ignore return value for now, should never be negative. */
+		found_match = FALSE;
+		(void)process_samples_until_condition_match(di, &found_match);
+		return found_match;
+	}
+}
+
+/* Set self.samplenum etc. after a wait_many() call, return its arrays. */
+static PyObject *finish_wait_many(struct srd_decoder_inst *di,
+	srd_Decoder *py_dec, struct srd_wait_op *op)
+{
+	PyObject *py_array_type, *py_samplenums, *py_pins, *py_matches, *py_ret;
+
+	set_decoder_slot(&py_dec->samplenum, PyLong_FromUnsignedLongLong(
+		g_array_index(op->samplenums, uint64_t, op->count - 1)));
+	set_matched_mask(di, py_dec, op->mask,
+		op->mask ? di->conditions->num_conditions : 0);
+
+	py_array_type = array_type_get(di);
+	py_ret = NULL;
+	py_samplenums = uint64_array_new(py_array_type, op->samplenums);
+	py_pins = uint64_array_new(py_array_type, op->pins);
+	py_matches = uint64_array_new(py_array_type, op->matches);
+	if (py_samplenums && py_pins && py_matches)
+		py_ret = Py_BuildValue("(OOO)", py_samplenums, py_pins, py_matches);
+	Py_XDECREF(py_samplenums);
+	Py_XDECREF(py_pins);
+	Py_XDECREF(py_matches);
+
+	return py_ret;
+}
+
+/* Set self.samplenum etc. after a shift_in() call, return the words. */
+static PyObject *finish_shift_in(struct srd_decoder_inst *di,
+	srd_Decoder *py_dec, struct srd_wait_op *op)
+{
+	PyObject *py_values, *py_item, *py_samplenums;
+	unsigned int i, num_words;
+
+	set_decoder_slot(&py_dec->samplenum,
+		PyLong_FromUnsignedLongLong(di->abs_cur_samplenum));
+	set_matched_mask(di, py_dec, op->mask, di->conditions->num_conditions);
+
+	/* Pack the words, one per data channel or all channels at once. */
+	num_words = op->parallel ? 1 : op->num_data;
+	py_values = PyTuple_New(num_words);
+	for (i = 0; py_values && i < num_words; i++) {
+		py_item = op->parallel ?
+			pack_bits(op->pins, 0, op->num_data, op->lsb_first) :
+			pack_bits(op->pins, op->num_data - 1 - i, 1, op->lsb_first);
+		if (!py_item) {
+			Py_CLEAR(py_values);
+			break;
+		}
+		PyTuple_SetItem(py_values, i, py_item);
+	}
+	if (!py_values)
+		return NULL;
+
+	if (op->want_samplenums) {
+		py_samplenums = uint64_array_new(array_type_get(di),
+			op->samplenums);
+		if (!py_samplenums) {
+			Py_DECREF(py_values);
+			return NULL;
+		}
+	} else {
+		py_samplenums = Py_None;
+		Py_INCREF(py_samplenums);
+	}
+
+	return Py_BuildValue("(nNN)", op->count, py_values, py_samplenums);
+}
+
+/*
+ * Complete an operation after wait_op_scan() found it done: set
+ * self.samplenum and self.matched, and create the return value.
+ * The attributes live in the Decoder object's slots, they are
+ * assigned directly instead of by name.
+ */
+static PyObject *wait_op_finish(struct srd_decoder_inst *di,
+	srd_Decoder *py_dec, struct srd_wait_op *op)
+{
+	PyObject *py_ret;
+
+	switch (op->kind) {
+	case WAIT_OP_WAIT_MANY:
+		return finish_wait_many(di, py_dec, op);
+	case WAIT_OP_SHIFT_IN:
+		return finish_shift_in(di, py_dec, op);
+	case WAIT_OP_SAMPLE_AT:
+		if (op->positions->len) {
+			/* Edge conditions of the next wait() start out from here. */
+			srd_inst_old_pins_set(di,
+				srd_inst_sample_pos(di, di->abs_cur_samplenum));
+			set_decoder_slot(&py_dec->samplenum,
+				PyLong_FromUnsignedLongLong(di->abs_cur_samplenum));
+		}
+		py_ret = op->py_values;
+		op->py_values = NULL;
+		return py_ret;
+	default:
+		/* Set self.samplenum to the (absolute) sample number that matched. */
+		set_decoder_slot(&py_dec->samplenum,
+			PyLong_FromUnsignedLongLong(di->abs_cur_samplenum));
+		set_decoder_slot(&py_dec->matched, get_matched(di));
+		if (di->match_array)
+			g_array_set_size(di->match_array, 0);
+		return get_current_pinvalues(di);
+	}
+}
+
+/*
+ * Run an operation on the input data of a regular decode(), in the
+ * stack's worker thread. Blocks until the operation is complete, the
+ * main thread hands in chunk after chunk meanwhile.
+ */
+static PyObject *wait_op_block(struct srd_decoder_inst *di,
+	srd_Decoder *py_dec, struct srd_wait_op *op)
+{
+	gboolean done, need_gil;
+	PyObject *py_ret;
+
+	need_gil = op->kind == WAIT_OP_SAMPLE_AT;
+	while (1) {
+
+		Py_BEGIN_ALLOW_THREADS
+
+		/* Wait for new samples to process, or termination request. */
+		wait_for_samples(di);
+
+		done = !need_gil && wait_op_scan(di, op);
+
+		Py_END_ALLOW_THREADS
+
+		if (need_gil)
+			done = wait_op_scan(di, op);
+		if (done)
+			break;
+
+		if (release_chunk(di, py_dec) != SRD_OK)
+			return NULL;
+	}
+
+	py_ret = wait_op_finish(di, py_dec, op);
+
+	g_mutex_unlock(&di->data_mutex);
+
+	return py_ret;
+}
+
+/*
+ * Complete a call of wait() or one of its variants, after the operation
+ * was set up. Blocking calls run it right away. A generator based
+ * decode() gets an object to yield instead, the instance runs the
+ * operation when decode() yields it, see srd_wait_op_run().
+ */
+static PyObject *wait_op_run(struct srd_decoder_inst *di,
+	srd_Decoder *py_dec, struct srd_wait_op *op)
+{
+	PyObject *py_ret;
+
+	if (op == di->wait_op) {
+		if (!op->py_capsule)
+			op->py_capsule = PyCapsule_New(op, WAIT_OP_CAPSULE, NULL);
+		if (!op->py_capsule) {
+			wait_op_clear(op);
+			return NULL;
+		}
+		op->armed = TRUE;
+		Py_INCREF(op->py_capsule);
+		return op->py_capsule;
+	}
+
+	py_ret = wait_op_block(di, py_dec, op);
+	wait_op_clear(op);
+
+	return py_ret;
+}
+
+/**
+ * Take the value which a generator based decode() yielded.
+ *
+ * This is either the object which wait() or one of its variants returned
+ * to decode(), or conditions like wait() takes them, which are short for
+ * yielding the result of a wait() call with these conditions. Must be
+ * called with the GIL held.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param py_yielded The value which decode() yielded. Must not be NULL.
+ *
+ * @retval SRD_OK The operation is ready for srd_wait_op_run().
+ * @retval SRD_ERR The value is unusable, a Python exception was raised.
+ *
+ * @private
+ */
+SRD_PRIV int srd_wait_op_arm(struct srd_decoder_inst *di,
+	PyObject *py_yielded)
+{
+	struct srd_wait_op *op;
+	gboolean no_conditions;
+
+	if (PyCapsule_IsValid(py_yielded, WAIT_OP_CAPSULE)) {
+		op = PyCapsule_GetPointer(py_yielded, WAIT_OP_CAPSULE);
+		if (op != di->wait_op || !op->armed) {
+			PyErr_SetString(PyExc_RuntimeError,
+				"yielded a wait operation which is not pending");
+			return SRD_ERR;
+		}
+		return SRD_OK;
+	}
+	if (srd_wait_op_armed(di)) {
+		PyErr_SetString(PyExc_RuntimeError,
+			"another wait operation was not yielded yet");
+		return SRD_ERR;
+	}
+
+	count_wait_call(di);
+	op = wait_op_next(di);
+	op->kind = WAIT_OP_WAIT;
+	if (setup_conditions(di->py_inst, di, py_yielded, NULL,
+			&no_conditions) != SRD_OK) {
+		if (!PyErr_Occurred())
+			PyErr_SetString(PyExc_ValueError, "invalid conditions");
+		return SRD_ERR;
+	}
+	op->armed = TRUE;
+
+	return SRD_OK;
+}
+
+/**
+ * Check whether a generator based decode() waits for an operation.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @return TRUE if an operation was yielded and is not complete yet.
+ *
+ * @private
+ */
+SRD_PRIV gboolean srd_wait_op_armed(const struct srd_decoder_inst *di)
+{
+	const struct srd_wait_op *op;
+
+	op = di->wait_op;
+
+	return op && op->armed;
+}
+
+/**
+ * Run the pending operation of a generator based decode() on the
+ * current chunk.
+ *
+ * Must be called with the GIL held, which gets released while the
+ * samples are inspected.
+ *
+ * @param di The decoder instance. Must not be NULL, and must have an
+ *           armed operation.
+ *
+ * @retval TRUE The operation is complete, see srd_wait_op_finish().
+ * @retval FALSE All samples of the chunk were inspected.
+ *
+ * @private
+ */
+SRD_PRIV gboolean srd_wait_op_run(struct srd_decoder_inst *di)
+{
+	struct srd_wait_op *op;
+	gboolean done;
+
+	op = di->wait_op;
+	if (op->kind == WAIT_OP_SAMPLE_AT)
+		return wait_op_scan(di, op);
+
+	Py_BEGIN_ALLOW_THREADS
+	done = wait_op_scan(di, op);
+	Py_END_ALLOW_THREADS
+
+	return done;
+}
+
+/**
+ * Complete the operation of a generator based decode().
+ *
+ * Sets self.samplenum and self.matched like the blocking call would,
+ * and disarms the operation. Must be called with the GIL held.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @return A new reference to the result, which is to be sent into the
+ *         generator, or NULL if a Python exception was raised.
+ *
+ * @private
+ */
+SRD_PRIV PyObject *srd_wait_op_finish(struct srd_decoder_inst *di)
+{
+	struct srd_wait_op *op;
+	PyObject *py_ret;
+
+	op = di->wait_op;
+	py_ret = wait_op_finish(di, (srd_Decoder *)di->py_inst, op);
+	wait_op_clear(op);
+
+	return py_ret;
+}
+
+/**
+ * Drop the pending operation of a generator based decode(), if any.
+ *
+ * Must be called with the GIL held.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_wait_op_clear(struct srd_decoder_inst *di)
+{
+	if (di->wait_op)
+		wait_op_clear(di->wait_op);
+}
+
+/**
+ * Release the operation state of a decoder instance.
+ *
+ * Must be called with the GIL held.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_wait_op_free(struct srd_decoder_inst *di)
+{
+	struct srd_wait_op *op;
+
+	if (!(op = di->wait_op))
+		return;
+
+	wait_op_clear(op);
+	Py_XDECREF(op->py_capsule);
+	g_free(op);
+	di->wait_op = NULL;
+}
+
+PyDoc_STRVAR(Decoder_wait_doc,
+	"Wait for one or more conditions to occur.\n"
+	"\n"
+	"Returns the sample data at the next position where the condition\n"
+	"is seen. When the optional condition is missing or empty, the next\n"
+	"sample number is used. The condition can be a dictionary with one\n"
+	"condition's details, or a list of dictionaries specifying multiple\n"
+	"conditions of which at least one condition must be true. Dicts can\n"
+	"contain one or more key/value pairs, all of which must be true for\n"
+	"the dict's condition to be considered true. The key either is a\n"
+	"channel index or a keyword, the value is the operation's parameter.\n"
+	"\n"
 	"Supported parameters for channel number keys: 'h', 'l', 'r', 'f',\n"
 	"or 'e' for level or edge conditions. Other supported keywords:\n"
 	"'skip' to advance over the given number of samples.\n"
+	"\n"
+	"The conditions can also be compiled by compile_conditions(). The\n"
+	"optional 'skip' argument then replaces the count of their 'skip'\n"
+	"terms.\n"
+	"\n"
+	"When decode() is a generator, wait() and its variants don't block,\n"
+	"and don't return the sample data. They return an opaque operation\n"
+	"instead, which decode() has to yield before it calls any of them\n"
+	"again (RuntimeError is raised otherwise). The value of the yield\n"
+	"expression is what the blocking call would have returned. decode()\n"
+	"may also yield conditions, which is short for yielding wait() with\n"
+	"them.\n"
 );
 
-static PyObject *Decoder_wait(PyObject *self, PyObject *args)
+static PyObject *Decoder_wait(PyObject *self, PyObject *args,
+	PyObject *kwargs)
 {
-	int ret;
-	uint64_t skip_count;
-	unsigned int i;
-	gboolean found_match;
+	static char *kwlist[] = { "conds", "skip", NULL };
+	gboolean no_conditions;
 	struct srd_decoder_inst *di;
-	PyObject *py_pinvalues, *py_matched, *py_samplenum;
+	struct srd_wait_op local, *op;
+	PyObject *py_conds, *py_skip, *py_ret;
 	PyGILState_STATE gstate;
 
 	if (!self || !args)
 		return NULL;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		Py_RETURN_NONE;
 	}
 
-	ret = set_new_condition_list(self, args);
-	if (ret < 0) {
+	count_wait_call(di);
+
+	/*
+	 * The argument of self.wait() is optional, None is assumed
+	 * in its absence.
+	 */
+	py_conds = Py_None;
+	py_skip = NULL;
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|OO", kwlist,
+			&py_conds, &py_skip)) {
+		/* Let Python raise this exception. */
+		goto err;
+	}
+
+	if (!(op = wait_op_new(di, &local, WAIT_OP_WAIT)))
+		goto err;
+	if (setup_conditions(self, di, py_conds, py_skip, &no_conditions) != SRD_OK) {
 		srd_dbg("%s: %s: Aborting wait().", di->inst_id, __func__);
+		wait_op_clear(op);
 		goto err;
 	}
-	if (ret == 9999) {
-		/*
-		 * Empty condition list, automatic match. Arrange for the
-		 * execution of regular match handling code paths such that
-		 * the next available sample is returned to the caller.
-		 * Make sure to skip one sample when "anywhere within the
-		 * stream", yet make sure to not skip sample number 0.
-		 */
-		if (di->abs_cur_samplenum)
-			skip_count = 1;
-		else if (!di->condition_list)
-			skip_count = 0;
-		else
-			skip_count = 1;
-		ret = set_skip_condition(di, skip_count);
-		if (ret < 0) {
-			srd_dbg("%s: %s: Cannot setup condition-less wait().",
-				di->inst_id, __func__);
-			goto err;
-		}
+
+	py_ret = wait_op_run(di, (srd_Decoder *)self, op);
+
+	srd_gil_release(gstate);
+
+	return py_ret;
+
+err:
+	srd_gil_release(gstate);
+
+	return NULL;
+}
+
+PyDoc_STRVAR(Decoder_wait_many_doc,
+	"Wait for a series of condition matches.\n"
+	"\n"
+	"Takes the same conditions as wait(), and the maximum number of\n"
+	"matches to return. Behaves like that many wait() calls with the\n"
+	"same conditions, but returns the results of all of them at once,\n"
+	"as a tuple of three array('Q') objects: the sample numbers, the\n"
+	"pin values (bit N holds channel N, unused channels read as 0),\n"
+	"and the match results (bit N is set when condition N matched).\n"
+	"Fewer matches are returned when the current chunk of input data\n"
+	"is exhausted, but never none. self.samplenum and self.matched\n"
+	"are those of the last match. Supports up to 64 channels and 64\n"
+	"conditions.\n"
+);
+
+static PyObject *Decoder_wait_many(PyObject *self, PyObject *args)
+{
+	Py_ssize_t max_matches, count;
+	struct srd_decoder_inst *di;
+	struct srd_wait_op local, *op;
+	PyObject *py_conds, *py_ret;
+	PyGILState_STATE gstate;
+
+	if (!self || !args)
+		return NULL;
+
+	op = NULL;
+	py_ret = NULL;
+
+	gstate = srd_gil_ensure(NULL);
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		goto err;
 	}
 
-	while (1) {
+	count_wait_call(di);
 
-		Py_BEGIN_ALLOW_THREADS
+	if (!PyArg_ParseTuple(args, "On", &py_conds, &max_matches)) {
+		/* Let Python raise this exception. */
+		goto err;
+	}
+	if (max_matches < 1) {
+		PyErr_SetString(PyExc_ValueError, "invalid match count");
+		goto err;
+	}
+	if (di->dec_num_channels > 64) {
+		PyErr_SetString(PyExc_ValueError, "too many channels");
+		goto err;
+	}
 
-		/* Wait for new samples to process, or termination request. */
-		g_mutex_lock(&di->data_mutex);
-		while (!di->got_new_samples && !di->want_wait_terminate)
-			g_cond_wait(&di->got_new_samples_cond, &di->data_mutex);
+	if (!(op = wait_op_new(di, &local, WAIT_OP_WAIT_MANY)))
+		goto err;
+	if (setup_conditions(self, di, py_conds, NULL, &op->no_conditions) != SRD_OK) {
+		srd_dbg("%s: %s: Aborting wait_many().", di->inst_id, __func__);
+		goto err;
+	}
+	if (di->conditions->num_conditions > 64) {
+		PyErr_SetString(PyExc_ValueError, "too many conditions");
+		goto err;
+	}
 
-		/*
-		 * Check whether any of the current condition(s) match.
-		 * Arrange for termination requests to take a code path which
-		 * won't find new samples to process, pretends to have processed
-		 * previously stored samples, and returns to the main thread,
-		 * while the termination request still gets signalled.
-		 */
-		found_match = FALSE;
+	op->max_count = max_matches;
+	count = MIN(max_matches, 4096);
+	op->samplenums = g_array_sized_new(FALSE, FALSE, sizeof(uint64_t), count);
+	op->pins = g_array_sized_new(FALSE, FALSE, sizeof(uint64_t), count);
+	op->matches = g_array_sized_new(FALSE, FALSE, sizeof(uint64_t), count);
 
-		/* Ignore return value for now, should never be negative. */
-		(void)process_samples_until_condition_match(di, &found_match);
+	py_ret = wait_op_run(di, (srd_Decoder *)self, op);
 
-		Py_END_ALLOW_THREADS
+	srd_gil_release(gstate);
 
-		/* If there's a match, set self.samplenum etc. and return. */
-		if (found_match) {
-			/* Set self.samplenum to the (absolute) sample number that matched. */
-			py_samplenum = PyLong_FromUnsignedLongLong(di->abs_cur_samplenum);
-			PyObject_SetAttrString(di->py_inst, "samplenum", py_samplenum);
-			Py_DECREF(py_samplenum);
-
-			if (di->match_array && di->match_array->len > 0) {
-				py_matched = PyTuple_New(di->match_array->len);
-				for (i = 0; i < di->match_array->len; i++)
-					PyTuple_SetItem(py_matched, i, PyBool_FromLong(di->match_array->data[i]));
-				PyObject_SetAttrString(di->py_inst, "matched", py_matched);
-				Py_DECREF(py_matched);
-				match_array_free(di);
-			} else {
-				PyObject_SetAttrString(di->py_inst, "matched", Py_None);
-			}
+	return py_ret;
 
-			py_pinvalues = get_current_pinvalues(di);
+err:
+	if (op)
+		wait_op_clear(op);
 
-			g_mutex_unlock(&di->data_mutex);
+	srd_gil_release(gstate);
 
-			PyGILState_Release(gstate);
+	return py_ret;
+}
 
-			return py_pinvalues;
+PyDoc_STRVAR(Decoder_sample_at_doc,
+	"Get the pin values at several sample numbers.\n"
+	"\n"
+	"Argument: An iterable of absolute sample numbers, in increasing\n"
+	"order, none of them before self.samplenum.\n"
+	"Returns: A tuple with the pin values at each of the sample numbers,\n"
+	"like wait() returns them. This behaves like a series of wait() calls\n"
+	"which skip to the sample numbers, but takes just one call. It blocks\n"
+	"until the input data covers the last sample number. self.samplenum\n"
+	"is the last sample number afterwards, self.matched is not changed.\n"
+);
+
+static PyObject *Decoder_sample_at(PyObject *self, PyObject *py_positions)
+{
+	struct srd_decoder_inst *di;
+	struct srd_wait_op local, *op;
+	PyObject *py_iter, *py_item, *py_ret;
+	uint64_t samplenum;
+	PyGILState_STATE gstate;
+
+	op = NULL;
+	py_ret = NULL;
+
+	gstate = srd_gil_ensure(NULL);
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		goto out;
+	}
+
+	count_wait_call(di);
+
+	if (di->dec_num_channels < 1) {
+		PyErr_SetString(PyExc_ValueError, "decoder has no channels");
+		goto out;
+	}
+
+	/* Collect and check the sample numbers before waiting for any. */
+	if (!(op = wait_op_new(di, &local, WAIT_OP_SAMPLE_AT)))
+		goto out;
+	if (!(py_iter = PyObject_GetIter(py_positions)))
+		goto out;
+	op->positions = g_array_new(FALSE, FALSE, sizeof(uint64_t));
+	samplenum = di->abs_cur_samplenum;
+	while ((py_item = PyIter_Next(py_iter))) {
+		if (PyLong_Check(py_item))
+			samplenum = PyLong_AsUnsignedLongLong(py_item);
+		else
+			PyErr_SetString(PyExc_TypeError, "sample number is not an integer");
+		Py_DECREF(py_item);
+		if (PyErr_Occurred())
+			break;
+		if (samplenum < di->abs_cur_samplenum || (op->positions->len &&
+				samplenum < g_array_index(op->positions, uint64_t,
+					op->positions->len - 1))) {
+			PyErr_SetString(PyExc_ValueError, "sample numbers must not decrease");
+			break;
 		}
+		g_array_append_val(op->positions, samplenum);
+	}
+	Py_DECREF(py_iter);
+	if (PyErr_Occurred())
+		goto out;
+
+	if (!(op->py_values = PyTuple_New(op->positions->len)))
+		goto out;
+
+	/* Blocking calls without sample numbers need not wait for data. */
+	if (!op->positions->len && op != di->wait_op) {
+		py_ret = op->py_values;
+		op->py_values = NULL;
+		goto out;
+	}
 
-		/* No match, reset state for the next chunk. */
-		di->got_new_samples = FALSE;
-		di->handled_all_samples = TRUE;
-		di->abs_start_samplenum = 0;
-		di->abs_end_samplenum = 0;
-		di->inbuf = NULL;
-		di->inbuflen = 0;
+	py_ret = wait_op_run(di, (srd_Decoder *)self, op);
+	op = NULL;
 
-		/* Signal the main thread that we handled all samples. */
-		g_cond_signal(&di->handled_all_samples_cond);
+out:
+	if (op)
+		wait_op_clear(op);
 
-		/*
-		 * When EOF was provided externally, communicate the
-		 * Python EOFError exception to .decode() and return
-		 * from the .wait() method call. This is motivated by
-		 * the use of Python context managers, so that .decode()
-		 * methods can "close" incompletely accumulated data
-		 * when the sample data is exhausted.
-		 */
-		if (di->communicate_eof) {
-			/* Advance self.samplenum to the (absolute) last sample number. */
-			py_samplenum = PyLong_FromUnsignedLongLong(di->abs_cur_samplenum);
-			PyObject_SetAttrString(di->py_inst, "samplenum", py_samplenum);
-			Py_DECREF(py_samplenum);
-			/* Raise an EOFError Python exception. */
-			srd_dbg("%s: %s: Raising EOF from wait().",
-				di->inst_id, __func__);
-			g_mutex_unlock(&di->data_mutex);
-			PyErr_SetString(PyExc_EOFError, "samples exhausted");
-			goto err;
+	srd_gil_release(gstate);
+
+	return py_ret;
+}
+
+PyDoc_STRVAR(Decoder_shift_in_doc,
+	"Capture bits from data channels on clock edges.\n"
+	"\n"
+	"Arguments: The clock channel index, the clock edge to sample on\n"
+	"('r', 'f' or 'e'), a sequence of data channel indices, the number\n"
+	"of clock edges to capture. The optional 'stop' dict is a condition\n"
+	"like for wait() which ends the capture early (e.g. a chip select\n"
+	"change), the data is not sampled where it matches. Its 'skip'\n"
+	"terms count the samples since the latest clock edge.\n"
+	"By default the first captured bit ends up as the most significant\n"
+	"one, 'lsb_first' turns this around. In 'parallel' mode all data\n"
+	"channels form one word, which takes as many bits per clock edge as\n"
+	"there are data channels, data[0] being the most significant.\n"
+	"Returns: A tuple of the number of captured clock edges, a tuple of\n"
+	"the words (one per data channel, or one in parallel mode), and the\n"
+	"sample numbers of the clock edges as an array('Q') when\n"
+	"'samplenums' is True, None otherwise. This behaves like a series\n"
+	"of wait() calls for the clock edge or the stop condition, but takes\n"
+	"just one call. self.samplenum and self.matched are those of the\n"
+	"last match, self.matched tells the clock edge and stop condition\n"
+	"results. Raises EOFError like wait() when the input data ends\n"
+	"before the capture is complete.\n"
+);
+
+static PyObject *Decoder_shift_in(PyObject *self, PyObject *args,
+	PyObject *kwargs)
+{
+	static char *kwlist[] = { "clk", "edge", "data", "count", "stop",
+		"lsb_first", "parallel", "samplenums", NULL };
+	int clk, edge_type, lsb_first, parallel, want_samplenums;
+	unsigned int num_data;
+	Py_ssize_t count;
+	long ch;
+	const char *edge;
+	guint8 data[64];
+	struct srd_decoder_inst *di;
+	struct srd_term *term;
+	struct srd_wait_op local, *op;
+	PyObject *py_data, *py_stop, *py_iter, *py_item, *py_ret;
+	PyGILState_STATE gstate;
+
+	op = NULL;
+	py_ret = NULL;
+
+	gstate = srd_gil_ensure(NULL);
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		goto err;
+	}
+
+	count_wait_call(di);
+
+	py_stop = Py_None;
+	lsb_first = parallel = want_samplenums = 0;
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "isOn|Oppp", kwlist,
+			&clk, &edge, &py_data, &count, &py_stop,
+			&lsb_first, &parallel, &want_samplenums)) {
+		/* Let Python raise this exception. */
+		goto err;
+	}
+	if (di->dec_num_channels > 64) {
+		PyErr_SetString(PyExc_ValueError, "too many channels");
+		goto err;
+	}
+	if (clk < 0 || clk >= di->dec_num_channels) {
+		PyErr_SetString(PyExc_ValueError, "invalid clock channel");
+		goto err;
+	}
+	edge_type = get_term_type(edge);
+	if (edge_type != SRD_TERM_RISING_EDGE && edge_type != SRD_TERM_FALLING_EDGE
+			&& edge_type != SRD_TERM_EITHER_EDGE) {
+		PyErr_SetString(PyExc_ValueError, "invalid clock edge");
+		goto err;
+	}
+	if (count < 1) {
+		PyErr_SetString(PyExc_ValueError, "invalid bit count");
+		goto err;
+	}
+	if (py_stop != Py_None && !PyDict_Check(py_stop)) {
+		PyErr_SetString(PyExc_TypeError, "stop condition is not a dict");
+		goto err;
+	}
+
+	/* Get the data channel indices. */
+	if (!(py_iter = PyObject_GetIter(py_data)))
+		goto err;
+	num_data = 0;
+	while ((py_item = PyIter_Next(py_iter))) {
+		ch = PyLong_Check(py_item) ? PyLong_AsLong(py_item) : -1;
+		Py_DECREF(py_item);
+		if (ch < 0 || ch >= di->dec_num_channels) {
+			if (!PyErr_Occurred())
+				PyErr_SetString(PyExc_ValueError, "invalid data channel");
+			break;
+		}
+		if (num_data == G_N_ELEMENTS(data)) {
+			PyErr_SetString(PyExc_ValueError, "too many data channels");
+			break;
 		}
+		data[num_data++] = ch;
+	}
+	Py_DECREF(py_iter);
+	if (PyErr_Occurred())
+		goto err;
+	if (!num_data) {
+		PyErr_SetString(PyExc_ValueError, "no data channels");
+		goto err;
+	}
 
-		/*
-		 * When termination of wait() and decode() was requested,
-		 * then exit the loop after releasing the mutex.
-		 */
-		if (di->want_wait_terminate) {
-			srd_dbg("%s: %s: Will return from wait().",
-				di->inst_id, __func__);
-			g_mutex_unlock(&di->data_mutex);
+	/* The clock edge is condition 0, the stop condition (if any) is 1. */
+	if (di->want_wait_terminate)
+		goto err;
+	if (!(op = wait_op_new(di, &local, WAIT_OP_SHIFT_IN)))
+		goto err;
+	if (!di->conditions)
+		di->conditions = srd_conditions_new();
+	srd_conditions_clear(di->conditions);
+	srd_conditions_add(di->conditions);
+	term = srd_conditions_add_term(di->conditions);
+	term->type = edge_type;
+	term->channel = clk;
+	if (py_stop != Py_None && PyDict_Size(py_stop) > 0) {
+		if (create_term_list(di, py_stop, di->conditions) != SRD_OK) {
+			if (!PyErr_Occurred())
+				PyErr_SetString(PyExc_ValueError, "invalid stop condition");
 			goto err;
 		}
-
-		g_mutex_unlock(&di->data_mutex);
 	}
 
-	PyGILState_Release(gstate);
+	memcpy(op->data, data, num_data);
+	op->num_data = num_data;
+	op->lsb_first = lsb_first;
+	op->parallel = parallel;
+	op->want_samplenums = want_samplenums;
+	op->max_count = count;
+	count = MIN(count, 4096);
+	op->samplenums = g_array_sized_new(FALSE, FALSE, sizeof(uint64_t), count);
+	op->pins = g_array_sized_new(FALSE, FALSE, sizeof(uint64_t), count);
 
-	Py_RETURN_NONE;
+	py_ret = wait_op_run(di, (srd_Decoder *)self, op);
+
+	srd_gil_release(gstate);
+
+	return py_ret;
 
 err:
-	PyGILState_Release(gstate);
+	if (op)
+		wait_op_clear(op);
 
-	return NULL;
+	srd_gil_release(gstate);
+
+	return py_ret;
+}
+
+PyDoc_STRVAR(Decoder_compile_conditions_doc,
+	"Compile wait() conditions for repeated use.\n"
+	"\n"
+	"Argument: The conditions, like for wait().\n"
+	"Returns: An opaque, immutable object which wait() and wait_many()\n"
+	"accept in place of the conditions. It saves their conversion on\n"
+	"every call. To vary a 'skip' term's count, compile it with any\n"
+	"count and pass the actual one as wait(conds, skip=count).\n"
+);
+
+static PyObject *Decoder_compile_conditions(PyObject *self, PyObject *py_conds)
+{
+	struct srd_decoder_inst *di;
+	struct srd_conditions *conds;
+	PyObject *py_capsule;
+	int ret;
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		return NULL;
+	}
+
+	conds = srd_conditions_new();
+	ret = parse_conditions(di, py_conds, conds);
+	if (ret < 0) {
+		srd_conditions_free(conds);
+		if (!PyErr_Occurred())
+			PyErr_SetString(PyExc_ValueError, "invalid conditions");
+		return NULL;
+	}
+	/* Conditions which are absent compile to none at all. */
+	if (ret == 9999)
+		srd_conditions_clear(conds);
+
+	py_capsule = PyCapsule_New(conds, CONDITIONS_CAPSULE,
+		conditions_capsule_free);
+	if (!py_capsule)
+		srd_conditions_free(conds);
+
+	return py_capsule;
+}
+
+PyDoc_STRVAR(Decoder_checkpoint_doc,
+	"Declare a point which decoding can resume from.\n"
+	"\n"
+	"Call it in decode() where the protocol resynchronizes, e.g. while\n"
+	"the bus is idle, and all state which decoding continues with is\n"
+	"in attributes. When the frontend takes checkpoints, this takes a\n"
+	"snapshot of the attributes of the decoder and the decoders stacked\n"
+	"on top of it. After a resume, decode() gets called anew with the\n"
+	"attributes as they were, self.samplenum set to the sample of the\n"
+	"snapshot, and self.resumed set to True (it is False when decode()\n"
+	"starts at the beginning of the input). Local variables of decode()\n"
+	"don't survive.\n"
+);
+
+static PyObject *Decoder_checkpoint(PyObject *self, PyObject *args)
+{
+	struct srd_decoder_inst *di;
+
+	(void)args;
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		return NULL;
+	}
+
+	if (srd_inst_checkpoint(di) != SRD_OK)
+		return NULL;
+
+	Py_RETURN_NONE;
 }
 
 PyDoc_STRVAR(Decoder_has_channel_doc,
@@ -1162,9 +2688,9 @@ static PyObject *Decoder_has_channel(PyObject *self, PyObject *args)
 	if (!self || !args)
 		return NULL;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -1186,20 +2712,62 @@ static PyObject *Decoder_has_channel(PyObject *self, PyObject *args)
 		goto err;
 	}
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	bool_ret = (di->dec_channelmap[idx] == -1) ? Py_False : Py_True;
 	Py_INCREF(bool_ret);
 	return bool_ret;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return NULL;
 }
 
+PyDoc_STRVAR(Decoder_ann_enabled_doc,
+	"Check whether annotations of a given class are wanted.\n"
+	"\n"
+	"Argument: An annotation class index.\n"
+	"Returns: A boolean, False if the frontend disabled the class or\n"
+	"doesn't receive annotations at all. put() drops such annotations,\n"
+	"decoders can skip formatting their texts.\n"
+);
+
+static PyObject *Decoder_ann_enabled(PyObject *self, PyObject *py_cls)
+{
+	struct srd_decoder_inst *di;
+	long ann_class;
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		return NULL;
+	}
+
+	ann_class = PyLong_AsLong(py_cls);
+	if (ann_class == -1 && PyErr_Occurred())
+		return NULL;
+
+	return PyBool_FromLong(srd_inst_ann_wanted(di, ann_class));
+}
+
 PyDoc_STRVAR(Decoder_doc, "sigrok Decoder base class");
 
+static PyMemberDef Decoder_members[] = {
+	{ "samplenum",
+	  T_OBJECT_EX, offsetof(srd_Decoder, samplenum), 0,
+	  "Sample number of the most recent wait() result.",
+	},
+	{ "matched",
+	  T_OBJECT_EX, offsetof(srd_Decoder, matched), 0,
+	  "Tuple of booleans, which of the wait() conditions matched.",
+	},
+	{ "resumed",
+	  T_OBJECT_EX, offsetof(srd_Decoder, resumed), 0,
+	  "Whether decode() resumes from a checkpoint.",
+	},
+	ALL_ZERO,
+};
+
 static PyMethodDef Decoder_methods[] = {
 	{ "put",
 	  Decoder_put, METH_VARARGS,
@@ -1210,16 +2778,78 @@ static PyMethodDef Decoder_methods[] = {
 	  Decoder_register_doc,
 	},
 	{ "wait",
-	  Decoder_wait, METH_VARARGS,
+	  (PyCFunction)(void(*)(void))Decoder_wait, METH_VARARGS | METH_KEYWORDS,
 	  Decoder_wait_doc,
 	},
+	{ "wait_many",
+	  Decoder_wait_many, METH_VARARGS,
+	  Decoder_wait_many_doc,
+	},
+	{ "sample_at",
+	  Decoder_sample_at, METH_O,
+	  Decoder_sample_at_doc,
+	},
+	{ "shift_in",
+	  (PyCFunction)(void(*)(void))Decoder_shift_in, METH_VARARGS | METH_KEYWORDS,
+	  Decoder_shift_in_doc,
+	},
+	{ "compile_conditions",
+	  Decoder_compile_conditions, METH_O,
+	  Decoder_compile_conditions_doc,
+	},
+	{ "checkpoint",
+	  Decoder_checkpoint, METH_NOARGS,
+	  Decoder_checkpoint_doc,
+	},
 	{ "has_channel",
 	  Decoder_has_channel, METH_VARARGS,
 	  Decoder_has_channel_doc,
 	},
+	{ "ann_enabled",
+	  Decoder_ann_enabled, METH_O,
+	  Decoder_ann_enabled_doc,
+	},
 	ALL_ZERO,
 };
 
+/**
+ * Associate a sigrokdecode.Decoder object with its decoder instance.
+ *
+ * @param obj The Python class instantiation. Must be an instance of (a
+ *            subclass of) sigrokdecode.Decoder.
+ * @param di The decoder instance, or NULL to drop the association.
+ *
+ * @private
+ */
+SRD_PRIV void srd_Decoder_inst_set(PyObject *obj, struct srd_decoder_inst *di)
+{
+	((srd_Decoder *)obj)->di = di;
+}
+
+/* Release the references of the member slots with the object. */
+static void Decoder_dealloc(PyObject *self)
+{
+	srd_Decoder *py_dec;
+	PyTypeObject *type;
+
+	py_dec = (srd_Decoder *)self;
+	Py_CLEAR(py_dec->samplenum);
+	Py_CLEAR(py_dec->matched);
+	Py_CLEAR(py_dec->resumed);
+
+	/*
+	 * The limited API has no tp_free. Python subclasses are tracked by
+	 * the GC, sigrokdecode.Decoder itself is not. Instances of heap
+	 * types hold a reference to their type.
+	 */
+	type = Py_TYPE(self);
+	if (PyType_GetFlags(type) & Py_TPFLAGS_HAVE_GC)
+		PyObject_GC_Del(self);
+	else
+		PyObject_Free(self);
+	Py_DECREF(type);
+}
+
 /**
  * Create the sigrokdecode.Decoder type.
  *
@@ -1233,13 +2863,15 @@ SRD_PRIV PyObject *srd_Decoder_type_new(void)
 	PyType_Slot slots[] = {
 		{ Py_tp_doc, Decoder_doc },
 		{ Py_tp_methods, Decoder_methods },
+		{ Py_tp_members, Decoder_members },
 		{ Py_tp_new, (void *)&PyType_GenericNew },
+		{ Py_tp_dealloc, (void *)&Decoder_dealloc },
 		ALL_ZERO,
 	};
 	PyObject *py_obj;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	spec.name = "sigrokdecode.Decoder";
 	spec.basicsize = sizeof(srd_Decoder);
@@ -1249,7 +2881,7 @@ SRD_PRIV PyObject *srd_Decoder_type_new(void)
 
 	py_obj = PyType_FromSpec(&spec);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return py_obj;
 }
@@ -38,18 +38,18 @@ SRD_PRIV PyObject *py_import_by_name(const char *name)
 	PyObject *py_mod, *py_modname;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	py_modname = PyUnicode_FromString(name);
 	if (!py_modname) {
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return NULL;
 	}
 
 	py_mod = PyImport_Import(py_modname);
 	Py_DECREF(py_modname);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return py_mod;
 }
@@ -73,7 +73,7 @@ SRD_PRIV int py_attr_as_str(PyObject *py_obj, const char *attr, char **outstr)
 	int ret;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyObject_HasAttrString(py_obj, attr)) {
 		srd_dbg("Object has no attribute '%s'.", attr);
@@ -88,12 +88,12 @@ SRD_PRIV int py_attr_as_str(PyObject *py_obj, const char *attr, char **outstr)
 	ret = py_str_as_str(py_str, outstr);
 	Py_DECREF(py_str);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return ret;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -120,7 +120,7 @@ SRD_PRIV int py_attr_as_strlist(PyObject *py_obj, const char *attr, GSList **out
 	char *outstr;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyObject_HasAttrString(py_obj, attr)) {
 		srd_dbg("Object has no attribute '%s'.", attr);
@@ -150,12 +150,12 @@ SRD_PRIV int py_attr_as_strlist(PyObject *py_obj, const char *attr, GSList **out
 
 	Py_DECREF(py_list);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -179,7 +179,7 @@ SRD_PRIV int py_dictitem_as_str(PyObject *py_obj, const char *key,
 	PyObject *py_value;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyDict_Check(py_obj)) {
 		srd_dbg("Object is not a dictionary.");
@@ -191,12 +191,12 @@ SRD_PRIV int py_dictitem_as_str(PyObject *py_obj, const char *key,
 		goto err;
 	}
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return py_str_as_str(py_value, outstr);
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -221,7 +221,7 @@ SRD_PRIV int py_listitem_as_str(PyObject *py_obj, Py_ssize_t idx,
 	ssize_t item_idx;
 	PyObject *py_value;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyList_Check(py_obj)) {
 		srd_dbg("Object is not a list.");
@@ -234,12 +234,12 @@ SRD_PRIV int py_listitem_as_str(PyObject *py_obj, Py_ssize_t idx,
 		goto err;
 	}
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return py_str_as_str(py_value, outstr);
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -266,7 +266,7 @@ SRD_PRIV int py_pydictitem_as_str(PyObject *py_obj, PyObject *py_key,
 	if (!py_obj || !py_key || !outstr)
 		return SRD_ERR_ARG;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyDict_Check(py_obj)) {
 		srd_dbg("Object is not a dictionary.");
@@ -283,12 +283,12 @@ SRD_PRIV int py_pydictitem_as_str(PyObject *py_obj, PyObject *py_key,
 		goto err;
 	}
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return py_str_as_str(py_value, outstr);
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -313,7 +313,7 @@ SRD_PRIV int py_pydictitem_as_long(PyObject *py_obj, PyObject *py_key, int64_t *
 	if (!py_obj || !py_key || !out)
 		return SRD_ERR_ARG;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyDict_Check(py_obj)) {
 		srd_dbg("Object is not a dictionary.");
@@ -332,12 +332,12 @@ SRD_PRIV int py_pydictitem_as_long(PyObject *py_obj, PyObject *py_key, int64_t *
 
 	*out = PyLong_AsLongLong(py_value);
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -360,11 +360,11 @@ SRD_PRIV int py_str_as_str(PyObject *py_str, char **outstr)
 	char *str;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PyUnicode_Check(py_str)) {
 		srd_dbg("Object is not a string object.");
-		PyGILState_Release(gstate);
+		srd_gil_release(gstate);
 		return SRD_ERR_PYTHON;
 	}
 
@@ -374,13 +374,13 @@ SRD_PRIV int py_str_as_str(PyObject *py_str, char **outstr)
 		Py_DECREF(py_bytes);
 		if (str) {
 			*outstr = str;
-			PyGILState_Release(gstate);
+			srd_gil_release(gstate);
 			return SRD_OK;
 		}
 	}
 	srd_exception_catch("Failed to extract string");
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
@@ -406,7 +406,7 @@ SRD_PRIV int py_strseq_to_char(PyObject *py_strseq, char ***out_strv)
 	PyGILState_STATE gstate;
 	int ret = SRD_ERR_PYTHON;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (!PySequence_Check(py_strseq)) {
 		srd_err("Object does not provide sequence protocol.");
@@ -449,7 +449,7 @@ SRD_PRIV int py_strseq_to_char(PyObject *py_strseq, char ***out_strv)
 	}
 	*out_strv = strv;
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return SRD_OK;
 
@@ -458,7 +458,7 @@ err_out:
 	srd_exception_catch("Failed to obtain string item");
 
 err:
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return ret;
 }
@@ -477,7 +477,7 @@ SRD_PRIV GVariant *py_obj_to_variant(PyObject *py_obj)
 	GVariant *var = NULL;
 	PyGILState_STATE gstate;
 
-	gstate = PyGILState_Ensure();
+	gstate = srd_gil_ensure(NULL);
 
 	if (PyUnicode_Check(py_obj)) { /* string */
 		PyObject *py_bytes;
@@ -512,7 +512,7 @@ SRD_PRIV GVariant *py_obj_to_variant(PyObject *py_obj)
 		srd_err("Failed to extract value of unsupported type.");
 	}
 
-	PyGILState_Release(gstate);
+	srd_gil_release(gstate);
 
 	return var;
 }